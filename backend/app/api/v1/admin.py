@@ -11,6 +11,7 @@ from app.services.chat_repository import chat_repo
 from app.services.intimacy_service import intimacy_service
 from app.services.emotion_service import emotion_service
 from app.api.v1.characters import CHARACTERS
+from app.services.character_registry import character_registry
 
 router = APIRouter(prefix="/admin", tags=["Admin"])
 
@@ -572,6 +573,9 @@ async def update_character(character_id: str, data: CharacterUpdate):
     if not result:
         raise HTTPException(status_code=404, detail="Character not found")
     
+    # 热更新内存中的角色定义（聊天 / prompt 构建读的是注册表，不是数据库）
+    character_registry.apply_update(character_id, update_data)
+    
     return {"success": True, "character": result}
 
 
@@ -584,6 +588,9 @@ async def delete_character(character_id: str):
     if not success:
         raise HTTPException(status_code=404, detail="Character not found")
     
+    # 内置角色定义仍在代码里，下线即可（从列表和搭子的世界知识中移除）
+    character_registry.apply_update(character_id, {"is_active": False})
+    
     return {"success": True}
 
 
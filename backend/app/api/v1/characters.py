@@ -9,6 +9,7 @@ from uuid import UUID, uuid4
 from datetime import datetime
 from typing import List, Optional
 from pydantic import BaseModel
+from app.services.character_registry import character_registry
 
 router = APIRouter(prefix="/characters")
 
@@ -554,12 +555,12 @@ CHARACTERS = [
 ]
 
 
+character_registry.load(CHARACTERS)
+
+
 def get_character_by_id(character_id: str) -> Optional[dict]:
     """Get full character data by ID (including system_prompt)"""
-    for c in CHARACTERS:
-        if c["character_id"] == str(character_id):
-            return c
-    return None
+    return character_registry.get(character_id)
 
 
 @router.get("", response_model=CharacterListResponse,
@@ -603,9 +604,9 @@ async def list_characters(include_spicy: bool = True):
 @router.get("/{character_id}", response_model=CharacterResponse)
 async def get_character(character_id: UUID):
     """Get character details"""
-    for c in CHARACTERS:
-        if c["character_id"] == str(character_id):
-            return CharacterResponse(**{**c, "character_id": UUID(c["character_id"])})
+    c = character_registry.get(character_id)
+    if c:
+        return CharacterResponse(**{**c, "character_id": UUID(c["character_id"])})
     raise HTTPException(status_code=404, detail="Character not found")
 
 
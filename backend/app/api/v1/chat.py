@@ -20,9 +20,11 @@ from app.models.schemas import (
 from app.services.intimacy_service import intimacy_service, IntimacyService
 from app.services.chat_repository import chat_repo
 from app.services.chat_debug_logger import chat_debug
-from app.api.v1.characters import CHARACTERS, get_character_by_id
+from app.api.v1.characters import get_character_by_id
 from app.config import settings
 from app.core.perf import PerfTracker
+from app.core.metrics import metrics
+from app.core.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
@@ -33,10 +35,11 @@ MOCK_MODE = settings.MOCK_LLM
 
 def get_character_info(character_id: str) -> dict:
     """Get character info by ID"""
-    for c in CHARACTERS:
-        if c["character_id"] == str(character_id):
-            return c
-    return {"name": "AI Companion", "avatar_url": None, "background_url": None}
+    return get_character_by_id(character_id) or {"name": "AI Companion", "avatar_url": None, "background_url": None}
+
+
+# 同一会话并发补 greeting 时（多标签页 / 客户端重试）只检查、插入一次
+_greeting_flight = SingleFlight("greeting")
 
 
 async def ensure_session_has_greeting(session_id: str, character_id: str) -> bool:
@@ -47,7 +50,13 @@ async def ensure_session_has_greeting(session_id: str, character_id: str) -> boo
     这是greeting存储的唯一入口，统一处理：
     - 新创建的session
     - 旧session缺失greeting的情况
+    
+    同一 session 的并发调用合并为一次，避免重复插入。
     """
+    return await _greeting_flight.do(session_id, lambda: _insert_greeting_if_missing(session_id, character_id))
+
+
+async def _insert_greeting_if_missing(session_id: str, character_id: str) -> bool:
     character = get_character_info(character_id)
     greeting = character.get("greeting")
     if not greeting:
@@ -1032,6 +1041,7 @@ async def stream_chat_completion(request: StreamChatRequest, req: Request):
     """
     import time
     request_id = f"{int(time.time()*1000)}"
+    stream_start = time.perf_counter()
     
     logger.info(f"🌊 [{request_id}] STREAMING REQUEST")
     logger.info(f"   Session: {request.session_id}")
@@ -1151,6 +1161,10 @@ async def stream_chat_completion(request: StreamChatRequest, req: Request):
                             delta = chunk_json["choices"][0].get("delta", {})
                             content = delta.get("content", "")
                             if content:
+                                if not full_response:
+                                    metrics.SSE_TTFT.labels(endpoint="chat_stream").observe(
+                                        time.perf_counter() - stream_start
+                                    )
                                 full_response += content
                                 # Send chunk to client
                                 yield f"event: chunk\ndata: {json.dumps({'content': content}, ensure_ascii=False)}\n\n"
@@ -263,6 +263,55 @@ async def generate_event_story(
         )
 
 
+class StoryJobResponse(BaseModel):
+    """Response model for queued story generation"""
+    job_id: str
+    status: str
+    event_type: str
+
+
+@router.post("/{user_id}/{character_id}/generate/async", response_model=StoryJobResponse, status_code=202)
+async def generate_event_story_async(
+    user_id: str,
+    character_id: str,
+    body: StoryGenerationRequest,
+    request: Request,
+):
+    """
+    Queue story generation on the background job worker.
+    
+    One job per (user, character, event_type) while it is pending or running:
+    repeated calls return the same job. Once it finishes the key is released,
+    so a deleted event memory can be regenerated.
+    Poll GET /api/v1/jobs/{job_id} for the story.
+    """
+    from app.services.job_queue import job_queue
+    from app.tasks.jobs import JOB_EVENT_STORY
+    
+    if not EventType.is_story_event(body.event_type):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Event type '{body.event_type}' does not support story generation"
+        )
+    
+    job = await job_queue.enqueue(
+        JOB_EVENT_STORY,
+        {
+            "user_id": user_id,
+            "character_id": character_id,
+            "event_type": body.event_type,
+            "chat_history": body.chat_history,
+            "memory_context": body.memory_context,
+            "relationship_state": body.relationship_state,
+        },
+        user_id=user_id,
+        idempotency_key=f"event_story:{user_id}:{character_id}:{body.event_type}",
+        idempotency_in_flight_only=True,
+    )
+    
+    return StoryJobResponse(job_id=job.job_id, status=job.status, event_type=body.event_type)
+
+
 @router.delete("/{user_id}/{character_id}/{event_type}")
 async def delete_event_memory(
     user_id: str,
@@ -299,6 +348,9 @@ async def delete_event_memory(
                     detail="Event memory not found"
                 )
             
+            from app.services.prompt_fragment_cache import prompt_fragment_cache, FRAGMENT_EVENTS
+            prompt_fragment_cache.bump(user_id, character_id, FRAGMENT_EVENTS)
+            
             return {"success": True, "message": "Event memory deleted"}
             
     except HTTPException:
@@ -4,6 +4,7 @@ Image Generation API Routes
 
 API endpoints for image generation:
 - POST /api/v1/images/generate - Generate a new image
+- POST /api/v1/images/generate/async - Queue image generation, poll /api/v1/jobs/{job_id}
 - GET /api/v1/images/history - Get user's image history
 - GET /api/v1/images/styles - Get available styles and costs
 - GET /api/v1/images/{image_id} - Get single image details
@@ -87,6 +88,13 @@ class ImageGenerateResponse(BaseModel):
     error: Optional[str] = None
 
 
+class ImageJobResponse(BaseModel):
+    """Response for queued image generation"""
+    job_id: str
+    status: str
+    cost_credits: int
+
+
 class ImageHistoryItem(BaseModel):
     """Single image in history"""
     image_id: str
@@ -211,6 +219,53 @@ async def generate_image(
     )
 
 
+@router.post("/generate/async", response_model=ImageJobResponse, status_code=202)
+async def generate_image_async(
+    request: ImageGenerateRequest,
+    req: Request,
+):
+    """
+    Queue image generation on the background job worker.
+    
+    Returns a job_id immediately; poll GET /api/v1/jobs/{job_id} for the result.
+    Send an `Idempotency-Key` header to make retries safe.
+    """
+    from app.services.job_queue import job_queue
+    from app.tasks.jobs import JOB_IMAGE_GENERATION
+    
+    user = get_user_from_request(req)
+    service = get_image_service()
+    
+    try:
+        style = ImageStyle(request.style)
+    except ValueError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid style: {request.style}. Available: {[s.value for s in ImageStyle]}"
+        )
+    
+    idempotency_key = req.headers.get("Idempotency-Key")
+    job = await job_queue.enqueue(
+        JOB_IMAGE_GENERATION,
+        {
+            "user_id": user.user_id,
+            "character_id": request.character_id,
+            "prompt": request.prompt or "",
+            "style": style.value,
+            "aspect_ratio": request.aspect_ratio,
+        },
+        user_id=user.user_id,
+        idempotency_key=f"image:{user.user_id}:{idempotency_key}" if idempotency_key else None,
+        max_attempts=2,
+    )
+    
+    return ImageJobResponse(
+        job_id=job.job_id,
+        status=job.status,
+        cost_credits=service.get_image_cost(style),
+    )
+
+
 @router.get("/history", response_model=ImageHistoryResponse)
 async def get_image_history(
     req: Request,
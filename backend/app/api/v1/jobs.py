@@ -0,0 +1,46 @@
+"""
+Jobs API - /api/v1/jobs/{job_id}
+================================
+
+后台任务结果轮询（生图 / 事件故事 / TTS 等异步接口返回 job_id）。
+
+GET /jobs/{job_id} → 任务状态与结果
+"""
+
+import logging
+from fastapi import APIRouter, HTTPException, Request
+
+from app.services.job_queue import job_queue
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+
+def _get_user_id(request: Request) -> str:
+    user = getattr(request.state, "user", None)
+    if user and hasattr(user, "user_id"):
+        return str(user.user_id)
+    return request.headers.get("X-User-ID", "demo-user-123")
+
+
+@router.get("/{job_id}", summary="查询后台任务状态")
+async def get_job(job_id: str, req: Request):
+    """
+    返回任务状态：pending / running / succeeded / failed。
+    succeeded 时 result 为任务结果，failed 时 error 为失败原因。
+    """
+    job = await job_queue.get(job_id)
+    if job is None or (job.user_id and job.user_id != _get_user_id(req)):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job.job_id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "attempts": job.attempts,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
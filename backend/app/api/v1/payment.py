@@ -22,9 +22,19 @@ from app.services.payment_service import (
 )
 from app.services.stripe_service import stripe_service, STRIPE_ENABLED
 from app.services.iap_service import iap_service, IAPProvider
+from app.core.principal_cache import invalidate_principal
 
 logger = logging.getLogger(__name__)
 
+
+def _invalidate_principal_for(result) -> None:
+    """
+    Webhook 处理完后让认证缓存失效（订阅等级可能变了）。
+    结果里没有 user_id 时整体清空，宁可多查一次也不返回旧等级。
+    """
+    user_id = result.get("user_id") if isinstance(result, dict) else None
+    invalidate_principal(str(user_id) if user_id else None)
+
 router = APIRouter(prefix="/payment")
 
 
@@ -351,6 +361,7 @@ async def stripe_webhook(
         
         # Handle the event
         result = await stripe_service.handle_webhook_event(event)
+        _invalidate_principal_for(result)
         
         logger.info(f"Webhook processed: {event.type} -> {result}")
         return JSONResponse(content=result, status_code=200)
@@ -451,6 +462,7 @@ async def apple_server_notification(request: Request):
         
         # Process notification
         result = await iap_service.handle_apple_notification(signed_payload)
+        _invalidate_principal_for(result)
         
         logger.info(f"Apple webhook processed: {result.get('notification_type')}")
         return JSONResponse(content=result, status_code=200)
@@ -549,6 +561,7 @@ async def google_play_notification(request: Request):
         
         # Process notification
         result = await iap_service.handle_google_notification(message_data)
+        _invalidate_principal_for(result)
         
         logger.info(f"Google webhook processed: {result.get('type')}")
         return JSONResponse(content=result, status_code=200)
@@ -2,7 +2,7 @@
 Voice API Routes - TTS (豆包) and STT
 """
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import Response
 import os
 
@@ -88,6 +88,35 @@ async def text_to_speech(request: TTSRequest):
     return Response(content=audio, media_type="audio/mpeg")
 
 
+@router.post("/tts/async", status_code=202, summary="Queue text to speech")
+async def text_to_speech_async(request: TTSRequest, req: Request):
+    """
+    Queue TTS on the background job worker.
+
+    Returns a job_id immediately; poll GET /api/v1/jobs/{job_id} for the result
+    (`audio_base64`, `media_type`). Send an `Idempotency-Key` header to make retries safe.
+    """
+    from app.services.job_queue import job_queue
+    from app.tasks.jobs import JOB_TTS
+
+    user = getattr(req.state, "user", None)
+    user_id = user.user_id if user else None
+    idempotency_key = req.headers.get("Idempotency-Key")
+    job = await job_queue.enqueue(
+        JOB_TTS,
+        {
+            "text": request.text,
+            "voice": request.voice,
+            "speed": request.speed,
+            "emotion": request.emotion,
+        },
+        user_id=user_id,
+        idempotency_key=f"tts:{user_id}:{idempotency_key}" if idempotency_key else None,
+        max_attempts=2,
+    )
+    return {"job_id": job.job_id, "status": job.status}
+
+
 @router.get("/voices", response_model=VoiceListResponse)
 async def list_voices():
     """List available voice options"""
@@ -56,7 +56,11 @@ class Settings(BaseSettings):
     XAI_BASE_URL: str = Field(default="https://api.x.ai/v1")
     XAI_MODEL: str = Field(default="grok-4-1-fast-non-reasoning")  # $0.2/M tokens
     XAI_IMAGE_MODEL: str = Field(default="grok-2-image")  # $0.07/image
-    
+    # V4 system prompt layout: prefix (static → volatile, provider prefix cache) | legacy
+    PROMPT_LAYOUT: str = Field(default="prefix")
+    # V4 reply via provider structured output (json_schema); falls back to json_object if rejected
+    STRUCTURED_OUTPUT: bool = Field(default=True)
+
     # OpenAI - ONLY for embeddings! Do not use for chat.
     # See: app/services/llm/openai_embedding.py
     OPENAI_API_KEY: str = Field(default="")
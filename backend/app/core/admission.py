@@ -0,0 +1,208 @@
+"""
+Admission Control - 对话请求准入 + 同会话轮次串行
+==================================================
+
+一轮对话要占一次 LLM 调用加若干 DB 读写，过载时无上限地接请求只会让所有人一起超时。
+AdmissionController 在进入对话管线之前做两件事：
+
+1. 同会话串行：同一个 session 的轮次按到达顺序逐个执行（按 key 的 asyncio.Lock），
+   避免两轮交错读写情绪分数 / XP / 递减记录。积压超过 SESSION_MAX_PENDING 轮、
+   或等待上一轮超过 SESSION_WAIT_TIMEOUT 秒，直接 429
+2. 全局并发上限：同时执行的轮次最多 MAX_IN_FLIGHT 个，多出的排队等待，
+   队列满或等待超过 QUEUE_TIMEOUT 秒直接 503
+
+先排同会话的锁再占全局名额，排队中的重复提交不会占用全局并发。
+拒绝时抛 AdmissionRejected，带 status_code 和 Retry-After 建议秒数
+（按最近轮次耗时的滑动平均估算）。
+
+Usage:
+    async with chat_admission.turn(session_id):
+        ... 执行一轮对话 ...
+"""
+
+import os
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from app.core.exceptions import AppException
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_ENABLED = os.getenv("CHAT_ADMISSION_ENABLED", "true").lower() == "true"
+MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", "64"))
+MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "128"))
+QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "5"))
+SESSION_MAX_PENDING = int(os.getenv("CHAT_SESSION_MAX_PENDING", "2"))
+SESSION_WAIT_TIMEOUT = float(os.getenv("CHAT_SESSION_WAIT_TIMEOUT", "60"))
+
+INITIAL_TURN_SECONDS = 5.0
+MAX_RETRY_AFTER = 30
+
+
+class AdmissionRejected(AppException):
+    """请求未被准入（429 同会话积压 / 503 全局过载）"""
+
+    def __init__(self, message: str, status_code: int, retry_after: int, reason: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after  # seconds
+        self.reason = reason
+
+
+class KeyedLock:
+    """按 key 的互斥锁，没有持有者和等待者时自动回收"""
+
+    def __init__(self):
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._refs: Dict[str, int] = {}
+
+    def pending(self, key: str) -> int:
+        """持有 + 等待该 key 的数量"""
+        return self._refs.get(key, 0)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    async def acquire(self, key: str, timeout: Optional[float] = None) -> bool:
+        """获取 key 的锁；超时返回 False"""
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._refs[key] = self._refs.get(key, 0) + 1
+        try:
+            await asyncio.wait_for(lock.acquire(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._unref(key)
+            return False
+        except BaseException:
+            self._unref(key)
+            raise
+
+    def release(self, key: str) -> None:
+        self._locks[key].release()
+        self._unref(key)
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def _unref(self, key: str) -> None:
+        self._refs[key] -= 1
+        if not self._refs[key]:
+            del self._refs[key]
+            del self._locks[key]
+
+
+class AdmissionController:
+    """全局并发上限 + 有界等待队列 + 同会话串行"""
+
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_queue: int = MAX_QUEUE,
+        queue_timeout: float = QUEUE_TIMEOUT,
+        session_max_pending: int = SESSION_MAX_PENDING,
+        session_wait_timeout: float = SESSION_WAIT_TIMEOUT,
+    ):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.session_max_pending = session_max_pending
+        self.session_wait_timeout = session_wait_timeout
+        self.sessions = KeyedLock()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self._avg_turn = INITIAL_TURN_SECONDS
+
+    @asynccontextmanager
+    async def turn(self, session_id: Optional[str] = None) -> AsyncIterator[None]:
+        """
+        准入一轮对话；session_id 为空时只受全局上限约束
+
+        Raises:
+            AdmissionRejected: 同会话积压（429）或全局过载（503）
+        """
+        if session_id:
+            if self.sessions.pending(session_id) > self.session_max_pending:
+                raise self._reject("session_backlog", 429, self.retry_after())
+            if not await self.sessions.acquire(session_id, self.session_wait_timeout):
+                raise self._reject("session_timeout", 429, self.retry_after())
+        try:
+            await self._acquire_slot()
+            self.admitted += 1
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._release_slot(time.monotonic() - started)
+        finally:
+            if session_id:
+                self.sessions.release(session_id)
+
+    async def _acquire_slot(self) -> None:
+        if not self._slots.locked():
+            await self._slots.acquire()  # 有空闲名额时立即返回，不排队
+            self.in_flight += 1
+            return
+        if self.queued >= self.max_queue:
+            raise self._reject("queue_full", 503, self.retry_after(self.queued))
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise self._reject("queue_timeout", 503, self.retry_after(self.queued))
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+
+    def _release_slot(self, elapsed: float) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+        self._avg_turn += 0.2 * (elapsed - self._avg_turn)
+
+    def retry_after(self, backlog: int = 0) -> int:
+        """按平均轮次耗时估算排到的等待秒数"""
+        waves = (backlog + 1) / max(self.max_in_flight, 1)
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(self._avg_turn * max(waves, 1))))
+
+    def _reject(self, reason: str, status_code: int, retry_after: int) -> AdmissionRejected:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        try:
+            from app.core.metrics import metrics
+            metrics.CHAT_ADMISSION_REJECTED.labels(reason=reason).inc()
+        except Exception:
+            pass
+        logger.warning(
+            f"[Admission] {self.name} rejected ({reason}): in_flight={self.in_flight}, "
+            f"queued={self.queued}, retry_after={retry_after}s"
+        )
+        message = "当前会话还有消息在处理，请稍后再发" if status_code == 429 else "服务繁忙，请稍后重试"
+        return AdmissionRejected(message, status_code, retry_after, reason)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "sessions": len(self.sessions),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_turn_seconds": round(self._avg_turn, 3),
+        }
+
+
+# 对话入口（/chat/completions、/chat/stream）共用
+chat_admission = AdmissionController("chat")
@@ -91,8 +91,30 @@ class MockDB:
         yield
 
 
+def create_engine_from_env(**pool_kwargs):
+    """按 DATABASE_URL 创建 AsyncEngine（init_db 和迁移命令共用）"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    database_url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/app.db")
+
+    # Convert postgres:// to postgresql:// if needed
+    if database_url.startswith("postgres://"):
+        database_url = database_url.replace("postgres://", "postgresql+asyncpg://", 1)
+
+    # Use SQLite for development
+    if "sqlite" in database_url:
+        os.makedirs("./data", exist_ok=True)
+        return create_async_engine(database_url, echo=False)
+    return create_async_engine(database_url, pool_pre_ping=True, **pool_kwargs)
+
+
 async def init_db():
-    """Initialize database connection and create tables"""
+    """
+    Initialize database connection.
+
+    Schema changes are versioned migrations (app/core/migrations.py) run as a
+    separate command; startup only checks the schema version once.
+    """
     global _engine, _session_factory
 
     if MOCK_MODE:
@@ -100,36 +122,13 @@ async def init_db():
         return
 
     try:
-        from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-        # Import all model Bases to create all tables
-        from app.models.database.chat_models import Base as ChatBase
-        from app.models.database.billing_models import Base as BillingBase
-        # Import models to register them with Base.metadata
-        from app.models.database import intimacy_models, gift_models, payment_models, emotion_models, stats_models, user_settings_models, referral_models, date_models, image_models, interest_models
-        # Import memory v2 models to create tables
-        from app.models.database import memory_v2_models
-        # Import user memory model (分类记忆，与前端 MemoryItem 接口对应)
-        from app.models.database import user_memory_models
-        # Import stamina models for 体力系统
-        from app.models.database import stamina_models
-
-        database_url = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./data/app.db")
-        
-        # Convert postgres:// to postgresql:// if needed
-        if database_url.startswith("postgres://"):
-            database_url = database_url.replace("postgres://", "postgresql+asyncpg://", 1)
-        
-        # Use SQLite for development
-        if "sqlite" in database_url:
-            os.makedirs("./data", exist_ok=True)
-            _engine = create_async_engine(database_url, echo=False)
-        else:
-            _engine = create_async_engine(
-                database_url,
-                pool_size=20,
-                max_overflow=10,
-                pool_pre_ping=True,
-            )
+        from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+        from app.core.query_stats import instrument_engine
+        from app.core.migrations import ensure_schema
+
+        _engine = create_engine_from_env(pool_size=20, max_overflow=10)
+
+        instrument_engine(_engine)
 
         _session_factory = async_sessionmaker(
             _engine,
@@ -137,15 +136,9 @@ async def init_db():
             expire_on_commit=False,
         )
 
-        # Create all tables from both model bases
-        async with _engine.begin() as conn:
-            await conn.run_sync(ChatBase.metadata.create_all)
-            await conn.run_sync(BillingBase.metadata.create_all)
-        
-        # Run migrations for new columns (safe to run multiple times)
-        await _run_migrations()
-        
-        logger.info("Database connection initialized and tables created")
+        version = await ensure_schema(_engine)
+
+        logger.info(f"Database connection initialized (schema version {version})")
 
     except Exception as e:
         logger.warning(f"Database init failed, using mock: {e}")
@@ -153,49 +146,44 @@ async def init_db():
         traceback.print_exc()
 
 
-async def _run_migrations():
-    """Run database migrations for new columns (safe to run multiple times)"""
-    from sqlalchemy import text
-    global _engine
+def get_pool_stats() -> dict:
+    """
+    连接池占用情况（/metrics 抓取时调用）
     
-    if not _engine:
-        return
+    Returns:
+        {"sqlalchemy": {...}, "pgvector": {...}}，未初始化的池不出现
+    """
+    stats = {}
     
-    # Migrations format: (table_name, column_name, sqlite_sql, postgres_sql)
-    migrations = [
-        # Add is_extended column to date_sessions table
-        (
-            "date_sessions", 
-            "is_extended", 
-            "ALTER TABLE date_sessions ADD COLUMN is_extended BOOLEAN DEFAULT FALSE",
-            "ALTER TABLE date_sessions ADD COLUMN IF NOT EXISTS is_extended BOOLEAN DEFAULT FALSE",
-        ),
-    ]
+    pool = getattr(_engine, "pool", None) if _engine else None
+    if pool is not None and hasattr(pool, "checkedout"):
+        size = pool.size()
+        checked_out = pool.checkedout()
+        capacity = size + max(getattr(pool, "_max_overflow", 0), 0)
+        stats["sqlalchemy"] = {
+            "size": size,
+            "checked_out": checked_out,
+            "overflow": max(pool.overflow(), 0),
+            "saturation": round(checked_out / capacity, 3) if capacity else 0.0,
+        }
     
-    # Detect database type
-    db_url = str(_engine.url)
-    is_postgres = "postgresql" in db_url or "postgres" in db_url
+    try:
+        from app.services.vector_service import vector_service
+        vpool = vector_service._pool
+    except Exception:
+        vpool = None
+    if vpool is not None:
+        size = vpool.get_size()
+        in_use = size - vpool.get_idle_size()
+        max_size = vpool.get_max_size()
+        stats["pgvector"] = {
+            "size": size,
+            "checked_out": in_use,
+            "overflow": 0,
+            "saturation": round(in_use / max_size, 3) if max_size else 0.0,
+        }
     
-    for table_name, column_name, sqlite_sql, postgres_sql in migrations:
-        try:
-            async with _engine.begin() as conn:
-                # Choose SQL based on database type
-                sql = postgres_sql if is_postgres else sqlite_sql
-                
-                if is_postgres:
-                    # PostgreSQL: Use IF NOT EXISTS (native support)
-                    await conn.execute(text(sql))
-                    logger.info(f"Migration: Ensured column {table_name}.{column_name} exists")
-                else:
-                    # SQLite: Check if column exists first
-                    try:
-                        await conn.execute(text(f"SELECT {column_name} FROM {table_name} LIMIT 1"))
-                        logger.debug(f"Column {table_name}.{column_name} already exists, skipping")
-                    except Exception:
-                        await conn.execute(text(sql))
-                        logger.info(f"Migration: Added column {table_name}.{column_name}")
-        except Exception as e:
-            logger.warning(f"Migration for {table_name}.{column_name}: {e}")
+    return stats
 
 
 async def close_db():
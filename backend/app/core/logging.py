@@ -1,33 +1,177 @@
 """
 Logging Configuration
+=====================
+
+- 所有 handler 挂在后台线程（QueueListener）上，事件循环里只做入队，
+  不在请求路径上同步写 stdout / 文件（LOG_ASYNC=false 可关闭）
+- LOG_FORMAT=json 输出结构化 JSON（含 extra 字段，如 category / request_id）
+- 记录在入队时不格式化（lazy），%-style 参数由后台线程格式化；
+  参数里有可变容器（list/dict）时才在入队前格式化，避免之后被修改
+- 按分类采样：CategorySampler，供 chat.debug 等高频日志使用
 """
 
+import json
 import logging
+import queue
 import sys
 import os
-from logging.handlers import RotatingFileHandler
+import zlib
+import random
+import atexit
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
+from typing import Dict, List, Optional
 
 logger = logging.getLogger("ai_companion")
 
+# LogRecord 自带的属性，其余都视为 extra 字段
+_RESERVED_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+_log_queue: Optional[queue.Queue] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一个 JSON 对象；extra 字段原样带上"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc_info"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    入队时不格式化消息（标准 QueueHandler.prepare 会在调用线程里格式化）。
+    只有参数里含可变容器时才先格式化成字符串；异常栈总是先格式化。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args and any(isinstance(a, (list, dict, set)) for a in _iter_args(record.args)):
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _iter_args(args):
+    if isinstance(args, dict):
+        return args.values()
+    return args
+
+
+class CategorySampler:
+    """
+    按分类采样。rates: {category: 0.0~1.0}，未配置的分类使用 default。
+    同一个 key（如 request_id）在同一分类下的结果是确定的，
+    所以一轮对话要么完整记录要么完全不记，不会只留半个 prompt。
+    """
+
+    def __init__(self, rates: Optional[Dict[str, float]] = None, default: float = 1.0):
+        self.rates = dict(rates or {})
+        self.default = default
+
+    @classmethod
+    def from_env(cls, env_var: str, defaults: Optional[Dict[str, float]] = None) -> "CategorySampler":
+        """解析 "SYSTEM_PROMPT=0.05,L2_INPUT=0.1,*=1" 形式的环境变量"""
+        rates = dict(defaults or {})
+        default = rates.pop("*", 1.0)
+        for part in os.getenv(env_var, "").split(","):
+            if "=" not in part:
+                continue
+            category, _, value = part.partition("=")
+            try:
+                rate = min(max(float(value), 0.0), 1.0)
+            except ValueError:
+                continue
+            if category.strip() == "*":
+                default = rate
+            else:
+                rates[category.strip()] = rate
+        return cls(rates, default)
+
+    def rate(self, category: str) -> float:
+        return self.rates.get(category, self.default)
+
+    def should_log(self, category: str, key: Optional[str] = None) -> bool:
+        rate = self.rate(category)
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        if key is None:
+            return random.random() < rate
+        return (zlib.crc32(f"{key}:{category}".encode("utf-8")) % 10000) < rate * 10000
+
+
+def build_formatter(log_format: Optional[str] = None) -> logging.Formatter:
+    log_format = log_format or os.getenv("LOG_FORMAT", "text")
+    if log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+
+def start_queue_listener(handlers: List[logging.Handler]) -> QueueHandler:
+    """
+    启动（或替换）后台写日志线程，返回挂在 logger 上的 QueueHandler。
+    进程退出时自动 flush。
+    """
+    global _listener, _log_queue
+    stop_queue_listener()
+
+    _log_queue = queue.Queue(-1)
+    _listener = QueueListener(_log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return LazyQueueHandler(_log_queue)
+
+
+def stop_queue_listener() -> None:
+    """停止后台线程并写完队列里剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def queue_handler_for(*handlers: logging.Handler) -> logging.Handler:
+    """
+    给独立 logger（propagate=False，如 chat.debug）用的后台 handler：
+    共享同一个后台队列线程时无法指定不同 handler，所以单独起一个 listener。
+    """
+    q: queue.Queue = queue.Queue(-1)
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return LazyQueueHandler(q)
+
+
+atexit.register(stop_queue_listener)
+
 
 def setup_logging():
     """Setup application logging with file and console output"""
     log_level = os.getenv("LOG_LEVEL", "INFO").upper()
-    log_format = os.getenv("LOG_FORMAT", "text")
-    
+    use_async = os.getenv("LOG_ASYNC", "true").lower() == "true"
+
     # Log file path - in backend directory
     log_dir = Path(__file__).parent.parent.parent  # backend/
     log_file = log_dir / "server.log"
 
-    if log_format == "json":
-        formatter = logging.Formatter(
-            '{"timestamp":"%(asctime)s","level":"%(levelname)s","name":"%(name)s","message":"%(message)s"}'
-        )
-    else:
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
+    formatter = build_formatter()
 
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
@@ -44,16 +188,21 @@ def setup_logging():
 
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level))
-    
+
     # Clear existing handlers to avoid duplicates on reload
     root_logger.handlers.clear()
-    
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
+
+    if use_async:
+        # 事件循环只入队，写 stdout / 文件在后台线程
+        root_logger.addHandler(start_queue_listener([console_handler, file_handler]))
+    else:
+        stop_queue_listener()
+        root_logger.addHandler(console_handler)
+        root_logger.addHandler(file_handler)
 
     # Set specific loggers
     logging.getLogger("uvicorn").setLevel(logging.INFO)
     logging.getLogger("httpx").setLevel(logging.WARNING)
     logging.getLogger("httpcore").setLevel(logging.WARNING)
 
-    logger.info(f"Logging initialized at {log_level} level, writing to {log_file}")
+    logger.info("Logging initialized at %s level, writing to %s (async=%s)", log_level, log_file, use_async)
@@ -0,0 +1,572 @@
+"""
+Metrics - Prometheus 文本格式指标
+=================================
+
+进程内指标注册表，/metrics 按 Prometheus text exposition format (0.0.4) 输出。
+不依赖 prometheus_client：只需要 Counter / Gauge / Histogram 三种类型和抓取时采集的回调。
+
+数据来源：
+- PerfTracker / perf_track       → 阶段延迟直方图
+- GrokService / 向量 embedding   → LLM token / 费用计数
+- V4 prompt 前缀布局              → provider 前缀缓存命中 token（按角色 / 阶段）
+- V4 JSON 解析                     → 解析路径计数（直接解码 / 提取 / 修复 / 失败）
+- LLM 路由                         → 对冲 / 降级 / 熔断事件；每条路由的 p95 与熔断状态（抓取时采集）
+- SQLAlchemy 连接池 / pgvector 池 → 连接池占用（抓取时采集）
+- prompt 片段 / 审核 / 认证缓存   → 命中率（抓取时采集）
+- task_supervisor / job_queue / 记忆抽取 → 后台队列深度（抓取时采集）
+- /chat/stream                    → SSE 首 token 延迟
+
+Usage:
+    from app.core.metrics import metrics, record_llm_usage
+
+    metrics.STAGE_LATENCY.labels(operation="chat", stage="llm").observe(1.2)
+    record_llm_usage("xai", "grok-4-1-fast-non-reasoning", usage, pricing)
+    text = metrics.render()
+"""
+
+import math
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 秒级延迟的默认桶：覆盖毫秒级预计算到几十秒的 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+# 采集回调返回 (metric 名, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+# 采集回调产出的指标族：metric 名 -> (kind, HELP)
+Families = Dict[str, Tuple[str, str]]
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[LabelValues, "_Metric"] = {}
+
+    def labels(self, *values: str, **kwargs: str):
+        if kwargs:
+            values = tuple(str(kwargs[n]) for n in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _series(self) -> Iterable[Tuple[LabelValues, "_Metric"]]:
+        if self.labelnames:
+            return list(self._children.items())
+        return [((), self)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(child._render_samples(self.name, self.labelnames, values))
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._children.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counter can only increase")
+        self.value += amount
+
+    def _render_samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self):
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float) -> None:
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        self.value -= amount
+
+    def _render_samples(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def _render_samples(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        bucket_labels = labelnames + ("le",)
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(
+                f"{name}_bucket{_format_labels(bucket_labels, values + (_format_value(bound),))} {cumulative}"
+            )
+        lines.append(f"{name}_bucket{_format_labels(bucket_labels, values + ('+Inf',))} {self.count}")
+        label_str = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{label_str} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{label_str} {self.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表 + 抓取时采集的回调"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Tuple[str, str, Families, Callable[[], Iterable[Sample]]]] = []
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = cls(name, documentation, labelnames, **kwargs)
+            self._metrics[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} already registered as {metric.kind}")
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(
+        self,
+        kind: str,
+        collector: Callable[[], Iterable[Sample]],
+        documentation: str = "",
+        families: Optional[Families] = None,
+    ) -> None:
+        """
+        注册抓取时运行的回调（gauge / counter），返回 (name, labels, value) 样本。
+        families 按 metric 名声明各自的 kind 与 HELP，未声明的用 kind / documentation。
+        回调抛异常时跳过，不影响其他指标。
+        """
+        self._collectors.append((kind, documentation, dict(families or {}), collector))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+
+        # 同名样本必须连续输出在一个 HELP / TYPE 之下，先按 metric 名归组
+        collected: Dict[str, Tuple[str, str, List[str]]] = {}
+        for kind, documentation, families, collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.debug(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, labels, value in samples:
+                family = collected.get(name)
+                if family is None:
+                    family_kind, family_doc = families.get(name, (kind, documentation))
+                    family = collected[name] = (family_kind, family_doc, [])
+                names = tuple(labels)
+                family[2].append(
+                    f"{name}{_format_labels(names, [labels[n] for n in names])} {_format_value(value)}"
+                )
+
+        for name, (kind, documentation, samples) in collected.items():
+            if documentation:
+                lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+# =============================================================================
+# 全局注册表与核心指标
+# =============================================================================
+
+registry = MetricsRegistry()
+
+
+class _AppMetrics:
+    """应用指标集合（属性即指标）"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+
+        self.OPERATION_LATENCY = registry.histogram(
+            "luna_operation_duration_seconds",
+            "Total duration of a PerfTracker operation (e.g. one chat turn)",
+            ["operation"],
+        )
+        self.STAGE_LATENCY = registry.histogram(
+            "luna_stage_duration_seconds",
+            "Duration of a PerfTracker stage",
+            ["operation", "stage"],
+        )
+        self.FUNCTION_LATENCY = registry.histogram(
+            "luna_function_duration_seconds",
+            "Duration of functions decorated with perf_track",
+            ["name"],
+        )
+        self.LLM_REQUESTS = registry.counter(
+            "luna_llm_requests_total",
+            "LLM / embedding API calls",
+            ["provider", "model", "kind"],
+        )
+        self.LLM_TOKENS = registry.counter(
+            "luna_llm_tokens_total",
+            "LLM / embedding tokens used",
+            ["provider", "model", "type"],
+        )
+        self.LLM_COST = registry.counter(
+            "luna_llm_cost_usd_total",
+            "Estimated LLM / embedding spend in USD",
+            ["provider", "model"],
+        )
+        self.PROMPT_PREFIX_REQUESTS = registry.counter(
+            "luna_prompt_prefix_requests_total",
+            "V4 chat calls by prompt prefix; hit=true when the provider reported cached prompt tokens",
+            ["character", "stage", "hit"],
+        )
+        self.PROMPT_PREFIX_TOKENS = registry.counter(
+            "luna_prompt_prefix_tokens_total",
+            "V4 chat prompt tokens by prompt prefix (type=prompt|cached)",
+            ["character", "stage", "type"],
+        )
+        self.LLM_JSON_PARSE = registry.counter(
+            "luna_llm_json_parse_total",
+            "V4 LLM reply parses by decode path (fast|extracted|repaired|failed)",
+            ["path"],
+        )
+        self.LLM_ROUTER_EVENTS = registry.counter(
+            "luna_llm_router_events_total",
+            "LLM router events per route (hedge|fallback|circuit_open)",
+            ["route", "event"],
+        )
+        self.CHAT_ADMISSION_REJECTED = registry.counter(
+            "luna_chat_admission_rejected_total",
+            "Chat turns shed by admission control (session_backlog|session_timeout|queue_full|queue_timeout)",
+            ["reason"],
+        )
+        self.RATE_LIMITED = registry.counter(
+            "luna_rate_limited_total",
+            "Requests rejected by the token-bucket rate limiter per route class",
+            ["route"],
+        )
+        self.SSE_TTFT = registry.histogram(
+            "luna_sse_time_to_first_token_seconds",
+            "Time from stream request start to the first content chunk",
+            ["endpoint"],
+        )
+
+    def render(self) -> str:
+        return self.registry.render()
+
+
+metrics = _AppMetrics(registry)
+
+
+def observe_perf(operation: str, total: float, stages: Dict[str, float]) -> None:
+    """PerfTracker 汇总 → 直方图"""
+    metrics.OPERATION_LATENCY.labels(operation=operation).observe(total)
+    for stage, elapsed in stages.items():
+        metrics.STAGE_LATENCY.labels(operation=operation, stage=stage).observe(elapsed)
+
+
+def record_llm_usage(
+    provider: str,
+    model: str,
+    usage: Optional[Dict],
+    pricing: Optional[Dict[str, float]] = None,
+    kind: str = "chat",
+) -> float:
+    """
+    记录一次 LLM / embedding 调用的 token 与费用。
+
+    Args:
+        usage: OpenAI 兼容的 usage（prompt_tokens / completion_tokens / total_tokens）
+        pricing: 每百万 token 单价 {"input": x, "output": y}
+    Returns:
+        估算费用（USD）
+    """
+    metrics.LLM_REQUESTS.labels(provider=provider, model=model, kind=kind).inc()
+    if not usage:
+        return 0.0
+
+    prompt_tokens = usage.get("prompt_tokens", 0) or 0
+    completion_tokens = usage.get("completion_tokens", 0) or 0
+    if not prompt_tokens and not completion_tokens:
+        prompt_tokens = usage.get("total_tokens", 0) or 0
+
+    if prompt_tokens:
+        metrics.LLM_TOKENS.labels(provider=provider, model=model, type="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        metrics.LLM_TOKENS.labels(provider=provider, model=model, type="completion").inc(completion_tokens)
+    cached_tokens = cached_prompt_tokens(usage)
+    if cached_tokens:
+        metrics.LLM_TOKENS.labels(provider=provider, model=model, type="cached").inc(cached_tokens)
+
+    cost = 0.0
+    if pricing:
+        cost = (prompt_tokens * pricing.get("input", 0.0) + completion_tokens * pricing.get("output", 0.0)) / 1_000_000
+        if cost > 0:
+            metrics.LLM_COST.labels(provider=provider, model=model).inc(cost)
+
+    span = current_span()
+    if span is not None:
+        span.set_attributes({
+            "llm.provider": provider,
+            "llm.model": model,
+            "llm.prompt_tokens": prompt_tokens,
+            "llm.completion_tokens": completion_tokens,
+            "llm.cached_tokens": cached_tokens,
+            "llm.cost_usd": round(cost, 8),
+        })
+    return cost
+
+
+def cached_prompt_tokens(usage: Optional[Dict]) -> int:
+    """provider 前缀缓存命中的 prompt token 数（OpenAI 兼容: usage.prompt_tokens_details.cached_tokens）"""
+    if not usage:
+        return 0
+    details = usage.get("prompt_tokens_details") or {}
+    return int(details.get("cached_tokens", 0) or usage.get("cached_tokens", 0) or 0)
+
+
+def record_prompt_prefix(character_id: str, stage: str, usage: Optional[Dict]) -> int:
+    """
+    记录一次 V4 对话调用的前缀缓存命中情况。
+
+    命中率 = luna_prompt_prefix_tokens_total{type="cached"} / {type="prompt"}
+    Returns:
+        命中的 prompt token 数
+    """
+    usage = usage or {}
+    prompt_tokens = usage.get("prompt_tokens", 0) or 0
+    cached_tokens = cached_prompt_tokens(usage)
+
+    metrics.PROMPT_PREFIX_REQUESTS.labels(
+        character=character_id, stage=stage, hit="true" if cached_tokens else "false"
+    ).inc()
+    if prompt_tokens:
+        metrics.PROMPT_PREFIX_TOKENS.labels(character=character_id, stage=stage, type="prompt").inc(prompt_tokens)
+    if cached_tokens:
+        metrics.PROMPT_PREFIX_TOKENS.labels(character=character_id, stage=stage, type="cached").inc(cached_tokens)
+    return cached_tokens
+
+
+# =============================================================================
+# 抓取时采集：连接池 / 缓存 / 后台队列 / LLM 路由 / 对话准入
+# =============================================================================
+
+def _collect_db_pool() -> Iterable[Sample]:
+    from app.core.database import get_pool_stats
+
+    for pool_name, stats in get_pool_stats().items():
+        for key, value in stats.items():
+            yield f"luna_db_pool_{key}", {"pool": pool_name}, value
+
+
+def _collect_cache_stats() -> Iterable[Sample]:
+    caches = []
+    try:
+        from app.services.prompt_fragment_cache import prompt_fragment_cache
+        caches.append(("prompt_fragment", prompt_fragment_cache.get_stats))
+    except Exception:
+        pass
+    try:
+        from app.services.v4.prompt_builder_v4 import prompt_builder_v4
+        caches.append(("prompt_static_fragment", prompt_builder_v4.get_fragment_stats))
+    except Exception:
+        pass
+    try:
+        from app.services.llm_service import llm_responses
+        caches.append(("llm_response", llm_responses.get_stats))
+    except Exception:
+        pass
+    try:
+        from app.utils.moderation import verdict_cache
+        caches.append(("moderation_verdict", verdict_cache.get_stats))
+    except Exception:
+        pass
+    try:
+        from app.core.principal_cache import principal_cache
+        caches.append(("auth_principal", principal_cache.get_stats))
+    except Exception:
+        pass
+
+    for cache_name, get_stats in caches:
+        stats = get_stats()
+        labels = {"cache": cache_name}
+        yield "luna_cache_hit_ratio", labels, stats.get("hit_rate", 0.0)
+        yield "luna_cache_entries", labels, stats.get("entries", 0)
+        yield "luna_cache_hits_total", labels, stats.get("hits", 0)
+        yield "luna_cache_misses_total", labels, stats.get("misses", 0)
+
+
+def _collect_queue_stats() -> Iterable[Sample]:
+    from app.core.task_supervisor import task_supervisor
+
+    for queue_name, stats in task_supervisor.get_stats().items():
+        labels = {"queue": queue_name}
+        yield "luna_background_queue_depth", labels, stats.get("depth", 0)
+        yield "luna_background_queue_in_flight", labels, stats.get("in_flight", 0)
+        yield "luna_background_queue_dropped_total", labels, stats.get("dropped", 0)
+        yield "luna_background_queue_failed_total", labels, stats.get("failed", 0)
+
+    try:
+        from app.services.memory_extraction_worker import memory_extraction_worker
+        yield "luna_background_queue_depth", {"queue": "memory_extraction_buffer"}, \
+            memory_extraction_worker.pending_turns()
+    except Exception:
+        pass
+
+    try:
+        from app.services.job_queue import job_queue
+        for key, value in job_queue.get_stats().items():
+            yield f"luna_job_queue_{key}_total", {}, value
+    except Exception:
+        pass
+
+
+def _collect_llm_routes() -> Iterable[Sample]:
+    from app.services.llm.router import llm_router
+
+    for route_name, stats in llm_router.get_stats()["routes"].items():
+        labels = {"route": route_name}
+        yield "luna_llm_route_latency_p95_seconds", labels, stats["p95"] or 0.0
+        yield "luna_llm_route_circuit_open", labels, 0 if stats["state"] == "closed" else 1
+
+
+def _collect_admission() -> Iterable[Sample]:
+    from app.core.admission import chat_admission
+
+    stats = chat_admission.get_stats()
+    yield "luna_chat_in_flight", {}, stats["in_flight"]
+    yield "luna_chat_queued", {}, stats["queued"]
+    yield "luna_chat_active_sessions", {}, stats["sessions"]
+
+
+registry.register_collector("gauge", _collect_db_pool, "Database connection pool usage", {
+    "luna_db_pool_size": ("gauge", "Connections currently open in the pool"),
+    "luna_db_pool_checked_out": ("gauge", "Connections currently checked out of the pool"),
+    "luna_db_pool_overflow": ("gauge", "Connections open beyond the pool size"),
+    "luna_db_pool_saturation": ("gauge", "Checked-out connections / pool capacity (0-1)"),
+})
+registry.register_collector("gauge", _collect_cache_stats, "In-process cache statistics", {
+    "luna_cache_hit_ratio": ("gauge", "Cache hits / lookups since process start"),
+    "luna_cache_entries": ("gauge", "Entries currently held by the cache"),
+    "luna_cache_hits_total": ("counter", "Cache lookups served from the cache"),
+    "luna_cache_misses_total": ("counter", "Cache lookups that missed"),
+})
+registry.register_collector("gauge", _collect_queue_stats, "Background work queue statistics", {
+    "luna_background_queue_depth": ("gauge", "Background tasks waiting in the queue"),
+    "luna_background_queue_in_flight": ("gauge", "Background tasks currently running"),
+    "luna_background_queue_dropped_total": ("counter", "Background tasks dropped because the queue was full"),
+    "luna_background_queue_failed_total": ("counter", "Background tasks that raised"),
+    "luna_job_queue_enqueued_total": ("counter", "Jobs enqueued by this process"),
+    "luna_job_queue_succeeded_total": ("counter", "Jobs completed by this worker"),
+    "luna_job_queue_failed_total": ("counter", "Jobs failed permanently on this worker"),
+    "luna_job_queue_retried_total": ("counter", "Job attempts scheduled for retry on this worker"),
+})
+registry.register_collector("gauge", _collect_llm_routes, "LLM route latency and circuit state", {
+    "luna_llm_route_latency_p95_seconds": ("gauge", "Recent p95 latency of the LLM route"),
+    "luna_llm_route_circuit_open": ("gauge", "1 when the route's circuit breaker is open or half-open"),
+})
+registry.register_collector("gauge", _collect_admission, "Chat admission in-flight / queued turns", {
+    "luna_chat_in_flight": ("gauge", "Chat turns currently holding an admission slot"),
+    "luna_chat_queued": ("gauge", "Chat turns waiting for an admission slot"),
+    "luna_chat_active_sessions": ("gauge", "Chat sessions with a turn running or waiting"),
+})
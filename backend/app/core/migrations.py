@@ -0,0 +1,232 @@
+"""
+Schema Migrations - 带版本号的数据库迁移
+=======================================
+
+以前每次进程启动都要 create_all（逐表自省）再逐列 SELECT 探测缺失字段，
+Serverless 冷启动的每个实例都要付一遍。现在：
+
+- schema_version 表记录已执行的迁移（每个版本一行）
+- 启动时只查一次 MAX(version)；落后时 DB_AUTO_MIGRATE=true 就地执行，否则只打警告。
+  未设置时 SQLite 开发库自动执行，Postgres 不自动
+- 迁移作为单独命令在部署时执行：
+    python -m app.core.migrations            # 执行所有未执行的迁移
+    python -m app.core.migrations status     # 查看当前版本
+- 没有部署前步骤的目标（Cloud Run 镜像 / Vercel）设置了 DB_AUTO_MIGRATE=true，
+  由第一个冷启动的实例执行（见 Dockerfile / vercel.json）
+
+新增迁移：在 MIGRATIONS 末尾追加 Migration(上一个版本号 + 1, 名称, (步骤, ...))，
+已发布的版本不再修改。步骤都是幂等的（建表 checkfirst、加列前检查、CREATE INDEX IF NOT EXISTS），
+对已经被旧的启动时迁移改过的库也能安全执行。每个迁移一个事务，Postgres 上用 advisory lock
+防止多个实例同时执行。
+"""
+
+import os
+import sys
+import asyncio
+import logging
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "")
+ADVISORY_LOCK_KEY = 7_310_452  # pg_advisory_xact_lock 的键，所有实例相同即可
+
+SCHEMA_VERSION_DDL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(128) NOT NULL,
+    applied_at TIMESTAMP NOT NULL
+)
+"""
+
+Step = Callable[[AsyncConnection], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class Migration:
+    """一个版本的迁移：按顺序执行 steps，在同一个事务里记入 schema_version"""
+    version: int
+    name: str
+    steps: Tuple[Step, ...]
+
+
+def model_metadata() -> list:
+    """所有 ORM 模型的 MetaData（导入模型模块以注册表）"""
+    from app.models.database.chat_models import Base as ChatBase
+    from app.models.database.billing_models import Base as BillingBase
+    from app.models.database.payment_models import Base as PaymentBase
+    from app.models.database import (  # noqa: F401
+        intimacy_models, gift_models, payment_models, emotion_models, stats_models,
+        user_settings_models, referral_models, date_models, image_models, interest_models,
+        memory_v2_models, user_memory_models, stamina_models, job_models,
+    )
+    return [ChatBase.metadata, BillingBase.metadata, PaymentBase.metadata]
+
+
+def create_all() -> Step:
+    """按模型建出所有缺失的表（已存在的表不动）"""
+    async def step(conn: AsyncConnection) -> None:
+        for metadata in model_metadata():
+            await conn.run_sync(metadata.create_all)
+    return step
+
+
+def add_column(table: str, column: str, sqlite_type: str, postgres_type: Optional[str] = None) -> Step:
+    """给已有表加列；列已存在时跳过"""
+    async def step(conn: AsyncConnection) -> None:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {postgres_type or sqlite_type}"
+            ))
+            return
+        columns = await conn.run_sync(lambda sync_conn: {c["name"] for c in inspect(sync_conn).get_columns(table)})
+        if column not in columns:
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {sqlite_type}"))
+    return step
+
+
+def create_index(name: str, table: str, *columns: str, unique: bool = False) -> Step:
+    """建索引（名称与模型 __table_args__ / index=True 生成的一致，新库上不会重复建）"""
+    sql = f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+
+    async def step(conn: AsyncConnection) -> None:
+        await conn.execute(text(sql))
+    return step
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", (create_all(),)),
+    # 以前散落在启动时探测和 migrations/ scripts/ 里的加列
+    Migration(2, "legacy_columns", (
+        add_column("date_sessions", "is_extended", "BOOLEAN DEFAULT FALSE"),
+        add_column("chat_sessions", "intro_shown", "BOOLEAN DEFAULT FALSE"),
+        add_column("users", "stripe_customer_id", "VARCHAR(128)"),
+        create_index("ix_users_stripe_customer_id", "users", "stripe_customer_id", unique=True),
+    )),
+    Migration(3, "chat_session_summary", (
+        add_column("chat_sessions", "context_summary", "TEXT"),
+        add_column("chat_sessions", "summary_until", "DATETIME", "TIMESTAMP"),
+    )),
+    # 最近消息 / 摘要点之后的消息 / 分页都是 session_id = ? ORDER BY created_at
+    Migration(4, "chat_messages_session_created_index", (
+        create_index("idx_chat_messages_session_created", "chat_messages", "session_id", "created_at"),
+    )),
+    # 以前的 migrations/add_effect_columns.sql 和 add_consecutive_checkin_column.py；
+    # payment_models 有自己的 Base，之前的 create_all 没覆盖 user_subscriptions，先补建表
+    Migration(5, "gift_effect_and_checkin_columns", (
+        create_all(),
+        add_column("active_effects", "stage_boost", "INTEGER DEFAULT 0"),
+        add_column("active_effects", "allows_nsfw", "INTEGER DEFAULT 0"),
+        add_column("active_effects", "xp_multiplier", "REAL DEFAULT 1.0", "DOUBLE PRECISION DEFAULT 1.0"),
+        add_column("user_subscriptions", "consecutive_checkin_days", "INTEGER DEFAULT 0"),
+    )),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def current_version(engine: AsyncEngine) -> int:
+    """已执行到的版本（一次查询）；还没有 schema_version 表时为 0"""
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text("SELECT MAX(version) FROM schema_version"))
+            return result.scalar() or 0
+    except Exception:
+        return 0
+
+
+async def migrate(engine: AsyncEngine, target: Optional[int] = None) -> List[int]:
+    """
+    执行所有未执行的迁移（可指定 target 版本）
+
+    Returns:
+        本次执行的版本号列表
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(SCHEMA_VERSION_DDL))
+
+    applied = []
+    for migration in MIGRATIONS:
+        if target is not None and migration.version > target:
+            break
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            done = await conn.execute(
+                text("SELECT 1 FROM schema_version WHERE version = :version"), {"version": migration.version}
+            )
+            if done.first() is not None:
+                continue
+            for step in migration.steps:
+                await step(conn)
+            await conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+                {"version": migration.version, "name": migration.name, "applied_at": datetime.utcnow()},
+            )
+        applied.append(migration.version)
+        logger.info(f"Migration {migration.version} ({migration.name}) applied")
+    return applied
+
+
+def _auto_migrate(engine: AsyncEngine) -> bool:
+    if AUTO_MIGRATE:
+        return AUTO_MIGRATE.lower() == "true"
+    return engine.dialect.name == "sqlite"
+
+
+async def ensure_schema(engine: AsyncEngine) -> int:
+    """
+    启动时的版本检查：最新则直接返回；落后时按 DB_AUTO_MIGRATE 决定执行还是只警告
+
+    Returns:
+        检查（或迁移）后的版本
+    """
+    version = await current_version(engine)
+    if version >= LATEST_VERSION:
+        return version
+    if _auto_migrate(engine):
+        await migrate(engine)
+        return LATEST_VERSION
+    logger.warning(
+        f"Database schema is at version {version}, code expects {LATEST_VERSION}. "
+        f"Run `python -m app.core.migrations` before serving traffic."
+    )
+    return version
+
+
+async def _main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.core.migrations", description="Versioned schema migrations")
+    parser.add_argument("command", nargs="?", default="upgrade", choices=["upgrade", "status"])
+    parser.add_argument("--target", type=int, default=None, help="migrate up to this version")
+    args = parser.parse_args(argv)
+
+    from app.core.database import create_engine_from_env
+
+    engine = create_engine_from_env()
+    try:
+        version = await current_version(engine)
+        if args.command == "status":
+            pending = [m for m in MIGRATIONS if m.version > version]
+            print(f"schema version: {version} (latest {LATEST_VERSION})")
+            for m in pending:
+                print(f"  pending: {m.version} {m.name}")
+            return 0
+        applied = await migrate(engine, target=args.target)
+        print(f"schema version: {version} -> {await current_version(engine)} (applied {applied or 'nothing'})")
+        return 0
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1:])))
@@ -22,6 +22,10 @@ Usage:
     with tracker.track("llm"):
         ...
     tracker.log_summary("chat")  # [PERF] chat: 1.23s (precompute: 0.12s, llm: 1.05s)
+
+阶段耗时同时写入 app.core.metrics 的直方图（/metrics 输出）；
+在请求范围内时摘要末尾附带 SQL 统计，如 "db: 12q/0.05s"。
+开启追踪（TRACE_EXPORTER）时每个阶段同时是一个 span（app.core.tracing）。
 """
 
 import time
@@ -30,6 +34,10 @@ import functools
 from typing import Optional, Dict
 from contextlib import contextmanager, asynccontextmanager
 
+from app.core.metrics import metrics, observe_perf
+from app.core.query_stats import current_query_stats
+from app.core.tracing import tracer
+
 logger = logging.getLogger(__name__)
 
 
@@ -90,7 +98,8 @@ class PerfTracker:
         """同步追踪一个阶段"""
         start = time.perf_counter()
         try:
-            yield
+            with tracer.start_span(name, attributes={"perf.stage": name}):
+                yield
         finally:
             elapsed = time.perf_counter() - start
             self.stages[name] = elapsed
@@ -100,7 +109,8 @@ class PerfTracker:
         """异步追踪一个阶段"""
         start = time.perf_counter()
         try:
-            yield
+            with tracer.start_span(name, attributes={"perf.stage": name}):
+                yield
         finally:
             elapsed = time.perf_counter() - start
             self.stages[name] = elapsed
@@ -125,8 +135,9 @@ class PerfTracker:
             格式化的摘要，如 "chat: 1.23s (l1: 0.12s, llm: 1.05s)"
         """
         total = self.total_elapsed
+        query_stats = current_query_stats()
         
-        if not self.stages:
+        if not self.stages and not (query_stats and query_stats.count):
             return f"{operation}: {total:.2f}s"
         
         # 格式化各阶段
@@ -134,9 +145,17 @@ class PerfTracker:
         for name, elapsed in self.stages.items():
             stage_parts.append(f"{name}: {elapsed:.2f}s")
         
+        # 当前请求的 SQL 统计（LoggingMiddleware 建立的 query_scope）
+        if query_stats and query_stats.count:
+            stage_parts.append(query_stats.summary())
+        
         stages_str = ", ".join(stage_parts)
         return f"{operation}: {total:.2f}s ({stages_str})"
     
+    def record_metrics(self, operation: str):
+        """把总耗时和各阶段耗时写入延迟直方图"""
+        observe_perf(operation, self.total_elapsed, self.stages)
+    
     def log_summary(self, operation: str, level: str = "INFO"):
         """
         输出性能日志
@@ -148,10 +167,16 @@ class PerfTracker:
         summary = self.get_summary(operation)
         log_msg = f"[PERF] {summary}"
         
+        self.record_metrics(operation)
+        
         log_func = getattr(logger, level.lower(), logger.info)
         log_func(log_msg)
 
 
+def _observe_function(name: str, elapsed: float):
+    metrics.FUNCTION_LATENCY.labels(name=name).observe(elapsed)
+
+
 def perf_track(name: str):
     """
     性能追踪装饰器，自动记录函数执行时间
@@ -169,6 +194,7 @@ def perf_track(name: str):
                 return await func(*args, **kwargs)
             finally:
                 elapsed = time.perf_counter() - start
+                _observe_function(name, elapsed)
                 logger.debug(f"[PERF] {name}: {elapsed:.3f}s")
         
         @functools.wraps(func)
@@ -178,6 +204,7 @@ def perf_track(name: str):
                 return func(*args, **kwargs)
             finally:
                 elapsed = time.perf_counter() - start
+                _observe_function(name, elapsed)
                 logger.debug(f"[PERF] {name}: {elapsed:.3f}s")
         
         # 判断是否为异步函数
@@ -0,0 +1,184 @@
+"""
+Principal Cache - 已验证 token 的身份缓存
+=========================================
+
+AuthMiddleware 每个请求都要解析 token、查用户邮箱、查订阅状态（读订阅记录，
+过期时还会写库）。轮询类的轻量接口也一样要付这部分数据库开销。
+
+这里按 token 的 sha256 缓存解析结果（user_id / email / 有效订阅等级）：
+- 过期时间取 min(token 自带 exp, TTL)
+- 订阅 / 支付 webhook 以及任何订阅记录写入都会按 user_id 失效
+- 同一个 token 并发未命中时只解析一次（single-flight）
+
+Usage:
+    context = await principal_cache.get_or_resolve(token, resolver)
+    principal_cache.invalidate(user_id)      # 订阅变更
+"""
+
+import os
+import time
+import json
+import base64
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app.models.schemas import UserContext
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_TTL = int(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = 50000
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def token_expiry(token: str) -> Optional[float]:
+    """
+    读取 JWT 形式 token 的 exp（只用于缓存过期时间，不做签名校验）。
+    非 JWT（guest_token_xxx / luna_token_xxx）返回 None。
+    """
+    parts = token.split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        exp = json.loads(base64.urlsafe_b64decode(payload)).get("exp")
+        return float(exp) if exp is not None else None
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+class PrincipalCache:
+    """token hash → UserContext，带 TTL / LRU / 按用户失效"""
+
+    def __init__(self, ttl_seconds: int = PRINCIPAL_CACHE_TTL, max_entries: int = PRINCIPAL_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # value: (过期时间 wall clock, UserContext)
+        self._entries: "OrderedDict[str, Tuple[float, UserContext]]" = OrderedDict()
+        self._by_user: Dict[str, Set[str]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[UserContext]:
+        key = token_hash(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.time():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1].model_copy()
+
+    def set(self, token: str, context: UserContext) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        exp = token_expiry(token)
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+            if expires_at <= time.time():
+                return
+
+        key = token_hash(token)
+        self._remove(key)
+        self._entries[key] = (expires_at, context.model_copy())
+        self._by_user.setdefault(context.user_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    async def get_or_resolve(
+        self,
+        token: str,
+        resolver: Callable[[str], Awaitable[Optional[UserContext]]],
+    ) -> Optional[UserContext]:
+        """命中直接返回；未命中调用 resolver，同一 token 的并发请求共享一次解析"""
+        cached = self.get(token)
+        if cached is not None:
+            return cached
+
+        key = token_hash(token)
+        pending = self._inflight.get(key)
+        if pending is not None:
+            context = await asyncio.shield(pending)
+            return context.model_copy() if context else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            context = await resolver(token)
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        # 失败的 token 不缓存（可能是用户还没写入数据库）
+        if context is not None:
+            self.set(token, context)
+        future.set_result(context)
+        return context
+
+    def invalidate(self, user_id: Optional[str] = None) -> int:
+        """按用户失效；user_id 为 None 时清空全部（无法定位用户的 webhook）"""
+        if user_id is None:
+            count = len(self._entries)
+            self._entries.clear()
+            self._by_user.clear()
+        else:
+            keys = self._by_user.pop(str(user_id), set())
+            for key in keys:
+                self._entries.pop(key, None)
+            count = len(keys)
+        self.invalidations += 1
+        if count:
+            logger.debug(f"Principal cache invalidated: user={user_id}, entries={count}")
+        return count
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_user.get(entry[1].user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[entry[1].user_id]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._by_user.clear()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_principal(user_id: Optional[str] = None) -> int:
+    """订阅 / 支付状态变化后调用"""
+    return principal_cache.invalidate(user_id)
@@ -0,0 +1,188 @@
+"""
+Query Stats - 每请求 SQL 统计与 N+1 检测
+========================================
+
+挂在 SQLAlchemy engine（before/after_cursor_execute）和 VectorService 的 asyncpg
+连接（add_query_logger）上，按请求统计：
+- 语句数、数据库总耗时
+- 语句"形状"（去掉字面量、折叠 IN 列表后的 SQL）出现次数
+
+同一形状在一个请求里出现超过 DB_N_PLUS_ONE_THRESHOLD 次时记一条 warning
+（典型的 N+1：循环里逐条查询）。结果进入 PerfTracker 摘要和 /metrics。
+
+请求范围由 LoggingMiddleware 的 query_scope() 建立；范围之外（后台任务）只计全局计数。
+开启追踪时每条语句补记为当前 span 下的一个 "db.query" span。
+
+Usage:
+    with query_scope("GET /api/v1/chat/sessions") as stats:
+        ...
+    stats.count, stats.total_time, stats.repeated()
+"""
+
+import os
+import re
+import time
+import logging
+import functools
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from app.core.metrics import registry
+from app.core.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+N_PLUS_ONE_THRESHOLD = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "10"))
+
+QUERIES_TOTAL = registry.counter(
+    "luna_db_queries_total", "SQL statements executed", ["source"],
+)
+QUERIES_PER_REQUEST = registry.histogram(
+    "luna_db_queries_per_request", "SQL statements issued by one request",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_TIME_PER_REQUEST = registry.histogram(
+    "luna_db_time_per_request_seconds", "Total database time of one request",
+)
+N_PLUS_ONE_TOTAL = registry.counter(
+    "luna_db_n_plus_one_total", "Requests that repeated one statement shape above the threshold",
+)
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_POSITIONAL = re.compile(r"\$\d+|%\(\w+\)s|:\w+\b|%s")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def statement_shape(sql: str) -> str:
+    """
+    归一化 SQL：字面量和各种占位符都变成 ?，IN 列表折叠，空白合并。
+    SQLAlchemy 的语句本身已参数化，这一步主要处理 expanding IN 和手写 SQL。
+    """
+    shape = _STRING_LITERAL.sub("?", sql)
+    shape = _POSITIONAL.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("?...", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryStats:
+    """一个请求范围内的 SQL 统计"""
+
+    __slots__ = ("name", "count", "total_time", "shapes")
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.count = 0
+        self.total_time = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, sql: str, elapsed: float) -> None:
+        self.count += 1
+        self.total_time += elapsed
+        self.shapes[statement_shape(sql)] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """出现次数超过阈值的语句形状（疑似 N+1）"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n > threshold]
+
+    def summary(self) -> str:
+        return f"db: {self.count}q/{self.total_time:.2f}s"
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "total_time_ms": round(self.total_time * 1000, 1),
+            "distinct_shapes": len(self.shapes),
+            "repeated": self.repeated(),
+        }
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def record_query(sql: str, elapsed: float, source: str = "sqlalchemy") -> None:
+    QUERIES_TOTAL.labels(source=source).inc()
+    if tracer.enabled:
+        tracer.record_span("db.query", elapsed, {
+            "db.system": source,
+            "db.statement": statement_shape(sql)[:500],
+        }, kind="client")
+    stats = _current.get()
+    if stats is not None:
+        stats.record(sql, elapsed)
+
+
+@contextmanager
+def query_scope(name: str = "", threshold: int = N_PLUS_ONE_THRESHOLD):
+    """建立一个请求范围；退出时写入指标，并对重复语句形状报 N+1"""
+    stats = QueryStats(name)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        if stats.count:
+            QUERIES_PER_REQUEST.observe(stats.count)
+            DB_TIME_PER_REQUEST.observe(stats.total_time)
+            repeated = stats.repeated(threshold)
+            if repeated:
+                N_PLUS_ONE_TOTAL.inc()
+                shape, n = repeated[0]
+                logger.warning(
+                    f"[N+1] {name}: statement repeated {n}x "
+                    f"({stats.count} queries, {stats.total_time:.3f}s): {shape[:200]}"
+                )
+
+
+# =============================================================================
+# SQLAlchemy
+# =============================================================================
+
+def instrument_engine(engine) -> None:
+    """给 SQLAlchemy engine（AsyncEngine 或同步 Engine）挂上计时钩子，重复调用无副作用"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, "sync_engine", engine)
+    if getattr(sync_engine, "_query_stats_instrumented", False):
+        return
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("query_start")
+        if starts:
+            record_query(statement, time.perf_counter() - starts.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    sync_engine._query_stats_instrumented = True
+
+
+# =============================================================================
+# asyncpg (VectorService)
+# =============================================================================
+
+def _asyncpg_query_logger(record) -> None:
+    record_query(record.query, record.elapsed or 0.0, source="asyncpg")
+
+
+async def instrument_asyncpg_connection(conn) -> None:
+    """asyncpg.create_pool(init=...) 回调：每条新连接挂上 query logger"""
+    conn.add_query_logger(_asyncpg_query_logger)
@@ -0,0 +1,188 @@
+"""
+Rate Limiter - 令牌桶限流（Redis Lua 原子执行，进程内兜底）
+==========================================================
+
+每个桶有容量 capacity（允许的突发量）和补充速率 rate（令牌/秒）。一次请求同时检查
+多个桶（按用户 + 按 IP），只有所有桶都够才一起扣减，任何一个不够都不扣。
+
+- Redis 可用时：一段 Lua 脚本读-补充-扣减-写回，多实例共享同一份计数，原子执行
+- Redis 不可用（mock 模式 / 连接失败 / 脚本报错）：退回进程内令牌桶（LRU，最多
+  MAX_LOCAL_BUCKETS 个），单实例内仍然有效
+
+Usage:
+    result = await rate_limiter.hit([
+        (f"user:{user_id}:chat", RateLimitRule(capacity=10, per_minute=30)),
+        (f"ip:{ip}:chat", RateLimitRule(capacity=40, per_minute=120)),
+    ])
+    if not result.allowed:
+        ... 429, Retry-After: result.retry_after ...
+"""
+
+import math
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "rate_limit:"
+MAX_LOCAL_BUCKETS = 50000
+REDIS_RETRY_AFTER = 30.0  # Redis 出错后这段时间内直接走进程内，不再逐个请求试连
+
+# KEYS: 桶 key；ARGV: now, cost, 然后每个桶依次 capacity, rate
+# 返回 {allowed, 各桶剩余令牌（字符串，避免 Lua number 被截成整数）}
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local levels = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    if level < cost then
+        allowed = 0
+    end
+    levels[i] = level
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    if allowed == 1 then
+        levels[i] = levels[i] - cost
+    end
+    redis.call('HSET', key, 'tokens', levels[i], 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil((capacity - levels[i]) / rate * 1000) + 1000)
+    levels[i] = tostring(levels[i])
+end
+return {allowed, unpack(levels)}
+"""
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """令牌桶参数：capacity 突发上限，per_minute 每分钟补充的令牌数"""
+    capacity: int
+    per_minute: float
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+
+@dataclass
+class RateLimitResult:
+    """一次检查的结果；limit / remaining / reset_after 取最紧的那个桶"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: int   # 秒，桶重新补满
+    retry_after: int   # 秒，被拒绝时多久后够一次请求；放行时为 0
+    backend: str = "local"
+
+
+Bucket = Tuple[str, RateLimitRule]
+
+
+def _refill(level: Optional[float], ts: Optional[float], rule: RateLimitRule, now: float) -> float:
+    if level is None:
+        return float(rule.capacity)
+    return min(rule.capacity, level + max(0.0, now - ts) * rule.rate)
+
+
+def _summarize(buckets: Sequence[Bucket], levels: List[float], allowed: bool, cost: int,
+               backend: str) -> RateLimitResult:
+    """按剩余比例最小的桶生成结果（它决定响应头和 Retry-After）"""
+    index = min(range(len(buckets)), key=lambda i: levels[i] / buckets[i][1].capacity)
+    rule, level = buckets[index][1], levels[index]
+    retry_after = 0
+    if not allowed:
+        retry_after = max(
+            math.ceil((cost - levels[i]) / rule_i.rate)
+            for i, (_, rule_i) in enumerate(buckets) if levels[i] < cost
+        )
+    return RateLimitResult(
+        allowed=allowed,
+        limit=rule.capacity,
+        remaining=max(0, int(level)),
+        reset_after=math.ceil((rule.capacity - level) / rule.rate),
+        retry_after=max(1, retry_after) if not allowed else 0,
+        backend=backend,
+    )
+
+
+class TokenBucketLimiter:
+    """多桶令牌桶限流，Redis 优先，失败退回进程内"""
+
+    def __init__(self, max_local_buckets: int = MAX_LOCAL_BUCKETS):
+        self.max_local_buckets = max_local_buckets
+        self._local: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._script = None
+        self._script_client = None
+        self.redis_errors = 0
+        self._redis_down_until = 0.0
+
+    async def hit(self, buckets: Sequence[Bucket], cost: int = 1, redis=None) -> RateLimitResult:
+        """
+        检查并扣减一组桶（全部够才扣）
+
+        Args:
+            redis: 指定 Redis 客户端；默认取 app.core.redis 的全局客户端
+        """
+        if redis is None and time.monotonic() >= self._redis_down_until:
+            try:
+                from app.core.redis import get_redis
+                redis = await get_redis()
+            except Exception:
+                redis = None
+        if redis is not None and hasattr(redis, "register_script"):
+            try:
+                return await self._hit_redis(redis, buckets, cost)
+            except Exception as e:
+                self.redis_errors += 1
+                self._redis_down_until = time.monotonic() + REDIS_RETRY_AFTER
+                logger.warning(f"[RateLimit] Redis token bucket failed, using in-process fallback: {e}")
+        return self._hit_local(buckets, cost)
+
+    async def _hit_redis(self, redis, buckets: Sequence[Bucket], cost: int) -> RateLimitResult:
+        if self._script is None or self._script_client is not redis:
+            # register_script 走 EVALSHA，脚本不在缓存里时自动 EVAL
+            self._script = redis.register_script(TOKEN_BUCKET_LUA)
+            self._script_client = redis
+        args: list = [time.time(), cost]
+        for _, rule in buckets:
+            args += [rule.capacity, rule.rate]
+        reply = await self._script(keys=[KEY_PREFIX + key for key, _ in buckets], args=args)
+        levels = [float(level) for level in reply[1:]]
+        return _summarize(buckets, levels, bool(int(reply[0])), cost, "redis")
+
+    def _hit_local(self, buckets: Sequence[Bucket], cost: int) -> RateLimitResult:
+        now = time.time()
+        levels = []
+        for key, rule in buckets:
+            level, ts = self._local.get(key, (None, None))
+            levels.append(_refill(level, ts, rule, now))
+        allowed = all(level >= cost for level in levels)
+        if allowed:
+            levels = [level - cost for level in levels]
+        for (key, _), level in zip(buckets, levels):
+            self._local[key] = (level, now)
+            self._local.move_to_end(key)
+        while len(self._local) > self.max_local_buckets:
+            self._local.popitem(last=False)
+        return _summarize(buckets, levels, allowed, cost, "local")
+
+    def reset(self) -> None:
+        self._local.clear()
+        self._redis_down_until = 0.0
+
+    def get_stats(self) -> dict:
+        return {"local_buckets": len(self._local), "redis_errors": self.redis_errors}
+
+
+rate_limiter = TokenBucketLimiter()
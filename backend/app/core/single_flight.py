@@ -0,0 +1,108 @@
+"""
+Single Flight - 相同请求合并 + 可选 TTL 结果缓存
+================================================
+
+客户端重试、多个标签页同时打开时，同样的生成请求会并发打到 LLM（或同样的写操作
+并发执行）。SingleFlight 按 key 合并：
+
+- 同一 key 已有在途调用时，后来者等待同一个结果（成功或异常都共享），不再发起新调用
+- do(..., ttl=秒数) 时成功结果再缓存 ttl 秒（LRU，最多 max_entries 条）；异常不缓存
+- 在途调用用 shield 保护：某个等待方被取消不会取消共享的调用
+
+key 一般用 request_key(...) 对请求的规范化表示取 sha256（dict 按键排序）。
+
+Usage:
+    flight = SingleFlight("llm_response")
+    key = request_key(model, messages, {"temperature": 0.8})
+    result = await flight.do(key, lambda: call_llm(...), ttl=600)
+    flight.get_stats()
+"""
+
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MAX_ENTRIES = 1000
+
+
+def request_key(*parts: Any) -> str:
+    """请求的规范化哈希（dict 按键排序，非 JSON 类型按 str 处理）"""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """按 key 合并并发调用，可选缓存成功结果"""
+
+    def __init__(self, name: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.max_entries = max_entries
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._cache: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[T]], ttl: float = 0) -> T:
+        """
+        执行 factory()；同 key 的并发调用共享结果
+
+        Args:
+            ttl: >0 时成功结果缓存 ttl 秒
+        """
+        if ttl > 0:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._cache[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._finish(key, f, ttl))
+        return await asyncio.shield(future)
+
+    def _finish(self, key: str, future: asyncio.Future, ttl: float) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.cancelled():
+            return
+        if future.exception() is not None:  # 同时标记异常已被读取（等待方可能都已取消）
+            return
+        if ttl > 0:
+            self._cache[key] = (time.monotonic() + ttl, future.result())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, key: str) -> None:
+        self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._cache),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+        }
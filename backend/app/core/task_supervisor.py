@@ -0,0 +1,305 @@
+"""
+Background Task Supervisor
+==========================
+
+有界的后台任务调度器，替代裸 asyncio.create_task。
+
+- 命名队列，每个队列独立的并发上限和长度上限（满了直接丢弃并计数）
+- 队列内按优先级出队（数字越小越先执行）
+- 失败重试（指数退避 + 抖动）
+- 持有所有任务引用，不会被 GC 回收
+- 关闭时优雅 drain：停止接收新任务，等待队列清空，超时后取消
+- 提交时记下当前 span，任务执行时的 span 挂在发起请求的 trace 下
+- worker 在空的 contextvars 上下文里启动：首次请求时懒启动也不会继承该请求的
+  上下文（如 query_stats 的 QueryStats），后台任务的查询不会记到那个请求头上
+
+Usage:
+    # app lifespan
+    task_supervisor.start()
+    ...
+    await task_supervisor.shutdown(timeout=10)
+
+    # 提交任务（传入返回 coroutine 的函数，重试时会重新调用）
+    task_supervisor.submit(
+        "post_update",
+        lambda: update_emotion(user_id, character_id, delta),
+        name="emotion",
+        priority=PRIORITY_HIGH,
+    )
+"""
+
+import time
+import random
+import asyncio
+import logging
+import itertools
+import contextvars
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.core.tracing import tracer, current_span
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 10
+
+
+@dataclass
+class QueueConfig:
+    """队列配置"""
+    concurrency: int = 4          # 同时执行的任务数
+    max_size: int = 1000          # 排队上限，超过后丢弃
+    retries: int = 0              # 默认重试次数
+    retry_base_delay: float = 0.5  # 重试基础延迟（秒）
+    retry_max_delay: float = 10.0
+
+
+# 默认队列：对话后置更新（情绪/XP 优先于记忆提取）
+DEFAULT_QUEUES: Dict[str, QueueConfig] = {
+    "post_update": QueueConfig(concurrency=8, max_size=2000),
+}
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    name: str = field(compare=False)
+    factory: Callable[[], Awaitable[Any]] = field(compare=False)
+    retries: int = field(compare=False, default=0)
+    attempt: int = field(compare=False, default=0)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    trace_parent: Any = field(compare=False, default=None)
+
+
+@dataclass
+class QueueStats:
+    """队列指标"""
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    retried: int = 0
+    dropped: int = 0
+    in_flight: int = 0
+    total_wait_seconds: float = 0.0
+    total_run_seconds: float = 0.0
+
+
+class _SupervisedQueue:
+    """单个命名队列：优先级队列 + 固定数量的 worker"""
+
+    def __init__(self, name: str, config: QueueConfig):
+        self.name = name
+        self.config = config
+        self.queue: "asyncio.PriorityQueue[_Job]" = asyncio.PriorityQueue()
+        self.workers: List[asyncio.Task] = []
+        self.stats = QueueStats()
+
+    def start(self) -> None:
+        for i in range(self.config.concurrency):
+            self.workers.append(
+                asyncio.create_task(
+                    self._worker(), name=f"supervisor:{self.name}:{i}", context=contextvars.Context()
+                )
+            )
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: _Job) -> None:
+        self.stats.total_wait_seconds += time.monotonic() - job.enqueued_at
+        self.stats.in_flight += 1
+        started = time.monotonic()
+        try:
+            while True:
+                try:
+                    with tracer.start_span(
+                        f"task {self.name}/{job.name}",
+                        attributes={"task.queue": self.name, "task.attempt": job.attempt},
+                        parent=job.trace_parent,
+                    ):
+                        await job.factory()
+                    self.stats.completed += 1
+                    return
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    if job.attempt >= job.retries:
+                        self.stats.failed += 1
+                        logger.error(
+                            f"❌ Background task failed: {self.name}/{job.name} "
+                            f"after {job.attempt + 1} attempt(s): {e}",
+                            exc_info=True,
+                        )
+                        return
+
+                    delay = min(
+                        self.config.retry_max_delay,
+                        self.config.retry_base_delay * (2 ** job.attempt),
+                    ) * random.uniform(0.5, 1.5)
+                    job.attempt += 1
+                    self.stats.retried += 1
+                    logger.warning(
+                        f"Background task {self.name}/{job.name} failed ({e}), "
+                        f"retry {job.attempt}/{job.retries} in {delay:.2f}s"
+                    )
+                    await asyncio.sleep(delay)
+        finally:
+            self.stats.in_flight -= 1
+            self.stats.total_run_seconds += time.monotonic() - started
+
+
+class TaskSupervisor:
+    """
+    后台任务调度器（由 app lifespan 持有）
+
+    start() 之前提交的任务会触发懒启动，保证脚本/测试里也能用。
+    """
+
+    def __init__(self, queues: Optional[Dict[str, QueueConfig]] = None):
+        self._configs: Dict[str, QueueConfig] = dict(queues or DEFAULT_QUEUES)
+        self._queues: Dict[str, _SupervisedQueue] = {}
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._accepting = True
+
+    def configure_queue(self, name: str, config: QueueConfig) -> None:
+        """注册或修改队列配置（需在 start 之前）"""
+        if name in self._queues:
+            raise RuntimeError(f"Queue already started: {name}")
+        self._configs[name] = config
+
+    @property
+    def started(self) -> bool:
+        return self._loop is not None
+
+    def start(self) -> None:
+        """启动所有队列的 worker"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # 新的事件循环（如测试）→ 旧 worker 已不可用，重建
+        self._queues.clear()
+        self._loop = loop
+        self._accepting = True
+        for name, config in self._configs.items():
+            q = _SupervisedQueue(name, config)
+            q.start()
+            self._queues[name] = q
+        logger.info(f"Task supervisor started: {', '.join(self._queues)}")
+
+    def submit(
+        self,
+        queue: str,
+        factory: Callable[[], Awaitable[Any]],
+        *,
+        name: str = "task",
+        priority: int = PRIORITY_NORMAL,
+        retries: Optional[int] = None,
+    ) -> bool:
+        """
+        提交后台任务
+
+        Args:
+            queue: 队列名
+            factory: 返回 coroutine 的函数（重试时重新调用）
+            name: 任务名（日志/指标用）
+            priority: 优先级，数字越小越先执行
+            retries: 失败重试次数，None 时使用队列默认值
+
+        Returns:
+            是否入队成功（队列满或正在关闭时返回 False）
+        """
+        if not self._accepting:
+            logger.warning(f"Task supervisor shutting down, dropped {queue}/{name}")
+            return False
+
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+        if self._loop is not running_loop:
+            self.start()
+
+        q = self._queues.get(queue)
+        if q is None:
+            raise KeyError(f"Unknown task queue: {queue}")
+
+        q.stats.submitted += 1
+        if q.depth >= q.config.max_size:
+            q.stats.dropped += 1
+            logger.warning(f"⚠️ Task queue '{queue}' full ({q.depth}), dropped {name}")
+            return False
+
+        q.queue.put_nowait(_Job(
+            priority=priority,
+            seq=next(self._seq),
+            name=name,
+            factory=factory,
+            retries=q.config.retries if retries is None else retries,
+            trace_parent=current_span(),
+        ))
+        return True
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """停止接收新任务，等待队列清空，超时后取消剩余任务"""
+        self._accepting = False
+        if not self._queues:
+            return
+
+        pending = sum(q.depth + q.stats.in_flight for q in self._queues.values())
+        if pending:
+            logger.info(f"Draining background tasks: {pending} pending")
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(q.queue.join() for q in self._queues.values())),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError:
+            remaining = sum(q.depth + q.stats.in_flight for q in self._queues.values())
+            logger.warning(f"Background task drain timed out, cancelling {remaining} task(s)")
+
+        workers = [w for q in self._queues.values() for w in q.workers]
+        for w in workers:
+            w.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+        self._queues.clear()
+        self._loop = None
+        logger.info("Task supervisor stopped")
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """各队列指标"""
+        stats = {}
+        for name, q in self._queues.items():
+            s = q.stats
+            finished = s.completed + s.failed
+            stats[name] = {
+                "depth": q.depth,
+                "in_flight": s.in_flight,
+                "concurrency": q.config.concurrency,
+                "submitted": s.submitted,
+                "completed": s.completed,
+                "failed": s.failed,
+                "retried": s.retried,
+                "dropped": s.dropped,
+                "avg_wait_ms": round(s.total_wait_seconds / finished * 1000, 1) if finished else 0.0,
+                "avg_run_ms": round(s.total_run_seconds / finished * 1000, 1) if finished else 0.0,
+            }
+        return stats
+
+
+# 全局实例（app lifespan 负责 start/shutdown）
+task_supervisor = TaskSupervisor()
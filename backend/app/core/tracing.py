@@ -0,0 +1,444 @@
+"""
+Tracing - 请求级 span 追踪
+==========================
+
+PerfTracker 只有扁平的阶段耗时，看不出嵌套 / 并发的工作（如 memory 阶段里的向量检索、
+请求结束后才跑的 post_update 任务）。这里提供一个轻量的 span 追踪：
+
+- 上下文通过 contextvar 传递；跨进程使用 W3C traceparent 头
+  （与 OpenTelemetry 的传播格式一致，上游网关 / 其他服务的 trace 可以接上）
+- span 导出为 OTLP 风格的 JSON（traceId / spanId / parentSpanId / 纳秒时间戳 / attributes），
+  一行一个，可离线分析或转成 OTLP 导入 Jaeger / Tempo
+- 埋点：LoggingMiddleware（根 span）、PerfTracker 阶段、ChatRepository / VectorService、
+  LLM / embedding HTTP 调用、SQL 语句、TaskSupervisor 后台任务（挂在发起请求的 trace 下）
+
+环境变量:
+    TRACE_EXPORTER=none|console|file   默认 none（不创建 span，开销只有一次判断）
+    TRACE_FILE=traces.jsonl            file 导出时的文件路径
+    TRACE_SAMPLE_RATE=1.0              根 span 采样率，子 span 跟随根 span
+
+Usage:
+    with tracer.start_span("memory.retrieve", attributes={"k": 5}) as span:
+        ...
+        span.set_attribute("hits", len(hits))
+
+    @traced("grok.chat")
+    async def chat(...): ...
+"""
+
+import os
+import json
+import time
+import queue
+import random
+import atexit
+import asyncio
+import inspect
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_UNSET = object()
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"
+
+
+class Span:
+    """一个 span；结束时交给 Tracer 导出"""
+
+    __slots__ = (
+        "name", "kind", "trace_id", "span_id", "parent_id", "sampled",
+        "start_ns", "end_ns", "attributes", "events", "status", "status_message", "_tracer",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        sampled: bool,
+        kind: str = "internal",
+        attributes: Optional[Dict[str, Any]] = None,
+        start_ns: Optional[int] = None,
+        tracer: Optional["Tracer"] = None,
+    ):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.events: List[Dict[str, Any]] = []
+        self.status = "UNSET"
+        self.status_message = ""
+        self._tracer = tracer
+
+    @property
+    def is_recording(self) -> bool:
+        return self.sampled and self.end_ns is None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if self.is_recording:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        if self.is_recording:
+            self.attributes.update(attributes)
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None) -> None:
+        if self.is_recording:
+            self.events.append({"name": name, "timeUnixNano": time.time_ns(), "attributes": attributes or {}})
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = "ERROR"
+        self.status_message = f"{type(exc).__name__}: {exc}"
+        self.add_event("exception", {
+            "exception.type": type(exc).__name__,
+            "exception.message": str(exc),
+        })
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        if self.sampled and self._tracer is not None:
+            self._tracer.export(self)
+
+    @property
+    def duration(self) -> float:
+        """耗时（秒），未结束时为到现在的耗时"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "events": self.events,
+            "status": {"code": self.status, "message": self.status_message},
+        }
+
+
+class _NoopSpan:
+    """追踪关闭时返回的空 span，所有操作都是空操作"""
+
+    name = ""
+    trace_id = "0" * 32
+    span_id = "0" * 16
+    parent_id = None
+    sampled = False
+    is_recording = False
+    traceparent = None
+    duration = 0.0
+
+    def set_attribute(self, key, value): pass
+    def set_attributes(self, attributes): pass
+    def add_event(self, name, attributes=None): pass
+    def record_exception(self, exc): pass
+    def end(self, end_ns=None): pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """解析 W3C traceparent："00-<trace_id 32hex>-<span_id 16hex>-<flags>"，非法时返回 None"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if version == "ff" or trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, sampled
+
+
+# =============================================================================
+# Exporters
+# =============================================================================
+
+class InMemorySpanExporter:
+    """测试用：保存导出的 span"""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span)
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+    def shutdown(self) -> None:
+        pass
+
+
+class ConsoleSpanExporter:
+    """每个 span 一条 INFO 日志（走日志后台队列）"""
+
+    def export(self, span: Span) -> None:
+        logger.info("[TRACE] %s", json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+
+    def shutdown(self) -> None:
+        pass
+
+
+class FileSpanExporter:
+    """追加写 JSONL 文件；写文件在后台线程，事件循环只入队"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._writer, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span) -> None:
+        self._queue.put_nowait(span)
+
+    def _writer(self) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                span = self._queue.get()
+                if span is None:
+                    f.flush()
+                    return
+                f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def shutdown(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put_nowait(None)
+            self._thread.join(timeout=5)
+
+
+# =============================================================================
+# Tracer
+# =============================================================================
+
+class Tracer:
+    """创建 span、维护当前 span、导出已结束的 span"""
+
+    def __init__(self, exporter=None, sample_rate: float = 1.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def configure(self, exporter=None, sample_rate: Optional[float] = None) -> None:
+        """替换导出器（None 关闭追踪）"""
+        if self.exporter is not None and self.exporter is not exporter:
+            self.exporter.shutdown()
+        self.exporter = exporter
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+
+    def export(self, span: Span) -> None:
+        exporter = self.exporter
+        if exporter is None:
+            return
+        try:
+            exporter.export(span)
+        except Exception as e:
+            logger.debug(f"Span export failed: {e}")
+
+    def create_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: str = "internal",
+        parent: Any = _UNSET,
+        traceparent: Optional[str] = None,
+        start_ns: Optional[int] = None,
+    ):
+        """
+        创建（但不激活）一个 span。
+
+        parent: 显式父 span（后台任务用）；默认取当前 span；None 表示新的根 span
+        traceparent: 上游传来的 W3C traceparent，仅在没有父 span 时使用
+        """
+        if self.exporter is None:
+            return NOOP_SPAN
+
+        if parent is _UNSET:
+            parent = _current_span.get()
+        if parent is NOOP_SPAN:
+            parent = None
+
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            remote = parse_traceparent(traceparent)
+            if remote:
+                trace_id, parent_id, sampled = remote
+            else:
+                trace_id, parent_id = _new_trace_id(), None
+                sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+        return Span(name, trace_id, parent_id, sampled, kind, attributes, start_ns, self)
+
+    @contextmanager
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: str = "internal",
+        parent: Any = _UNSET,
+        traceparent: Optional[str] = None,
+    ):
+        """创建并激活一个 span，退出时结束；异常记录到 span 后继续抛出"""
+        span = self.create_span(name, attributes, kind, parent, traceparent)
+        if span is NOOP_SPAN:
+            yield span
+            return
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def record_span(
+        self,
+        name: str,
+        elapsed: float,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: str = "internal",
+    ) -> None:
+        """补记一个刚结束的 span（已知耗时，如 SQL 语句），挂在当前 span 下"""
+        if self.exporter is None:
+            return
+        parent = _current_span.get()
+        if parent is None or not parent.sampled:
+            return
+        end_ns = time.time_ns()
+        span = self.create_span(name, attributes, kind, parent, start_ns=end_ns - int(elapsed * 1e9))
+        span.end(end_ns)
+
+
+def _exporter_from_env():
+    kind = os.getenv("TRACE_EXPORTER", "none").lower()
+    if kind == "console":
+        return ConsoleSpanExporter()
+    if kind == "file":
+        return FileSpanExporter(os.getenv("TRACE_FILE", "traces.jsonl"))
+    return None
+
+
+tracer = Tracer(
+    exporter=_exporter_from_env(),
+    sample_rate=float(os.getenv("TRACE_SAMPLE_RATE", "1.0")),
+)
+
+atexit.register(lambda: tracer.exporter and tracer.exporter.shutdown())
+
+
+def traced(name: Optional[str] = None, kind: str = "internal"):
+    """
+    追踪装饰器（同步 / 异步函数 / 异步生成器均可）
+
+    异步生成器的 span 不设为当前 span（yield 之间会切回调用方的上下文），
+    只记录从第一次迭代到结束的耗时。
+
+    Usage:
+        @traced("vector.search_memories")
+        async def search_memories(...): ...
+    """
+    def decorator(func: Callable):
+        span_name = name or func.__qualname__
+
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def asyncgen_wrapper(*args, **kwargs):
+                span = tracer.create_span(span_name, kind=kind)
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except Exception as e:
+                    span.record_exception(e)
+                    raise
+                finally:
+                    span.end()
+            return asyncgen_wrapper
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.start_span(span_name, kind=kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.start_span(span_name, kind=kind):
+                return func(*args, **kwargs)
+        return sync_wrapper
+
+    return decorator
+
+
+def trace_methods(prefix: str):
+    """
+    类装饰器：给所有公开的 async 方法（含 staticmethod / classmethod）加上 span，
+    span 名为 "<prefix>.<method>"。用于 repository 类。
+    """
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if attr.startswith("_"):
+                continue
+            wrapper_type = type(value) if isinstance(value, (staticmethod, classmethod)) else None
+            func = value.__func__ if wrapper_type else value
+            if not asyncio.iscoroutinefunction(func):
+                continue
+            wrapped = traced(f"{prefix}.{attr}")(func)
+            setattr(cls, attr, wrapper_type(wrapped) if wrapper_type else wrapped)
+        return cls
+
+    return decorator
@@ -12,8 +12,7 @@ load_dotenv()
 
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 import time
 
@@ -22,12 +21,16 @@ from app.core.logging import setup_logging, logger
 from app.core.database import init_db, close_db
 from app.core.redis import init_redis, close_redis
 from app.core.exceptions import AppException
+from app.core.metrics import metrics as app_metrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from app.middleware.auth_middleware import AuthMiddleware
 from app.middleware.billing_middleware import BillingMiddleware
+from app.middleware.admission_middleware import AdmissionMiddleware
+from app.middleware.rate_limit_middleware import RateLimitMiddleware
 from app.middleware.logging_middleware import LoggingMiddleware
+from app.middleware.gzip_middleware import StreamingAwareGZipMiddleware
 
 # Import routers
-from app.api.v1 import auth, chat, characters, wallet, market, voice, image, images, intimacy, pricing, payment, gifts, scenarios, emotion, user_settings, interests, referral, events, interactions, debug, dates, photos, stamina, push, daily_reward, admin, proactive, proactive_v2, user_insights, stories, telegram, memory
+from app.api.v1 import auth, chat, characters, wallet, market, voice, image, images, intimacy, pricing, payment, gifts, scenarios, emotion, user_settings, interests, referral, events, interactions, debug, dates, photos, stamina, push, daily_reward, admin, proactive, proactive_v2, user_insights, stories, telegram, memory, jobs
 
 
 # Lifespan context manager for startup/shutdown
@@ -44,6 +47,10 @@ async def lifespan(app: FastAPI):
     await init_db()
     logger.info("Database connection pool initialized")
     
+    # Merge admin character edits stored in the DB into the in-memory registry
+    from app.services.character_registry import character_registry
+    await character_registry.sync_from_db()
+    
     # Initialize Redis connection
     await init_redis()
     logger.info("Redis connection initialized")
@@ -59,6 +66,10 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Firebase initialization error: {e}")
     
+    # Start bounded background task queues (post-turn updates)
+    from app.core.task_supervisor import task_supervisor
+    task_supervisor.start()
+    
     logger.info("Application startup complete")
     
     yield
@@ -66,6 +77,11 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down AI Companion Backend...")
     
+    # Drain queued post-turn work, then flush buffered memory extraction before the DB goes away
+    await task_supervisor.shutdown(timeout=10)
+    from app.services.memory_extraction_worker import memory_extraction_worker
+    await memory_extraction_worker.drain()
+    
     await close_db()
     logger.info("Database connections closed")
     
@@ -149,13 +165,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# GZip compression
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# GZip compression (SSE endpoints bypass it so events are not buffered)
+app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=1000)
 
-# Custom middleware (order matters: last added = first executed)
-app.add_middleware(LoggingMiddleware)
+# Custom middleware - pure ASGI, sharing one RequestContext per request
+# (order matters: last added = first executed)
+app.add_middleware(AdmissionMiddleware)  # Chat turns: per-session ordering + global in-flight cap
 app.add_middleware(BillingMiddleware)  # Must be after Auth
+app.add_middleware(RateLimitMiddleware)  # Per-user / per-IP token buckets on expensive endpoints
 app.add_middleware(AuthMiddleware)     # Must be first (after logging)
+app.add_middleware(LoggingMiddleware)  # Outermost: timing + per-request SQL stats cover auth too
 
 
 # ============================================================================
@@ -229,6 +248,7 @@ app.include_router(user_insights.router, prefix="/api/v1", tags=["User Insights"
 app.include_router(stories.router, prefix="/api/v1", tags=["Stories"])
 app.include_router(telegram.router, prefix="/api/v1", tags=["Telegram"])
 app.include_router(memory.router,   prefix="/api/v1", tags=["Memory"])
+app.include_router(jobs.router,     prefix="/api/v1", tags=["Jobs"])
 
 # Static files (privacy policy, terms, etc.)
 import os
@@ -313,12 +333,10 @@ async def detailed_health_check():
 @app.get("/metrics", tags=["Monitoring"])
 async def metrics():
     """
-    Prometheus metrics endpoint.
-    TODO: Implement actual metrics collection.
+    Prometheus metrics endpoint (text exposition format).
+    Stage latency, LLM tokens/cost, DB pool, cache hit ratios, queue depth, SSE TTFT.
     """
-    return {
-        "message": "Metrics endpoint - integrate with prometheus_client"
-    }
+    return Response(content=app_metrics.render(), media_type=METRICS_CONTENT_TYPE)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+"""
+Admission Middleware
+对话入口的准入控制（pure ASGI）：同会话轮次串行 + 全局并发上限，过载时快速 429/503 + Retry-After。
+
+准入覆盖整个响应周期：流式回复（SSE）发完之前，会话锁和并发名额都不释放。
+session_id 从请求体里读（对话请求体很小，先整体读入，再原样回放给路由）。
+这时路由还没校验会话归属，会话锁按 (user_id, session_id) 取，别人的请求带上同一个
+session_id 也只会排在自己的锁上。必须放在 AuthMiddleware 之内（需要 ctx.user）。
+"""
+
+import json
+import logging
+from typing import Dict, Optional
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.admission import ADMISSION_ENABLED, AdmissionController, AdmissionRejected, chat_admission
+from app.middleware.context import get_request_context
+
+logger = logging.getLogger(__name__)
+
+ADMITTED_ENDPOINTS: Dict[str, str] = {
+    "/api/v1/chat/completions": "chat",
+    "/api/v1/chat/stream": "chat",
+}
+
+
+async def read_body(receive: Receive) -> bytes:
+    """读完整个请求体"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+def replay_body(body: bytes, receive: Receive) -> Receive:
+    """先返回已读入的请求体，之后的 receive（断连检测）交给原 receive"""
+    sent = False
+
+    async def replay() -> Message:
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+def session_key(body: bytes, user_id: Optional[str]) -> Optional[str]:
+    """会话锁的 key：user_id:session_id（没有 session_id 时不加会话锁）"""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or not payload.get("session_id"):
+        return None
+    return f"{user_id or ''}:{payload['session_id']}"
+
+
+def request_user_id(scope: Scope) -> Optional[str]:
+    user = get_request_context(scope).user or scope.get("state", {}).get("user")
+    if user is None:
+        return None
+    return str(user.user_id if hasattr(user, "user_id") else user.get("user_id"))
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI admission control for chat turns.
+
+    Non-chat paths and non-POST requests go straight to the app.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController = chat_admission,
+                 enabled: bool = ADMISSION_ENABLED):
+        self.app = app
+        self.controller = controller
+        self.enabled = enabled
+        self._paths = frozenset(ADMITTED_ENDPOINTS)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            not self.enabled
+            or scope["type"] != "http"
+            or scope.get("method") != "POST"
+            or scope["path"].rstrip("/") not in self._paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body = await read_body(receive)
+        try:
+            async with self.controller.turn(session_key(body, request_user_id(scope))):
+                await self.app(scope, replay_body(body, receive), send)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                status_code=e.status_code,
+                content={"error": e.reason, "message": str(e), "retry_after": e.retry_after},
+                headers={"Retry-After": str(e.retry_after)},
+            )
+            await response(scope, receive, send)
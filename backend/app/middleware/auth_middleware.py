@@ -4,13 +4,13 @@ Extracts and validates auth tokens, attaches user context to request.state
 """
 
 from typing import Optional
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Receive, Scope, Send
 import os
 import logging
 
 from app.models.schemas import UserContext
+from app.core.principal_cache import principal_cache
+from app.middleware.context import get_request_context, header, set_state
 
 logger = logging.getLogger(__name__)
 
@@ -75,68 +75,78 @@ async def fetch_email_from_firebase(firebase_uid: str) -> Optional[str]:
     return None
 
 
-class AuthMiddleware(BaseHTTPMiddleware):
+class AuthMiddleware:
     """
-    Middleware to extract user context from auth tokens.
+    Pure ASGI middleware to extract user context from auth tokens.
     In mock mode: creates a demo user context.
     In production: validates Firebase/JWT tokens.
+    
+    Sets request.state.user (and the shared RequestContext.user).
     """
 
+    PUBLIC_PATHS = frozenset({
+        "/",
+        "/health",
+        "/health/detailed",
+        "/docs",
+        "/redoc",
+        "/openapi.json",
+        "/metrics",
+        "/api/v1/auth/firebase",
+        "/api/v1/auth/google",
+        "/api/v1/auth/apple",
+        "/api/v1/market/packages",
+        "/api/v1/market/plans",
+        "/api/v1/characters",
+    })
+    PUBLIC_PREFIX = "/api/v1/auth"
+
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
         self.mock_mode = os.getenv("MOCK_AUTH", "true").lower() == "true"
-        self.public_paths = {
-            "/",
-            "/health",
-            "/health/detailed",
-            "/docs",
-            "/redoc",
-            "/openapi.json",
-            "/metrics",
-            "/api/v1/auth/firebase",
-            "/api/v1/auth/google",
-            "/api/v1/auth/apple",
-            "/api/v1/market/packages",
-            "/api/v1/market/plans",
-            "/api/v1/characters",
-        }
+        self.public_paths = self.PUBLIC_PATHS
+
+    def is_public(self, path: str) -> bool:
+        return path in self.public_paths or path.startswith(self.PUBLIC_PREFIX)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next):
         # Skip auth for public paths
-        if request.url.path in self.public_paths or request.url.path.startswith("/api/v1/auth"):
-            return await call_next(request)
+        if self.is_public(scope["path"]):
+            await self.app(scope, receive, send)
+            return
 
         # Extract token
-        auth_header = request.headers.get("Authorization", "")
+        auth_header = header(scope, b"authorization") or ""
         token = None
         if auth_header.startswith("Bearer "):
             token = auth_header[7:]
 
         # Create user context
         # Priority: 1) Valid token  2) X-User-ID header (mock mode)  3) Demo user (mock mode)
+        user = None
         if token:
             # Try to validate token first
-            user_context = await self._validate_token(token)
-            if user_context:
-                request.state.user = user_context
-            elif self.mock_mode:
+            user = await self._validate_token(token)
+            if not user and self.mock_mode:
                 # Token invalid but mock mode - fallback to header or demo
-                request.state.user = await self._create_mock_user(request)
-            else:
-                request.state.user = None
+                user = await self._create_mock_user(header(scope, b"x-user-id"))
         elif self.mock_mode:
             # No token but mock mode - use header or demo user
-            request.state.user = await self._create_mock_user(request)
-        else:
-            request.state.user = None
+            user = await self._create_mock_user(header(scope, b"x-user-id"))
 
-        return await call_next(request)
+        set_state(scope, "user", user)
+        get_request_context(scope).user = user
+
+        await self.app(scope, receive, send)
     
-    async def _create_mock_user(self, request: Request) -> UserContext:
+    async def _create_mock_user(self, header_user_id: Optional[str]) -> UserContext:
         """Create mock user context from X-User-ID header or demo user"""
         from app.services.subscription_service import subscription_service
         
-        header_user_id = request.headers.get("X-User-ID")
         user_id = header_user_id if header_user_id else DEMO_USER_ID
         
         # Fetch real email from database if user exists
@@ -285,6 +295,15 @@ class AuthMiddleware(BaseHTTPMiddleware):
         """
         Validate auth token and return user context.
         
+        Resolved principals are cached by token hash (see app.core.principal_cache),
+        so the user / subscription lookups below only run on a cache miss.
+        """
+        return await principal_cache.get_or_resolve(token, self._resolve_token)
+
+    async def _resolve_token(self, token: str) -> Optional[UserContext]:
+        """
+        Resolve auth token into user context (uncached).
+        
         Supports:
         - guest_token_xxx: Guest login tokens
         - luna_token_xxx: Firebase authenticated users
@@ -11,13 +11,15 @@ Billing Middleware - Credit checking and deduction for chat
 """
 
 import os
+import re
 import logging
-from typing import Callable
+from typing import Dict, Optional
 from datetime import datetime
-from fastapi import Request, Response, status
+from fastapi import Request, status
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.middleware.context import get_request_context, set_state, ResponseStatusRecorder
 
 logger = logging.getLogger(__name__)
 
@@ -47,44 +49,72 @@ class BillingContext:
         self.deducted: bool = False
 
 
-class BillingMiddleware(BaseHTTPMiddleware):
+# Only these endpoints (prefix match) need billing
+BILLABLE_ENDPOINTS: Dict[str, str] = {
+    "/api/v1/chat/completions": "chat",
+    "/api/v1/chat/stream": "chat",
+    "/api/v1/voice/tts": "voice_tts",
+    "/api/v1/image/generate": "image_gen",
+}
+
+
+def compile_endpoint_matcher(endpoints: Dict[str, str]):
+    """把前缀表编译成一个正则，match 一次得到 endpoint type（lastgroup → type）"""
+    group_types = {f"e{i}": etype for i, etype in enumerate(endpoints.values())}
+    pattern = re.compile("|".join(
+        f"(?P<e{i}>{re.escape(path)})" for i, path in enumerate(endpoints)
+    ))
+
+    def match(path: str) -> Optional[str]:
+        m = pattern.match(path)
+        return group_types[m.lastgroup] if m else None
+
+    return match
+
+
+class BillingMiddleware:
     """
-    Billing middleware for credit checking and deduction.
+    Pure ASGI billing middleware for credit checking and deduction.
     
     重要：普通聊天免费！只有 spicy mode 才扣费。
     
     Flow:
     1. Pre-request: Check if spicy mode, check credits if needed
-    2. Process request
+    2. Process request (response streamed through untouched)
     3. Post-request: Deduct actual cost ONLY if request successful AND spicy mode
+    
+    Non-billable paths go straight to the app without any billing work.
     """
 
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        # Only these endpoints with spicy mode need billing
-        self.billable_endpoints = {
-            "/api/v1/chat/completions": "chat",
-            "/api/v1/chat/stream": "chat",
-            "/api/v1/voice/tts": "voice_tts",
-            "/api/v1/image/generate": "image_gen",
-        }
-
-    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        self.app = app
+        self.billable_endpoints = dict(BILLABLE_ENDPOINTS)
+        self._billable_prefixes = tuple(self.billable_endpoints)
+        self._match_endpoint = compile_endpoint_matcher(self.billable_endpoints)
+
+    def endpoint_type(self, path: str) -> Optional[str]:
+        if not path.startswith(self._billable_prefixes):
+            return None
+        return self._match_endpoint(path)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         # Find matching billable endpoint
-        endpoint_type = None
-        for path, etype in self.billable_endpoints.items():
-            if request.url.path.startswith(path):
-                endpoint_type = etype
-                break
-        
+        endpoint_type = self.endpoint_type(scope["path"])
         if not endpoint_type:
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
 
         # Get user from auth middleware
-        user = getattr(request.state, "user", None)
+        ctx = get_request_context(scope)
+        user = ctx.user or scope.get("state", {}).get("user")
         if not user:
             # Let the request proceed - auth middleware will handle it
-            return await call_next(request)
+            await self.app(scope, receive, send)
+            return
 
         user_id = str(user.user_id) if hasattr(user, 'user_id') else str(user.get('user_id', 'unknown'))
         
@@ -92,12 +122,14 @@ class BillingMiddleware(BaseHTTPMiddleware):
         billing = BillingContext()
         billing.user_id = user_id
         billing.request_timestamp = datetime.utcnow().timestamp()
-        request.state.billing = billing
+        ctx.billing = billing
+        set_state(scope, "billing", billing)
 
         # In mock mode, just proceed
         if MOCK_MODE:
-            logger.debug(f"[MOCK] Billing check for {request.url.path}, user: {user_id}")
-            return await call_next(request)
+            logger.debug(f"[MOCK] Billing check for {scope['path']}, user: {user_id}")
+            await self.app(scope, receive, send)
+            return
 
         # =====================================================================
         # Production mode
@@ -125,22 +157,24 @@ class BillingMiddleware(BaseHTTPMiddleware):
                         if wallet:
                             billing.initial_credits = wallet.total_credits
                             if wallet.total_credits < estimated_cost:
-                                return JSONResponse(
+                                response = JSONResponse(
                                     status_code=status.HTTP_402_PAYMENT_REQUIRED,
                                     content={
                                         "error": "insufficient_credits",
                                         "message": f"余额不足：当前 {wallet.total_credits:.1f} 金币，需要 {estimated_cost:.1f} 金币",
                                     },
                                 )
+                                await response(scope, receive, send)
+                                return
                 except Exception as e:
                     logger.error(f"Credit check failed: {e}")
         
         # Process request
-        response = await call_next(request)
+        await self.app(scope, receive, ResponseStatusRecorder(send, ctx))
         
         # Post-request billing - ONLY if successful and has cost
         # For chat: only deduct if spicy mode (set by chat endpoint)
-        if response.status_code < 400 and not billing.deducted:
+        if ctx.status_code is not None and ctx.status_code < 400 and not billing.deducted:
             # Determine actual cost
             actual_cost = 0.0
             cost_type = None
@@ -160,8 +194,6 @@ class BillingMiddleware(BaseHTTPMiddleware):
             if actual_cost > 0:
                 billing.actual_cost = actual_cost
                 await self._deduct_credits(user_id, actual_cost, cost_type, billing)
-        
-        return response
     
     async def _deduct_credits(self, user_id: str, amount: float, cost_type: str, billing: BillingContext):
         """Deduct credits and record transaction"""
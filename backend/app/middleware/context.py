@@ -0,0 +1,84 @@
+"""
+Request Context - 中间件共享的请求级上下文
+==========================================
+
+Logging / Auth / Billing 三个纯 ASGI 中间件共用一个 RequestContext，
+存放在 scope["state"] 里（即 request.state），路由里照常用
+request.state.user / request.state.billing 读取。
+
+另外提供 ResponseStatusRecorder：包装 send，记录状态码和响应是否已开始，
+不缓冲、不改写 body，SSE chunk 原样透传。
+"""
+
+import time
+from typing import Any, Optional
+
+from starlette.types import Message, Scope, Send
+
+STATE_KEY = "request_context"
+
+
+class RequestContext:
+    """一个 HTTP 请求在中间件之间共享的状态"""
+
+    __slots__ = (
+        "method",
+        "path",
+        "client",
+        "start_time",
+        "user",
+        "billing",
+        "status_code",
+    )
+
+    def __init__(self, scope: Scope):
+        self.method: str = scope.get("method", "")
+        self.path: str = scope.get("path", "")
+        client = scope.get("client")
+        self.client: str = client[0] if client else "unknown"
+        self.start_time: float = time.time()
+        self.user: Any = None
+        self.billing: Any = None
+        self.status_code: Optional[int] = None
+
+    @property
+    def duration(self) -> float:
+        return time.time() - self.start_time
+
+
+def get_request_context(scope: Scope) -> RequestContext:
+    """取出（必要时创建）当前请求的上下文"""
+    state = scope.setdefault("state", {})
+    ctx = state.get(STATE_KEY)
+    if ctx is None:
+        ctx = RequestContext(scope)
+        state[STATE_KEY] = ctx
+    return ctx
+
+
+def set_state(scope: Scope, name: str, value: Any) -> None:
+    """等价于 request.state.<name> = value"""
+    scope.setdefault("state", {})[name] = value
+
+
+def header(scope: Scope, name: bytes) -> Optional[str]:
+    """读取请求头（name 为小写 bytes），避免为每个请求构造 Request / Headers"""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class ResponseStatusRecorder:
+    """包装 send：记录 http.response.start 的状态码，消息原样透传"""
+
+    __slots__ = ("_send", "_ctx")
+
+    def __init__(self, send: Send, ctx: RequestContext):
+        self._send = send
+        self._ctx = ctx
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self._ctx.status_code = message["status"]
+        await self._send(message)
@@ -0,0 +1,31 @@
+"""
+GZip Middleware
+Starlette GZip, but streaming (SSE) endpoints bypass it entirely.
+
+GZipMiddleware feeds streamed chunks into a gzip compressor without flushing,
+so SSE events sit in the compressor buffer until enough data accumulates.
+"""
+
+from typing import Iterable
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# SSE endpoints - never compressed
+STREAMING_PATHS = (
+    "/api/v1/chat/stream",
+)
+
+
+class StreamingAwareGZipMiddleware:
+    """GZipMiddleware that skips precompiled streaming path prefixes"""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 500, exclude_paths: Iterable[str] = STREAMING_PATHS):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self.exclude_paths = tuple(exclude_paths)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+        await self.gzip(scope, receive, send)
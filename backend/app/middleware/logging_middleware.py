@@ -1,50 +1,80 @@
 """
 Logging Middleware
-Logs request/response information
+Logs request/response information (pure ASGI, response body is passed through untouched)
 """
 
-import time
 import logging
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.middleware.context import get_request_context, header
+from app.core.query_stats import query_scope
+from app.core.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
 
-class LoggingMiddleware(BaseHTTPMiddleware):
+class LoggingMiddleware:
     """
     Middleware to log request and response information.
+
+    The response line is logged when the response starts, so streaming (SSE)
+    responses are logged at time-to-first-byte and never buffered.
+
+    Each request also runs inside a query_scope: SQL statement count / DB time
+    are recorded and repeated statement shapes are reported as N+1.
+
+    When tracing is enabled the request is the root span (continuing an incoming
+    W3C traceparent header) and the response carries its traceparent.
     """
 
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next):
-        start_time = time.time()
+        ctx = get_request_context(scope)
 
         # Log request
         logger.info(
-            f"Request: {request.method} {request.url.path}",
+            f"Request: {ctx.method} {ctx.path}",
             extra={
-                "method": request.method,
-                "path": request.url.path,
-                "client": request.client.host if request.client else "unknown",
+                "method": ctx.method,
+                "path": ctx.path,
+                "client": ctx.client,
             },
         )
 
-        response = await call_next(request)
+        span = None
 
-        # Log response
-        duration = time.time() - start_time
-        logger.info(
-            f"Response: {request.method} {request.url.path} - {response.status_code} ({duration:.3f}s)",
-            extra={
-                "method": request.method,
-                "path": request.url.path,
-                "status_code": response.status_code,
-                "duration_ms": int(duration * 1000),
-            },
-        )
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                ctx.status_code = message["status"]
+                if span is not None and span.is_recording:
+                    span.set_attribute("http.status_code", ctx.status_code)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"traceparent", span.traceparent.encode("latin-1"))
+                    ]
+                # Log response
+                duration = ctx.duration
+                logger.info(
+                    f"Response: {ctx.method} {ctx.path} - {ctx.status_code} ({duration:.3f}s)",
+                    extra={
+                        "method": ctx.method,
+                        "path": ctx.path,
+                        "status_code": ctx.status_code,
+                        "duration_ms": int(duration * 1000),
+                    },
+                )
+            await send(message)
 
-        return response
+        with query_scope(f"{ctx.method} {ctx.path}"), tracer.start_span(
+            f"{ctx.method} {ctx.path}",
+            attributes={"http.method": ctx.method, "http.target": ctx.path},
+            kind="server",
+            parent=None,
+            traceparent=header(scope, b"traceparent"),
+        ) as span:
+            await self.app(scope, receive, send_wrapper)
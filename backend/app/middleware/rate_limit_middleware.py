@@ -0,0 +1,143 @@
+"""
+Rate Limit Middleware
+按路由类别的令牌桶限流（pure ASGI）：昂贵接口（对话 / 生图 / TTS / 约会 / 故事生成）
+按用户 + 按 IP 各一个桶，超限返回 429 + Retry-After；放行的响应带 X-RateLimit-* 头。
+
+必须放在 AuthMiddleware 之内（需要 ctx.user），Admission 之外（被限流的请求不排队）。
+"""
+
+import os
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.rate_limiter import RateLimitResult, RateLimitRule, TokenBucketLimiter, rate_limiter
+from app.middleware.context import get_request_context, header
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# 前面有几层会追加 X-Forwarded-For 的可信代理（Cloud Run / nginx 各算一层）；
+# 0 表示不信任转发头，按连接地址分桶（客户端可以随意伪造这些头）
+TRUSTED_PROXY_COUNT = int(os.getenv("TRUSTED_PROXY_COUNT", "0"))
+
+# 路由类别 -> (按用户, 按 IP)；IP 桶放宽，给 NAT / 共享出口留余量
+ROUTE_LIMITS: Dict[str, Tuple[RateLimitRule, RateLimitRule]] = {
+    "chat": (RateLimitRule(capacity=10, per_minute=30), RateLimitRule(capacity=40, per_minute=120)),
+    "image_gen": (RateLimitRule(capacity=3, per_minute=6), RateLimitRule(capacity=10, per_minute=20)),
+    "voice_tts": (RateLimitRule(capacity=8, per_minute=20), RateLimitRule(capacity=20, per_minute=60)),
+    "date": (RateLimitRule(capacity=8, per_minute=20), RateLimitRule(capacity=20, per_minute=60)),
+    "story": (RateLimitRule(capacity=4, per_minute=10), RateLimitRule(capacity=10, per_minute=30)),
+}
+
+# 只限 POST；路径带参数，用正则
+RATE_LIMITED_ROUTES: List[Tuple[str, str]] = [
+    ("chat", r"/api/v1/chat/(completions|stream)"),
+    ("image_gen", r"/api/v1/(image/generate|images/generate(/async)?|images/gift|photos/[^/]+/request)"),
+    ("voice_tts", r"/api/v1/voice/tts(/async)?"),
+    ("date", r"/api/v1/dates/(start|interactive/(start|choose|free-input|extend))"),
+    ("story", r"/api/v1/(stories/(start|choice)|events/[^/]+/[^/]+/generate(/async)?)"),
+]
+
+
+def compile_route_classes(routes: List[Tuple[str, str]]):
+    """把路由表编译成一个正则，fullmatch 一次得到路由类别（lastgroup → 类别）"""
+    group_classes = {f"r{i}": route_class for i, (route_class, _) in enumerate(routes)}
+    pattern = re.compile("|".join(f"(?P<r{i}>{regex})/?" for i, (_, regex) in enumerate(routes)))
+
+    def match(path: str) -> Optional[str]:
+        m = pattern.fullmatch(path)
+        return group_classes[m.lastgroup] if m else None
+
+    return match
+
+
+def client_ip(scope: Scope, fallback: str, trusted_proxies: int = TRUSTED_PROXY_COUNT) -> str:
+    """
+    客户端 IP：配置了可信代理时取 X-Forwarded-For 从右数第 trusted_proxies 跳
+    （最右边那个不是可信代理写入的地址，左边的都可能是客户端伪造的）；
+    否则用连接地址 fallback
+    """
+    if trusted_proxies <= 0:
+        return fallback
+    hops = [hop.strip() for hop in (header(scope, b"x-forwarded-for") or "").split(",") if hop.strip()]
+    if not hops:
+        return fallback
+    return hops[-min(trusted_proxies, len(hops))]
+
+
+def limit_headers(result: RateLimitResult) -> List[Tuple[bytes, bytes]]:
+    headers = [
+        (b"x-ratelimit-limit", str(result.limit).encode()),
+        (b"x-ratelimit-remaining", str(result.remaining).encode()),
+        (b"x-ratelimit-reset", str(result.reset_after).encode()),
+    ]
+    if not result.allowed:
+        headers.append((b"retry-after", str(result.retry_after).encode()))
+    return headers
+
+
+class RateLimitMiddleware:
+    """
+    Pure ASGI token-bucket rate limiting for expensive endpoints.
+
+    Unlisted paths and non-POST requests go straight to the app.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: TokenBucketLimiter = rate_limiter,
+                 enabled: bool = RATE_LIMIT_ENABLED, trusted_proxies: int = TRUSTED_PROXY_COUNT):
+        self.app = app
+        self.limiter = limiter
+        self.enabled = enabled
+        self.trusted_proxies = trusted_proxies
+        self._match_route = compile_route_classes(RATE_LIMITED_ROUTES)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.enabled or scope["type"] != "http" or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self._match_route(scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        ctx = get_request_context(scope)
+        user_rule, ip_rule = ROUTE_LIMITS[route_class]
+        buckets = [(f"ip:{client_ip(scope, ctx.client, self.trusted_proxies)}:{route_class}", ip_rule)]
+        user = ctx.user or scope.get("state", {}).get("user")
+        if user is not None:
+            user_id = user.user_id if hasattr(user, "user_id") else user.get("user_id")
+            buckets.insert(0, (f"user:{user_id}:{route_class}", user_rule))
+
+        result = await self.limiter.hit(buckets)
+        headers = limit_headers(result)
+
+        if not result.allowed:
+            try:
+                from app.core.metrics import metrics
+                metrics.RATE_LIMITED.labels(route=route_class).inc()
+            except Exception:
+                pass
+            logger.warning(f"[RateLimit] {route_class} limited: {buckets[0][0]}, retry_after={result.retry_after}s")
+            response = JSONResponse(
+                status_code=429,
+                content={
+                    "error": "rate_limited",
+                    "message": "请求太频繁了，请稍后再试",
+                    "retry_after": result.retry_after,
+                },
+            )
+            response.raw_headers.extend(headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -20,6 +20,7 @@ from .story_models import StorySession, StoryTemplate
 from .stamina_models import UserStamina, StaminaConstants
 from .character_models import Character
 from .proactive_models import ProactiveHistory, UserProactiveSettings
+from .job_models import BackgroundJob
 from .user_learning_models import (
     UserCommunicationStyle,
     UserTopicInterest,
@@ -46,6 +47,8 @@ __all__ = [
     # Proactive
     "ProactiveHistory",
     "UserProactiveSettings",
+    # Background jobs
+    "BackgroundJob",
     # User Learning
     "UserCommunicationStyle",
     "UserTopicInterest",
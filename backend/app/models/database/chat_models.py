@@ -31,6 +31,10 @@ class ChatSession(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # 滚动摘要：summary_until 之前（含）的消息已折叠进 context_summary
+    context_summary = Column(Text, nullable=True)
+    summary_until = Column(DateTime, nullable=True)
+    
     # Relationship to messages
     messages = relationship("ChatMessageDB", back_populates="session", cascade="all, delete-orphan")
     
@@ -52,6 +56,8 @@ class ChatSession(Base):
             "is_active": self.is_active,
             "created_at": self.created_at,
             "updated_at": self.updated_at,
+            "context_summary": self.context_summary,
+            "summary_until": self.summary_until,
         }
 
 
@@ -71,6 +77,10 @@ class ChatMessageDB(Base):
     
     # Relationship back to session
     session = relationship("ChatSession", back_populates="messages")
+
+    __table_args__ = (
+        Index('idx_chat_messages_session_created', 'session_id', 'created_at'),
+    )
     
     def to_dict(self):
         return {
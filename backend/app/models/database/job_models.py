@@ -0,0 +1,42 @@
+"""
+Background Job - Database Model
+===============================
+
+后台任务表：Redis 不可用时作为任务队列，同时保存任务结果供客户端轮询。
+"""
+
+from sqlalchemy import Column, String, Integer, DateTime, Text, Index
+from sqlalchemy.dialects.sqlite import JSON
+from datetime import datetime
+import uuid
+
+from app.models.database.chat_models import Base
+
+
+class BackgroundJob(Base):
+    """后台任务（记忆提取 / 生图 / 事件故事 / TTS）"""
+    __tablename__ = "background_jobs"
+
+    job_id = Column(String(64), primary_key=True, default=lambda: str(uuid.uuid4()))
+    job_type = Column(String(64), nullable=False)
+    user_id = Column(String(128), nullable=True, index=True)
+
+    payload = Column(JSON, default={})
+    idempotency_key = Column(String(256), nullable=True, unique=True)
+
+    # pending / running / succeeded / failed
+    status = Column(String(16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String(128), nullable=True)
+
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_background_jobs_status_run_at", "status", "run_at"),
+    )
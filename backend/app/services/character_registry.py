@@ -0,0 +1,114 @@
+"""
+Character Registry
+==================
+
+角色定义的 id 索引（替代每次对 CHARACTERS 的线性扫描）。
+
+索引里存的是 CHARACTERS 中的同一个 dict：admin 通过 /admin/characters 更新角色时
+原地修改，列表接口、聊天、prompt 构建看到的都是新数据；同时通知订阅者
+（如 PromptBuilderV4 的静态片段缓存）失效。
+
+admin 的修改写进 characters 表，热更新只发生在处理该请求的进程；启动时 sync_from_db()
+把表里的可编辑字段合并回内存定义，所以多 worker 部署下其他进程要到重启后才会看到修改。
+
+Usage:
+    from app.services.character_registry import character_registry
+
+    char = character_registry.get(character_id)
+    character_registry.subscribe(lambda character_id: cache.clear())
+    character_registry.apply_update(character_id, {"system_prompt": "..."})
+    await character_registry.sync_from_db()   # 应用启动时
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# admin 可以修改的字段（与 /admin/characters 的 CharacterUpdate 一致），启动时从数据库合并
+EDITABLE_FIELDS = (
+    "name", "description", "greeting", "system_prompt", "is_active", "is_spicy", "sort_order",
+    "personality_traits", "personality", "age", "zodiac", "occupation", "hobbies", "mbti",
+    "birthday", "height", "location",
+)
+
+
+class CharacterRegistry:
+    """id → 角色定义"""
+
+    def __init__(self):
+        self._by_id: Dict[str, Dict[str, Any]] = {}
+        self._listeners: List[Callable[[str], None]] = []
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def load(self, characters: Iterable[Dict[str, Any]]) -> None:
+        """（重新）建立索引"""
+        with self._lock:
+            self._by_id = {str(c["character_id"]): c for c in characters}
+            self.version += 1
+        logger.debug(f"Character registry loaded: {len(self._by_id)} characters")
+
+    def get(self, character_id: str) -> Optional[Dict[str, Any]]:
+        return self._by_id.get(str(character_id))
+
+    def all(self) -> List[Dict[str, Any]]:
+        return list(self._by_id.values())
+
+    def subscribe(self, listener: Callable[[str], None]) -> None:
+        """注册变更回调，参数为被修改的 character_id"""
+        self._listeners.append(listener)
+
+    def apply_update(self, character_id: str, fields: Dict[str, Any]) -> bool:
+        """
+        把 admin 的修改合并进内存中的角色定义并通知订阅者
+
+        Returns:
+            角色不在注册表中时返回 False
+        """
+        character_id = str(character_id)
+        with self._lock:
+            character = self._by_id.get(character_id)
+            if character is None:
+                return False
+            character.update(fields)
+            self.version += 1
+
+        logger.info(f"Character registry updated: {character_id} ({', '.join(sorted(fields))})")
+        for listener in self._listeners:
+            try:
+                listener(character_id)
+            except Exception as e:
+                logger.warning(f"Character registry listener failed: {e}")
+        return True
+
+    async def sync_from_db(self) -> int:
+        """
+        把 characters 表里的可编辑字段合并进内存定义（应用启动时调用）
+
+        只合并代码里已有的角色；表里为空的字段保留代码默认值。读库失败只记日志，
+        不影响启动。
+
+        Returns:
+            被更新的角色数
+        """
+        from app.services.character_service import character_service
+
+        try:
+            rows = await character_service.get_all(include_inactive=True, include_private=True)
+        except Exception as e:
+            logger.warning(f"Character registry DB sync failed: {e}")
+            return 0
+
+        merged = 0
+        for row in rows:
+            fields = {k: row[k] for k in EDITABLE_FIELDS if row.get(k) is not None}
+            if fields and self.apply_update(row["character_id"], fields):
+                merged += 1
+        logger.info(f"Character registry synced from DB: {merged}/{len(rows)} characters")
+        return merged
+
+
+# 单例
+character_registry = CharacterRegistry()
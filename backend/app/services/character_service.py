@@ -22,8 +22,8 @@ _cache_loaded = False
 class CharacterService:
     """角色服务"""
     
-    async def get_all(self, include_inactive: bool = False, lang: str = "zh") -> List[Dict]:
-        """获取所有角色"""
+    async def get_all(self, include_inactive: bool = False, lang: str = "zh", include_private: bool = False) -> List[Dict]:
+        """获取所有角色（include_private=True 时包含 system_prompt）"""
         async with get_db() as db:
             query = select(Character).order_by(Character.sort_order, Character.name)
             if not include_inactive:
@@ -32,6 +32,8 @@ class CharacterService:
             result = await db.execute(query)
             characters = result.scalars().all()
             
+            if include_private:
+                return [c.to_dict(lang) for c in characters]
             return [c.to_public_dict(lang) for c in characters]
     
     async def get_by_id(self, character_id: str, lang: str = "zh") -> Optional[Dict]:
@@ -20,66 +20,102 @@ Chat Debug Logger
     chat_debug.log_l2_output(response)
 """
 
+import os
 import logging
-import json
+from contextvars import ContextVar
 from typing import Any, Dict, List, Optional
-from datetime import datetime
+
+from app.core.logging import CategorySampler, build_formatter, queue_handler_for
 
 # 创建专门的 logger
 logger = logging.getLogger("chat.debug")
 logger.setLevel(logging.DEBUG)
 logger.propagate = False  # 不向 root logger 传播，避免重复日志
 
-# 如果没有 handler，添加一个
+# 当前请求的 ID：按请求（asyncio 任务）隔离，并发请求互不覆盖
+_request_id: ContextVar[Optional[str]] = ContextVar("chat_debug_request_id", default=None)
+
+
+class _TextFormatter(logging.Formatter):
+    """文本格式：把 extra 里的 data 接在消息后面（JSON 格式下 data 本身就是字段）"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        data = getattr(record, "data", None)
+        return text if data is None else f"{text}\n{data}"
+
+
+# 如果没有 handler，添加一个（后台线程写 stdout，不阻塞事件循环）
 if not logger.handlers:
     handler = logging.StreamHandler()
     handler.setLevel(logging.DEBUG)
-    formatter = logging.Formatter(
-        '%(asctime)s [CHAT_DEBUG] %(message)s',
-        datefmt='%H:%M:%S'
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    if os.getenv("LOG_FORMAT", "text") == "json":
+        handler.setFormatter(build_formatter("json"))
+    else:
+        handler.setFormatter(_TextFormatter(
+            '%(asctime)s [CHAT_DEBUG] %(message)s',
+            datefmt='%H:%M:%S'
+        ))
+    logger.addHandler(queue_handler_for(handler))
+
+# 默认采样率：完整 prompt / 完整对话体积最大，默认只采样一小部分
+DEFAULT_SAMPLING = {
+    "SYSTEM_PROMPT": 0.05,
+    "L2_INPUT": 0.1,
+    "L2_OUTPUT": 0.2,
+}
+
+_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+}
 
 
 class ChatDebugLogger:
-    """聊天调试日志器"""
+    """
+    聊天调试日志器
+    
+    - CHAT_DEBUG=true 开启（默认关闭）
+    - CHAT_DEBUG_SAMPLING="SYSTEM_PROMPT=0.05,L2_INPUT=0.1,*=1" 按分类采样，
+      同一个 request_id 的同一分类要么全记要么全不记
+    - request_id 存在 ContextVar 里，每个请求各自一份
+    - 每条记录是一条结构化日志（category / request_id / data 作为字段），
+      关闭或未采中时在格式化任何字符串之前就返回
+    """
     
     def __init__(self):
-        self.enabled = True
-        self.request_id = None
+        self.enabled = os.getenv("CHAT_DEBUG", "false").lower() == "true"
+        self.sampler = CategorySampler.from_env("CHAT_DEBUG_SAMPLING", DEFAULT_SAMPLING)
+    
+    @property
+    def request_id(self) -> Optional[str]:
+        return _request_id.get()
     
     def set_request_id(self, request_id: str):
-        """设置当前请求ID"""
-        self.request_id = request_id
+        """设置当前请求ID（只对当前请求的上下文生效）"""
+        _request_id.set(request_id)
+    
+    def is_enabled(self, category: str, level: str = "DEBUG") -> bool:
+        """是否需要记录该分类（开关 / 日志级别 / 采样）"""
+        return (
+            self.enabled
+            and logger.isEnabledFor(_LEVELS.get(level, logging.DEBUG))
+            and self.sampler.should_log(category, self.request_id)
+        )
     
     def _log(self, level: str, category: str, message: str, data: Any = None):
-        """内部日志方法"""
-        if not self.enabled:
-            return
-        
-        prefix = f"[{self.request_id}]" if self.request_id else ""
+        """内部日志方法（调用方已经过 is_enabled 检查）；data 只作为字段，由 formatter 决定怎么输出"""
+        request_id = _request_id.get()
+        prefix = f"[{request_id}]" if request_id else ""
         
         log_msg = f"{prefix} [{category}] {message}"
-        
+        extra = {"category": category, "request_id": request_id}
         if data is not None:
-            if isinstance(data, (dict, list)):
-                try:
-                    data_str = json.dumps(data, ensure_ascii=False, indent=2)
-                    log_msg += f"\n{data_str}"
-                except:
-                    log_msg += f"\n{data}"
-            else:
-                log_msg += f"\n{data}"
+            extra["data"] = data
         
-        if level == "DEBUG":
-            logger.debug(log_msg)
-        elif level == "INFO":
-            logger.info(log_msg)
-        elif level == "WARNING":
-            logger.warning(log_msg)
-        elif level == "ERROR":
-            logger.error(log_msg)
+        logger.log(_LEVELS.get(level, logging.DEBUG), log_msg, extra=extra)
     
     # =========================================================================
     # L1 感知引擎
@@ -87,28 +123,28 @@ class ChatDebugLogger:
     
     def log_l1_input(self, message: str, intimacy_level: int, context_messages: List[Dict]):
         """记录 L1 输入"""
-        self._log("DEBUG", "L1_INPUT", f"用户消息: '{message}'")
-        self._log("DEBUG", "L1_INPUT", f"亲密度等级: {intimacy_level}")
-        self._log("DEBUG", "L1_INPUT", f"上下文消息数: {len(context_messages)}")
-        
-        # 打印最近几条上下文
-        if context_messages:
-            recent = context_messages[-3:]
-            for i, msg in enumerate(recent):
-                role = msg.get("role", "?")
-                content = msg.get("content", "")[:50]
-                self._log("DEBUG", "L1_INPUT", f"  上下文[{i}] {role}: {content}...")
+        if not self.is_enabled("L1_INPUT"):
+            return
+        recent = [
+            {"role": msg.get("role", "?"), "content": msg.get("content", "")[:50]}
+            for msg in context_messages[-3:]
+        ]
+        self._log("DEBUG", "L1_INPUT",
+            f"用户消息: '{message}' | 亲密度等级: {intimacy_level} | 上下文消息数: {len(context_messages)}",
+            recent or None)
     
     def log_l1_output(self, result: Any):
         """记录 L1 输出"""
-        self._log("DEBUG", "L1_OUTPUT", "=" * 50)
-        self._log("DEBUG", "L1_OUTPUT", f"安全标志: {getattr(result, 'safety_flag', 'N/A')}")
-        self._log("DEBUG", "L1_OUTPUT", f"意图分类: {getattr(result, 'intent_category', getattr(result, 'intent', 'N/A'))}")
-        self._log("DEBUG", "L1_OUTPUT", f"难度评级: {getattr(result, 'difficulty_rating', 'N/A')}")
-        self._log("DEBUG", "L1_OUTPUT", f"情感分数: {getattr(result, 'sentiment_score', getattr(result, 'sentiment', 'N/A'))}")
-        self._log("DEBUG", "L1_OUTPUT", f"是否NSFW: {getattr(result, 'is_nsfw', 'N/A')}")
-        self._log("DEBUG", "L1_OUTPUT", f"推理过程: {getattr(result, 'reasoning', 'N/A')}")
-        self._log("DEBUG", "L1_OUTPUT", "=" * 50)
+        if not self.is_enabled("L1_OUTPUT"):
+            return
+        self._log("DEBUG", "L1_OUTPUT", "L1 结果", {
+            "safety_flag": getattr(result, 'safety_flag', 'N/A'),
+            "intent": getattr(result, 'intent_category', getattr(result, 'intent', 'N/A')),
+            "difficulty": getattr(result, 'difficulty_rating', 'N/A'),
+            "sentiment": getattr(result, 'sentiment_score', getattr(result, 'sentiment', 'N/A')),
+            "is_nsfw": getattr(result, 'is_nsfw', 'N/A'),
+            "reasoning": getattr(result, 'reasoning', 'N/A'),
+        })
     
     # =========================================================================
     # 分数变化
@@ -123,15 +159,20 @@ class ChatDebugLogger:
         reason: str
     ):
         """记录分数变化"""
+        if not self.is_enabled("SCORE"):
+            return
         arrow = "↑" if delta > 0 else "↓" if delta < 0 else "→"
         self._log("DEBUG", "SCORE", 
             f"{score_type}: {old_value:.1f} {arrow} {new_value:.1f} (Δ{delta:+.1f}) | 原因: {reason}")
     
     def log_emotion_state(self, emotion: float, state: str, events: List[str] = None):
         """记录情绪状态"""
-        self._log("DEBUG", "EMOTION", f"情绪值: {emotion:.1f}, 状态: {state}")
+        if not self.is_enabled("EMOTION"):
+            return
+        message = f"情绪值: {emotion:.1f}, 状态: {state}"
         if events:
-            self._log("DEBUG", "EMOTION", f"已解锁事件: {events}")
+            message += f", 已解锁事件: {events}"
+        self._log("DEBUG", "EMOTION", message)
     
     # =========================================================================
     # Game Engine
@@ -139,37 +180,33 @@ class ChatDebugLogger:
     
     def log_game_input(self, user_id: str, character_id: str, l1_intent: str, l1_sentiment: float):
         """记录 Game Engine 输入"""
-        self._log("DEBUG", "GAME_INPUT", f"用户: {user_id}, 角色: {character_id}")
-        self._log("DEBUG", "GAME_INPUT", f"L1意图: {l1_intent}, L1情感: {l1_sentiment:.2f}")
+        if not self.is_enabled("GAME_INPUT"):
+            return
+        self._log("DEBUG", "GAME_INPUT",
+            f"用户: {user_id}, 角色: {character_id} | L1意图: {l1_intent}, L1情感: {l1_sentiment:.2f}")
     
     def log_game_output(self, result: Any):
         """记录 Game Engine 输出"""
-        self._log("DEBUG", "GAME_OUTPUT", "=" * 50)
-        self._log("DEBUG", "GAME_OUTPUT", f"检查通过: {getattr(result, 'check_passed', 'N/A')}")
-        self._log("DEBUG", "GAME_OUTPUT", f"拒绝原因: {getattr(result, 'refusal_reason', 'None')}")
-        self._log("DEBUG", "GAME_OUTPUT", f"当前情绪: {getattr(result, 'current_emotion', 'N/A')}")
-        self._log("DEBUG", "GAME_OUTPUT", f"当前亲密度: {getattr(result, 'current_intimacy', 'N/A')}")
-        self._log("DEBUG", "GAME_OUTPUT", f"新事件: {getattr(result, 'new_event', 'None')}")
-        self._log("DEBUG", "GAME_OUTPUT", f"已解锁事件: {getattr(result, 'events', [])}")
-        self._log("DEBUG", "GAME_OUTPUT", "=" * 50)
+        if not self.is_enabled("GAME_OUTPUT"):
+            return
+        self._log("DEBUG", "GAME_OUTPUT", "Game Engine 结果", {
+            "check_passed": getattr(result, 'check_passed', 'N/A'),
+            "refusal_reason": getattr(result, 'refusal_reason', 'None'),
+            "current_emotion": getattr(result, 'current_emotion', 'N/A'),
+            "current_intimacy": getattr(result, 'current_intimacy', 'N/A'),
+            "new_event": getattr(result, 'new_event', 'None'),
+            "events": list(getattr(result, 'events', []) or []),
+        })
     
     # =========================================================================
     # Prompt
     # =========================================================================
     
     def log_prompt(self, system_prompt: str, label: str = "SYSTEM_PROMPT"):
-        """记录完整 Prompt"""
-        self._log("DEBUG", label, "=" * 60)
-        self._log("DEBUG", label, "完整 System Prompt:")
-        
-        # 分行打印，方便阅读
-        lines = system_prompt.split('\n')
-        for i, line in enumerate(lines):
-            if line.strip():
-                self._log("DEBUG", label, f"  {line}")
-        
-        self._log("DEBUG", label, f"Prompt 长度: {len(system_prompt)} 字符")
-        self._log("DEBUG", label, "=" * 60)
+        """记录完整 Prompt（默认按 SYSTEM_PROMPT 采样率采样）"""
+        if not self.is_enabled(label):
+            return
+        self._log("DEBUG", label, f"完整 System Prompt ({len(system_prompt)} 字符)", system_prompt)
     
     # =========================================================================
     # L2 生成引擎
@@ -177,26 +214,25 @@ class ChatDebugLogger:
     
     def log_l2_input(self, conversation: List[Dict], temperature: float = 0.8):
         """记录 L2 输入"""
-        self._log("DEBUG", "L2_INPUT", f"对话轮数: {len(conversation)}, 温度: {temperature}")
-        
-        for i, msg in enumerate(conversation):
+        if not self.is_enabled("L2_INPUT"):
+            return
+        # System prompt 可能很长，截断显示
+        previews = []
+        for msg in conversation:
             role = msg.get("role", "?")
             content = msg.get("content", "")
-            
-            # System prompt 可能很长，截断显示
-            if role == "system":
-                preview = content[:200] + "..." if len(content) > 200 else content
-                self._log("DEBUG", "L2_INPUT", f"  [{i}] {role}: {preview}")
-            else:
-                preview = content[:100] + "..." if len(content) > 100 else content
-                self._log("DEBUG", "L2_INPUT", f"  [{i}] {role}: {preview}")
+            limit = 200 if role == "system" else 100
+            previews.append({
+                "role": role,
+                "content": content[:limit] + "..." if len(content) > limit else content,
+            })
+        self._log("DEBUG", "L2_INPUT", f"对话轮数: {len(conversation)}, 温度: {temperature}", previews)
     
     def log_l2_output(self, response: str, tokens_used: int = 0):
         """记录 L2 输出"""
-        self._log("DEBUG", "L2_OUTPUT", "=" * 50)
-        self._log("DEBUG", "L2_OUTPUT", f"AI 回复 ({len(response)} 字符, {tokens_used} tokens):")
-        self._log("DEBUG", "L2_OUTPUT", response)
-        self._log("DEBUG", "L2_OUTPUT", "=" * 50)
+        if not self.is_enabled("L2_OUTPUT"):
+            return
+        self._log("DEBUG", "L2_OUTPUT", f"AI 回复 ({len(response)} 字符, {tokens_used} tokens)", response)
     
     # =========================================================================
     # 状态效果
@@ -204,21 +240,21 @@ class ChatDebugLogger:
     
     def log_effects(self, effects: List[Dict]):
         """记录活跃状态效果"""
+        if not self.is_enabled("EFFECTS"):
+            return
         if not effects:
             self._log("DEBUG", "EFFECTS", "无活跃状态效果")
             return
-        
-        self._log("DEBUG", "EFFECTS", f"活跃状态效果: {len(effects)} 个")
-        for e in effects:
-            self._log("DEBUG", "EFFECTS", 
-                f"  - {e.get('type')}: 剩余 {e.get('remaining', '?')} 条对话")
+        self._log("DEBUG", "EFFECTS", f"活跃状态效果: {len(effects)} 个", [
+            {"type": e.get("type"), "remaining": e.get("remaining", "?")} for e in effects
+        ])
     
     def log_effect_modifier(self, modifier: str):
         """记录效果 Prompt 修改器"""
-        if not modifier:
+        if not modifier or not self.is_enabled("EFFECT_MOD"):
             return
-        self._log("DEBUG", "EFFECT_MOD", "状态效果 Prompt 修改:")
-        self._log("DEBUG", "EFFECT_MOD", modifier[:300] + "..." if len(modifier) > 300 else modifier)
+        self._log("DEBUG", "EFFECT_MOD", "状态效果 Prompt 修改",
+            modifier[:300] + "..." if len(modifier) > 300 else modifier)
     
     # =========================================================================
     # 请求摘要
@@ -235,13 +271,14 @@ class ChatDebugLogger:
         tokens_used: int
     ):
         """记录请求摘要"""
-        self._log("INFO", "SUMMARY", "=" * 60)
-        self._log("INFO", "SUMMARY", f"用户: {user_message[:50]}...")
-        self._log("INFO", "SUMMARY", f"AI: {ai_response[:50]}...")
-        self._log("INFO", "SUMMARY", f"意图: {l1_intent}")
-        self._log("INFO", "SUMMARY", f"情绪: {emotion_before:.1f} → {emotion_after:.1f}")
-        self._log("INFO", "SUMMARY", f"亲密度: Lv.{intimacy_level}, Tokens: {tokens_used}")
-        self._log("INFO", "SUMMARY", "=" * 60)
+        if not self.is_enabled("SUMMARY", "INFO"):
+            return
+        self._log("INFO", "SUMMARY",
+            f"意图: {l1_intent} | 情绪: {emotion_before:.1f} → {emotion_after:.1f} | "
+            f"亲密度: Lv.{intimacy_level}, Tokens: {tokens_used}", {
+                "user": user_message[:50],
+                "ai": ai_response[:50],
+            })
 
 
 # 全局实例
@@ -12,6 +12,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models.database.chat_models import ChatSession, ChatMessageDB
 from app.core.database import get_db, MOCK_MODE
+from app.core.tracing import trace_methods
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +23,7 @@ _memory_sessions = {}
 _memory_messages = {}
 
 
+@trace_methods("chat_repository")
 class ChatRepository:
     """Repository for chat sessions and messages with DB + memory fallback"""
     
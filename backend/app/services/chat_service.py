@@ -21,7 +21,8 @@ from app.core.exceptions import (
 )
 from app.services.llm_service import GrokService
 from app.services.vector_service import VectorService
-from app.utils.moderation import moderate_content
+from app.utils.moderation import moderate_content, ModerationGate
+from app.services.v4.precompute_service import precompute_service
 from app.models.schemas import (
     ChatMessage,
     ChatCompletionRequest,
@@ -162,8 +163,15 @@ class ChatService:
         session = await self.get_session(request.session_id, user_context.user_id)
         character = await self._get_character(UUID(session["character_id"]))
         
-        # Step 2: Moderate user input
-        if not await moderate_content(request.message, mode="input"):
+        # Step 2: Moderate user input (local-first cascade)
+        # 本地规则 / 预计算安全标记 / 缓存命中直接判定；否则远程审核与后续 LLM 调用并行，
+        # 在返回回复之前等待判定（hold-and-release）
+        input_gate = ModerationGate(
+            request.message,
+            mode="input",
+            safety_flag=precompute_service.analyze(request.message).safety_flag,
+        )
+        if (await input_gate.prescreen()).flagged:
             raise ContentModerationError(
                 "Your message contains prohibited content",
                 flagged_content=request.message[:100]
@@ -314,15 +322,24 @@ class ChatService:
                 max_tokens=int(character.get("max_tokens", 500))
             )
         except Exception as e:
+            input_gate.cancel()
             raise LLMServiceError(f"Grok API error: {str(e)}")
         
         assistant_message = grok_response["choices"][0]["message"]["content"]
         tokens_used = grok_response["usage"]["total_tokens"]
         
+        # Step 4.5: Release gate - remote input verdict must be in before the reply leaves
+        if (await input_gate.verdict()).flagged:
+            raise ContentModerationError(
+                "Your message contains prohibited content",
+                flagged_content=request.message[:100]
+            )
+        
         # Step 5: Moderate assistant output (basic check)
-        if not await moderate_content(assistant_message, mode="output"):
+        output_verdict = await ModerationGate(assistant_message, mode="output").verdict()
+        if output_verdict.flagged:
             # Log but don't block (Grok should handle this)
-            print(f"Warning: Assistant message flagged by moderation: {assistant_message[:100]}")
+            logger.warning(f"Assistant message flagged by moderation: {assistant_message[:100]}")
         
         # Step 6: Store messages
         user_message_id = await self._store_message(
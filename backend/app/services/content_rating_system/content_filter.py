@@ -8,9 +8,11 @@ Content Rating System - 内容过滤器
 
 import re
 import logging
-from typing import List, Tuple, Optional, Dict, Any
+from typing import AsyncIterator, List, Tuple, Optional, Dict, Any
 from dataclasses import dataclass
 
+from app.utils.keyword_automaton import KeywordAutomaton
+
 logger = logging.getLogger(__name__)
 
 
@@ -31,7 +33,7 @@ class ContentFilter:
     功能：
     1. 检测露骨词汇
     2. 检测违规描写模式
-    3. 过滤并替换违规内容
+    3. 过滤并替换违规内容（一次线性扫描，支持流式 chunk 输入）
     4. 记录违规日志
     """
     
@@ -104,12 +106,65 @@ class ContentFilter:
         '肌肤': '...',
     }
     
+    # 违规模式中 ".*" 的最大跨度（字符）。限定跨度后单个匹配长度有上界，
+    # 流式过滤只需保留这么长的尾部即可覆盖跨 chunk 的匹配
+    MAX_PATTERN_GAP = 24
+    
+    # 输出清理：连续省略号合并为一个、移除空的动作描写 "* *"
+    _CLEANUP_PATTERN = re.compile(r'\.{3,}(?:\s*\.{3,})*|\*\s*\*')
+    
     def __init__(self):
-        # 编译正则表达式以提高性能
-        self._compiled_patterns = [
-            (re.compile(pattern, re.IGNORECASE), severity, desc)
-            for pattern, severity, desc in self.VIOLATION_PATTERNS
+        # 所有违规模式合并成一个交替正则，命名分组 v{i} 对应 VIOLATION_PATTERNS[i]
+        bounded = [
+            pattern.replace('.*', '.{0,%d}' % self.MAX_PATTERN_GAP)
+            for pattern, _, _ in self.VIOLATION_PATTERNS
         ]
+        self._violation_regex = re.compile(
+            '|'.join(f'(?P<v{i}>{p})' for i, p in enumerate(bounded)),
+            re.IGNORECASE,
+        )
+        
+        # 禁止词 + 各等级限制词编译成一个自动机
+        self._word_automaton = KeywordAutomaton({"banned": self.BANNED_WORDS})
+        for lvl, words in self.LEVEL_RESTRICTED_WORDS.items():
+            self._word_automaton.add(f"level_{lvl}", words)
+        self._word_automaton.build()
+        
+        # 流式过滤需要保留的最短尾部：任何匹配都不会比它更长
+        self.holdback = max(
+            self._word_automaton.max_keyword_length,
+            max(len(p) for p, _, _ in self.VIOLATION_PATTERNS) + self.MAX_PATTERN_GAP,
+        )
+    
+    def stream(self, level: int = 0) -> "StreamingContentFilter":
+        """
+        创建流式过滤器（用于 SSE 逐块输出）
+        
+        Usage:
+            f = content_filter.stream(level)
+            for chunk in chunks:
+                yield f.feed(chunk)
+            yield f.finish()
+            f.result()  # FilterResult
+        """
+        return StreamingContentFilter(self, level)
+    
+    async def filter_stream(
+        self,
+        chunks: AsyncIterator[str],
+        level: int = 0,
+    ) -> AsyncIterator[str]:
+        """过滤异步 chunk 流（SSE），不缓冲整段回复"""
+        stream = self.stream(level)
+        async for chunk in chunks:
+            out = stream.feed(chunk)
+            if out:
+                yield out
+        out = stream.finish()
+        if out:
+            yield out
+        if stream.violations:
+            logger.warning(f"Stream filtered. Level: {level}, Violations: {stream.violations}")
     
     def filter(
         self,
@@ -117,7 +172,7 @@ class ContentFilter:
         level: int = 0,
     ) -> FilterResult:
         """
-        过滤内容
+        过滤内容（一次线性扫描，单个输出缓冲）
         
         Args:
             content: 要过滤的内容
@@ -126,50 +181,15 @@ class ContentFilter:
         Returns:
             FilterResult 对象
         """
-        violations = []
-        filtered = content
-        max_severity = 'low'
+        stream = self.stream(level)
+        stream.feed(content)
+        stream.finish()
+        result = stream.result()
         
-        # 1. 检测绝对禁止词汇
-        for word in self.BANNED_WORDS:
-            if word in filtered:
-                violations.append(f"绝对禁止词汇: {word}")
-                filtered = filtered.replace(word, "[内容已过滤]")
-                max_severity = 'critical'
+        if result.violations:
+            logger.warning(f"Content filtered. Level: {level}, Violations: {result.violations}")
         
-        # 2. 检测等级限制词汇
-        restricted = self.LEVEL_RESTRICTED_WORDS.get(level, [])
-        for word in restricted:
-            if word in filtered:
-                violations.append(f"等级限制词汇: {word}")
-                replacement = self.REPLACEMENTS.get(word, '...')
-                filtered = filtered.replace(word, replacement)
-                if max_severity not in ['critical', 'high']:
-                    max_severity = 'medium'
-        
-        # 3. 检测违规模式
-        for pattern, severity, desc in self._compiled_patterns:
-            if pattern.search(filtered):
-                violations.append(f"违规模式: {desc}")
-                filtered = pattern.sub('...', filtered)
-                if self._severity_compare(severity, max_severity) > 0:
-                    max_severity = severity
-        
-        # 4. 最终清理
-        filtered = self._final_cleanup(filtered)
-        
-        was_modified = filtered != content
-        
-        if violations:
-            logger.warning(f"Content filtered. Level: {level}, Violations: {violations}")
-        
-        return FilterResult(
-            original=content,
-            filtered=filtered,
-            was_modified=was_modified,
-            violations=violations,
-            severity=max_severity,
-        )
+        return result
     
     def _severity_compare(self, a: str, b: str) -> int:
         """比较严重程度"""
@@ -178,29 +198,18 @@ class ContentFilter:
     
     def _final_cleanup(self, content: str) -> str:
         """最终清理"""
-        # 移除多余的省略号
-        content = re.sub(r'\.{4,}', '...', content)
-        content = re.sub(r'\.\.\.\s*\.\.\.', '...', content)
-        
-        # 移除空的动作描写
-        content = re.sub(r'\*\s*\*', '', content)
-        
-        return content.strip()
+        return self._cleanup(content).strip()
+    
+    def _cleanup(self, content: str) -> str:
+        """合并省略号、移除空动作描写（单次替换）"""
+        return self._CLEANUP_PATTERN.sub(
+            lambda m: '' if m.group(0).startswith('*') else '...', content
+        )
     
     def is_safe(self, content: str, level: int = 0) -> bool:
-        """快速检查内容是否安全"""
-        # 检查绝对禁止词
-        for word in self.BANNED_WORDS:
-            if word in content:
-                return False
-        
-        # 检查等级限制词
-        restricted = self.LEVEL_RESTRICTED_WORDS.get(level, [])
-        for word in restricted:
-            if word in content:
-                return False
-        
-        return True
+        """快速检查内容是否安全（禁止词 / 等级限制词，一次扫描）"""
+        matches = self._word_automaton.scan(content)
+        return not (matches.has("banned") or matches.has(f"level_{level}"))
     
     def get_violation_report(
         self,
@@ -219,6 +228,157 @@ class ContentFilter:
         }
 
 
+class StreamingContentFilter:
+    """
+    流式内容过滤器
+    
+    输入按 chunk 喂入，输出按 chunk 返回。每次只保留 holdback 长度的尾部
+    （可能是跨 chunk 的词或违规描写的开头），其余部分立即过滤并输出。
+    
+    替换规则：从左到右取最早开始的匹配（同位置取最长，同长度禁止词优先），
+    替换后从匹配末尾继续；替换结果不再重复扫描。
+    """
+    
+    _WORD_PRIORITY = {'banned': 0, 'pattern': 1, 'restricted': 2}
+    
+    def __init__(self, content_filter: ContentFilter, level: int = 0):
+        self._filter = content_filter
+        self.level = level
+        self._level_category = f"level_{level}"
+        self._pending = ""        # 尚未过滤的输入
+        self._out_pending = ""    # 已过滤但可能参与清理合并的输出尾部
+        self._started = False     # 是否已输出过非空白字符（用于去掉开头空白）
+        self._original: List[str] = []
+        self._output: List[str] = []
+        self.violations: List[str] = []
+        self.severity = 'low'
+        self._finished = False
+    
+    def feed(self, chunk: str) -> str:
+        """喂入一段文本，返回可以安全输出的过滤结果"""
+        if not chunk:
+            return ""
+        self._original.append(chunk)
+        self._pending += chunk
+        return self._emit(self._process(final=False), final=False)
+    
+    def finish(self) -> str:
+        """输入结束，返回剩余的过滤结果"""
+        if self._finished:
+            return ""
+        self._finished = True
+        return self._emit(self._process(final=True), final=True)
+    
+    def result(self) -> FilterResult:
+        """完整的过滤结果（finish 之后调用）"""
+        original = "".join(self._original)
+        filtered = "".join(self._output)
+        return FilterResult(
+            original=original,
+            filtered=filtered,
+            was_modified=filtered != original,
+            violations=list(self.violations),
+            severity=self.severity,
+        )
+    
+    # ------------------------------------------------------------------
+    
+    def _record(self, violation: str, severity: str) -> None:
+        if violation not in self.violations:
+            self.violations.append(violation)
+        if self._filter._severity_compare(severity, self.severity) > 0:
+            self.severity = severity
+    
+    def _word_matches(self, text: str) -> List[Tuple[int, int, str, str]]:
+        """自动机一次扫描：(start, end, kind, word)，只保留当前等级相关的词"""
+        automaton = self._filter._word_automaton
+        matches = []
+        for start, end, word in automaton.finditer(text):
+            categories = automaton.categories_of(word)
+            if "banned" in categories:
+                matches.append((start, end, 'banned', word))
+            elif self._level_category in categories:
+                matches.append((start, end, 'restricted', word))
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0]), self._WORD_PRIORITY[m[2]]))
+        return matches
+    
+    def _process(self, final: bool) -> str:
+        """过滤 _pending 中可以确定的前缀，写入单个输出缓冲"""
+        text = self._pending
+        limit = len(text) if final else len(text) - self._filter.holdback
+        if limit <= 0:
+            return ""
+        
+        words = self._word_matches(text)
+        regex = self._filter._violation_regex
+        out: List[str] = []
+        pos = 0
+        w = 0
+        
+        while True:
+            # 下一个候选：最早开始的词匹配 / 违规模式匹配
+            while w < len(words) and words[w][0] < pos:
+                w += 1
+            word = words[w] if w < len(words) else None
+            m = regex.search(text, pos)
+            
+            candidate = None
+            if word is not None:
+                candidate = word
+            if m is not None:
+                pattern = (m.start(), m.end(), 'pattern', m.lastgroup)
+                if candidate is None or (
+                    (pattern[0], -(pattern[1] - pattern[0]), self._WORD_PRIORITY['pattern'])
+                    < (candidate[0], -(candidate[1] - candidate[0]), self._WORD_PRIORITY[candidate[2]])
+                ):
+                    candidate = pattern
+            
+            if candidate is None or candidate[0] >= limit:
+                break
+            
+            start, end, kind, key = candidate
+            out.append(text[pos:start])
+            if kind == 'banned':
+                self._record(f"绝对禁止词汇: {key}", 'critical')
+                out.append("[内容已过滤]")
+            elif kind == 'restricted':
+                self._record(f"等级限制词汇: {key}", 'medium')
+                out.append(self._filter.REPLACEMENTS.get(key, '...'))
+            else:
+                _, severity, desc = self._filter.VIOLATION_PATTERNS[int(key[1:])]
+                self._record(f"违规模式: {desc}", severity)
+                out.append('...')
+            pos = max(end, start + 1)
+        
+        cut = max(pos, limit)
+        out.append(text[pos:cut])
+        self._pending = text[cut:]
+        return "".join(out)
+    
+    def _emit(self, filtered: str, final: bool) -> str:
+        """输出清理（合并省略号 / 去掉空动作描写 / 去掉首尾空白）"""
+        buf = self._out_pending + filtered
+        if final:
+            cut = len(buf)
+        else:
+            # 末尾的 . * 空白 可能和下一段合并，先留着
+            cut = len(buf)
+            while cut > 0 and (buf[cut - 1] in '.*' or buf[cut - 1].isspace()):
+                cut -= 1
+        
+        ready = self._filter._cleanup(buf[:cut])
+        self._out_pending = buf[cut:]
+        
+        if not self._started:
+            ready = ready.lstrip()
+            self._started = bool(ready)
+        if final:
+            ready = ready.rstrip()
+        
+        self._output.append(ready)
+        return ready
+
+
 class UserInputFilter:
     """
     用户输入过滤器
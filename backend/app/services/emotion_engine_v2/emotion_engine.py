@@ -27,6 +27,8 @@ from enum import Enum
 import json
 import re
 
+from app.utils.keyword_automaton import KeywordAutomaton
+
 logger = logging.getLogger(__name__)
 
 
@@ -135,6 +137,25 @@ class EmotionEngineV2:
         },
     }
     
+    POSITIVE_EMOJIS = ["😊", "❤️", "🥰", "😍", "💕", "😘", "🤗", "💖", "😄", "🥺"]
+    NEGATIVE_EMOJIS = ["😡", "😤", "💢", "😒", "🙄", "😑", "👎", "💔", "😢", "😭"]
+    
+    # QUICK_PATTERNS + 表情编译成一个自动机（首次使用时构建）
+    _quick_automaton: Optional[KeywordAutomaton] = None
+    
+    @classmethod
+    def _get_quick_automaton(cls) -> KeywordAutomaton:
+        if cls._quick_automaton is None:
+            automaton = KeywordAutomaton()
+            for pattern_name, pattern_config in cls.QUICK_PATTERNS.items():
+                # 中文词不区分大小写，统一在小写文本上匹配
+                automaton.add(pattern_name, pattern_config.get("cn", []))
+                automaton.add(pattern_name, pattern_config.get("en", []))
+            automaton.add("emoji_positive", cls.POSITIVE_EMOJIS)
+            automaton.add("emoji_negative", cls.NEGATIVE_EMOJIS)
+            cls._quick_automaton = automaton.build()
+        return cls._quick_automaton
+    
     def __init__(self, llm_service=None, db_service=None):
         self.llm = llm_service
         self.db = db_service
@@ -180,24 +201,17 @@ class EmotionEngineV2:
             "message_anomaly": None,
         }
         
-        msg_lower = message.lower()
+        matches = self._get_quick_automaton().scan(message.lower())
         
         # 1. 关键词匹配
         for pattern_name, pattern_config in self.QUICK_PATTERNS.items():
-            cn_words = pattern_config.get("cn", [])
-            en_words = pattern_config.get("en", [])
-            weight = pattern_config.get("weight", 0.3)
-            
-            if any(w in message for w in cn_words) or any(w in msg_lower for w in en_words):
+            if matches.has(pattern_name):
                 result["patterns_matched"].append(pattern_name)
-                result["pattern_weights"][pattern_name] = weight
+                result["pattern_weights"][pattern_name] = pattern_config.get("weight", 0.3)
         
         # 2. 表情分析
-        positive_emojis = ["😊", "❤️", "🥰", "😍", "💕", "😘", "🤗", "💖", "😄", "🥺"]
-        negative_emojis = ["😡", "😤", "💢", "😒", "🙄", "😑", "👎", "💔", "😢", "😭"]
-        
-        pos_count = sum(message.count(e) for e in positive_emojis)
-        neg_count = sum(message.count(e) for e in negative_emojis)
+        pos_count = matches.occurrence_count("emoji_positive")
+        neg_count = matches.occurrence_count("emoji_negative")
         
         if pos_count + neg_count > 0:
             result["emoji_sentiment"] = (pos_count - neg_count) / (pos_count + neg_count)
@@ -31,13 +31,21 @@ from dataclasses import dataclass
 from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.single_flight import SingleFlight, request_key
 from app.services.llm_service import GrokService
 from app.models.database.event_memory_models import EventMemory, EventType
 from app.services.character_config import get_character_config, CharacterConfig
 from app.core.database import get_db
+from app.services.prompt_fragment_cache import prompt_fragment_cache, FRAGMENT_EVENTS
 
 logger = logging.getLogger(__name__)
 
+# Identical story prompts within this window reuse the generated story
+STORY_CACHE_TTL = 600
+
+# In-flight story generations keyed by (user, character, event)
+_story_generations = SingleFlight("event_story")
+
 
 # =============================================================================
 # Prompt Templates for Each Event Type
@@ -282,6 +290,10 @@ class EventStoryGenerator:
         """
         Generate an immersive story for a milestone event.
         
+        Concurrent calls for the same (user, character, event) while a story is
+        being generated share that generation instead of producing (and saving)
+        a second one.
+        
         Args:
             user_id: User ID
             character_id: Character ID
@@ -295,6 +307,26 @@ class EventStoryGenerator:
         Returns:
             StoryGenerationResult with the generated story
         """
+        generate = lambda: self._generate_event_story(
+            user_id, character_id, event_type, chat_history,
+            memory_context, relationship_state, save_to_db, db_session,
+        )
+        if not save_to_db:
+            return await generate()
+        key = request_key("event_story", user_id, character_id, event_type)
+        return await _story_generations.do(key, generate)
+    
+    async def _generate_event_story(
+        self,
+        user_id: str,
+        character_id: str,
+        event_type: str,
+        chat_history: List[Dict[str, str]],
+        memory_context: str,
+        relationship_state: Optional[Dict[str, Any]],
+        save_to_db: bool,
+        db_session: Optional[AsyncSession],
+    ) -> StoryGenerationResult:
         try:
             # Validate event type
             if not EventType.is_story_event(event_type):
@@ -532,6 +564,7 @@ class EventStoryGenerator:
                 messages=messages,
                 temperature=0.85,  # Higher creativity for stories
                 max_tokens=2500,   # Allow longer responses for stories
+                cache_ttl=STORY_CACHE_TTL,  # Same prompt (client retry) reuses the story
             )
             
             if response and "choices" in response:
@@ -644,10 +677,14 @@ class EventStoryGenerator:
                     return event_memory
             
             if db_session:
-                return await _save(db_session)
+                saved = await _save(db_session)
             else:
                 async with get_db() as session:
-                    return await _save(session)
+                    saved = await _save(session)
+            
+            # 事件记忆已变化，记忆 prompt 中的事件片段失效
+            prompt_fragment_cache.bump(user_id, character_id, FRAGMENT_EVENTS)
+            return saved
                     
         except Exception as e:
             logger.exception(f"Error saving story: {e}")
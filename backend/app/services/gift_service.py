@@ -22,6 +22,7 @@ from uuid import uuid4
 from app.services.payment_service import payment_service, _transactions
 from app.services.intimacy_service import intimacy_service
 from app.services.effect_service import effect_service
+from app.services.prompt_fragment_cache import prompt_fragment_cache, FRAGMENT_GIFTS
 from app.models.database.gift_models import DEFAULT_GIFT_CATALOG, GiftStatus, GiftTier
 
 # Import emotion service for mood-aware gift responses
@@ -429,6 +430,9 @@ class GiftService:
                     # 注意：TransactionHistory 已在 payment_service.deduct_credits 中创建，这里不再重复
                     await db.commit()
             
+            # 礼物记录已写入，礼物记忆 prompt 片段失效
+            prompt_fragment_cache.bump(user_id, character_id, FRAGMENT_GIFTS)
+            
             # Step 6.5: Check and unlock bottleneck lock if applicable
             bottleneck_unlocked = False
             bottleneck_unlock_result = None
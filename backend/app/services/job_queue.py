@@ -0,0 +1,547 @@
+"""
+Job Queue - 跨进程的持久化后台任务
+==================================
+
+慢任务（记忆提取、生图、事件故事、TTS）不再占用 API worker 的事件循环：
+API 只负责入队，独立的 worker 进程（python -m app.tasks.job_worker）执行，
+客户端通过 GET /api/v1/jobs/{job_id} 轮询结果。
+
+存储后端：
+- Redis（REDIS_URL 可用时）：ready list + scheduled zset + job 记录（带 TTL），
+  抢占时 BLMOVE 到 processing list 并记租约，崩溃 worker 的任务租约到期后重新排队
+- 数据库（MOCK_REDIS / Redis 不可用时）：background_jobs 表
+
+特性：
+- idempotency_key：相同 key 只会创建一个任务，重复入队返回已有任务（已失败的除外；
+  idempotency_in_flight_only=True 时只在任务未完成期间去重，完成后可再次入队）
+- 定时任务：delay_seconds / run_at
+- 失败重试：指数退避 + 抖动，超过 max_attempts 标记 failed
+- 结果存储：handler 返回的 dict 写入 result
+
+Usage:
+    job = await job_queue.enqueue(
+        "image_generation",
+        {"user_id": uid, "character_id": cid, "prompt": "..."},
+        user_id=uid,
+        idempotency_key=f"image:{uid}:{request_id}",
+    )
+    # 之后
+    job = await job_queue.get(job.job_id)
+"""
+
+import json
+import time
+import calendar
+import uuid
+import random
+import asyncio
+import logging
+from dataclasses import dataclass, field, asdict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+
+RETRY_BASE_DELAY = 5.0       # 秒
+RETRY_MAX_DELAY = 300.0
+RESULT_TTL_SECONDS = 7 * 24 * 3600
+RUNNING_LEASE_SECONDS = 15 * 60  # running 超过该时间视为 worker 崩溃，重新排队
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]
+
+# job_type -> handler，由 app/tasks/jobs.py 注册
+JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+
+def job_handler(job_type: str):
+    """注册任务处理函数：handler(payload) -> result dict"""
+    def decorator(func: JobHandler) -> JobHandler:
+        JOB_HANDLERS[job_type] = func
+        return func
+    return decorator
+
+
+@dataclass
+class Job:
+    """后台任务"""
+    job_type: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+    job_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: Optional[str] = None
+    idempotency_key: Optional[str] = None
+    status: str = STATUS_PENDING
+    attempts: int = 0
+    max_attempts: int = 3
+    run_at: datetime = field(default_factory=datetime.utcnow)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    updated_at: datetime = field(default_factory=datetime.utcnow)
+
+    @property
+    def done(self) -> bool:
+        return self.status in (STATUS_SUCCEEDED, STATUS_FAILED)
+
+    def holds_idempotency_key(self, in_flight_only: bool = False) -> bool:
+        """已失败的任务不占用幂等 key；in_flight_only 时已完成的任务都不占用"""
+        return not self.done if in_flight_only else self.status != STATUS_FAILED
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        for key in ("run_at", "created_at", "updated_at"):
+            data[key] = data[key].isoformat() if data[key] else None
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Job":
+        data = dict(data)
+        for key in ("run_at", "created_at", "updated_at"):
+            if isinstance(data.get(key), str):
+                data[key] = datetime.fromisoformat(data[key])
+        return cls(**data)
+
+
+# =============================================================================
+# Redis 后端
+# =============================================================================
+
+class RedisJobBackend:
+    """
+    Redis 后端：jobs:ready (list) + jobs:scheduled (zset) + jobs:job:{id}
+
+    claim 用 BLMOVE 把任务从 ready 原子地移到 jobs:processing，并在 jobs:leases
+    记下租约到期时间（RUNNING_LEASE_SECONDS）；完成 / 重试 / 失败时移除。
+    worker 崩溃留下的任务在租约到期后由下一次 claim 放回 ready。
+    """
+
+    READY_KEY = "jobs:ready"
+    SCHEDULED_KEY = "jobs:scheduled"
+    PROCESSING_KEY = "jobs:processing"
+    LEASES_KEY = "jobs:leases"
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"jobs:job:{job_id}"
+
+    @staticmethod
+    def _idem_key(key: str) -> str:
+        return f"jobs:idem:{key}"
+
+    async def _save(self, job: Job) -> None:
+        job.updated_at = datetime.utcnow()
+        await self.redis.set(
+            self._job_key(job.job_id),
+            json.dumps(job.to_dict(), ensure_ascii=False, default=str),
+            ex=RESULT_TTL_SECONDS,
+        )
+
+    async def _schedule(self, job: Job) -> None:
+        if job.run_at <= datetime.utcnow():
+            await self.redis.lpush(self.READY_KEY, job.job_id)
+        else:
+            await self.redis.zadd(self.SCHEDULED_KEY, {job.job_id: calendar.timegm(job.run_at.utctimetuple())})
+
+    async def enqueue(self, job: Job, in_flight_only: bool = False) -> Job:
+        if job.idempotency_key:
+            claimed = await self.redis.set(
+                self._idem_key(job.idempotency_key), job.job_id,
+                nx=True, ex=RESULT_TTL_SECONDS,
+            )
+            if not claimed:
+                existing_id = await self.redis.get(self._idem_key(job.idempotency_key))
+                existing = await self.get(existing_id) if existing_id else None
+                if existing and existing.holds_idempotency_key(in_flight_only):
+                    return existing
+                # 不再占用幂等 key 的任务（已失败 / 已完成），允许重新入队
+                await self.redis.set(
+                    self._idem_key(job.idempotency_key), job.job_id, ex=RESULT_TTL_SECONDS
+                )
+
+        await self._save(job)
+        await self._schedule(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        raw = await self.redis.get(self._job_key(job_id))
+        return Job.from_dict(json.loads(raw)) if raw else None
+
+    async def _promote_due(self) -> None:
+        """把到期的定时任务移到 ready list（zrem 成功者负责推送，避免重复）"""
+        due = await self.redis.zrangebyscore(
+            self.SCHEDULED_KEY, "-inf", time.time(), start=0, num=100
+        )
+        for job_id in due:
+            if await self.redis.zrem(self.SCHEDULED_KEY, job_id):
+                await self.redis.lpush(self.READY_KEY, job_id)
+
+    async def _reclaim_expired(self) -> None:
+        """租约到期的任务放回 ready（zrem 成功者负责，避免重复）"""
+        expired = await self.redis.zrangebyscore(
+            self.LEASES_KEY, "-inf", time.time(), start=0, num=100
+        )
+        for job_id in expired:
+            if not await self.redis.zrem(self.LEASES_KEY, job_id):
+                continue
+            await self.redis.lrem(self.PROCESSING_KEY, 0, job_id)
+            job = await self.get(job_id)
+            if job is None or job.done:
+                continue
+            logger.warning(f"Job lease expired, requeueing: {job.job_type} {job_id}")
+            job.status = STATUS_PENDING
+            await self._save(job)
+            await self.redis.lpush(self.READY_KEY, job_id)
+
+    async def _release(self, job_id: str) -> None:
+        await self.redis.zrem(self.LEASES_KEY, job_id)
+        await self.redis.lrem(self.PROCESSING_KEY, 0, job_id)
+
+    async def claim(self, worker_id: str, timeout: float) -> Optional[Job]:
+        await self._promote_due()
+        await self._reclaim_expired()
+        # 生产者 lpush，从右端取；任务留在 processing 直到完成
+        job_id = await self.redis.blmove(
+            self.READY_KEY, self.PROCESSING_KEY, max(1, int(timeout)), "RIGHT", "LEFT"
+        )
+        if not job_id:
+            return None
+        await self.redis.zadd(self.LEASES_KEY, {job_id: time.time() + RUNNING_LEASE_SECONDS})
+        job = await self.get(job_id)
+        if job is None or job.status != STATUS_PENDING:
+            await self._release(job_id)
+            return None
+        job.status = STATUS_RUNNING
+        job.attempts += 1
+        await self._save(job)
+        return job
+
+    async def complete(self, job: Job, result: Optional[Dict[str, Any]]) -> None:
+        job.status = STATUS_SUCCEEDED
+        job.result = result
+        job.error = None
+        await self._save(job)
+        await self._release(job.job_id)
+
+    async def retry(self, job: Job, error: str, run_at: datetime) -> None:
+        job.status = STATUS_PENDING
+        job.error = error
+        job.run_at = run_at
+        await self._save(job)
+        await self._release(job.job_id)
+        await self._schedule(job)
+
+    async def fail(self, job: Job, error: str) -> None:
+        job.status = STATUS_FAILED
+        job.error = error
+        await self._save(job)
+        await self._release(job.job_id)
+
+
+# =============================================================================
+# 数据库后端
+# =============================================================================
+
+class DatabaseJobBackend:
+    """数据库后端：background_jobs 表，条件 UPDATE 抢占任务"""
+
+    @staticmethod
+    def _to_job(row) -> Job:
+        return Job(
+            job_id=row.job_id,
+            job_type=row.job_type,
+            payload=row.payload or {},
+            user_id=row.user_id,
+            idempotency_key=row.idempotency_key,
+            status=row.status,
+            attempts=row.attempts or 0,
+            max_attempts=row.max_attempts or 1,
+            run_at=row.run_at,
+            result=row.result,
+            error=row.error,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+        )
+
+    async def _get_by_idempotency_key(self, key: str) -> Optional[Job]:
+        from sqlalchemy import select
+        from app.core.database import get_db
+        from app.models.database.job_models import BackgroundJob
+
+        async with get_db() as db:
+            result = await db.execute(
+                select(BackgroundJob).where(BackgroundJob.idempotency_key == key)
+            )
+            row = result.scalar_one_or_none()
+            return self._to_job(row) if row else None
+
+    async def enqueue(self, job: Job, in_flight_only: bool = False) -> Job:
+        from sqlalchemy.exc import IntegrityError
+        from app.core.database import get_db
+        from app.models.database.job_models import BackgroundJob
+
+        if job.idempotency_key:
+            existing = await self._get_by_idempotency_key(job.idempotency_key)
+            if existing and existing.holds_idempotency_key(in_flight_only):
+                return existing
+            if existing:
+                # 不再占用幂等 key 的任务（已失败 / 已完成），允许重新入队
+                await self._update(existing, idempotency_key=None)
+
+        try:
+            async with get_db() as db:
+                db.add(BackgroundJob(
+                    job_id=job.job_id,
+                    job_type=job.job_type,
+                    user_id=job.user_id,
+                    payload=job.payload,
+                    idempotency_key=job.idempotency_key,
+                    status=job.status,
+                    attempts=job.attempts,
+                    max_attempts=job.max_attempts,
+                    run_at=job.run_at,
+                    created_at=job.created_at,
+                    updated_at=job.updated_at,
+                ))
+        except IntegrityError:
+            # 并发入队同一个 idempotency_key
+            existing = await self._get_by_idempotency_key(job.idempotency_key)
+            if existing:
+                return existing
+            raise
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        from sqlalchemy import select
+        from app.core.database import get_db
+        from app.models.database.job_models import BackgroundJob
+
+        async with get_db() as db:
+            result = await db.execute(
+                select(BackgroundJob).where(BackgroundJob.job_id == job_id)
+            )
+            row = result.scalar_one_or_none()
+            return self._to_job(row) if row else None
+
+    async def claim(self, worker_id: str, timeout: float) -> Optional[Job]:
+        from sqlalchemy import select, update
+        from app.core.database import get_db
+        from app.models.database.job_models import BackgroundJob
+
+        now = datetime.utcnow()
+        async with get_db() as db:
+            # 回收崩溃 worker 遗留的 running 任务
+            await db.execute(
+                update(BackgroundJob)
+                .where(
+                    BackgroundJob.status == STATUS_RUNNING,
+                    BackgroundJob.updated_at < now - timedelta(seconds=RUNNING_LEASE_SECONDS),
+                )
+                .values(status=STATUS_PENDING, locked_by=None)
+            )
+
+            result = await db.execute(
+                select(BackgroundJob.job_id)
+                .where(BackgroundJob.status == STATUS_PENDING, BackgroundJob.run_at <= now)
+                .order_by(BackgroundJob.run_at)
+                .limit(5)
+            )
+            for job_id in result.scalars().all():
+                claimed = await db.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.job_id == job_id, BackgroundJob.status == STATUS_PENDING)
+                    .values(
+                        status=STATUS_RUNNING,
+                        attempts=BackgroundJob.attempts + 1,
+                        locked_by=worker_id,
+                        updated_at=now,
+                    )
+                )
+                if claimed.rowcount == 1:
+                    row = await db.get(BackgroundJob, job_id)
+                    await db.refresh(row)
+                    return self._to_job(row)
+
+        # 没有任务，等待下一轮轮询
+        await asyncio.sleep(timeout)
+        return None
+
+    async def _update(self, job: Job, **values) -> None:
+        from sqlalchemy import update
+        from app.core.database import get_db
+        from app.models.database.job_models import BackgroundJob
+
+        async with get_db() as db:
+            await db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.job_id == job.job_id)
+                .values(updated_at=datetime.utcnow(), **values)
+            )
+
+    async def complete(self, job: Job, result: Optional[Dict[str, Any]]) -> None:
+        job.status, job.result, job.error = STATUS_SUCCEEDED, result, None
+        await self._update(job, status=STATUS_SUCCEEDED, result=result, error=None, locked_by=None)
+
+    async def retry(self, job: Job, error: str, run_at: datetime) -> None:
+        job.status, job.error, job.run_at = STATUS_PENDING, error, run_at
+        await self._update(job, status=STATUS_PENDING, error=error, run_at=run_at, locked_by=None)
+
+    async def fail(self, job: Job, error: str) -> None:
+        job.status, job.error = STATUS_FAILED, error
+        await self._update(job, status=STATUS_FAILED, error=error, locked_by=None)
+
+
+# =============================================================================
+# 队列
+# =============================================================================
+
+class JobQueue:
+    """任务队列（入队 / 查询 / worker 执行循环）"""
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self.stats: Dict[str, int] = {
+            "enqueued": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retried": 0,
+        }
+
+    async def _get_backend(self):
+        if self._backend is None:
+            from app.core.redis import get_redis, MockRedis
+            redis = await get_redis()
+            if isinstance(redis, MockRedis):
+                self._backend = DatabaseJobBackend()
+                logger.info("Job queue backend: database")
+            else:
+                self._backend = RedisJobBackend(redis)
+                logger.info("Job queue backend: redis")
+        return self._backend
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        *,
+        user_id: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        delay_seconds: float = 0,
+        run_at: Optional[datetime] = None,
+        max_attempts: int = 3,
+        idempotency_in_flight_only: bool = False,
+    ) -> Job:
+        """
+        入队
+
+        Args:
+            job_type: 任务类型（见 app/tasks/jobs.py）
+            payload: JSON 可序列化的参数
+            user_id: 任务所属用户（轮询接口做归属校验）
+            idempotency_key: 幂等 key，重复入队返回已有任务
+            delay_seconds / run_at: 定时执行
+            max_attempts: 最大尝试次数
+            idempotency_in_flight_only: 幂等 key 只在任务未完成期间生效（结果会过期的任务用）
+
+        Returns:
+            新建或已有的 Job
+        """
+        if run_at is None:
+            run_at = datetime.utcnow() + timedelta(seconds=delay_seconds)
+        job = Job(
+            job_type=job_type,
+            payload=payload,
+            user_id=user_id,
+            idempotency_key=idempotency_key,
+            max_attempts=max(1, max_attempts),
+            run_at=run_at,
+        )
+        backend = await self._get_backend()
+        stored = await backend.enqueue(job, in_flight_only=idempotency_in_flight_only)
+        if stored.job_id == job.job_id:
+            self.stats["enqueued"] += 1
+            logger.info(f"📥 Job enqueued: {job_type} {job.job_id}")
+        return stored
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        backend = await self._get_backend()
+        return await backend.get(job_id)
+
+    async def run_once(self, worker_id: str = "worker", timeout: float = 1.0) -> bool:
+        """抢占并执行一个任务，没有任务时返回 False"""
+        backend = await self._get_backend()
+        job = await backend.claim(worker_id, timeout)
+        if job is None:
+            return False
+        await self._execute(backend, job)
+        return True
+
+    async def _execute(self, backend, job: Job) -> None:
+        handler = JOB_HANDLERS.get(job.job_type)
+        if handler is None:
+            self.stats["failed"] += 1
+            await backend.fail(job, f"Unknown job type: {job.job_type}")
+            logger.error(f"❌ Unknown job type: {job.job_type} ({job.job_id})")
+            return
+
+        try:
+            result = await handler(job.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if job.attempts < job.max_attempts:
+                delay = min(
+                    RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (job.attempts - 1))
+                ) * random.uniform(0.5, 1.5)
+                self.stats["retried"] += 1
+                await backend.retry(job, error, datetime.utcnow() + timedelta(seconds=delay))
+                logger.warning(
+                    f"Job {job.job_type} {job.job_id} failed ({error}), "
+                    f"retry {job.attempts}/{job.max_attempts} in {delay:.1f}s"
+                )
+            else:
+                self.stats["failed"] += 1
+                await backend.fail(job, error)
+                logger.error(f"❌ Job {job.job_type} {job.job_id} failed permanently: {error}")
+            return
+
+        self.stats["succeeded"] += 1
+        await backend.complete(job, result)
+        logger.info(f"✅ Job completed: {job.job_type} {job.job_id}")
+
+    async def run_forever(
+        self,
+        concurrency: int = 4,
+        poll_interval: float = 1.0,
+        stop_event: Optional[asyncio.Event] = None,
+        worker_id: str = "worker",
+    ) -> None:
+        """worker 主循环：concurrency 个并发消费者，stop_event 置位后退出"""
+        stop_event = stop_event or asyncio.Event()
+
+        async def consumer(index: int) -> None:
+            name = f"{worker_id}:{index}"
+            while not stop_event.is_set():
+                try:
+                    await self.run_once(name, poll_interval)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Job consumer {name} error: {e}", exc_info=True)
+                    await asyncio.sleep(poll_interval)
+
+        await asyncio.gather(*(consumer(i) for i in range(concurrency)))
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+# 单例
+job_queue = JobQueue()
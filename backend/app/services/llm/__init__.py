@@ -6,6 +6,7 @@ Architecture:
 - Chat: Grok grok-4-1-fast-non-reasoning ($0.2/M tokens) - Main conversation
 - Image: Grok grok-imagine-image ($0.07/image) - Image generation
 - Embedding: OpenAI text-embedding-3-small ($0.02/M tokens) - Memory/RAG only
+- Router: hedged requests / fallback routes / circuit breaker for chat completions
 
 IMPORTANT: OpenAI API is ONLY used for embeddings. Do not use it for chat/completion.
 """
@@ -13,12 +14,15 @@ IMPORTANT: OpenAI API is ONLY used for embeddings. Do not use it for chat/comple
 from app.services.llm.grok_chat import GrokChatService, grok_chat
 from app.services.llm.grok_image import GrokImageService, grok_image
 from app.services.llm.openai_embedding import OpenAIEmbeddingService, openai_embedding
+from app.services.llm.router import LLMRouter, llm_router
 
 __all__ = [
     "GrokChatService",
     "GrokImageService", 
     "OpenAIEmbeddingService",
+    "LLMRouter",
     "grok_chat",
     "grok_image",
     "openai_embedding",
+    "llm_router",
 ]
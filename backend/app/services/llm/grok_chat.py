@@ -14,6 +14,8 @@ import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.core.exceptions import LLMServiceError
+from app.core.metrics import record_llm_usage
+from app.core.tracing import traced
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -53,6 +55,7 @@ class GrokChatService:
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=2, max=10)
     )
+    @traced("grok.chat", kind="client")
     async def chat(
         self,
         messages: List[Dict[str, str]],
@@ -107,11 +110,10 @@ class GrokChatService:
                 
                 # Log usage for cost tracking
                 usage = result.get("usage", {})
+                pricing = self.PRICING.get(use_model, self.PRICING[self.DEFAULT_MODEL])
+                cost = record_llm_usage("xai", use_model, usage, pricing)
                 if usage:
-                    pricing = self.PRICING.get(use_model, self.PRICING[self.DEFAULT_MODEL])
-                    input_cost = usage.get("prompt_tokens", 0) / 1_000_000 * pricing["input"]
-                    output_cost = usage.get("completion_tokens", 0) / 1_000_000 * pricing["output"]
-                    logger.debug(f"Grok usage: {usage}, cost: ${input_cost + output_cost:.6f}")
+                    logger.debug(f"Grok usage: {usage}, cost: ${cost:.6f}")
                 
                 return result
         
@@ -152,6 +154,7 @@ class GrokChatService:
         
         return result["choices"][0]["message"]["content"]
     
+    @traced("grok.stream_chat", kind="client")
     async def stream_chat(
         self,
         messages: List[Dict[str, str]],
@@ -26,6 +26,8 @@ import httpx
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.core.exceptions import LLMServiceError
+from app.core.metrics import record_llm_usage
+from app.core.tracing import traced
 from app.config import settings
 
 logger = logging.getLogger(__name__)
@@ -64,6 +66,7 @@ class OpenAIEmbeddingService:
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=5)
     )
+    @traced("openai.embed", kind="client")
     async def embed(self, texts: List[str]) -> List[List[float]]:
         """
         Generate embeddings for multiple texts.
@@ -111,10 +114,12 @@ class OpenAIEmbeddingService:
                 
                 # Log usage for cost tracking
                 usage = data.get("usage", {})
+                cost = record_llm_usage(
+                    "openai", self.MODEL, usage,
+                    {"input": self.COST_PER_MILLION_TOKENS}, kind="embedding",
+                )
                 if usage:
-                    tokens = usage.get("total_tokens", 0)
-                    cost = tokens / 1_000_000 * self.COST_PER_MILLION_TOKENS
-                    logger.debug(f"Embedding tokens: {tokens}, cost: ${cost:.6f}")
+                    logger.debug(f"Embedding tokens: {usage.get('total_tokens', 0)}, cost: ${cost:.6f}")
                 
                 # Sort by index to ensure correct order
                 embeddings_data = sorted(data["data"], key=lambda x: x["index"])
@@ -0,0 +1,407 @@
+"""
+LLM Router - 对冲请求 / 延迟感知降级 / 熔断
+============================================
+
+GrokService.chat_completion 原来只有一个 provider、60s 超时，失败后 @retry 指数等待
+2~10s 重试 3 次：provider 抖一下，一次对话就可能超过一分钟。这里替换为:
+
+- 每条路由（model@base_url）维护最近 LATENCY_WINDOW 次成功调用的延迟，算滚动 p50 / p95
+- 对冲：请求超过该路由观测到的 p95 仍未返回时，对同一路由再发一份，先返回的胜出，另一份取消
+  （样本不足 MIN_SAMPLES 时用 HEDGE_DEFAULT_DELAY）
+- 降级：可重试的失败（超时 / 网络错误 / 429 / 5xx）按顺序换下一条路由，列表用完后回到主路由，
+  每次请求最多 MAX_ATTEMPTS 次尝试（含对冲）；4xx 参数错误直接抛出，不重试
+- 熔断：每条路由连续失败 BREAKER_FAILURES 次后打开 BREAKER_COOLDOWN 秒，期间跳过该路由；
+  冷却后放一个试探请求（half-open），成功则关闭，失败或被取消则重新打开
+- 重试预算：对冲和降级都要从预算里取；滑动窗口内重试数不超过
+  RETRY_BUDGET_MIN + RETRY_BUDGET_RATIO × 请求数，provider 整体故障时不会把流量放大成几倍
+
+路由列表 = 主路由（settings.XAI_MODEL @ settings.XAI_BASE_URL）+ LLM_FALLBACK_ROUTES。
+所有路由共用 XAI_API_KEY（OpenAI 兼容接口）。
+
+Usage:
+    result = await llm_router.chat_completion(payload, headers={"x-grok-conv-id": key})
+    llm_router.get_stats()
+
+环境变量:
+    LLM_FALLBACK_ROUTES     降级路由，逗号分隔，"model" 或 "model@base_url"（默认空）
+    LLM_HEDGE_ENABLED       是否对冲（默认 true）
+    LLM_ATTEMPT_TIMEOUT     单次尝试超时秒数（默认 30）
+    LLM_RETRY_BUDGET_RATIO  重试预算占请求数的比例（默认 0.1）
+"""
+
+import os
+import time
+import asyncio
+import bisect
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from app.config import settings
+from app.core.exceptions import LLMServiceError
+from app.core.metrics import metrics, record_llm_usage
+from app.core.tracing import tracer
+from app.services.llm.grok_chat import GrokChatService
+from app.services.v4.context_builder import MESSAGE_OVERHEAD, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_ROUTES = os.getenv("LLM_FALLBACK_ROUTES", "")
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "true").lower() == "true"
+ATTEMPT_TIMEOUT = float(os.getenv("LLM_ATTEMPT_TIMEOUT", "30"))
+RETRY_BUDGET_RATIO = float(os.getenv("LLM_RETRY_BUDGET_RATIO", "0.1"))
+
+LATENCY_WINDOW = 200
+MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.5
+HEDGE_DEFAULT_DELAY = 8.0
+MAX_ATTEMPTS = 3
+
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30.0
+
+RETRY_BUDGET_WINDOW = 10.0
+RETRY_BUDGET_MIN = 5
+
+# 可重试的 HTTP 状态码（其余 4xx 视为请求本身有问题）
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """超时 / 网络错误 / 429 / 5xx 可以换路由重试；参数错误等 4xx 不行"""
+    if isinstance(error, LLMServiceError):
+        status = error.status_code
+        return status is None or status >= 500 or status in RETRYABLE_STATUS
+    return isinstance(error, (httpx.HTTPError, asyncio.TimeoutError))
+
+
+class LatencyWindow:
+    """最近 N 次延迟的滚动分位数（有序列表 + 环形队列）"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples: Deque[float] = deque()
+        self._sorted: List[float] = []
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        if len(self._samples) >= self.size:
+            oldest = self._samples.popleft()
+            del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+        self._samples.append(seconds)
+        bisect.insort(self._sorted, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._sorted:
+            return None
+        index = min(len(self._sorted) - 1, int(q * len(self._sorted)))
+        return self._sorted[index]
+
+
+class CircuitBreaker:
+    """连续失败计数熔断器（closed → open → half_open → closed）"""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.failure_threshold = failures
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_cancelled(self) -> None:
+        """试探请求被取消时按失败处理，否则 half-open 会一直停在"试探中"，路由再也不会被放行"""
+        if self._probing:
+            self.record_failure()
+
+    def record_failure(self) -> bool:
+        """记录一次失败，返回这次是否打开了熔断"""
+        self.failures += 1
+        was_open = self.opened_at is not None
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._probing = False
+            return not was_open
+        return False
+
+
+class RetryBudget:
+    """滑动窗口内: 重试数 <= min_retries + ratio × 请求数"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_retries: int = RETRY_BUDGET_MIN,
+                 window: float = RETRY_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        now = time.monotonic()
+        self._trim(now)
+        self._requests.append(now)
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+            return False
+        self._retries.append(now)
+        return True
+
+
+@dataclass
+class Route:
+    """一条 provider 路由"""
+    model: str
+    base_url: str
+    latency: LatencyWindow = field(default_factory=LatencyWindow)
+    breaker: CircuitBreaker = field(default_factory=CircuitBreaker)
+
+    @property
+    def name(self) -> str:
+        return f"{self.model}@{urlparse(self.base_url).netloc or self.base_url}"
+
+    @property
+    def provider(self) -> str:
+        host = urlparse(self.base_url).netloc
+        return "xai" if not host or host.endswith("x.ai") else host
+
+    def hedge_delay(self) -> float:
+        """超过这个时间还没返回就发对冲请求：观测 p95（样本不足时用默认值）"""
+        if len(self.latency) < MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, self.latency.quantile(0.95))
+
+
+def parse_routes(spec: str, default_base_url: str) -> List[Route]:
+    """"model" 或 "model@base_url"，逗号分隔"""
+    routes = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        model, _, base_url = item.partition("@")
+        routes.append(Route(model=model.strip(), base_url=(base_url.strip() or default_base_url).rstrip("/")))
+    return routes
+
+
+class LLMRouter:
+    """按路由顺序发送 chat completion，带对冲、降级、熔断和重试预算"""
+
+    def __init__(
+        self,
+        routes: Optional[List[Route]] = None,
+        hedge_enabled: bool = HEDGE_ENABLED,
+        attempt_timeout: float = ATTEMPT_TIMEOUT,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self._routes = routes
+        self.hedge_enabled = hedge_enabled
+        self.attempt_timeout = attempt_timeout
+        self.budget = budget or RetryBudget()
+        self.stats = {
+            "requests": 0, "hedges": 0, "hedge_wins": 0, "fallbacks": 0,
+            "cancelled": 0, "budget_exhausted": 0, "circuit_rejected": 0,
+        }
+
+    @property
+    def routes(self) -> List[Route]:
+        # 首次使用时才读配置，测试 / 压测可以先改 settings
+        if self._routes is None:
+            primary = Route(model=settings.XAI_MODEL, base_url=settings.XAI_BASE_URL.rstrip("/"))
+            self._routes = [primary] + parse_routes(FALLBACK_ROUTES, primary.base_url)
+        return self._routes
+
+    async def chat_completion(self, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> Dict:
+        """
+        发送一次 chat completion（payload 不含 model，由路由填入）
+
+        Raises:
+            LLMServiceError: 所有尝试都失败、遇到不可重试的错误，或所有路由都处于熔断
+        """
+        self.stats["requests"] += 1
+        self.budget.record_request()
+
+        routes = self.routes
+        index = next((i for i, route in enumerate(routes) if route.breaker.allow()), None)
+        if index is None:
+            self.stats["circuit_rejected"] += 1
+            raise LLMServiceError("All LLM routes are unavailable (circuit open)", status_code=503)
+        primary = routes[index]
+        fallbacks = routes[index + 1:]
+
+        pending: Dict[asyncio.Task, str] = {}
+        attempts = 0
+        last_error: Optional[BaseException] = None
+
+        def launch(route: Route, kind: str) -> None:
+            nonlocal attempts
+            attempts += 1
+            task = asyncio.create_task(self._attempt(route, payload, headers or {}))
+            pending[task] = kind
+            if kind != "primary":
+                self.stats[f"{kind}s"] += 1
+                metrics.LLM_ROUTER_EVENTS.labels(route=route.name, event=kind).inc()
+
+        def spend_retry() -> bool:
+            if attempts >= MAX_ATTEMPTS:
+                return False
+            if not self.budget.try_spend():
+                self.stats["budget_exhausted"] += 1
+                return False
+            return True
+
+        launch(primary, "primary")
+        hedge_at = time.monotonic() + primary.hedge_delay() if self.hedge_enabled else None
+        try:
+            while pending:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # 超过 p95 还没返回：对同一路由再发一份
+                    hedge_at = None
+                    if spend_retry():
+                        launch(primary, "hedge")
+                    continue
+
+                for task in done:
+                    kind = pending.pop(task)
+                    error = task.exception()
+                    if error is None:
+                        if kind == "hedge":
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    last_error = error
+                    if not is_retryable(error):
+                        raise error
+
+                # 在途的都失败了：按顺序降级（列表用完且主路由未熔断时回到主路由）
+                if not pending:
+                    route = next((r for r in fallbacks if r.breaker.state != "open"), None)
+                    if route is None and primary.breaker.state == "closed":
+                        route = primary
+                    if route is not None and spend_retry() and (route is primary or route.breaker.allow()):
+                        if route in fallbacks:
+                            fallbacks.remove(route)
+                        launch(route, "fallback")
+                        hedge_at = None
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise last_error
+
+    async def _attempt(self, route: Route, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict:
+        started = time.monotonic()
+        with tracer.start_span("llm.attempt", attributes={"llm.route": route.name}, kind="client"):
+            try:
+                result = await self._post(route, payload, headers)
+            except asyncio.CancelledError:
+                self.stats["cancelled"] += 1
+                route.breaker.record_cancelled()
+                self._record_cancelled_usage(route, payload)
+                raise
+            except Exception as e:
+                if is_retryable(e):
+                    if route.breaker.record_failure():
+                        logger.warning(f"LLM circuit opened for {route.name}: {e}")
+                        metrics.LLM_ROUTER_EVENTS.labels(route=route.name, event="circuit_open").inc()
+                else:
+                    route.breaker.record_success()
+                raise
+
+        route.latency.observe(time.monotonic() - started)
+        route.breaker.record_success()
+        return result
+
+    async def _post(self, route: Route, payload: Dict[str, Any], headers: Dict[str, str]) -> Dict:
+        request_headers = {
+            "Authorization": f"Bearer {settings.XAI_API_KEY}",
+            "Content-Type": "application/json",
+            **headers,
+        }
+        try:
+            async with httpx.AsyncClient(timeout=self.attempt_timeout) as client:
+                response = await client.post(
+                    f"{route.base_url}/chat/completions",
+                    headers=request_headers,
+                    json={**payload, "model": route.model},
+                )
+        except httpx.TimeoutException:
+            raise LLMServiceError(f"LLM timeout ({route.name})")
+        except httpx.RequestError as e:
+            raise LLMServiceError(f"LLM request failed ({route.name}): {e}")
+
+        if response.status_code != 200:
+            raise LLMServiceError(f"LLM API error ({route.name}): {response.text}", status_code=response.status_code)
+
+        result = response.json()
+        record_llm_usage(route.provider, route.model, result.get("usage"), self._pricing(route))
+        return result
+
+    @staticmethod
+    def _pricing(route: Route) -> Dict[str, float]:
+        return GrokChatService.PRICING.get(route.model, GrokChatService.PRICING[GrokChatService.DEFAULT_MODEL])
+
+    def _record_cancelled_usage(self, route: Route, payload: Dict[str, Any]) -> None:
+        """
+        被取消的尝试（对冲落败 / 调用方取消）拿不到 usage，但 provider 已经收到并计费了整段 prompt：
+        按估算的 prompt token 记账（kind="cancelled"），对冲的真实成本才算得出来
+        """
+        prompt_tokens = sum(
+            estimate_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD
+            for message in payload.get("messages") or []
+        )
+        record_llm_usage(
+            route.provider, route.model, {"prompt_tokens": prompt_tokens}, self._pricing(route), kind="cancelled",
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        routes = {}
+        for route in self.routes:
+            routes[route.name] = {
+                "state": route.breaker.state,
+                "samples": len(route.latency),
+                "p50": route.latency.quantile(0.5),
+                "p95": route.latency.quantile(0.95),
+                "hedge_delay": route.hedge_delay(),
+            }
+        return {**self.stats, "routes": routes}
+
+
+# 单例
+llm_router = LLMRouter()
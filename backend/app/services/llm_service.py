@@ -13,6 +13,7 @@ Architecture:
 - Embedding: OpenAI text-embedding-3-small ($0.02/M tokens) - ONLY OpenAI use!
 """
 
+import copy
 import logging
 from typing import List, Dict, Optional, AsyncGenerator
 import httpx
@@ -24,10 +25,18 @@ except ImportError:
     from app.core.retry import retry, stop_after_attempt, wait_exponential
 
 from app.core.exceptions import LLMServiceError
+from app.core.metrics import record_llm_usage
+from app.core.single_flight import SingleFlight, request_key
+from app.core.tracing import traced
 from app.config import settings
+from app.services.llm.router import llm_router
+from app.services.llm import openai_embedding
 
 logger = logging.getLogger(__name__)
 
+# 所有 GrokService 实例共享：相同请求的并发合并 + cache_ttl 结果缓存
+llm_responses = SingleFlight("llm_response")
+
 
 # =============================================================================
 # GrokService - Main Chat (backward compatible)
@@ -51,10 +60,7 @@ class GrokService:
         
         logger.debug(f"GrokService initialized with model: {self.model}")
     
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=2, max=10)
-    )
+    @traced("grok.chat_completion", kind="client")
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -64,16 +70,27 @@ class GrokService:
         frequency_penalty: float = 0.0,
         presence_penalty: float = 0.0,
         stream: bool = False,
-        response_format: Dict = None
+        response_format: Dict = None,
+        prompt_cache_key: str = None,
+        cache_ttl: float = 0
     ) -> Dict:
-        """Call Grok chat completion API."""
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
+        """
+        Call Grok chat completion API.
+        
+        经 llm_router 发送：超过观测 p95 时对冲、失败按顺序降级、熔断与重试预算
+        （见 app/services/llm/router.py），不再做固定退避的 @retry。
+        
+        相同的 (model, messages, 参数) 并发请求合并为一次调用（客户端重试 / 多标签页）；
+        cache_ttl > 0 的调用成功结果再缓存 cache_ttl 秒，只给输入相同即可复用输出的生成用。
+        
+        prompt_cache_key: 稳定前缀的缓存 key，作为 x-grok-conv-id 发送，
+        让同一前缀的请求路由到同一缓存（见 PromptBuilderV4.build_prompt_layout）
+        """
+        headers = {}
+        if prompt_cache_key:
+            headers["x-grok-conv-id"] = prompt_cache_key
         
         payload = {
-            "model": self.model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
@@ -83,27 +100,12 @@ class GrokService:
         if response_format:
             payload["response_format"] = response_format
         
-        try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload
-                )
-                
-                if response.status_code != 200:
-                    raise LLMServiceError(
-                        f"Grok API error: {response.text}",
-                        status_code=response.status_code
-                    )
-                
-                return response.json()
-        
-        except httpx.TimeoutException:
-            raise LLMServiceError("Grok API timeout")
-        except httpx.RequestError as e:
-            raise LLMServiceError(f"Grok API request failed: {str(e)}")
+        key = request_key(self.model, payload)
+        result = await llm_responses.do(key, lambda: llm_router.chat_completion(payload, headers), ttl=cache_ttl)
+        # 合并 / 缓存的结果是共享对象，调用方拿副本
+        return copy.deepcopy(result)
     
+    @traced("grok.stream_completion", kind="client")
     async def stream_completion(
         self,
         messages: List[Dict[str, str]],
@@ -179,6 +181,7 @@ class OpenAIEmbeddingService:
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=5)
     )
+    @traced("openai.embed_texts", kind="client")
     async def embed_texts(self, texts: List[str]) -> List[List[float]]:
         """Get embeddings for multiple texts."""
         if not self.api_key:
@@ -209,6 +212,10 @@ class OpenAIEmbeddingService:
                     )
                 
                 data = response.json()
+                record_llm_usage(
+                    "openai", self.model, data.get("usage"),
+                    {"input": openai_embedding.COST_PER_MILLION_TOKENS}, kind="embedding",
+                )
                 embeddings = [item["embedding"] for item in data["data"]]
                 return embeddings
         
@@ -252,6 +259,7 @@ class MiniLLMService:
         stop=stop_after_attempt(2),
         wait=wait_exponential(multiplier=1, min=1, max=3)
     )
+    @traced("grok.analyze", kind="client")
     async def analyze(
         self,
         system_prompt: str,
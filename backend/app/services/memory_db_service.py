@@ -7,6 +7,7 @@ This service provides the db_service interface that MemoryManager expects.
 """
 
 import logging
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from sqlalchemy import select, and_
@@ -22,6 +23,16 @@ from app.models.database.memory_v2_models import (
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def _session_scope(db_session: Optional[AsyncSession] = None):
+    """复用调用方的 session（由调用方提交），否则新开一个自动提交的 session"""
+    if db_session is not None:
+        yield db_session
+    else:
+        async with get_db() as session:
+            yield session
+
+
 class MemoryDBService:
     """
     Database service for the memory system.
@@ -60,10 +71,11 @@ class MemoryDBService:
         user_id: str,
         character_id: str,
         data: Dict[str, Any],
+        db_session: Optional[AsyncSession] = None,
     ) -> bool:
         """Save or update semantic memory."""
         try:
-            async with get_db() as session:
+            async with _session_scope(db_session) as session:
                 result = await session.execute(
                     select(SemanticMemory).where(
                         and_(
@@ -96,6 +108,9 @@ class MemoryDBService:
                 logger.info(f"Saved semantic memory for user={user_id}, char={character_id}")
                 return True
         except Exception as e:
+            if db_session is not None:
+                # 调用方的事务内出错，交给调用方回滚
+                raise
             logger.error(f"Failed to save semantic memory: {e}")
             return False
     
@@ -130,10 +145,11 @@ class MemoryDBService:
         user_id: str,
         character_id: str,
         data: Dict[str, Any],
+        db_session: Optional[AsyncSession] = None,
     ) -> bool:
         """Save or update an episodic memory."""
         try:
-            async with get_db() as session:
+            async with _session_scope(db_session) as session:
                 memory_id = data.get("memory_id")
                 
                 # Check if exists
@@ -175,6 +191,9 @@ class MemoryDBService:
                 logger.info(f"Saved episodic memory: {memory_id}")
                 return True
         except Exception as e:
+            if db_session is not None:
+                # 调用方的事务内出错，交给调用方回滚
+                raise
             logger.error(f"Failed to save episodic memory: {e}")
             return False
     
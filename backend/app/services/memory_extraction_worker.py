@@ -0,0 +1,461 @@
+"""
+Memory Extraction Worker
+========================
+
+合并 + 去抖的记忆提取。
+
+以前每轮 V4 对话后会各调一次 LLM：
+    1. process_conversation_for_memory → 场记提取（语义 + 情节记忆）
+    2. extract_memories_from_chat      → 分类记忆（user_memories 表）
+
+现在按 (user, character) 缓冲对话轮次，满 N 轮或空闲一段时间后，
+用一次 LLM 调用同时提取三类记忆，并在同一个事务里写入：
+    semantic_memories / episodic_memories / user_memories
+
+Usage:
+    await memory_extraction_worker.submit_turn(
+        user_id, character_id, user_message, assistant_reply, context,
+    )
+
+    # 关闭时把剩余缓冲全部提取掉
+    await memory_extraction_worker.drain()
+
+环境变量:
+    MEMORY_EXTRACTION_BATCH_TURNS   满多少轮立即提取（默认 4）
+    MEMORY_EXTRACTION_IDLE_SECONDS  空闲多少秒后提取（默认 90）
+    MEMORY_EXTRACTION_VIA_JOB_QUEUE 为 true 时 API 进程只入队，
+                                    由独立 job worker 进程逐轮提取（默认 false）
+"""
+
+import os
+import re
+import json
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATCH_TURNS = int(os.getenv("MEMORY_EXTRACTION_BATCH_TURNS", "4"))
+IDLE_SECONDS = float(os.getenv("MEMORY_EXTRACTION_IDLE_SECONDS", "90"))
+VIA_JOB_QUEUE = os.getenv("MEMORY_EXTRACTION_VIA_JOB_QUEUE", "false").lower() == "true"
+
+# 单个缓冲最多保留的轮次（提取失败后不会无限增长）
+MAX_BUFFERED_TURNS = 20
+
+
+COMBINED_EXTRACTION_PROMPT = """# Role
+你是 Luna 恋爱游戏的后台剧情分析师（场记），同时负责整理用户档案。
+
+# 已知用户信息
+{current_info}
+
+# 对话片段（按时间顺序，共 {turn_count} 轮）
+{dialogue}
+
+# Task
+分析以上对话，一次性输出三部分：
+1. **semantic**：用户信息更新（名字、生日、职业、喜好等新信息）
+2. **episodic**：最重要的一个事件（如果有的话）
+3. **user_memories**：值得长期记住的分类记忆{user_memory_hint}
+
+# 重要规则
+- 只记录**实际发生**的事件，不记录"想要但没发生"的
+- 梦境、回忆、假设、否定句 = 不算实际发生
+- "亲我" + "不要" = rejection（求欢被拒），不是 intimate
+- 只提取明确表达的信息，不要猜测或推断
+- 跨语言统一：无论中英日法，输出标准化字段
+
+# Event Types
+confession / intimate / rejection / fight / reconciliation / milestone / gift / proposal
+
+# user_memories 分类
+- preference（喜好）/ opinion（观点）/ date（约会记忆）/ profile（个人档案）
+- title 不超过 20 字，content 不超过 100 字，importance: 1-3
+
+# Output (JSON only, no markdown)
+{{
+  "semantic": {{
+    "user_name": "名字或null",
+    "birthday": "生日或null",
+    "occupation": "职业或null",
+    "likes": ["喜欢的东西"],
+    "dislikes": ["不喜欢的东西"],
+    "relationship_status": "dating/engaged/married/single 或 null",
+    "important_dates": {{"纪念日名称": "MM-DD"}},
+    "pet_names": ["昵称"]
+  }},
+  "episodic": {{
+    "event_found": true/false,
+    "actually_happened": true/false,
+    "event_type": "...",
+    "summary": "一句话描述发生了什么（用中文）",
+    "importance": 1-4,
+    "turn": 发生在第几轮（从1开始）
+  }},
+  "user_memories": [
+    {{"category": "preference", "title": "喜欢黑咖啡", "content": "用户喜欢喝不加糖的黑咖啡", "importance": 2}}
+  ]
+}}
+
+null 的字段可以省略。没有重要事件时 episodic 只需 {{"event_found": false}}，没有分类记忆时 user_memories 为 []。"""
+
+
+@dataclass
+class BufferedTurn:
+    """一轮待提取的对话"""
+    user_message: str
+    assistant_reply: str
+    context: List[Dict[str, str]] = field(default_factory=list)
+    created_at: datetime = field(default_factory=datetime.now)
+
+
+class MemoryExtractionWorker:
+    """
+    按对话缓冲、批量提取记忆
+
+    - submit_turn: 加入缓冲；满 batch_turns 轮立即提取，否则（重新）启动空闲计时
+    - flush:       取出缓冲，一次 LLM 调用 + 一个事务写入
+    - drain:       关闭时提取所有剩余缓冲
+    """
+
+    def __init__(
+        self,
+        batch_turns: int = BATCH_TURNS,
+        idle_seconds: float = IDLE_SECONDS,
+        memory_manager=None,
+    ):
+        self.batch_turns = max(1, batch_turns)
+        self.idle_seconds = idle_seconds
+        self._memory_manager = memory_manager
+
+        self._buffers: Dict[Tuple[str, str], List[BufferedTurn]] = {}
+        self._idle_tasks: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+        self.stats = {
+            "turns_buffered": 0,
+            "batches": 0,
+            "llm_calls": 0,
+            "llm_skipped": 0,
+            "failures": 0,
+        }
+
+    @property
+    def memory_manager(self):
+        """Lazy load，复用带 LLM 场记的全局 MemoryManager"""
+        if self._memory_manager is None:
+            from app.services.memory_integration_service import get_memory_manager
+            self._memory_manager = get_memory_manager()
+        return self._memory_manager
+
+    # =========================================================================
+    # 主要 API
+    # =========================================================================
+
+    async def submit_turn(
+        self,
+        user_id: str,
+        character_id: str,
+        user_message: str,
+        assistant_reply: str,
+        context: Optional[List[Dict[str, str]]] = None,
+    ) -> None:
+        """加入一轮对话；满批次立即提取，否则等空闲窗口"""
+        key = (str(user_id), str(character_id))
+        buffer = self._buffers.setdefault(key, [])
+        buffer.append(BufferedTurn(
+            user_message=user_message,
+            assistant_reply=assistant_reply,
+            context=list(context or [])[-3:],
+        ))
+        del buffer[:-MAX_BUFFERED_TURNS]
+        self.stats["turns_buffered"] += 1
+
+        if len(buffer) >= self.batch_turns:
+            self._cancel_idle_timer(key)
+            await self.flush(*key)
+        else:
+            self._restart_idle_timer(key)
+
+    async def flush(self, user_id: str, character_id: str) -> Dict[str, Any]:
+        """提取并写入某个对话的全部缓冲轮次"""
+        key = (str(user_id), str(character_id))
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            turns = self._buffers.pop(key, [])
+            if not turns:
+                return {"turns": 0}
+
+            self.stats["batches"] += 1
+            try:
+                return await self._extract_and_save(key[0], key[1], turns)
+            except Exception as e:
+                self.stats["failures"] += 1
+                logger.warning(f"Batched memory extraction failed ({len(turns)} turns): {e}")
+                return {"turns": len(turns), "error": str(e)}
+
+    async def extract_turns(
+        self, user_id: str, character_id: str, turns: List[BufferedTurn]
+    ) -> Dict[str, Any]:
+        """
+        不经缓冲，立即提取并写入给定轮次（job worker 用）
+
+        失败时抛出异常，由 job_queue 重试；成功返回后这些轮次才算处理完。
+        """
+        key = (str(user_id), str(character_id))
+        lock = self._locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            self.stats["turns_buffered"] += len(turns)
+            self.stats["batches"] += 1
+            try:
+                return await self._extract_and_save(key[0], key[1], turns)
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+
+    async def drain(self) -> None:
+        """提取所有剩余缓冲（应用关闭时调用）"""
+        for key in list(self._idle_tasks):
+            self._cancel_idle_timer(key)
+
+        keys = list(self._buffers)
+        if keys:
+            logger.info(f"🧠 Draining memory extraction buffers: {len(keys)} conversations")
+        for user_id, character_id in keys:
+            await self.flush(user_id, character_id)
+
+    def pending_turns(self) -> int:
+        """当前缓冲中的轮次数"""
+        return sum(len(b) for b in self._buffers.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "pending_turns": self.pending_turns(),
+            "pending_conversations": len(self._buffers),
+        }
+
+    # =========================================================================
+    # 空闲计时
+    # =========================================================================
+
+    def _restart_idle_timer(self, key: Tuple[str, str]) -> None:
+        self._cancel_idle_timer(key)
+        self._idle_tasks[key] = asyncio.create_task(self._flush_when_idle(key))
+
+    def _cancel_idle_timer(self, key: Tuple[str, str]) -> None:
+        task = self._idle_tasks.pop(key, None)
+        if task and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+
+    async def _flush_when_idle(self, key: Tuple[str, str]) -> None:
+        try:
+            await asyncio.sleep(self.idle_seconds)
+        except asyncio.CancelledError:
+            return
+        self._idle_tasks.pop(key, None)
+        await self.flush(*key)
+
+    # =========================================================================
+    # 提取 + 写入
+    # =========================================================================
+
+    async def _extract_and_save(
+        self, user_id: str, character_id: str, turns: List[BufferedTurn]
+    ) -> Dict[str, Any]:
+        manager = self.memory_manager
+        semantic = await manager.get_semantic_memory(user_id, character_id)
+
+        tier = await self._get_tier(user_id)
+        from app.services.user_memory_service import get_memory_limit
+        wants_user_memories = get_memory_limit(tier) > 0
+
+        # 预筛选：没有事件线索、也不需要分类记忆 → 整批跳过 LLM
+        needs_scene = any(
+            manager.extractor._needs_scene_analysis(t.user_message, t.assistant_reply)
+            for t in turns
+        )
+        if not needs_scene and not wants_user_memories:
+            self.stats["llm_skipped"] += 1
+            logger.debug(f"Skipping batched extraction for {len(turns)} small-talk turns")
+            return {"turns": len(turns), "skipped": True}
+
+        if not manager.llm:
+            logger.warning("No LLM service available for batched memory extraction")
+            return {"turns": len(turns), "skipped": True}
+
+        extracted = await self._call_llm(manager, turns, semantic, wants_user_memories)
+        return await self._save(
+            user_id, character_id, turns, extracted, tier if wants_user_memories else None
+        )
+
+    async def _get_tier(self, user_id: str) -> str:
+        try:
+            from app.services.subscription_service import subscription_service
+            return await subscription_service.get_effective_tier(user_id)
+        except Exception as e:
+            logger.warning(f"Failed to get tier for memory extraction: {e}")
+            return "free"
+
+    async def _call_llm(
+        self, manager, turns: List[BufferedTurn], semantic, wants_user_memories: bool
+    ) -> Dict[str, Any]:
+        dialogue_lines = []
+        for m in turns[0].context[-2:]:
+            role = "用户" if m.get("role") == "user" else "Luna"
+            dialogue_lines.append(f"(之前) {role}: {m.get('content', '')[:150]}")
+        for i, t in enumerate(turns, 1):
+            dialogue_lines.append(f"[第{i}轮] 用户: {t.user_message}")
+            if t.assistant_reply:
+                dialogue_lines.append(f"[第{i}轮] Luna: {t.assistant_reply[:200]}")
+
+        current_info = semantic.to_prompt_text() if semantic else ""
+        prompt = COMBINED_EXTRACTION_PROMPT.format(
+            current_info=current_info or "无已知信息",
+            turn_count=len(turns),
+            dialogue="\n".join(dialogue_lines),
+            user_memory_hint="" if wants_user_memories else "（本用户无记忆配额，user_memories 输出 []）",
+        )
+
+        self.stats["llm_calls"] += 1
+        result = await manager.llm.chat_completion(
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0,
+            max_tokens=700,
+        )
+        return self._parse(result["choices"][0]["message"]["content"])
+
+    @staticmethod
+    def _parse(raw: str) -> Dict[str, Any]:
+        """解析合并提取结果，清理空值"""
+        empty = {"semantic": {}, "episodic": None, "user_memories": []}
+        json_match = re.search(r'\{[\s\S]*\}', raw or "")
+        if not json_match:
+            return empty
+        try:
+            data = json.loads(json_match.group())
+        except json.JSONDecodeError as e:
+            logger.warning(f"Failed to parse batched extraction JSON: {e}")
+            return empty
+
+        semantic = {k: v for k, v in (data.get("semantic") or {}).items() if v}
+        episodic = data.get("episodic") or {}
+        if not episodic.get("event_found") or not episodic.get("actually_happened", True):
+            episodic = None
+
+        user_memories = data.get("user_memories") or []
+        if not isinstance(user_memories, list):
+            user_memories = []
+
+        return {"semantic": semantic, "episodic": episodic, "user_memories": user_memories}
+
+    async def _save(
+        self,
+        user_id: str,
+        character_id: str,
+        turns: List[BufferedTurn],
+        extracted: Dict[str, Any],
+        tier: Optional[str],
+    ) -> Dict[str, Any]:
+        """三类记忆在同一个事务里写入，成功后再更新内存缓存"""
+        import copy
+        from app.core.database import get_db
+        from app.services.memory_db_service import memory_db_service
+        from app.services.user_memory_service import save_extracted_memories
+
+        manager = self.memory_manager
+        result = {
+            "turns": len(turns),
+            "semantic_updated": False,
+            "episodic_created": False,
+            "user_memories_saved": 0,
+        }
+
+        semantic = None
+        if extracted["semantic"]:
+            current = await manager.get_semantic_memory(user_id, character_id)
+            semantic = manager.merge_semantic_updates(copy.deepcopy(current), extracted["semantic"])
+
+        episode = None
+        if extracted["episodic"]:
+            event = extracted["episodic"]
+            turn_index = event.get("turn")
+            if not isinstance(turn_index, int) or not 1 <= turn_index <= len(turns):
+                turn_index = len(turns)
+            turn = turns[turn_index - 1]
+            episode = manager.build_episode(
+                user_id, character_id, event, turn.user_message, turn.assistant_reply
+            )
+
+        if not semantic and not episode and not (tier and extracted["user_memories"]):
+            return result
+
+        saved_memories: List[dict] = []
+        async with get_db() as db:
+            if semantic:
+                await memory_db_service.save_semantic_memory(
+                    user_id, character_id, manager._semantic_to_dict(semantic), db_session=db
+                )
+            if episode:
+                await memory_db_service.save_episodic_memory(
+                    user_id, character_id, manager._episode_to_dict(episode), db_session=db
+                )
+            if tier:
+                saved_memories = await save_extracted_memories(
+                    user_id, character_id, extracted["user_memories"], tier, db_session=db
+                )
+
+        # 事务已提交，更新缓存
+        if semantic:
+            manager.remember_semantic(semantic)
+            result["semantic_updated"] = True
+        if episode:
+            manager.remember_episode(episode)
+            await manager.save_episode_embedding(episode)
+            result["episodic_created"] = True
+        result["user_memories_saved"] = len(saved_memories)
+
+        logger.info(
+            f"🧠 Batched memory extraction ({len(turns)} turns): "
+            f"semantic={result['semantic_updated']}, episodic={result['episodic_created']}, "
+            f"user_memories={len(saved_memories)}"
+        )
+        return result
+
+
+# 单例
+memory_extraction_worker = MemoryExtractionWorker()
+
+
+async def dispatch_turn(
+    user_id: str,
+    character_id: str,
+    user_message: str,
+    assistant_reply: str,
+    context: Optional[List[Dict[str, str]]] = None,
+) -> None:
+    """API 进程入口：进程内缓冲，或投递到 job worker 进程（任务内提取完才算成功）"""
+    if not VIA_JOB_QUEUE:
+        await memory_extraction_worker.submit_turn(
+            user_id, character_id, user_message, assistant_reply, context
+        )
+        return
+
+    from app.services.job_queue import job_queue
+    from app.tasks.jobs import JOB_MEMORY_EXTRACTION
+    await job_queue.enqueue(
+        JOB_MEMORY_EXTRACTION,
+        {
+            "user_id": str(user_id),
+            "character_id": str(character_id),
+            "user_message": user_message,
+            "assistant_reply": assistant_reply,
+            "context_messages": list(context or [])[-3:],
+        },
+        user_id=str(user_id),
+    )
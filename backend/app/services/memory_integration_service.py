@@ -18,6 +18,7 @@ from app.services.memory_system_v2 import (
     MemoryContext,
 )
 from app.services.memory_db_service import memory_db_service
+from app.services.prompt_fragment_cache import prompt_fragment_cache, FRAGMENT_SEMANTIC
 
 # Global memory manager instance (initialized lazily)
 _memory_manager: Optional[MemoryManager] = None
@@ -185,11 +186,24 @@ def generate_memory_prompt(
                 "last_recalled": ep.last_recalled.isoformat() if ep.last_recalled else None,
             })
         
+        # 用户档案部分只随语义记忆和亲密度变化，按版本缓存
+        profile_section = None
+        if semantic_dict:
+            profile = memory_context.user_profile
+            profile_section = prompt_fragment_cache.get_or_build_sync(
+                profile.user_id, profile.character_id, FRAGMENT_SEMANTIC,
+                lambda: memory_prompt_generator.generate_profile_section(
+                    semantic_dict, intimacy_level
+                ),
+                variant=f"profile_section:{intimacy_level}",
+            )
+        
         prompt = memory_prompt_generator.generate(
             semantic_memory=semantic_dict,
             episodic_memories=episodic_list,
             current_query=current_query,
             intimacy_level=intimacy_level,
+            profile_section=profile_section,
         )
         
         # Add special date reminder if exists
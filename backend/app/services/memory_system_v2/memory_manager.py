@@ -20,6 +20,13 @@ from dataclasses import dataclass, field
 from enum import Enum
 import hashlib
 
+from app.services.prompt_fragment_cache import (
+    prompt_fragment_cache,
+    FRAGMENT_SEMANTIC,
+    FRAGMENT_EPISODES,
+    FRAGMENT_EVENTS,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -156,9 +163,13 @@ class MemoryContext:
         """生成完整的记忆 prompt 部分"""
         sections = []
         
-        # 用户档案
+        # 用户档案（按语义记忆版本缓存）
         if self.user_profile:
-            profile_text = self.user_profile.to_prompt_text()
+            profile_text = prompt_fragment_cache.get_or_build_sync(
+                self.user_profile.user_id, self.user_profile.character_id,
+                FRAGMENT_SEMANTIC, self.user_profile.to_prompt_text,
+                variant="profile_text",
+            )
             if profile_text:
                 sections.append(f"=== 关于用户 ===\n{profile_text}")
         
@@ -182,25 +193,39 @@ class MemoryContext:
             if memory_lines:
                 sections.append(f"=== 你们的回忆 ===\n" + "\n".join(memory_lines))
         
-        # 约会/事件记忆（从 EventMemory 表）
+        # 约会/事件记忆（从 EventMemory 表，按事件版本缓存）
         if self.event_memories:
-            event_lines = []
-            for event in self.event_memories[:5]:  # 最多显示5个
-                event_type = event.get("event_type", "")
-                summary = event.get("context_summary", "") or event.get("story_content", "")[:100]
-                if event_type == "date":
-                    event_lines.append(f"💕 约会: {summary}")
-                elif event_type == "first_date":
-                    event_lines.append(f"💝 第一次约会: {summary}")
-                elif event_type == "gift":
-                    event_lines.append(f"🎁 收到礼物: {summary}")
-                else:
-                    event_lines.append(f"📌 {event_type}: {summary}")
-            
-            if event_lines:
-                sections.append(f"=== 重要事件 ===\n" + "\n".join(event_lines))
+            if self.user_profile:
+                events_text = prompt_fragment_cache.get_or_build_sync(
+                    self.user_profile.user_id, self.user_profile.character_id,
+                    FRAGMENT_EVENTS, self._build_events_section,
+                    variant="prompt_section",
+                )
+            else:
+                events_text = self._build_events_section()
+            if events_text:
+                sections.append(events_text)
         
         return "\n\n".join(sections)
+    
+    def _build_events_section(self) -> str:
+        """生成重要事件部分"""
+        event_lines = []
+        for event in self.event_memories[:5]:  # 最多显示5个
+            event_type = event.get("event_type", "")
+            summary = event.get("context_summary", "") or event.get("story_content", "")[:100]
+            if event_type == "date":
+                event_lines.append(f"💕 约会: {summary}")
+            elif event_type == "first_date":
+                event_lines.append(f"💝 第一次约会: {summary}")
+            elif event_type == "gift":
+                event_lines.append(f"🎁 收到礼物: {summary}")
+            else:
+                event_lines.append(f"📌 {event_type}: {summary}")
+        
+        if not event_lines:
+            return ""
+        return f"=== 重要事件 ===\n" + "\n".join(event_lines)
 
 
 # =============================================================================
@@ -680,8 +705,12 @@ class MemoryManager:
             user_id=user_id, character_id=character_id
         )
         
-        # 获取最近记忆
-        recent = await self.retriever.get_recent_episodes(episodes, days=7, limit=2)
+        # 获取最近记忆（按情节记忆版本缓存）
+        recent = await prompt_fragment_cache.get_or_build(
+            user_id, character_id, FRAGMENT_EPISODES,
+            lambda: self.retriever.get_recent_episodes(episodes, days=7, limit=2),
+            variant="recent",
+        )
         
         # 检查特殊日期
         special = self.retriever.check_special_date(semantic)
@@ -761,39 +790,53 @@ class MemoryManager:
         获取约会/事件记忆（从 EventMemory 表）
         
         这些是约会、送礼物等重要事件的记录。
+        事件写入时会递增版本号，未变化时直接使用缓存，不再查库。
         """
         try:
-            from app.core.database import get_db
-            from app.models.database.event_memory_models import EventMemory
-            from sqlalchemy import select, desc
-            
-            async with get_db() as db:
-                stmt = (
-                    select(EventMemory)
-                    .where(
-                        EventMemory.user_id == user_id,
-                        EventMemory.character_id == character_id,
-                    )
-                    .order_by(desc(EventMemory.generated_at))
-                    .limit(limit)
-                )
-                result = await db.execute(stmt)
-                events = result.scalars().all()
-                
-                return [
-                    {
-                        "id": str(event.id),
-                        "event_type": event.event_type,
-                        "story_content": event.story_content,
-                        "context_summary": event.context_summary,
-                        "generated_at": event.generated_at.isoformat() if event.generated_at else None,
-                    }
-                    for event in events
-                ]
+            return await prompt_fragment_cache.get_or_build(
+                user_id, character_id, FRAGMENT_EVENTS,
+                lambda: self._query_event_memories(user_id, character_id, limit),
+                variant=f"rows:{limit}",
+            )
         except Exception as e:
             logger.error(f"Failed to get event memories: {e}")
             return []
     
+    async def _query_event_memories(
+        self,
+        user_id: str,
+        character_id: str,
+        limit: int,
+    ) -> List[Dict[str, Any]]:
+        """从 EventMemory 表查询事件记忆"""
+        from app.core.database import get_db
+        from app.models.database.event_memory_models import EventMemory
+        from sqlalchemy import select, desc
+        
+        async with get_db() as db:
+            stmt = (
+                select(EventMemory)
+                .where(
+                    EventMemory.user_id == user_id,
+                    EventMemory.character_id == character_id,
+                )
+                .order_by(desc(EventMemory.generated_at))
+                .limit(limit)
+            )
+            result = await db.execute(stmt)
+            events = result.scalars().all()
+            
+            return [
+                {
+                    "id": str(event.id),
+                    "event_type": event.event_type,
+                    "story_content": event.story_content,
+                    "context_summary": event.context_summary,
+                    "generated_at": event.generated_at.isoformat() if event.generated_at else None,
+                }
+                for event in events
+            ]
+    
     # =========================================================================
     # 内部方法
     # =========================================================================
@@ -805,10 +848,23 @@ class MemoryManager:
         updates: Dict[str, Any],
     ):
         """更新语义记忆"""
-        key = self._cache_key(user_id, character_id)
         semantic = await self.get_semantic_memory(user_id, character_id)
+        semantic = self.merge_semantic_updates(semantic, updates)
+        self.remember_semantic(semantic)
         
-        # 应用更新
+        # 持久化
+        if self.db:
+            try:
+                await self.db.save_semantic_memory(user_id, character_id, self._semantic_to_dict(semantic))
+            except Exception as e:
+                logger.error(f"Failed to save semantic memory: {e}")
+    
+    def merge_semantic_updates(
+        self,
+        semantic: SemanticMemory,
+        updates: Dict[str, Any],
+    ) -> SemanticMemory:
+        """把提取结果合并到语义记忆（原地修改并返回）"""
         for field, value in updates.items():
             if field == "likes" and isinstance(value, list):
                 semantic.likes = list(set(semantic.likes + value))[:20]
@@ -826,31 +882,54 @@ class MemoryManager:
             elif field == "relationship_status" and value:
                 # 关系状态只在有值时更新（不覆盖为空）
                 semantic.relationship_status = value
-                logger.info(f"Relationship status updated: {value} for user {user_id}")
+                logger.info(f"Relationship status updated: {value} for user {semantic.user_id}")
             elif hasattr(semantic, field):
                 setattr(semantic, field, value)
         
         semantic.updated_at = datetime.now()
+        return semantic
+    
+    def remember_semantic(self, semantic: SemanticMemory) -> None:
+        """写入语义记忆缓存，并使 prompt 片段失效"""
+        key = self._cache_key(semantic.user_id, semantic.character_id)
         self._semantic_cache[key] = semantic
+        prompt_fragment_cache.bump(semantic.user_id, semantic.character_id, FRAGMENT_SEMANTIC)
+    
+    async def _create_episode(
+        self,
+        user_id: str,
+        character_id: str,
+        event_data: Dict[str, Any],
+        user_message: str,
+        assistant_response: str,
+    ) -> Optional[EpisodicMemory]:
+        """创建情节记忆"""
+        episode = self.build_episode(
+            user_id, character_id, event_data, user_message, assistant_response
+        )
+        self.remember_episode(episode)
         
         # 持久化
         if self.db:
             try:
-                await self.db.save_semantic_memory(user_id, character_id, self._semantic_to_dict(semantic))
+                await self.db.save_episodic_memory(user_id, character_id, self._episode_to_dict(episode))
             except Exception as e:
-                logger.error(f"Failed to save semantic memory: {e}")
+                logger.error(f"Failed to save episodic memory: {e}")
+        
+        await self.save_episode_embedding(episode)
+        
+        logger.info(f"Created episodic memory: {episode.event_type} - {episode.summary}")
+        return episode
     
-    async def _create_episode(
+    def build_episode(
         self,
         user_id: str,
         character_id: str,
         event_data: Dict[str, Any],
         user_message: str,
         assistant_response: str,
-    ) -> Optional[EpisodicMemory]:
-        """创建情节记忆"""
-        key = self._cache_key(user_id, character_id)
-        
+    ) -> EpisodicMemory:
+        """根据提取结果构建情节记忆（不写缓存、不持久化）"""
         # 生成 ID
         memory_id = hashlib.md5(
             f"{user_id}:{character_id}:{datetime.now().isoformat()}".encode()
@@ -874,7 +953,7 @@ class MemoryManager:
         if event_data.get("importance"):
             importance = MemoryImportance(min(event_data["importance"], 4))
         
-        episode = EpisodicMemory(
+        return EpisodicMemory(
             memory_id=memory_id,
             user_id=user_id,
             character_id=character_id,
@@ -889,6 +968,10 @@ class MemoryManager:
             created_at=datetime.now(),
             strength=1.0,
         )
+    
+    def remember_episode(self, episode: EpisodicMemory) -> None:
+        """加入情节记忆缓存，并使 prompt 片段失效"""
+        key = self._cache_key(episode.user_id, episode.character_id)
         
         # 添加到缓存
         if key not in self._episodic_cache:
@@ -897,15 +980,10 @@ class MemoryManager:
         
         # 限制数量
         self._episodic_cache[key] = self._episodic_cache[key][-100:]
-        
-        # 持久化
-        if self.db:
-            try:
-                await self.db.save_episodic_memory(user_id, character_id, self._episode_to_dict(episode))
-            except Exception as e:
-                logger.error(f"Failed to save episodic memory: {e}")
-        
-        # 生成并保存 embedding（用于语义搜索）
+        prompt_fragment_cache.bump(episode.user_id, episode.character_id, FRAGMENT_EPISODES)
+    
+    async def save_episode_embedding(self, episode: EpisodicMemory) -> None:
+        """生成并保存 embedding（用于语义搜索）"""
         try:
             from app.services.vector_service import vector_service
             # 组合摘要和关键对话作为 embedding 文本
@@ -914,13 +992,10 @@ class MemoryManager:
                 embed_text += " " + " ".join(episode.key_dialogue[:2])
             
             embedding = await vector_service.embed_text(embed_text)
-            await vector_service.save_episode_embedding(memory_id, embedding)
-            logger.debug(f"Saved embedding for episode {memory_id}")
+            await vector_service.save_episode_embedding(episode.memory_id, embedding)
+            logger.debug(f"Saved embedding for episode {episode.memory_id}")
         except Exception as e:
             logger.warning(f"Failed to save episode embedding (non-critical): {e}")
-        
-        logger.info(f"Created episodic memory: {episode.event_type} - {episode.summary}")
-        return episode
     
     # =========================================================================
     # 记忆衰减
@@ -965,6 +1040,7 @@ class MemoryManager:
         
         key = self._cache_key(user_id, character_id)
         self._episodic_cache[key] = kept
+        prompt_fragment_cache.bump(user_id, character_id, FRAGMENT_EPISODES)
     
     async def recall_memory(
         self,
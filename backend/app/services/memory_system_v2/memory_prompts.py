@@ -43,6 +43,7 @@ class MemoryPromptGenerator:
         episodic_memories: List[Dict[str, Any]],
         current_query: str = None,
         intimacy_level: int = 1,
+        profile_section: Optional[str] = None,
     ) -> str:
         """
         生成完整的记忆 prompt 部分
@@ -52,6 +53,7 @@ class MemoryPromptGenerator:
             episodic_memories: 情节记忆列表
             current_query: 当前用户消息（用于相关性判断）
             intimacy_level: 亲密度等级（影响信息使用方式）
+            profile_section: 预先生成（缓存）的用户档案部分，None 时现场生成
         
         Returns:
             str: 要添加到 system prompt 的记忆部分
@@ -60,9 +62,10 @@ class MemoryPromptGenerator:
         
         # 用户档案
         if self.config.include_profile and semantic_memory:
-            profile_section = self._generate_profile_section(
-                semantic_memory, intimacy_level
-            )
+            if profile_section is None:
+                profile_section = self.generate_profile_section(
+                    semantic_memory, intimacy_level
+                )
             if profile_section:
                 sections.append(profile_section)
         
@@ -85,6 +88,14 @@ class MemoryPromptGenerator:
         
         return "\n\n".join(sections)
     
+    def generate_profile_section(
+        self,
+        memory: Dict[str, Any],
+        intimacy_level: int,
+    ) -> str:
+        """生成用户档案部分（只依赖语义记忆和亲密度，可缓存）"""
+        return self._generate_profile_section(memory, intimacy_level)
+    
     def _generate_profile_section(
         self,
         memory: Dict[str, Any],
@@ -0,0 +1,167 @@
+"""
+Prompt Fragment Cache
+=====================
+
+按 (user, character) 缓存 prompt 片段，基于版本号失效。
+
+每个片段（语义档案 / 最近情节 / 礼物摘要 / 事件记忆）都有一个版本号，
+由对应的写路径在数据变化时递增：
+
+    semantic  ← MemoryManager._update_semantic
+    episodes  ← MemoryManager._create_episode / apply_memory_decay
+    gifts     ← GiftService.send_gift
+    events    ← EventStoryGenerator._save_story
+
+读路径只在版本号变化（或 TTL 到期）时才重新查询和拼接字符串。
+TTL 兜底多 worker 部署下其他进程的写入（版本号只在本进程内递增）。
+
+Usage:
+    text = await prompt_fragment_cache.get_or_build(
+        user_id, character_id, "gifts", build_gift_text,
+    )
+
+    # 写路径
+    prompt_fragment_cache.bump(user_id, character_id, "gifts")
+"""
+
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_SEMANTIC = "semantic"
+FRAGMENT_EPISODES = "episodes"
+FRAGMENT_GIFTS = "gifts"
+FRAGMENT_EVENTS = "events"
+
+FRAGMENTS = (FRAGMENT_SEMANTIC, FRAGMENT_EPISODES, FRAGMENT_GIFTS, FRAGMENT_EVENTS)
+
+
+class PromptFragmentCache:
+    """版本化的 prompt 片段缓存（进程内 LRU）"""
+
+    def __init__(self, ttl_seconds: float = 300, max_entries: int = 20000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # (user, char, fragment) -> version
+        self._versions: Dict[Tuple[str, str, str], int] = {}
+        # (user, char, fragment, variant) -> (version, stored_at, value)
+        self._entries: "OrderedDict[Tuple[str, str, str, str], Tuple[int, float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, user_id: str, character_id: str, fragment: str) -> int:
+        """当前片段版本号"""
+        return self._versions.get((str(user_id), str(character_id), fragment), 0)
+
+    def bump(self, user_id: str, character_id: str, fragment: str) -> int:
+        """递增片段版本号（写路径调用），旧缓存随即失效"""
+        if fragment not in FRAGMENTS:
+            raise ValueError(f"Unknown prompt fragment: {fragment}")
+        key = (str(user_id), str(character_id), fragment)
+        version = self._versions.get(key, 0) + 1
+        self._versions[key] = version
+        logger.debug(f"Prompt fragment bumped: {fragment} v{version} ({user_id}:{character_id})")
+        return version
+
+    def get(
+        self, user_id: str, character_id: str, fragment: str, variant: str = ""
+    ) -> Optional[Any]:
+        """读取缓存；版本不匹配或过期时返回 None"""
+        key = (str(user_id), str(character_id), fragment, variant)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        version, stored_at, value = entry
+        if (
+            version != self.version(user_id, character_id, fragment)
+            or time.monotonic() - stored_at > self.ttl_seconds
+        ):
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(
+        self, user_id: str, character_id: str, fragment: str, value: Any, variant: str = ""
+    ) -> None:
+        """写入缓存，绑定当前版本号"""
+        key = (str(user_id), str(character_id), fragment, variant)
+        version = self.version(user_id, character_id, fragment)
+        self._entries[key] = (version, time.monotonic(), value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get_or_build_sync(
+        self,
+        user_id: str,
+        character_id: str,
+        fragment: str,
+        builder: Callable[[], Any],
+        variant: str = "",
+    ) -> Any:
+        """同步版本：命中返回缓存，否则调用 builder 构建并缓存"""
+        value = self.get(user_id, character_id, fragment, variant)
+        if value is not None:
+            return value
+
+        version = self.version(user_id, character_id, fragment)
+        value = builder()
+        # 构建期间版本未变才写入，避免缓存过期数据
+        if value is not None and version == self.version(user_id, character_id, fragment):
+            self.set(user_id, character_id, fragment, value, variant)
+        return value
+
+    async def get_or_build(
+        self,
+        user_id: str,
+        character_id: str,
+        fragment: str,
+        builder: Callable[[], Awaitable[Any]],
+        variant: str = "",
+    ) -> Any:
+        """异步版本：命中返回缓存，否则 await builder() 构建并缓存"""
+        value = self.get(user_id, character_id, fragment, variant)
+        if value is not None:
+            return value
+
+        version = self.version(user_id, character_id, fragment)
+        value = await builder()
+        if value is not None and version == self.version(user_id, character_id, fragment):
+            self.set(user_id, character_id, fragment, value, variant)
+        return value
+
+    def invalidate(self, user_id: str, character_id: str) -> None:
+        """使某个 (user, character) 的全部片段失效"""
+        for fragment in FRAGMENTS:
+            self.bump(user_id, character_id, fragment)
+
+    def clear(self) -> None:
+        """清空缓存（测试用）"""
+        self._versions.clear()
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# 单例
+prompt_fragment_cache = PromptFragmentCache()
@@ -560,9 +560,12 @@ class SubscriptionService:
         return None
     
     async def _save_subscription_record(self, user_id: str, data: dict):
-        """保存订阅记录到数据库或 mock 存储"""
+        """保存订阅记录到数据库或 mock 存储（并让该用户的认证缓存失效）"""
+        from app.core.principal_cache import invalidate_principal
+        
         if MOCK_MODE:
             _mock_subscriptions[user_id] = data
+            invalidate_principal(user_id)
             return
         
         # Use database
@@ -592,6 +595,8 @@ class SubscriptionService:
                 await db.commit()
         except Exception as e:
             logger.error(f"Failed to save subscription record: {e}")
+        finally:
+            invalidate_principal(user_id)
     
     async def _handle_subscription_expiry(self, user_id: str, old_tier: str):
         """处理订阅过期 - 降级并记录账单"""
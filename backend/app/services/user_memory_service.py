@@ -257,13 +257,10 @@ async def extract_memories_from_chat(
         remaining_quota = limit - current_count
 
         for item in extracted[:remaining_quota]:
-            cat   = item.get("category", "")
-            title = item.get("title", "").strip()
-            content = item.get("content", "").strip()
-            imp   = int(item.get("importance", 2))
-
-            if not title or not content or cat not in VALID_CATEGORIES:
+            cleaned = _clean_extracted_item(item)
+            if not cleaned:
                 continue
+            title = cleaned["title"]
 
             # 检查是否已有相同 title（避免重复）
             if await _memory_title_exists(user_id, character_id, title):
@@ -274,11 +271,8 @@ async def extract_memories_from_chat(
                 mem = await create_memory(
                     user_id=user_id,
                     character_id=character_id,
-                    category=cat,
-                    title=title,
-                    content=content,
-                    importance=imp,
                     source="auto",
+                    **cleaned,
                 )
                 saved.append(mem)
             except Exception as e:
@@ -297,6 +291,83 @@ async def extract_memories_from_chat(
         return []
 
 
+async def save_extracted_memories(
+    user_id: str,
+    character_id: str,
+    items: List[dict],
+    tier: str,
+    db_session=None,
+) -> List[dict]:
+    """
+    保存批量提取的记忆（供合并提取 worker 使用）。
+
+    配额和标题去重只查一次库；传入 db_session 时在调用方的事务里写入，
+    由调用方提交。
+    """
+    limit = get_memory_limit(tier)
+    if limit == 0 or not items:
+        return []
+
+    from sqlalchemy import select
+
+    async def _save(db) -> List[dict]:
+        result = await db.execute(
+            select(UserMemory.title).where(
+                UserMemory.user_id == user_id,
+                UserMemory.character_id == character_id,
+            )
+        )
+        existing_titles = {row[0] for row in result.fetchall()}
+        remaining_quota = limit - len(existing_titles)
+
+        saved = []
+        for item in items:
+            if len(saved) >= remaining_quota:
+                break
+            cleaned = _clean_extracted_item(item)
+            if not cleaned or cleaned["title"][:128] in existing_titles:
+                continue
+
+            mem = UserMemory(
+                user_id=user_id,
+                character_id=character_id,
+                category=cleaned["category"],
+                title=cleaned["title"][:128],
+                content=cleaned["content"],
+                source="auto",
+                importance=cleaned["importance"] if cleaned["importance"] in (1, 2, 3) else 2,
+            )
+            db.add(mem)
+            existing_titles.add(mem.title)
+            saved.append(mem)
+
+        if saved:
+            await db.flush()
+        return [m.to_dict() for m in saved]
+
+    if db_session is not None:
+        return await _save(db_session)
+    async with get_db() as db:
+        return await _save(db)
+
+
+def _clean_extracted_item(item: dict) -> Optional[dict]:
+    """校验 LLM 提取的单条记忆，非法时返回 None"""
+    if not isinstance(item, dict):
+        return None
+    cat     = item.get("category", "")
+    title   = str(item.get("title", "")).strip()
+    content = str(item.get("content", "")).strip()
+    try:
+        imp = int(item.get("importance", 2))
+    except (TypeError, ValueError):
+        imp = 2
+
+    if not title or not content or cat not in VALID_CATEGORIES:
+        return None
+    return {"category": cat, "title": title, "content": content, "importance": imp}
+
+
 def _parse_extraction(raw: str) -> List[dict]:
     """安全地解析 LLM 输出的 JSON 数组"""
     # 去掉可能的 markdown 代码块
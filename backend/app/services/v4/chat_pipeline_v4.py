@@ -6,15 +6,20 @@ V4.0单次调用流水线：
 Service前置计算 → Prompt Builder → 单次LLM调用(JSON) → 异步后置更新 → Response
 """
 
-import asyncio
 import logging
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from dataclasses import dataclass
 
+from app.config import settings
+from app.core.exceptions import LLMServiceError
 from app.core.perf import PerfTracker
+from app.core.metrics import record_prompt_prefix
+from app.core.task_supervisor import task_supervisor, PRIORITY_HIGH, PRIORITY_LOW
+from app.core.admission import KeyedLock
 from app.services.v4.precompute_service import precompute_service, PrecomputeResult
-from app.services.v4.prompt_builder_v4 import prompt_builder_v4
+from app.services.v4.prompt_builder_v4 import prompt_builder_v4, PromptLayout
+from app.services.v4.context_builder import context_builder
 from app.services.v4.json_parser import json_parser, ParsedResponse
 from app.services.llm_service import GrokService
 from app.services.chat_repository import chat_repo
@@ -86,6 +91,9 @@ class ChatResponseV4:
 class ChatPipelineV4:
     """V4.0聊天流水线"""
     
+    # provider 拒绝 json_schema 后本进程降级为 json_object + 启发式修复
+    structured_output: bool = settings.STRUCTURED_OUTPUT
+    
     def __init__(self):
         self.grok_service = GrokService()
     
@@ -105,8 +113,8 @@ class ChatPipelineV4:
             # 1. 加载用户状态
             async with perf.track_async("load_state"):
                 user_state = await self._load_user_state(request.user_id, request.character_id)
-            logger.info(f"📊 User State: level={user_state.intimacy_level}, "
-                       f"intimacy={user_state.intimacy_x:.1f}, emotion={user_state.emotion}")
+            logger.info("📊 User State: level=%s, intimacy=%.1f, emotion=%s",
+                        user_state.intimacy_level, user_state.intimacy_x, user_state.emotion)
             
             # 2. 前置计算 (替代L1)
             with perf.track("precompute"):
@@ -114,7 +122,8 @@ class ChatPipelineV4:
                     message=request.message,
                     user_state=user_state
                 )
-            logger.info(f"📊 Precompute: {precompute_service.get_analysis_summary(precompute_result)}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("📊 Precompute: %s", precompute_service.get_analysis_summary(precompute_result))
             
             # 3. 硬性拦截检查
             if precompute_result.safety_flag == "BLOCK":
@@ -124,9 +133,10 @@ class ChatPipelineV4:
             if user_state.emotion <= -75:  # 冷战状态
                 return self._create_cold_war_response(user_state, precompute_result)
             
-            # 5. 获取对话上下文
+            # 5. 获取对话上下文（滚动摘要 + 摘要之后的原文，token 预算在 5.9 统一分配）
             async with perf.track_async("db_context"):
-                context_messages = await self._get_context_messages(request.session_id)
+                conversation_summary, history = await context_builder.load_history(request.session_id)
+            context_messages = [{"role": m["role"], "content": m["content"]} for m in history]
             
             # 5.5 先存用户消息（确保 DB 立即可查，避免前端 refetch 时消息消失）
             async with perf.track_async("db_save_user"):
@@ -159,6 +169,14 @@ class ChatPipelineV4:
                 else:
                     memory_context_str = gift_memory_str
             
+            # 5.9 按 token 预算分配：最近几轮 > 摘要 > 记忆 > 更早的原文
+            with perf.track("context_budget"):
+                context = context_builder.assemble(conversation_summary, history, memory_context_str)
+            context_messages = context.messages
+            memory_context_str = context.memory_context
+            logger.info("🧮 Context: ~%d tokens %s, %d messages (dropped %d)",
+                        context.tokens, context.breakdown, len(context_messages), context.dropped_messages)
+            
             # 6. 构建System Prompt
             
             # 6.0 获取临时升阶和NSFW解锁
@@ -202,7 +220,8 @@ class ChatPipelineV4:
             except Exception as e:
                 logger.warning(f"Failed to get stage boost: {e}")
             
-            system_prompt = prompt_builder_v4.build_system_prompt(
+            # 稳定前缀在前，后续注入（状态效果 / 约会）都追加在易变后缀之后
+            prompt_layout = prompt_builder_v4.build_prompt_layout(
                 user_state=user_state,
                 character_id=request.character_id,
                 precompute_result=precompute_result,
@@ -211,7 +230,9 @@ class ChatPipelineV4:
                 user_interests=user_interests,
                 stage_boost=stage_boost,
                 nsfw_override=nsfw_override,
+                conversation_summary=context.summary,
             )
+            system_prompt = prompt_layout.text
             
             # 6.1 注入状态效果 (Tier 2 礼物 prompt modifier)
             effect_modifier = None
@@ -241,15 +262,19 @@ class ChatPipelineV4:
             except Exception as e:
                 logger.warning(f"Failed to load date status for V4: {e}")
             
-            # 6.5 日志：打印完整 System Prompt（方便调试）
-            logger.info(f"📝 === FULL SYSTEM PROMPT ({len(system_prompt)} chars) ===\n{system_prompt}\n=== END SYSTEM PROMPT ===")
+            # 6.5 日志：完整 System Prompt 只在 DEBUG 级别输出（每轮几 KB，INFO 下不拼接）
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("📝 === FULL SYSTEM PROMPT (%d chars) ===\n%s\n=== END SYSTEM PROMPT ===",
+                             len(system_prompt), system_prompt)
             
             # 7. 单次LLM调用（包含对话历史）
             async with perf.track_async("llm"):
-                llm_response = await self._call_llm(system_prompt, request.message, context_messages)
+                llm_response = await self._call_llm(
+                    system_prompt, request.message, context_messages, prompt_layout=prompt_layout
+                )
             
             # 7.5 日志：LLM 原始返回
-            logger.info(f"🤖 LLM raw response: {llm_response['content'][:500]}")
+            logger.debug("🤖 LLM raw response: %.500s", llm_response['content'])
             
             # 8. JSON解析
             with perf.track("parse"):
@@ -275,15 +300,15 @@ class ChatPipelineV4:
             except Exception as e:
                 logger.warning(f"Failed to get bottleneck status: {e}")
             
-            # 10. 异步后置更新（包括记忆提取 + 状态效果递减）
-            asyncio.create_task(
-                self._async_post_update(
-                    user_state, precompute_result, parsed_response,
-                    user_message=request.message,
-                    assistant_reply=parsed_response.reply,
-                    context_messages=context_messages,
-                )
+            # 10. 后置更新交给后台调度器（情绪/XP 优先于记忆提取）
+            self._schedule_post_update(
+                user_state, precompute_result, parsed_response,
+                user_message=request.message,
+                assistant_reply=parsed_response.reply,
+                context_messages=context_messages,
             )
+            # 未摘要的原文够多时，后台折叠进滚动摘要
+            context_builder.maybe_schedule_summary(request.session_id, history)
             
             # 10.5 递减状态效果计数
             if effect_modifier:
@@ -301,8 +326,8 @@ class ChatPipelineV4:
             # 性能日志
             perf.log_summary("chat")
             elapsed = perf.total_elapsed
-            logger.info(f"✅ V4 Pipeline completed in {elapsed:.2f}s, "
-                       f"tokens: {llm_response['tokens_used']}")
+            logger.info("✅ V4 Pipeline completed in %.2fs, tokens: %s",
+                        elapsed, llm_response['tokens_used'])
             
             return ChatResponseV4(
                 message_id=message_id,
@@ -458,70 +483,58 @@ class ChatPipelineV4:
             return ""
     
     async def _load_gift_memory(self, user_id: str, character_id: str) -> str:
-        """加载礼物记忆上下文"""
+        """加载礼物记忆上下文（送礼时失效，其余轮次直接用缓存）"""
         try:
-            from app.services.gift_service import gift_service
-            
-            gift_summary = await gift_service.get_gift_summary(user_id, character_id)
-            if gift_summary["total_gifts"] == 0:
-                return ""
+            from app.services.prompt_fragment_cache import prompt_fragment_cache, FRAGMENT_GIFTS
             
-            gift_lines = ["### 礼物记忆"]
-            gift_lines.append(
-                f"用户送过你 {gift_summary['total_gifts']} 次礼物，"
-                f"总价值 {gift_summary['total_spent']} 月石。"
+            return await prompt_fragment_cache.get_or_build(
+                user_id, character_id, FRAGMENT_GIFTS,
+                lambda: self._build_gift_memory(user_id, character_id),
+                variant="prompt_section",
             )
             
-            if gift_summary["top_gifts"]:
-                top = gift_summary["top_gifts"][:3]
-                gifts_str = "、".join([
-                    f"{g.get('icon', '🎁')} {g.get('name_cn') or g.get('name')}({g['count']}次)"
-                    for g in top
-                ])
-                gift_lines.append(f"常收到：{gifts_str}")
-            
-            result = "\n".join(gift_lines)
-            logger.info(f"🎁 Gift memory loaded: {gift_summary['total_gifts']} gifts")
-            return result
-            
         except Exception as e:
             logger.warning(f"Failed to load gift memory: {e}")
             return ""
     
-    async def _get_context_messages(self, session_id: str) -> List[Dict[str, str]]:
-        """获取对话上下文"""
+    async def _build_gift_memory(self, user_id: str, character_id: str) -> str:
+        """查询礼物摘要并生成 prompt 文本"""
+        from app.services.gift_service import gift_service
         
-        try:
-            messages = await chat_repo.get_recent_messages(session_id, count=10)
-            
-            context = []
-            for msg in messages:
-                # 跳过系统消息
-                if msg["role"] == "system":
-                    continue
-                
-                context.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-            
-            return context
+        gift_summary = await gift_service.get_gift_summary(user_id, character_id)
+        if gift_summary["total_gifts"] == 0:
+            return ""
             
-        except Exception as e:
-            logger.warning(f"Failed to load context: {e}")
-            return []
+        gift_lines = ["### 礼物记忆"]
+        gift_lines.append(
+            f"用户送过你 {gift_summary['total_gifts']} 次礼物，"
+            f"总价值 {gift_summary['total_spent']} 月石。"
+        )
+        
+        if gift_summary["top_gifts"]:
+            top = gift_summary["top_gifts"][:3]
+            gifts_str = "、".join([
+                f"{g.get('icon', '🎁')} {g.get('name_cn') or g.get('name')}({g['count']}次)"
+                for g in top
+            ])
+            gift_lines.append(f"常收到：{gifts_str}")
+        
+        result = "\n".join(gift_lines)
+        logger.info(f"🎁 Gift memory loaded: {gift_summary['total_gifts']} gifts")
+        return result
     
     async def _call_llm(
         self, system_prompt: str, user_message: str,
-        context_messages: List[Dict[str, str]] = None
+        context_messages: List[Dict[str, str]] = None,
+        prompt_layout: Optional[PromptLayout] = None,
     ) -> Dict[str, Any]:
-        """调用LLM（包含对话历史）"""
+        """调用LLM（包含对话历史）；prompt_layout 用于前缀缓存 key 和命中统计"""
         
         messages = [
             {"role": "system", "content": system_prompt},
         ]
         
-        # 注入对话历史（最近10轮）
+        # 注入对话历史（已按 token 预算裁剪）
         if context_messages:
             for msg in context_messages:
                 role = msg.get("role", "user")
@@ -532,17 +545,17 @@ class ChatPipelineV4:
         # 当前用户消息
         messages.append({"role": "user", "content": user_message})
         
-        logger.info(f"📨 LLM call: {len(messages)} messages "
-                    f"(1 system + {len(messages)-2} history + 1 current)")
+        logger.info("📨 LLM call: %d messages (1 system + %d history + 1 current)",
+                    len(messages), len(messages) - 2)
         
         try:
-            response = await self.grok_service.chat_completion(
-                messages=messages,
-                temperature=0.8,
-                max_tokens=400,
-                response_format={"type": "json_object"}
+            response = await self._chat_completion(
+                messages, prompt_cache_key=prompt_layout.cache_key if prompt_layout else None
             )
             
+            if prompt_layout:
+                record_prompt_prefix(prompt_layout.character_id, prompt_layout.stage, response.get("usage"))
+            
             return {
                 "content": response["choices"][0]["message"]["content"],
                 "tokens_used": response.get("usage", {}).get("total_tokens", 0)
@@ -552,6 +565,37 @@ class ChatPipelineV4:
             logger.error(f"LLM call failed: {e}")
             raise
     
+    async def _chat_completion(self, messages: List[Dict[str, str]], prompt_cache_key: Optional[str]) -> Dict:
+        """优先用结构化输出（schema 与 json_parser 的校验一致），provider 不支持时降级为 json_object"""
+        if self.structured_output:
+            try:
+                return await self.grok_service.chat_completion(
+                    messages=messages,
+                    temperature=0.8,
+                    max_tokens=400,
+                    response_format=json_parser.response_format(),
+                    prompt_cache_key=prompt_cache_key,
+                )
+            except Exception as e:
+                if not _rejects_response_format(e):
+                    raise
+                logger.warning(f"Provider rejected json_schema response_format, retrying with json_object: {e}")
+                response = await self._json_object_completion(messages, prompt_cache_key)
+                # json_object 能成功才说明是 schema 不被支持，本进程之后不再尝试
+                self.structured_output = False
+                return response
+        
+        return await self._json_object_completion(messages, prompt_cache_key)
+    
+    async def _json_object_completion(self, messages: List[Dict[str, str]], prompt_cache_key: Optional[str]) -> Dict:
+        return await self.grok_service.chat_completion(
+            messages=messages,
+            temperature=0.8,
+            max_tokens=400,
+            response_format={"type": "json_object"},
+            prompt_cache_key=prompt_cache_key,
+        )
+    
     async def _store_messages(
         self,
         session_id: str,
@@ -580,7 +624,7 @@ class ChatPipelineV4:
         
         return assistant_msg["message_id"]
     
-    async def _async_post_update(
+    def _schedule_post_update(
         self,
         user_state: UserStateV4,
         precompute_result: PrecomputeResult,
@@ -589,134 +633,110 @@ class ChatPipelineV4:
         assistant_reply: str = "",
         context_messages: List[Dict[str, str]] = None,
     ) -> None:
-        """异步后置更新（情绪、XP、事件、记忆提取）"""
+        """提交后置更新到后台调度器（有界队列，情绪/XP 优先，记忆提取在后）"""
+        task_supervisor.submit(
+            "post_update",
+            lambda: self._serialized_post_update(user_state, precompute_result, parsed_response),
+            name="state_update",
+            priority=PRIORITY_HIGH,
+            retries=0,  # 情绪/XP 写入非幂等，不重试
+        )
         
-        try:
-            # 1. 更新情绪（带阶段瓶颈锁）
-            delta = parsed_response.emotion_delta
-            if delta != 0:
-                # 阶段瓶颈 × 角色性格系数（后端兜底，防止 AI 无视 prompt 指令）
-                if delta > 0:
-                    from app.services.intimacy_constants import get_stage, RelationshipStage
-                    from app.api.v1.characters import get_character_by_id
-                    
-                    intimacy = int(getattr(user_state, 'intimacy_x', 0))
-                    stage = get_stage(intimacy)
-                    
-                    # S3/S4 不限制
-                    stage_base_caps = {
-                        RelationshipStage.S0_STRANGER: 20,
-                        RelationshipStage.S1_FRIEND: 20,
-                        RelationshipStage.S2_CRUSH: 25,
-                    }
-                    base_cap = stage_base_caps.get(stage)
-                    
-                    if base_cap:
-                        # 角色 sensitivity 系数：sensitivity 越高，情绪波动越大
-                        sensitivity = 5  # 默认中等
-                        char_data = get_character_by_id(user_state.character_id)
-                        if char_data and char_data.get("personality"):
-                            sensitivity = char_data["personality"].get("sensitivity", 5)
-                        
-                        # 公式：base_cap × (0.6 + sensitivity × 0.1)
-                        # sensitivity 3 → ×0.9, sensitivity 5 → ×1.1, sensitivity 8 → ×1.4
-                        modifier = 0.6 + sensitivity * 0.1
-                        cap = int(base_cap * modifier)
-                        
-                        if delta > cap:
-                            logger.info(f"🔒 Stage cap: {stage.name} × sensitivity={sensitivity} "
-                                       f"→ cap={cap}, delta {delta:+d} → +{cap}")
-                            delta = cap
-                
-                await self._update_emotion(
-                    user_state.user_id,
-                    user_state.character_id,
-                    delta
-                )
-            
-            # 2. 奖励XP
-            await self._award_xp(
-                user_state.user_id,
-                user_state.character_id,
-                precompute_result.intent
-            )
-            
-            # 3. 检查事件触发
-            await self._check_event_triggers(
-                user_state,
-                precompute_result,
-                parsed_response
-            )
-            
-            # 4. 记忆提取（从对话中提取用户信息和重要事件）
-            if user_message:
-                await self._extract_memory(
+        if user_message:
+            from app.services.memory_extraction_worker import dispatch_turn
+            task_supervisor.submit(
+                "post_update",
+                lambda: dispatch_turn(
                     user_state.user_id,
                     user_state.character_id,
                     user_message,
                     assistant_reply,
                     context_messages or [],
-                )
-
-            # 5. 用户记忆自动提取（LLM 分类提取，写入 user_memories 表）
-            if user_message:
-                await self._extract_user_memory(
-                    user_state.user_id,
-                    user_state.character_id,
-                    user_message,
-                    assistant_reply,
-                )
-
-            logger.info(f"✅ Post-update completed for user {user_state.user_id}")
-            
-        except Exception as e:
-            logger.error(f"❌ Post-update failed: {e}", exc_info=True)
-    
-    async def _extract_memory(
-        self, user_id: str, character_id: str,
-        user_message: str, assistant_reply: str,
-        context_messages: List[Dict[str, str]]
-    ) -> None:
-        """从对话中提取记忆（语义+情节）"""
-        try:
-            from app.services.memory_integration_service import process_conversation_for_memory
-            
-            result = await process_conversation_for_memory(
-                user_id=user_id,
-                character_id=character_id,
-                user_message=user_message,
-                assistant_response=assistant_reply,
-                context=context_messages,
+                ),
+                name="memory_extraction",
+                priority=PRIORITY_LOW,
+                retries=1,
             )
-            
-            if result.get("semantic_updated") or result.get("episodic_created"):
-                logger.info(f"🧠 Memory extracted: {result.get('updates', {})}")
-        except Exception as e:
-            logger.warning(f"Memory extraction failed: {e}")
     
-    async def _extract_user_memory(
+    # 同一 user:character 的后置更新逐个执行（情绪分数读-改-写、递减记录、XP 不交错）
+    _post_update_locks = KeyedLock()
+
+    async def _serialized_post_update(
         self,
-        user_id: str,
-        character_id: str,
-        user_message: str,
-        assistant_reply: str,
+        user_state: UserStateV4,
+        precompute_result: PrecomputeResult,
+        parsed_response: ParsedResponse,
     ) -> None:
-        """LLM 自动提取分类记忆（写入 user_memories 表，供前端展示和管理）"""
-        try:
-            from app.services.subscription_service import subscription_service
-            from app.services.user_memory_service import extract_memories_from_chat
+        key = f"{user_state.user_id}:{user_state.character_id}"
+        async with self._post_update_locks.hold(key):
+            await self._async_post_update(user_state, precompute_result, parsed_response)
 
-            tier = await subscription_service.get_effective_tier(user_id)
-            await extract_memories_from_chat(
-                user_id=user_id,
-                character_id=character_id,
-                user_message=user_message,
-                assistant_reply=assistant_reply,
-                tier=tier,
+    async def _async_post_update(
+        self,
+        user_state: UserStateV4,
+        precompute_result: PrecomputeResult,
+        parsed_response: ParsedResponse,
+    ) -> None:
+        """异步后置更新（情绪、XP、事件），异常由 task_supervisor 记录"""
+        
+        # 1. 更新情绪（带阶段瓶颈锁）
+        delta = parsed_response.emotion_delta
+        if delta != 0:
+            # 阶段瓶颈 × 角色性格系数（后端兜底，防止 AI 无视 prompt 指令）
+            if delta > 0:
+                from app.services.intimacy_constants import get_stage, RelationshipStage
+                from app.api.v1.characters import get_character_by_id
+                
+                intimacy = int(getattr(user_state, 'intimacy_x', 0))
+                stage = get_stage(intimacy)
+                
+                # S3/S4 不限制
+                stage_base_caps = {
+                    RelationshipStage.S0_STRANGER: 20,
+                    RelationshipStage.S1_FRIEND: 20,
+                    RelationshipStage.S2_CRUSH: 25,
+                }
+                base_cap = stage_base_caps.get(stage)
+                
+                if base_cap:
+                    # 角色 sensitivity 系数：sensitivity 越高，情绪波动越大
+                    sensitivity = 5  # 默认中等
+                    char_data = get_character_by_id(user_state.character_id)
+                    if char_data and char_data.get("personality"):
+                        sensitivity = char_data["personality"].get("sensitivity", 5)
+                    
+                    # 公式：base_cap × (0.6 + sensitivity × 0.1)
+                    # sensitivity 3 → ×0.9, sensitivity 5 → ×1.1, sensitivity 8 → ×1.4
+                    modifier = 0.6 + sensitivity * 0.1
+                    cap = int(base_cap * modifier)
+                    
+                    if delta > cap:
+                        logger.info(f"🔒 Stage cap: {stage.name} × sensitivity={sensitivity} "
+                                   f"→ cap={cap}, delta {delta:+d} → +{cap}")
+                        delta = cap
+            
+            await self._update_emotion(
+                user_state.user_id,
+                user_state.character_id,
+                delta
             )
-        except Exception as e:
-            logger.warning(f"User memory extraction failed: {e}")
-
+        
+        # 2. 奖励XP
+        await self._award_xp(
+            user_state.user_id,
+            user_state.character_id,
+            precompute_result.intent
+        )
+        
+        # 3. 检查事件触发
+        await self._check_event_triggers(
+            user_state,
+            precompute_result,
+            parsed_response
+        )
+        
+        logger.info("✅ Post-update completed for user %s", user_state.user_id)
+    
     # 近期 emotion delta 历史（用于递减防刷）
     _recent_deltas: dict = {}  # key -> list of (timestamp, delta)
     
@@ -955,5 +975,13 @@ class ChatPipelineV4:
         )
 
 
+def _rejects_response_format(error: Exception) -> bool:
+    """provider 是否因为不认识 response_format 而拒绝了请求（4xx 参数错误）"""
+    last_attempt = getattr(error, "last_attempt", None)  # tenacity.RetryError
+    if last_attempt is not None:
+        error = last_attempt.exception()
+    return isinstance(error, LLMServiceError) and error.status_code in (400, 422)
+
+
 # 单例
 chat_pipeline_v4 = ChatPipelineV4()
\ No newline at end of file
@@ -0,0 +1,350 @@
+"""
+Context Builder - Token 预算内的上下文组装
+==========================================
+
+替代"固定发最近 10 条原文 + 不限长度的记忆"：先估算 token，再按优先级填满预算。
+
+优先级（预算不够时从后往前砍）:
+    1. 最近 MIN_RECENT 条消息（总是保留，单条超长时截断）
+    2. 滚动摘要（更早对话的压缩，存在会话上）
+    3. 记忆上下文（按行截断到 CONTEXT_MEMORY_TOKENS）
+    4. 更早的原文消息，从新到旧填满剩余预算
+
+滚动摘要:
+    未摘要的消息超过 SUMMARY_TRIGGER 条时，后台把较早的部分（保留最近 KEEP_RECENT 条原文）
+    连同旧摘要交给 LLM 压缩成新摘要，写回 chat_sessions.context_summary / summary_until。
+    之后只加载 summary_until 之后的消息。每个会话同一时间最多一个摘要任务。
+
+token 估算:
+    CJK 字符按 1 token，其余按 4 字符 1 token（不依赖 tokenizer）。
+    按文本缓存：历史消息每轮都会被重新估算，缓存后只算一次。
+
+Usage:
+    summary, history = await context_builder.load_history(session_id)
+    ctx = context_builder.assemble(summary, history, memory_context)
+    ...
+    context_builder.maybe_schedule_summary(session_id, history, new_messages=2)
+
+环境变量:
+    CONTEXT_TOKEN_BUDGET     历史 + 摘要 + 记忆的总预算（默认 2400）
+    CONTEXT_MEMORY_TOKENS    记忆上下文上限（默认 800）
+    CONTEXT_SUMMARY_ENABLED  是否启用滚动摘要（默认 true）
+"""
+
+import os
+import re
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2400"))
+MEMORY_TOKENS = int(os.getenv("CONTEXT_MEMORY_TOKENS", "800"))
+SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "true").lower() == "true"
+
+# 总是保留的最近消息条数（约 2 轮）
+MIN_RECENT = 4
+# 单条消息上限（长回复 / 粘贴长文）
+MAX_MESSAGE_TOKENS = 400
+# 摘要上限
+SUMMARY_TOKENS = 400
+# 每轮最多加载的未摘要消息
+FETCH_LIMIT = 40
+# 未摘要消息超过这个数时触发摘要；摘要后保留的原文条数
+SUMMARY_TRIGGER = 16
+KEEP_RECENT = 8
+# 摘要失败后的重试次数与间隔（秒，按次数线性增长）
+SUMMARY_RETRIES = 1
+SUMMARY_RETRY_DELAY = 2.0
+
+# 每条消息的角色 / 分隔开销
+MESSAGE_OVERHEAD = 4
+
+_CJK = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+@lru_cache(maxsize=8192)
+def estimate_tokens(text: str) -> int:
+    """估算 token 数（CJK 1 字 1 token，其余 4 字符 1 token）"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """截断到约 max_tokens（按字符累计，超出时加省略号）"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens * 4
+    for i, ch in enumerate(text):
+        budget -= 4 if _CJK.match(ch) else 1
+        if budget < 0:
+            return text[:i] + "…"
+    return text
+
+
+def _message_tokens(message: Dict[str, str]) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD
+
+
+@dataclass
+class AssembledContext:
+    """组装结果"""
+    messages: List[Dict[str, str]]     # 发给 LLM 的原文历史（时间顺序）
+    summary: str = ""                  # 滚动摘要（注入 System Prompt）
+    memory_context: str = ""           # 截断后的记忆上下文
+    tokens: int = 0                    # 估算的总 token
+    dropped_messages: int = 0          # 因预算丢弃的原文条数
+    breakdown: Dict[str, int] = field(default_factory=dict)
+
+
+SUMMARY_PROMPT = """你负责为一段长期陪伴聊天维护"前情提要"。
+
+# 已有摘要
+{previous}
+
+# 新的对话（按时间顺序）
+{dialogue}
+
+# 任务
+把已有摘要和新的对话合并成一份新的摘要：
+- 用第三人称，记录发生过的事、用户透露的信息、双方情绪和关系变化、未完成的话题
+- 不写寒暄和无信息量的内容，不编造
+- 不超过 {max_chars} 字，只输出摘要正文"""
+
+
+class ContextBuilder:
+    """按 token 预算组装上下文，并维护每个会话的滚动摘要"""
+
+    def __init__(
+        self,
+        budget: int = TOKEN_BUDGET,
+        memory_tokens: int = MEMORY_TOKENS,
+        summary_enabled: bool = SUMMARY_ENABLED,
+    ):
+        self.budget = budget
+        self.memory_tokens = memory_tokens
+        self.summary_enabled = summary_enabled
+        self._summarizing: Set[str] = set()
+        self._llm = None
+        self.stats = {"assembled": 0, "dropped_messages": 0, "summaries": 0, "summary_failures": 0}
+
+    # ------------------------------------------------------------------
+    # 加载
+    # ------------------------------------------------------------------
+
+    async def load_history(self, session_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        加载会话摘要和摘要之后的消息（读库失败时返回空历史，不影响本轮回复）
+
+        Returns:
+            (summary, messages)，messages 为时间顺序的 {"role", "content", "created_at"}
+        """
+        try:
+            return await self._load_history(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to load context: {e}")
+            return "", []
+
+    async def _load_history(self, session_id: str) -> Tuple[str, List[Dict[str, str]]]:
+        from app.services.chat_repository import chat_repo
+
+        summary, summary_until = "", None
+        if self.summary_enabled:
+            session = await chat_repo.get_session(session_id) or {}
+            summary = session.get("context_summary") or ""
+            summary_until = session.get("summary_until")
+
+        recent = await chat_repo.get_recent_messages(session_id, count=FETCH_LIMIT)
+        history = []
+        for msg in recent:
+            # 跳过系统消息和已经折叠进摘要的消息
+            if msg["role"] not in ("user", "assistant") or not msg.get("content"):
+                continue
+            if summary_until and msg.get("created_at") and msg["created_at"] <= summary_until:
+                continue
+            history.append({"role": msg["role"], "content": msg["content"], "created_at": msg.get("created_at")})
+        return summary, history
+
+    # ------------------------------------------------------------------
+    # 组装
+    # ------------------------------------------------------------------
+
+    def assemble(
+        self,
+        summary: str,
+        history: List[Dict[str, str]],
+        memory_context: str = "",
+    ) -> AssembledContext:
+        """按优先级把摘要、记忆、原文历史装进预算（纯计算，不访问数据库）"""
+        remaining = self.budget
+
+        # 1. 最近几条总是保留
+        recent = [
+            {"role": m["role"], "content": truncate_to_tokens(m["content"], MAX_MESSAGE_TOKENS)}
+            for m in history[-MIN_RECENT:]
+        ]
+        recent_tokens = sum(_message_tokens(m) for m in recent)
+        remaining -= recent_tokens
+
+        # 2. 滚动摘要
+        summary = truncate_to_tokens(summary, SUMMARY_TOKENS) if summary else ""
+        summary_tokens = estimate_tokens(summary)
+        if summary_tokens > remaining:
+            summary, summary_tokens = "", 0
+        remaining -= summary_tokens
+
+        # 3. 记忆上下文（按行保留，放不下的行丢弃）
+        memory_context, memory_tokens = self._fit_lines(memory_context, min(self.memory_tokens, max(remaining, 0)))
+        remaining -= memory_tokens
+
+        # 4. 更早的原文，从新到旧
+        older: List[Dict[str, str]] = []
+        older_tokens = 0
+        candidates = history[:-MIN_RECENT] if len(history) > MIN_RECENT else []
+        for m in reversed(candidates):
+            message = {"role": m["role"], "content": truncate_to_tokens(m["content"], MAX_MESSAGE_TOKENS)}
+            cost = _message_tokens(message)
+            if cost > remaining:
+                break
+            older.append(message)
+            older_tokens += cost
+            remaining -= cost
+        older.reverse()
+
+        dropped = len(candidates) - len(older)
+        self.stats["assembled"] += 1
+        self.stats["dropped_messages"] += dropped
+        return AssembledContext(
+            messages=older + recent,
+            summary=summary,
+            memory_context=memory_context,
+            tokens=recent_tokens + summary_tokens + memory_tokens + older_tokens,
+            dropped_messages=dropped,
+            breakdown={
+                "recent": recent_tokens,
+                "summary": summary_tokens,
+                "memory": memory_tokens,
+                "older": older_tokens,
+            },
+        )
+
+    @staticmethod
+    def _fit_lines(text: str, max_tokens: int) -> Tuple[str, int]:
+        if not text:
+            return "", 0
+        total = estimate_tokens(text)
+        if total <= max_tokens:
+            return text, total
+        kept, used = [], 0
+        for line in text.split("\n"):
+            cost = estimate_tokens(line) + 1
+            if used + cost > max_tokens:
+                break
+            kept.append(line)
+            used += cost
+        return "\n".join(kept).rstrip(), used
+
+    # ------------------------------------------------------------------
+    # 滚动摘要
+    # ------------------------------------------------------------------
+
+    def maybe_schedule_summary(self, session_id: str, history: List[Dict], new_messages: int = 2) -> bool:
+        """未摘要消息够多时提交后台摘要任务（同一会话不重复提交）"""
+        if not self.summary_enabled or session_id in self._summarizing:
+            return False
+        if len(history) + new_messages < SUMMARY_TRIGGER:
+            return False
+
+        from app.core.task_supervisor import task_supervisor, PRIORITY_LOW
+
+        self._summarizing.add(session_id)
+        submitted = task_supervisor.submit(
+            "post_update",
+            lambda: self._summarize_guarded(session_id),
+            name="context_summary",
+            priority=PRIORITY_LOW,
+            retries=0,  # 重试在 _summarize_guarded 里做，保证去重标记覆盖所有尝试
+        )
+        if not submitted:
+            self._summarizing.discard(session_id)
+        return submitted
+
+    async def _summarize_guarded(self, session_id: str) -> None:
+        """带重试地执行摘要；最后一次尝试结束后才清除去重标记"""
+        try:
+            for attempt in range(SUMMARY_RETRIES + 1):
+                try:
+                    await self.summarize(session_id)
+                    return
+                except Exception as e:
+                    if attempt >= SUMMARY_RETRIES:
+                        raise
+                    logger.warning("Context summary failed, retrying: session=%s, %s", session_id, e)
+                    await asyncio.sleep(SUMMARY_RETRY_DELAY * (attempt + 1))
+        finally:
+            self._summarizing.discard(session_id)
+
+    async def summarize(self, session_id: str, llm=None) -> bool:
+        """
+        把摘要点之后、最近 KEEP_RECENT 条之前的消息折叠进摘要
+
+        Returns:
+            是否写入了新摘要
+        """
+        from app.services.chat_repository import chat_repo
+
+        summary, history = await self._load_history(session_id)
+        to_fold = history[:-KEEP_RECENT]
+        if not to_fold:
+            return False
+
+        dialogue = "\n".join(
+            f"{'用户' if m['role'] == 'user' else '角色'}: {truncate_to_tokens(m['content'], MAX_MESSAGE_TOKENS)}"
+            for m in to_fold
+        )
+        prompt = SUMMARY_PROMPT.format(
+            previous=summary or "（无）",
+            dialogue=dialogue,
+            max_chars=SUMMARY_TOKENS,
+        )
+
+        if llm is None:
+            if self._llm is None:
+                from app.services.llm_service import GrokService
+                self._llm = GrokService()
+            llm = self._llm
+        try:
+            result = await llm.chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.3,
+                max_tokens=SUMMARY_TOKENS * 2,
+            )
+            new_summary = result["choices"][0]["message"]["content"].strip()
+        except Exception:
+            self.stats["summary_failures"] += 1
+            raise
+        if not new_summary:
+            return False
+
+        summary_until = to_fold[-1].get("created_at") or datetime.utcnow()
+        await chat_repo.update_session(
+            session_id,
+            context_summary=truncate_to_tokens(new_summary, SUMMARY_TOKENS),
+            summary_until=summary_until,
+        )
+        self.stats["summaries"] += 1
+        logger.info("📝 Context summary updated: session=%s, folded %d messages", session_id, len(to_fold))
+        return True
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "summarizing": len(self._summarizing)}
+
+
+# 单例
+context_builder = ContextBuilder()
@@ -4,16 +4,238 @@ JSON Parser v4.0
 
 处理LLM输出的JSON解析、验证和错误处理。
 确保输出格式符合V4.0规范。
+
+解析路径（计数见 get_parse_stats / luna_llm_json_parse_total）:
+    fast       整段回复就是一个 JSON 对象，直接解码（装了 orjson 时用 orjson）
+    extracted  对象前后夹杂文字 / markdown 代码块，扫描出最外层对象后原样解码
+               （候选解不出时从下一个 '{' 重新扫描，最多 _MAX_SCAN_ATTEMPTS 次）
+    repaired   扫描时顺带修复了常见错误后解码成功
+    failed     没有可用的对象，走 fallback 文本提取
+
+回复结构（字段、类型、取值范围、intent 枚举）只在 RESPONSE_FIELDS 定义一次：
+_validate_json 按它校验，response_format() 按它生成 provider 结构化输出用的 JSON Schema。
+
+修复在一次扫描中完成：未转义的引号、单引号字符串、字符串里的裸换行、尾逗号、
+换行处缺的逗号、Python 风格的 True/False/None、截断（补齐引号和括号，丢掉不完整的键值）。
 """
 
 import json
 import logging
 import re
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
 
+from app.core.metrics import metrics
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+def _load(text: str) -> Any:
+    """orjson 优先；orjson 拒绝但标准库接受的 JSON（NaN / Infinity、部分版本下的超大整数）回退 json.loads"""
+    try:
+        return _loads(text)
+    except ValueError:
+        if _loads is json.loads:
+            raise
+        return json.loads(text)
+
 logger = logging.getLogger(__name__)
 
+PARSE_PATHS = ("fast", "extracted", "repaired", "failed")
+
+# 与 prompt_builder_v4 里 "intent: must be one of [...]" 的列表保持一致
+# （GIFT_SEND 只由 precompute 根据送礼请求判定，不是模型输出的 intent）
+VALID_INTENTS = (
+    "GREETING", "SMALL_TALK", "CLOSING", "COMPLIMENT", "FLIRT",
+    "LOVE_CONFESSION", "COMFORT", "CRITICISM", "INSULT", "IGNORE",
+    "APOLOGY", "REQUEST_NSFW", "INVITATION", "EXPRESS_SADNESS",
+    "COMPLAIN", "INAPPROPRIATE", "PROPOSAL",
+)
+
+# 回复字段定义（JSON Schema 子集）
+RESPONSE_FIELDS: Dict[str, Dict[str, Any]] = {
+    "reply": {"type": "string"},
+    "emotion_delta": {"type": "integer", "minimum": -50, "maximum": 50},
+    "intent": {"type": "string", "enum": list(VALID_INTENTS)},
+    "is_nsfw_blocked": {"type": "boolean"},
+    "thought": {"type": "string"},
+}
+REQUIRED_FIELDS = ("reply", "emotion_delta", "intent", "is_nsfw_blocked")
+
+# 校验用的 Python 类型与错误信息里的类型名
+_FIELD_TYPES = {
+    "string": (str, "string"),
+    "integer": ((int, float), "number"),
+    "boolean": (bool, "boolean"),
+}
+
+_WHITESPACE = " \t\r\n"
+_LITERALS = (("true", "true"), ("false", "false"), ("null", "null"),
+             ("True", "true"), ("False", "false"), ("None", "null"))
+_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_ITALIC = re.compile(r'\*(.*?)\*')
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+# 候选对象解码失败时从下一个 '{' 重新扫描的次数上限（如 "Here {is} the answer {...}"）
+_MAX_SCAN_ATTEMPTS = 4
+
+
+def _next_significant(text: str, i: int) -> int:
+    """i 及之后第一个非空白字符的位置（没有则返回 len(text)）"""
+    n = len(text)
+    while i < n and text[i] in _WHITESPACE:
+        i += 1
+    return i
+
+
+def _literal_at(text: str, i: int) -> Optional[Tuple[str, str]]:
+    for literal, replacement in _LITERALS:
+        if text.startswith(literal, i):
+            return literal, replacement
+    return None
+
+
+def _starts_value(text: str, i: int) -> bool:
+    c = text[i]
+    return c in "\"'{[}]-" or c.isdigit() or _literal_at(text, i) is not None
+
+
+def _is_string_end(text: str, i: int) -> bool:
+    """text[i] 是当前字符串的引号：判断它是结尾，还是值里没转义的引号"""
+    n = len(text)
+    j = _next_significant(text, i + 1)
+    if j >= n:
+        return True
+    c = text[j]
+    if c in ":}]":
+        return True
+    if c == ",":
+        k = _next_significant(text, j + 1)
+        return k >= n or _starts_value(text, k)
+    if c in "\"'":
+        # 换行后紧跟下一个键：这里缺了逗号
+        return "\n" in text[i + 1:j]
+    return False
+
+
+def _scan_object(text: str, start: int = 0) -> Tuple[Optional[str], bool]:
+    """
+    单遍扫描出 start 之后第一个最外层 JSON 对象，同时修复常见的 LLM 输出错误
+
+    Returns:
+        (候选 JSON 文本, 是否做过修复)；找不到对象时为 (None, False)
+    """
+    start = text.find("{", start)
+    if start == -1:
+        return None, False
+
+    out: List[str] = []
+    stack: List[str] = []           # 容器类型 '{' / '['
+    member_start: List[int] = []    # 每层容器中当前成员在 out 里的起点
+    changed = False
+    quote = ""                      # 当前字符串的引号，空串表示不在字符串里
+    in_key = False
+    last = ""                       # 字符串外最后一个有效字符
+    n = len(text)
+    i = start
+
+    while i < n:
+        ch = text[i]
+
+        if quote:
+            if ch == "\\" and i + 1 < n:
+                if quote == "'" and text[i + 1] == "'":
+                    out.append("'")
+                    changed = True
+                else:
+                    out.append(text[i:i + 2])
+                i += 2
+                continue
+            if ch == quote and _is_string_end(text, i):
+                out.append('"')
+                quote = ""
+                last = '"'
+            elif ch == '"':
+                out.append('\\"')
+                changed = True
+            elif ch in _STRING_ESCAPES:
+                out.append(_STRING_ESCAPES[ch])
+                changed = True
+            elif ch < " ":
+                changed = True
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in _WHITESPACE:
+            out.append(ch)
+        elif ch in "\"'":
+            if last and last in '"}]el' or last.isdigit():
+                out.append(",")
+                member_start[-1] = len(out)
+                last = ","
+                changed = True
+            in_key = bool(stack) and stack[-1] == "{" and last in "{,"
+            if ch == "'":
+                changed = True
+            out.append('"')
+            quote = ch
+        elif ch == ",":
+            j = _next_significant(text, i + 1)
+            if j < n and text[j] in "}]":
+                changed = True
+            else:
+                out.append(ch)
+                last = ch
+                if member_start:
+                    member_start[-1] = len(out)
+        elif ch in "{[":
+            out.append(ch)
+            stack.append(ch)
+            member_start.append(len(out))
+            last = ch
+        elif ch in "}]":
+            out.append(ch)
+            last = ch
+            if stack:
+                stack.pop()
+                member_start.pop()
+            if not stack:
+                return "".join(out), changed
+        else:
+            literal = _literal_at(text, i) if ch.isalpha() else None
+            if literal:
+                out.append(literal[1])
+                changed = changed or literal[0] != literal[1]
+                last = literal[1][-1]
+                i += len(literal[0])
+                continue
+            out.append(ch)
+            last = ch
+        i += 1
+
+    # 截断：补齐字符串和括号，不完整的键值整个丢掉
+    changed = True
+    incomplete = (
+        (quote and in_key)
+        or (not quote and (last in ":,-." or (last.isalpha() and last not in "el")))
+        or (not quote and last == '"' and in_key)
+    )
+    if quote and not incomplete:
+        out.append('"')
+    elif incomplete and member_start:
+        del out[member_start[-1]:]
+    while out and (out[-1] in _WHITESPACE or out[-1] in ",:"):
+        out.pop()
+    for container in reversed(stack):
+        out.append("}" if container == "{" else "]")
+    return "".join(out), changed
+
 
 @dataclass
 class ParsedResponse:
@@ -32,12 +254,10 @@ class JsonParser:
     """JSON解析器"""
     
     def __init__(self):
-        self.valid_intents = {
-            "GREETING", "SMALL_TALK", "CLOSING", "COMPLIMENT", "FLIRT", 
-            "LOVE_CONFESSION", "COMFORT", "CRITICISM", "INSULT", "IGNORE",
-            "APOLOGY", "REQUEST_NSFW", "INVITATION", "EXPRESS_SADNESS", 
-            "COMPLAIN", "INAPPROPRIATE", "GIFT_SEND"
-        }
+        self.valid_intents = set(VALID_INTENTS)
+        self._stats: Dict[str, int] = {path: 0 for path in PARSE_PATHS}
+        self._stats["successful_parses"] = 0
+        self._path_counters = {path: metrics.LLM_JSON_PARSE.labels(path=path) for path in PARSE_PATHS}
     
     def parse_llm_response(self, response: str) -> ParsedResponse:
         """
@@ -51,7 +271,8 @@ class JsonParser:
         """
         try:
             # 1. 提取JSON
-            json_obj = self._extract_json(response)
+            json_obj, path = self._decode(response)
+            self._record(path)
             if not json_obj:
                 return self._create_fallback_response(
                     response, "No valid JSON found in response"
@@ -67,6 +288,7 @@ class JsonParser:
             # 3. 清理和转换数据
             cleaned_data = self._clean_json_data(json_obj)
             
+            self._stats["successful_parses"] += 1
             return ParsedResponse(
                 reply=cleaned_data["reply"],
                 emotion_delta=cleaned_data["emotion_delta"],
@@ -85,103 +307,92 @@ class JsonParser:
     
     def _extract_json(self, response: str) -> Optional[Dict[str, Any]]:
         """从响应中提取JSON对象"""
-        
-        # 方法1: 查找最大的JSON对象
-        json_pattern = re.compile(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', re.DOTALL)
-        json_matches = json_pattern.findall(response)
-        
-        for match in json_matches:
+        return self._decode(response)[0]
+
+    def _decode(self, response: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """
+        解码响应中的JSON对象
+
+        Returns:
+            (JSON对象或None, 解析路径)
+        """
+        text = response.strip()
+
+        # 快速路径: 整段就是一个对象
+        if text.startswith("{") and text.endswith("}"):
             try:
-                return json.loads(match)
-            except json.JSONDecodeError:
+                obj = _load(text)
+                if isinstance(obj, dict):
+                    return obj, "fast"
+            except ValueError:
+                pass
+
+        # 慢路径: 扫描最外层对象并修复；候选不可用时从下一个 '{' 重试
+        start = text.find("{")
+        for _ in range(_MAX_SCAN_ATTEMPTS):
+            if start == -1:
+                break
+            candidate, changed = _scan_object(text, start)
+            start = text.find("{", start + 1)
+            if candidate is None:
+                break
+            if candidate == text and not changed:
                 continue
-        
-        # 方法2: 尝试查找部分JSON
-        simple_patterns = [
-            r'\{[^}]*"reply"[^}]*\}',
-            r'\{.*?"reply".*?\}',
-        ]
-        
-        for pattern in simple_patterns:
-            match = re.search(pattern, response, re.DOTALL | re.IGNORECASE)
-            if match:
-                try:
-                    return json.loads(match.group())
-                except json.JSONDecodeError:
-                    continue
-        
-        # 方法3: 尝试修复常见JSON错误
-        return self._attempt_json_repair(response)
-    
-    def _attempt_json_repair(self, response: str) -> Optional[Dict[str, Any]]:
-        """尝试修复常见的JSON格式错误"""
-        
-        # 移除多余的文本
-        response = response.strip()
-        
-        # 查找可能的JSON片段
-        start_idx = response.find('{')
-        end_idx = response.rfind('}')
-        
-        if start_idx == -1 or end_idx == -1 or start_idx >= end_idx:
-            return None
-        
-        json_candidate = response[start_idx:end_idx+1]
-        
-        # 修复常见错误
-        repairs = [
-            # 修复未闭合的引号
-            (r'("reply":\s*"[^"]*[^"])\n', r'\1"'),
-            # 修复缺失的逗号
-            (r'(")\s*\n\s*(")', r'\1,\n\2'),
-            # 修复末尾逗号
-            (r',\s*}', '}'),
-            # 修复单引号
-            (r"'([^']*)'", r'"\1"'),
-            # 修复未转义的引号
-            (r'(?<!\\)"(?=[^,:}\s])', r'\\"'),
-        ]
-        
-        for pattern, replacement in repairs:
-            json_candidate = re.sub(pattern, replacement, json_candidate)
-        
-        try:
-            return json.loads(json_candidate)
-        except json.JSONDecodeError:
-            return None
-    
+            try:
+                obj = _load(candidate)
+            except ValueError:
+                continue
+            if isinstance(obj, dict) and obj:
+                return obj, "repaired" if changed else "extracted"
+        return None, "failed"
+
     def _validate_json(self, json_obj: Dict[str, Any]) -> Optional[str]:
-        """验证JSON对象的字段"""
+        """按 RESPONSE_FIELDS 验证JSON对象的字段"""
         
         # 必需字段
-        required_fields = ["reply", "emotion_delta", "intent", "is_nsfw_blocked"]
-        
-        for field in required_fields:
+        for field in REQUIRED_FIELDS:
             if field not in json_obj:
                 return f"Missing required field: {field}"
         
-        # 字段类型验证
-        if not isinstance(json_obj["reply"], str):
-            return "Field 'reply' must be string"
-        
-        if not isinstance(json_obj["emotion_delta"], (int, float)):
-            return "Field 'emotion_delta' must be number"
-        
-        if not isinstance(json_obj["intent"], str):
-            return "Field 'intent' must be string"
-        
-        if not isinstance(json_obj["is_nsfw_blocked"], bool):
-            return "Field 'is_nsfw_blocked' must be boolean"
-        
-        # 值范围验证
-        if not (-50 <= json_obj["emotion_delta"] <= 50):
-            return "Field 'emotion_delta' must be between -50 and 50"
-        
-        if json_obj["intent"] not in self.valid_intents:
-            return f"Field 'intent' must be one of: {self.valid_intents}"
+        for field in REQUIRED_FIELDS:
+            spec = RESPONSE_FIELDS[field]
+            value = json_obj[field]
+            
+            # 字段类型验证
+            python_type, type_name = _FIELD_TYPES[spec["type"]]
+            if not isinstance(value, python_type):
+                return f"Field '{field}' must be {type_name}"
+            
+            # 值范围验证
+            if "minimum" in spec and not (spec["minimum"] <= value <= spec["maximum"]):
+                return f"Field '{field}' must be between {spec['minimum']} and {spec['maximum']}"
+            
+            if "enum" in spec and value not in self.valid_intents:
+                return f"Field '{field}' must be one of: {self.valid_intents}"
         
         return None
     
+    def response_format(self, strict: bool = True) -> Dict[str, Any]:
+        """
+        provider 结构化输出参数（OpenAI 兼容 response_format）
+        
+        Schema 由 RESPONSE_FIELDS 生成，和 _validate_json 的校验规则一致。
+        strict 模式要求所有字段都出现在 required 里，thought 因此也是必填。
+        """
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": "v4_reply",
+                "strict": strict,
+                "schema": {
+                    "type": "object",
+                    "properties": RESPONSE_FIELDS,
+                    "required": list(RESPONSE_FIELDS),
+                    "additionalProperties": False,
+                },
+            },
+        }
+    
     def _clean_json_data(self, json_obj: Dict[str, Any]) -> Dict[str, Any]:
         """清理和标准化JSON数据"""
         
@@ -190,8 +401,9 @@ class JsonParser:
         # reply: 清理文本
         reply = str(json_obj["reply"]).strip()
         # 移除可能的markdown格式
-        reply = re.sub(r'\*\*(.*?)\*\*', r'\1', reply)  # **bold**
-        reply = re.sub(r'\*(.*?)\*', r'\1', reply)      # *italic*
+        if "*" in reply:
+            reply = _BOLD.sub(r'\1', reply)    # **bold**
+            reply = _ITALIC.sub(r'\1', reply)  # *italic*
         cleaned["reply"] = reply
         
         # emotion_delta: 转换为int并限制范围
@@ -221,6 +433,7 @@ class JsonParser:
                 "sad": "EXPRESS_SADNESS",
                 "whine": "COMPLAIN",
                 "bad": "INAPPROPRIATE",
+                "propose": "PROPOSAL",
             }
             cleaned["intent"] = intent_mapping.get(intent_lower, "SMALL_TALK")
         
@@ -285,13 +498,19 @@ class JsonParser:
         
         return text[:500]
     
+    def _record(self, path: str) -> None:
+        self._stats[path] += 1
+        self._path_counters[path].inc()
+
     def get_parse_stats(self) -> Dict[str, Any]:
         """获取解析统计信息（用于监控）"""
-        # TODO: 实现解析成功率统计
+        total = sum(self._stats[path] for path in PARSE_PATHS)
+        successful = self._stats["successful_parses"]
         return {
-            "total_parses": 0,
-            "successful_parses": 0,
-            "success_rate": 0.0
+            "total_parses": total,
+            "successful_parses": successful,
+            "success_rate": round(successful / total, 4) if total else 0.0,
+            "paths": {path: self._stats[path] for path in PARSE_PATHS},
         }
 
 
@@ -12,6 +12,8 @@ from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
 from enum import Enum
 
+from app.utils.keyword_automaton import KeywordAutomaton, KeywordMatches
+
 logger = logging.getLogger(__name__)
 
 
@@ -139,6 +141,60 @@ class PrecomputeService:
             "烦死了", "累死了", "工作", "老板", "加班", "压力",
             "tired", "exhausted", "work", "boss", "stress"
         ]
+        
+        # 不当内容 (粗俗但不违法)
+        self.inappropriate_keywords = ["傻逼", "草你妈", "滚", "操"]
+        
+        # 极端危险关键词 (真正需要BLOCK的内容)
+        self.dangerous_keywords = [
+            "恐怖主义", "儿童色情",
+            "terrorism", "child porn"
+        ]
+        
+        # 情感微调词汇
+        self.positive_keywords = ["爱", "喜欢", "开心", "高兴", "好", "棒", "amazing", "love", "happy", "great"]
+        self.negative_keywords = ["讨厌", "烦", "差", "不好", "失望", "hate", "bad", "terrible", "annoying"]
+        
+        # 所有关键词表编译成一个自动机，每条消息只扫描一次
+        self._automaton = KeywordAutomaton({
+            "greeting": self.greeting_keywords,
+            "closing": self.closing_keywords,
+            "confession": self.confession_keywords,
+            "nsfw": self.nsfw_keywords,
+            "invitation": self.invitation_keywords,
+            "apology": self.apology_keywords,
+            "sadness": self.sadness_keywords,
+            "complain": self.complain_keywords,
+            "insult": self.insult_keywords,
+            "criticism": self.criticism_keywords,
+            "flirt": self.flirt_keywords,
+            "compliment": self.compliment_keywords,
+            "inappropriate": self.inappropriate_keywords,
+            "dangerous": self.dangerous_keywords,
+            "positive": self.positive_keywords,
+            "negative": self.negative_keywords,
+        }).build()
+    
+    # 意图优先级（从高到低），扫描之后按此顺序决定意图
+    INTENT_PRIORITY = [
+        ("greeting", Intent.GREETING),
+        ("closing", Intent.CLOSING),
+        ("confession", Intent.LOVE_CONFESSION),
+        ("nsfw", Intent.REQUEST_NSFW),
+        ("invitation", Intent.INVITATION),
+        ("apology", Intent.APOLOGY),
+        ("sadness", Intent.EXPRESS_SADNESS),
+        ("complain", Intent.COMPLAIN),
+        ("insult", Intent.INSULT),
+        ("criticism", Intent.CRITICISM),
+        ("flirt", Intent.FLIRT),
+        ("compliment", Intent.COMPLIMENT),
+        ("inappropriate", Intent.INAPPROPRIATE),
+    ]
+    
+    def scan(self, message: str) -> KeywordMatches:
+        """一次扫描消息（已小写），返回所有命中的关键词分类"""
+        return self._automaton.scan(message)
     
     def analyze(
         self,
@@ -158,21 +214,22 @@ class PrecomputeService:
             PrecomputeResult
         """
         message_lower = message.lower().strip()
+        matches = self.scan(message_lower)
         
         # 1. 安全检查
-        safety_flag = self._check_safety(message_lower)
+        safety_flag = self._check_safety(message_lower, matches)
         
         # 2. 意图识别
-        intent = self._detect_intent(message_lower)
+        intent = self._detect_intent(message_lower, matches)
         
         # 3. 难度评估
         difficulty = self._estimate_difficulty(intent, message)
         
         # 4. 情感分析 (简化版)
-        sentiment = self._analyze_sentiment(message_lower, intent)
+        sentiment = self._analyze_sentiment(message_lower, intent, matches)
         
         # 5. NSFW检测
-        is_nsfw = self._detect_nsfw(message_lower)
+        is_nsfw = self._detect_nsfw(message_lower, matches)
         
         return PrecomputeResult(
             safety_flag=safety_flag,
@@ -183,82 +240,28 @@ class PrecomputeService:
             reasoning=f"Rule-based analysis: intent={intent}, difficulty={difficulty}"
         )
     
-    def _check_safety(self, message: str) -> str:
+    def _check_safety(self, message: str, matches: Optional[KeywordMatches] = None) -> str:
         """安全检查 - 仅拦截真正危险的内容"""
-        
-        # 极端危险关键词 (真正需要BLOCK的内容)
-        dangerous_keywords = [
-            "恐怖主义", "儿童色情",
-            "terrorism", "child porn"
-        ]
-        
-        for keyword in dangerous_keywords:
-            if keyword in message:
-                return SafetyFlag.BLOCK.value
+        if matches is None:
+            matches = self.scan(message)
+        if matches.has("dangerous"):
+            return SafetyFlag.BLOCK.value
         
         return SafetyFlag.SAFE.value
     
-    def _detect_intent(self, message: str) -> str:
+    def _detect_intent(self, message: str, matches: Optional[KeywordMatches] = None) -> str:
         """意图检测 - 基于关键词规则"""
         
-        # 按优先级顺序检查
-        
-        # 1. 特殊礼物标记 (系统标记，优先级最高)
+        # 特殊礼物标记 (系统标记，优先级最高)
         if message.startswith("[verified_gift:"):
             return Intent.GIFT_SEND.value
         
-        # 2. 问候
-        if any(kw in message for kw in self.greeting_keywords):
-            return Intent.GREETING.value
-        
-        # 3. 告别
-        if any(kw in message for kw in self.closing_keywords):
-            return Intent.CLOSING.value
-        
-        # 4. 表白
-        if any(kw in message for kw in self.confession_keywords):
-            return Intent.LOVE_CONFESSION.value
-        
-        # 5. NSFW请求
-        if any(kw in message for kw in self.nsfw_keywords):
-            return Intent.REQUEST_NSFW.value
-        
-        # 6. 约会邀请
-        if any(kw in message for kw in self.invitation_keywords):
-            return Intent.INVITATION.value
-        
-        # 7. 道歉
-        if any(kw in message for kw in self.apology_keywords):
-            return Intent.APOLOGY.value
-        
-        # 8. 悲伤表达
-        if any(kw in message for kw in self.sadness_keywords):
-            return Intent.EXPRESS_SADNESS.value
-        
-        # 9. 抱怨
-        if any(kw in message for kw in self.complain_keywords):
-            return Intent.COMPLAIN.value
-        
-        # 10. 侮辱
-        if any(kw in message for kw in self.insult_keywords):
-            return Intent.INSULT.value
-        
-        # 11. 批评
-        if any(kw in message for kw in self.criticism_keywords):
-            return Intent.CRITICISM.value
-        
-        # 12. 调情
-        if any(kw in message for kw in self.flirt_keywords):
-            return Intent.FLIRT.value
-        
-        # 13. 夸奖
-        if any(kw in message for kw in self.compliment_keywords):
-            return Intent.COMPLIMENT.value
-        
-        # 14. 检查不当内容 (粗俗但不违法)
-        inappropriate_keywords = ["傻逼", "草你妈", "滚", "操"]
-        if any(kw in message for kw in inappropriate_keywords):
-            return Intent.INAPPROPRIATE.value
+        # 按优先级取第一个命中的分类
+        if matches is None:
+            matches = self.scan(message)
+        for category, intent in self.INTENT_PRIORITY:
+            if matches.has(category):
+                return intent.value
         
         # 默认：日常聊天
         return Intent.SMALL_TALK.value
@@ -287,7 +290,9 @@ class PrecomputeService:
         
         return difficulty_map.get(intent, 20)
     
-    def _analyze_sentiment(self, message: str, intent: str) -> float:
+    def _analyze_sentiment(
+        self, message: str, intent: str, matches: Optional[KeywordMatches] = None
+    ) -> float:
         """情感分析 - 简化版本"""
         
         # 基于意图的基础情感值
@@ -313,11 +318,10 @@ class PrecomputeService:
         base_sentiment = intent_sentiment_map.get(intent, 0.0)
         
         # 微调：检查积极/消极词汇
-        positive_keywords = ["爱", "喜欢", "开心", "高兴", "好", "棒", "amazing", "love", "happy", "great"]
-        negative_keywords = ["讨厌", "烦", "差", "不好", "失望", "hate", "bad", "terrible", "annoying"]
-        
-        positive_count = sum(1 for kw in positive_keywords if kw in message)
-        negative_count = sum(1 for kw in negative_keywords if kw in message)
+        if matches is None:
+            matches = self.scan(message)
+        positive_count = matches.count("positive")
+        negative_count = matches.count("negative")
         
         # 调整情感值
         adjustment = (positive_count - negative_count) * 0.1
@@ -325,9 +329,11 @@ class PrecomputeService:
         
         return round(final_sentiment, 2)
     
-    def _detect_nsfw(self, message: str) -> bool:
+    def _detect_nsfw(self, message: str, matches: Optional[KeywordMatches] = None) -> bool:
         """NSFW检测"""
-        return any(kw in message for kw in self.nsfw_keywords)
+        if matches is None:
+            matches = self.scan(message)
+        return matches.has("nsfw")
     
     def get_analysis_summary(self, result: PrecomputeResult) -> str:
         """获取分析摘要（用于调试）"""
@@ -4,15 +4,27 @@ Prompt Builder v4.0 - Single Call Architecture
 
 简化版Prompt构建器，用于单次LLM调用架构。
 将复杂的状态机逻辑预先注入到System Prompt中，强制输出JSON格式。
+
+布局 (settings.PROMPT_LAYOUT):
+- prefix: 静态 → 易变排列。前缀只依赖 (角色, 阶段, NSFW)，同一组合每轮逐字节相同，
+  可以命中 provider 侧的 prompt 前缀缓存；时间、状态数值、记忆、情绪等放在后缀
+- legacy: 旧的交错顺序（动态段夹在人设和阶段规则之间）
+
+静态片段（人设、搭子世界知识、阶段规则、整个前缀）按 (角色, 阶段, 升阶, NSFW) 记忆化，
+admin 修改角色时经 character_registry 通知整体清空。
 """
 
 import logging
 import json
+import hashlib
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Callable, Dict, Any, List, Optional, Tuple
 
+from app.config import settings
 from app.services.character_config import get_character_config, CharacterConfig
 from app.api.v1.characters import get_character_by_id
+from app.services.character_registry import character_registry
 from app.services.intimacy_constants import (
     get_stage, RelationshipStage, STAGE_NAMES_CN, STAGE_NAMES_EN
 )
@@ -20,6 +32,20 @@ from app.services.intimacy_constants import (
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class PromptLayout:
+    """System Prompt 布局：稳定前缀 + 易变后缀"""
+    prefix: str
+    suffix: str
+    cache_key: Optional[str]   # 前缀缓存 key，legacy 布局为 None
+    character_id: str
+    stage: str                 # 阶段标签（统计用），临时升阶时为 "S2_CRUSH+S1_FRIEND"
+
+    @property
+    def text(self) -> str:
+        return "\n\n".join(filter(None, [self.prefix, self.suffix]))
+
+
 class PromptBuilderV4:
     """
     V4.0 Prompt构建器 - 模板化注入
@@ -27,6 +53,40 @@ class PromptBuilderV4:
     
     def __init__(self):
         self.json_schema = self._get_json_schema()
+        # 静态片段缓存: (片段名, ...) -> 文本；组合数有限（角色 × 阶段 × 升阶 × NSFW），不设上限
+        self._fragments: Dict[Tuple, Any] = {}
+        self.fragment_hits = 0
+        self.fragment_misses = 0
+        character_registry.subscribe(self.clear_fragment_cache)
+    
+    def clear_fragment_cache(self, character_id: Optional[str] = None) -> None:
+        """
+        清空静态片段缓存（角色定义变更时）。
+        搭子角色的世界知识包含其他角色的介绍，所以任一角色变更都整体清空。
+        """
+        self._fragments.clear()
+        logger.debug(f"Prompt fragment cache cleared (character={character_id})")
+    
+    def get_fragment_stats(self) -> Dict[str, Any]:
+        """静态片段缓存命中统计"""
+        total = self.fragment_hits + self.fragment_misses
+        return {
+            "entries": len(self._fragments),
+            "hits": self.fragment_hits,
+            "misses": self.fragment_misses,
+            "hit_rate": round(self.fragment_hits / total, 3) if total else 0.0,
+        }
+    
+    def _fragment(self, key: Tuple, build: Callable[[], Any]) -> Any:
+        """读取或构建静态片段（None 结果也缓存）"""
+        try:
+            value = self._fragments[key]
+        except KeyError:
+            self.fragment_misses += 1
+            value = self._fragments[key] = build()
+            return value
+        self.fragment_hits += 1
+        return value
     
     def _get_json_schema(self) -> str:
         """获取JSON输出格式要求"""
@@ -96,6 +156,7 @@ You MUST respond with ONLY a valid JSON object in this exact format:
         user_interests: List[str] = None,
         stage_boost: int = 0,
         nsfw_override: bool = False,
+        conversation_summary: str = "",
     ) -> str:
         """
         构建完整的System Prompt用于单次调用
@@ -109,32 +170,124 @@ You MUST respond with ONLY a valid JSON object in this exact format:
             user_interests: 用户兴趣标签列表 (display_name)
             stage_boost: 临时升阶数量
             nsfw_override: 是否解锁NSFW（角色特定礼物效果）
+            conversation_summary: 更早对话的滚动摘要（见 context_builder）
             
         Returns:
             完整的System Prompt
         """
+        return self.build_prompt_layout(
+            user_state=user_state,
+            character_id=character_id,
+            precompute_result=precompute_result,
+            context_messages=context_messages,
+            memory_context=memory_context,
+            user_interests=user_interests,
+            stage_boost=stage_boost,
+            nsfw_override=nsfw_override,
+            conversation_summary=conversation_summary,
+        ).text
+    
+    def build_prompt_layout(
+        self,
+        user_state: Any,
+        character_id: str,
+        precompute_result: Any = None,
+        context_messages: List[Dict] = None,
+        memory_context: str = "",
+        user_interests: List[str] = None,
+        stage_boost: int = 0,
+        nsfw_override: bool = False,
+        conversation_summary: str = "",
+        layout: Optional[str] = None,
+    ) -> PromptLayout:
+        """
+        构建 System Prompt 布局（参数同 build_system_prompt）
+        
+        Args:
+            layout: "prefix" | "legacy"，默认取 settings.PROMPT_LAYOUT
+            
+        Returns:
+            PromptLayout，.text 为完整 System Prompt
+        """
         # 获取角色配置
         char_config = get_character_config(character_id)
         char_data = get_character_by_id(character_id)
-        
-        # 构建各个组件
-        parts = [
-            self._build_character_base(char_config, char_data),
-            self._build_buddy_world_knowledge(char_config, user_state),
-            self._build_current_status(user_state, character_id, stage_boost=stage_boost),
+        stage, original_stage = self._resolve_stage(user_state, stage_boost)
+        stage_label = stage.name if stage == original_stage else f"{stage.name}+{original_stage.name}"
+        
+        if (layout or settings.PROMPT_LAYOUT) == "legacy":
+            parts = [
+                self._build_character_base(char_config, char_data),
+                self._build_buddy_world_knowledge(char_config, user_state),
+                self._build_current_status(user_state, character_id, stage_boost=stage_boost),
+                self._build_user_interests(user_interests),
+                self._build_stage_rules(user_state, stage_boost=stage_boost, nsfw_override=nsfw_override),
+                self._build_memory_context(user_state.events, memory_context),
+                self._build_conversation_summary(conversation_summary),
+                self._build_emotional_guidance(user_state),
+                self._build_safety_boundaries(char_config, user_state, nsfw_override=nsfw_override),
+                self.json_schema
+            ]
+            return PromptLayout("", "\n\n".join(filter(None, parts)), None, character_id, stage_label)
+        
+        # 前缀：只依赖 (角色, 阶段, NSFW)（搭子角色另含好感档位），不能出现任何每轮变化的内容
+        # 安全边界引用「上方的关系阶段」，必须排在阶段规则之后
+        def build_prefix() -> Tuple[str, str]:
+            prefix = "\n\n".join(filter(None, [
+                self._build_character_persona(char_config, char_data),
+                self.json_schema,
+                self._build_buddy_world_knowledge(char_config, user_state),
+                self._build_stage_rules(user_state, stage_boost=stage_boost, nsfw_override=nsfw_override),
+                self._build_safety_boundaries(char_config, user_state, nsfw_override=nsfw_override),
+            ]))
+            return prefix, hashlib.sha1(prefix.encode("utf-8")).hexdigest()[:12]
+        
+        buddy_tier = self._buddy_tier(user_state) if self._is_buddy(char_config) else None
+        prefix, digest = self._fragment(
+            ("prefix", str(character_id), stage, original_stage, nsfw_override, buddy_tier), build_prefix
+        )
+        # 后缀：按变化频率从低到高
+        suffix = "\n\n".join(filter(None, [
             self._build_user_interests(user_interests),
-            self._build_stage_rules(user_state, stage_boost=stage_boost, nsfw_override=nsfw_override),
+            self._build_conversation_summary(conversation_summary),
+            self._build_current_time(),
             self._build_memory_context(user_state.events, memory_context),
+            self._build_current_status(user_state, character_id, stage_boost=stage_boost),
             self._build_emotional_guidance(user_state),
-            self._build_safety_boundaries(char_config, user_state, nsfw_override=nsfw_override),
-            self.json_schema
-        ]
+        ]))
         
-        return "\n\n".join(filter(None, parts))
+        cache_key = f"v4:{character_id}:{stage_label}:{'nsfw' if nsfw_override else 'sfw'}:{digest}"
+        return PromptLayout(prefix, suffix, cache_key, character_id, stage_label)
     
-    def _build_character_base(self, char_config: Optional[CharacterConfig], char_data: Optional[Dict]) -> str:
-        """构建角色基础人设"""
+    def _resolve_stage(self, user_state: Any, stage_boost: int = 0) -> Tuple[RelationshipStage, RelationshipStage]:
+        """返回 (生效阶段, 原始阶段)"""
+        if hasattr(user_state, 'intimacy_x'):
+            intimacy = int(user_state.intimacy_x)
+        else:
+            level = getattr(user_state, 'intimacy_level', 1)
+            intimacy = self._level_to_intimacy(level)
+        
+        stage = get_stage(intimacy)
         
+        # Stage boost from active effects (临时升阶)
+        original_stage = stage
+        if stage_boost > 0:
+            from app.services.intimacy_constants import STAGE_ORDER
+            stage_index = STAGE_ORDER.index(stage) if stage in STAGE_ORDER else 0
+            boosted_index = min(stage_index + stage_boost, len(STAGE_ORDER) - 1)
+            stage = STAGE_ORDER[boosted_index]
+        return stage, original_stage
+    
+    def _build_character_base(self, char_config: Optional[CharacterConfig], char_data: Optional[Dict]) -> str:
+        """构建角色基础人设（含当前时间，legacy 布局）"""
+        return f"{self._build_character_persona(char_config, char_data)}\n\n{self._build_current_time()}"
+    
+    def _build_character_persona(self, char_config: Optional[CharacterConfig], char_data: Optional[Dict]) -> str:
+        """构建角色人设 + 输出格式（不含时间，可进前缀）"""
+        character_id = (char_data or {}).get("character_id") or getattr(char_config, "char_id", None)
+        return self._fragment(("persona", character_id), lambda: self._render_character_persona(char_config, char_data))
+    
+    def _render_character_persona(self, char_config: Optional[CharacterConfig], char_data: Optional[Dict]) -> str:
         # 从characters.py获取system_prompt
         if char_data and char_data.get("system_prompt"):
             base_prompt = char_data["system_prompt"]
@@ -143,7 +296,15 @@ You MUST respond with ONLY a valid JSON object in this exact format:
         else:
             base_prompt = "You are Luna, an elegant and caring AI companion."
         
-        # 添加时间信息
+        return f"""{base_prompt}
+
+### 输出格式规范 / Output Format
+- Use parentheses for actions: (tilts head) or （歪头）
+- Match the user's language in your reply
+- NO *asterisks* or markdown formatting"""
+    
+    def _build_current_time(self) -> str:
+        """构建当前时间信息"""
         now = datetime.now()
         date_str = now.strftime("%Y年%m月%d日")
         time_str = now.strftime("%H:%M")
@@ -172,14 +333,7 @@ You MUST respond with ONLY a valid JSON object in this exact format:
         elif now.month == 1 and now.day == 1:
             special_date = "🎉 新年快乐！"
         
-        return f"""{base_prompt}
-
-### 输出格式规范 / Output Format
-- Use parentheses for actions: (tilts head) or （歪头）
-- Match the user's language in your reply
-- NO *asterisks* or markdown formatting
-
-### 当前时间
+        return f"""### 当前时间
 - 日期: {date_str} {weekday}
 - 时间: {time_str} ({time_period})
 {f'- {special_date}' if special_date else ''}"""
@@ -189,14 +343,21 @@ You MUST respond with ONLY a valid JSON object in this exact format:
         搭子型角色专属：注入其他角色的信息，让煤球能当攻略军师。
         好感度越高，给的信息越详细。
         """
-        if not char_config:
+        if not self._is_buddy(char_config):
             return None
         
+        level = self._buddy_level(user_state)
+        return self._fragment(
+            ("buddy_world", char_config.char_id, self._buddy_tier(user_state)),
+            lambda: self._render_buddy_world_knowledge(level),
+        )
+    
+    def _is_buddy(self, char_config: Optional[CharacterConfig]) -> bool:
         from app.services.character_config import CharacterArchetype
-        if char_config.archetype != CharacterArchetype.BUDDY:
-            return None
-        
-        # 获取当前好感等级
+        return bool(char_config) and char_config.archetype == CharacterArchetype.BUDDY
+    
+    def _buddy_level(self, user_state: Any) -> int:
+        """搭子世界知识用的好感等级"""
         level = getattr(user_state, 'intimacy_level', 1)
         if hasattr(user_state, 'intimacy_x'):
             intimacy = int(user_state.intimacy_x)
@@ -207,12 +368,17 @@ You MUST respond with ONLY a valid JSON object in this exact format:
                 level = max(level, 25)
             elif intimacy >= 30:
                 level = max(level, 10)
-        
-        # 从 characters.py 动态获取其他角色信息
-        from app.api.v1.characters import CHARACTERS
-        
+        return level
+    
+    def _buddy_tier(self, user_state: Any) -> int:
+        """好感档位（世界知识的内容只随档位变化：Lv.5 / 10 / 25）"""
+        level = self._buddy_level(user_state)
+        return sum(level >= threshold for threshold in (5, 10, 25))
+    
+    def _render_buddy_world_knowledge(self, level: int) -> Optional[str]:
+        # 从角色注册表动态获取其他角色信息
         other_chars = []
-        for c in CHARACTERS:
+        for c in character_registry.all():
             # 跳过自己和非活跃角色
             if c.get("character_type") == "buddy" or not c.get("is_active", True):
                 continue
@@ -323,6 +489,22 @@ You MUST respond with ONLY a valid JSON object in this exact format:
             emotion_state = "愤怒"
         
         # 角色性格参数
+        personality_desc = self._fragment(
+            ("personality", str(character_id)), lambda: self._render_personality(character_id)
+        )
+        
+        return f"""### 当前状态 (内部参考，不要在回复中暴露这些数值)
+- 情绪值: {emotion} ({emotion_state})
+- 亲密度: {intimacy}/100
+- 关系阶段: {stage_en} ({stage_cn})
+- 等级: {getattr(user_state, 'intimacy_level', 1)}{personality_desc}
+
+⚠️ 重要：这些数值仅供你内部参考，绝不要在回复中说出具体数字！
+⚠️ 你的 emotion_delta 应符合你的性格特征（敏感角色波动大，淡定角色波动小）
+⚠️ 情绪值范围是 -100 到 100。如果已经接近上限(>80)，正向delta应减小(+1~+3)；接近下限(<-80)，负向delta也应减小。不要在已经极端的情况下继续大幅波动。"""
+    
+    def _render_personality(self, character_id: str) -> str:
+        """角色性格参数 → 状态段里的性格特征描述"""
         personality_desc = ""
         char_data = get_character_by_id(character_id)
         if char_data and char_data.get("personality"):
@@ -348,15 +530,7 @@ You MUST respond with ONLY a valid JSON object in this exact format:
             if traits:
                 personality_desc = f"\n- 性格特征: {'；'.join(traits)}"
         
-        return f"""### 当前状态 (内部参考，不要在回复中暴露这些数值)
-- 情绪值: {emotion} ({emotion_state})
-- 亲密度: {intimacy}/100
-- 关系阶段: {stage_en} ({stage_cn})
-- 等级: {getattr(user_state, 'intimacy_level', 1)}{personality_desc}
-
-⚠️ 重要：这些数值仅供你内部参考，绝不要在回复中说出具体数字！
-⚠️ 你的 emotion_delta 应符合你的性格特征（敏感角色波动大，淡定角色波动小）
-⚠️ 情绪值范围是 -100 到 100。如果已经接近上限(>80)，正向delta应减小(+1~+3)；接近下限(<-80)，负向delta也应减小。不要在已经极端的情况下继续大幅波动。"""
+        return personality_desc
     
     def _level_to_intimacy(self, level: int) -> int:
         """将等级映射到intimacy值"""
@@ -373,23 +547,15 @@ You MUST respond with ONLY a valid JSON object in this exact format:
     
     def _build_stage_rules(self, user_state: Any, stage_boost: int = 0, nsfw_override: bool = False) -> str:
         """构建阶段行为规则"""
-        
-        if hasattr(user_state, 'intimacy_x'):
-            intimacy = int(user_state.intimacy_x)
-        else:
-            level = getattr(user_state, 'intimacy_level', 1)
-            intimacy = self._level_to_intimacy(level)
-        
-        stage = get_stage(intimacy)
-        
-        # Stage boost from active effects (临时升阶)
-        original_stage = stage
-        if stage_boost > 0:
-            from app.services.intimacy_constants import STAGE_ORDER
-            stage_index = STAGE_ORDER.index(stage) if stage in STAGE_ORDER else 0
-            boosted_index = min(stage_index + stage_boost, len(STAGE_ORDER) - 1)
-            stage = STAGE_ORDER[boosted_index]
-        
+        stage, original_stage = self._resolve_stage(user_state, stage_boost)
+        return self._fragment(
+            ("stage_rules", stage, original_stage, nsfw_override),
+            lambda: self._render_stage_rules(stage, original_stage, nsfw_override),
+        )
+    
+    def _render_stage_rules(
+        self, stage: RelationshipStage, original_stage: RelationshipStage, nsfw_override: bool
+    ) -> str:
         # NSFW override from special gift (角色特定解锁)
         nsfw_hint = ""
         if nsfw_override:
@@ -463,7 +629,7 @@ You MUST respond with ONLY a valid JSON object in this exact format:
         
         result = stage_rules.get(stage, "### 关系阶段：未知\n保持自然友好的态度。")
         
-        if stage_boost > 0 and stage != original_stage:
+        if stage != original_stage:
             result += f"\n\n⚠️ 状态效果：当前临时进入 {STAGE_NAMES_CN.get(stage, '未知')} 阶段的行为模式（原始阶段：{STAGE_NAMES_CN.get(original_stage, '未知')}）。效果结束后回到原始阶段。"
         
         # 添加 NSFW 解锁提示（角色特定礼物效果）
@@ -500,6 +666,13 @@ You MUST respond with ONLY a valid JSON object in this exact format:
         
         return "\n\n".join(context_parts) if context_parts else ""
     
+    def _build_conversation_summary(self, summary: str = "") -> Optional[str]:
+        """构建更早对话的摘要（原文不再发送）"""
+        if not summary:
+            return None
+        return f"""### 之前的对话摘要
+{summary}"""
+    
     def _build_emotional_guidance(self, user_state: Any) -> str:
         """构建情绪行为指导"""
         
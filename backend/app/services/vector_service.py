@@ -14,11 +14,14 @@ from uuid import UUID
 from datetime import datetime
 
 from app.core.exceptions import VectorDBError
+from app.core.query_stats import instrument_asyncpg_connection
+from app.core.tracing import trace_methods
 from app.services.llm_service import OpenAIEmbeddingService
 
 logger = logging.getLogger(__name__)
 
 
+@trace_methods("vector")
 class VectorService:
     """
     pgvector-based semantic search for Luna memories.
@@ -49,6 +52,7 @@ class VectorService:
                 min_size=1,
                 max_size=5,
                 command_timeout=30,
+                init=instrument_asyncpg_connection,
             )
             logger.info("pgvector connection pool created")
         return self._pool
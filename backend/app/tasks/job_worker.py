@@ -0,0 +1,74 @@
+"""
+Background Job Worker
+=====================
+
+独立的任务 worker 进程，消费 job_queue（Redis 或 background_jobs 表）。
+API 进程只负责入队，worker 可按 LLM/生图负载单独扩容。
+
+运行:
+    python -m app.tasks.job_worker
+    JOB_WORKER_CONCURRENCY=8 python -m app.tasks.job_worker
+
+环境变量:
+    JOB_WORKER_CONCURRENCY   并发消费者数量（默认 4）
+    JOB_WORKER_POLL_INTERVAL 空闲时轮询间隔，秒（默认 1.0）
+"""
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import os
+import signal
+import socket
+import asyncio
+import logging
+
+from app.core.logging import setup_logging
+from app.core.database import init_db, close_db
+from app.core.redis import init_redis, close_redis
+from app.services.job_queue import job_queue, JOB_HANDLERS
+import app.tasks.jobs  # noqa: F401 - registers job handlers
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+POLL_INTERVAL = float(os.getenv("JOB_WORKER_POLL_INTERVAL", "1.0"))
+
+
+async def main() -> None:
+    setup_logging()
+    await init_db()
+    await init_redis()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(
+        f"Job worker {worker_id} started: concurrency={CONCURRENCY}, "
+        f"handlers={', '.join(sorted(JOB_HANDLERS))}"
+    )
+
+    try:
+        await job_queue.run_forever(
+            concurrency=CONCURRENCY,
+            poll_interval=POLL_INTERVAL,
+            stop_event=stop_event,
+            worker_id=worker_id,
+        )
+    finally:
+        # 缓冲中的记忆提取在退出前写入
+        from app.services.memory_extraction_worker import memory_extraction_worker
+        await memory_extraction_worker.drain()
+        logger.info(f"Job worker stopped: {job_queue.get_stats()}")
+        await close_db()
+        await close_redis()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
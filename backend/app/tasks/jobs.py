@@ -0,0 +1,117 @@
+"""
+Background Job Handlers
+=======================
+
+job_queue 的任务处理函数，在独立 worker 进程中执行（python -m app.tasks.job_worker）。
+
+每个 handler 接收 JSON payload，返回 JSON 可序列化的 result dict（写入任务结果供客户端轮询）。
+抛出异常会触发 job_queue 的重试逻辑。
+"""
+
+import base64
+import logging
+from typing import Any, Dict
+
+from app.services.job_queue import job_handler
+
+logger = logging.getLogger(__name__)
+
+JOB_MEMORY_EXTRACTION = "memory_extraction"
+JOB_IMAGE_GENERATION = "image_generation"
+JOB_EVENT_STORY = "event_story"
+JOB_TTS = "tts"
+
+
+@job_handler(JOB_MEMORY_EXTRACTION)
+async def run_memory_extraction(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    记忆提取：在任务内提取并写入这一轮对话，写完才标记成功。
+
+    不放进 worker 进程内的缓冲：缓冲只在内存里，进程重启会丢，
+    多个 worker 之间也会把同一对话的轮次拆散。提取失败抛出异常，由 job_queue 重试。
+    """
+    from app.services.memory_extraction_worker import BufferedTurn, memory_extraction_worker
+
+    turn = BufferedTurn(
+        user_message=payload.get("user_message", ""),
+        assistant_reply=payload.get("assistant_reply", ""),
+        context=list(payload.get("context_messages") or [])[-3:],
+    )
+    return await memory_extraction_worker.extract_turns(
+        payload["user_id"], payload["character_id"], [turn]
+    )
+
+
+@job_handler(JOB_IMAGE_GENERATION)
+async def run_image_generation(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """生图：ImageGenerationService.generate_image"""
+    from app.core.database import get_db
+    from app.services.image_service import get_image_service, ImageStyle, GenerationType
+
+    service = get_image_service()
+    async with get_db() as db:
+        result = await service.generate_image(
+            prompt=payload.get("prompt", ""),
+            style=ImageStyle(payload.get("style", ImageStyle.SELFIE.value)),
+            character_id=payload["character_id"],
+            user_id=payload["user_id"],
+            generation_type=GenerationType(
+                payload.get("generation_type", GenerationType.USER_REQUEST.value)
+            ),
+            db=db,
+            context=payload.get("context"),
+            aspect_ratio=payload.get("aspect_ratio", "1:1"),
+        )
+
+    if not result.success:
+        raise RuntimeError(result.error or "Image generation failed")
+
+    return {
+        "image_id": result.image_id,
+        "image_url": result.image_url,
+        "thumbnail_url": result.thumbnail_url,
+        "cost_credits": result.cost_credits,
+        "is_free": result.is_free,
+    }
+
+
+@job_handler(JOB_EVENT_STORY)
+async def run_event_story(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """事件故事：EventStoryGenerator.generate_event_story（已存在的故事直接返回）"""
+    from app.services.event_story_generator import event_story_generator
+
+    result = await event_story_generator.generate_event_story(
+        user_id=payload["user_id"],
+        character_id=payload["character_id"],
+        event_type=payload["event_type"],
+        chat_history=payload.get("chat_history") or [],
+        memory_context=payload.get("memory_context", ""),
+        relationship_state=payload.get("relationship_state"),
+        save_to_db=True,
+    )
+
+    if not result.success:
+        raise RuntimeError(result.error or "Story generation failed")
+
+    return {
+        "event_type": payload["event_type"],
+        "story_content": result.story_content,
+        "event_memory_id": result.event_memory_id,
+    }
+
+
+@job_handler(JOB_TTS)
+async def run_tts(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """TTS：豆包语音合成，音频以 base64 存入结果"""
+    from app.services.voice_service import DoubaoTTSService
+
+    audio = await DoubaoTTSService().synthesize_long(
+        text=payload["text"],
+        voice=payload.get("voice"),
+        speed_ratio=payload.get("speed", 1.0),
+        emotion=payload.get("emotion"),
+    )
+    return {
+        "media_type": "audio/mpeg",
+        "audio_base64": base64.b64encode(audio).decode("ascii"),
+    }
@@ -0,0 +1,177 @@
+"""
+Keyword Automaton - 多模式关键词匹配
+====================================
+
+Aho-Corasick 自动机：所有关键词表编译一次，一次线性扫描返回命中的全部分类。
+语义与 `kw in text` 完全一致（子串匹配，允许重叠），优先级由调用方在扫描之后决定。
+
+用于 PrecomputeService（意图 / 安全 / NSFW / 情感）、EmotionEngineV2.quick_detect、
+ContentFilter 等每条消息都要跑的关键词检测。
+
+Usage:
+    automaton = KeywordAutomaton({
+        "greeting": ["你好", "hello"],
+        "closing": ["再见", "bye"],
+    })
+    matches = automaton.scan("hello, 再见")
+    matches.has("greeting")                          # True
+    matches.first_of(["closing", "greeting"])        # "closing"
+"""
+
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+
+class KeywordMatches:
+    """一次扫描的结果：分类 -> 命中的关键词集合 / 出现次数"""
+
+    __slots__ = ("keywords", "occurrences")
+
+    def __init__(self):
+        self.keywords: Dict[str, Set[str]] = {}
+        self.occurrences: Dict[str, int] = {}
+
+    def _add(self, category: str, keyword: str) -> None:
+        found = self.keywords.get(category)
+        if found is None:
+            self.keywords[category] = {keyword}
+            self.occurrences[category] = 1
+        else:
+            found.add(keyword)
+            self.occurrences[category] += 1
+
+    def has(self, category: str) -> bool:
+        """是否命中该分类（等价于 any(kw in text for kw in keywords)）"""
+        return category in self.keywords
+
+    def count(self, category: str) -> int:
+        """命中的不同关键词数（等价于 sum(1 for kw in keywords if kw in text)）"""
+        return len(self.keywords.get(category, ()))
+
+    def occurrence_count(self, category: str) -> int:
+        """关键词出现总次数（含重复出现）"""
+        return self.occurrences.get(category, 0)
+
+    def first_of(self, priority: Iterable[str]) -> Optional[str]:
+        """按优先级返回第一个命中的分类"""
+        for category in priority:
+            if category in self.keywords:
+                return category
+        return None
+
+    @property
+    def categories(self) -> Set[str]:
+        return set(self.keywords)
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+
+    def __repr__(self) -> str:
+        return f"KeywordMatches({self.keywords})"
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 多模式匹配自动机"""
+
+    def __init__(self, categories: Optional[Dict[str, Iterable[str]]] = None):
+        # keyword -> 所属分类（同一个词可以属于多个分类，如 "晚安"）
+        self._keyword_categories: Dict[str, List[str]] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[str, ...]] = [()]
+        self._built = True
+
+        for category, keywords in (categories or {}).items():
+            self.add(category, keywords)
+
+    def add(self, category: str, keywords: Iterable[str]) -> "KeywordAutomaton":
+        """添加一个分类的关键词（空字符串忽略）"""
+        for keyword in keywords:
+            if not keyword:
+                continue
+            owners = self._keyword_categories.setdefault(keyword, [])
+            if category not in owners:
+                owners.append(category)
+                self._built = False
+        return self
+
+    def build(self) -> "KeywordAutomaton":
+        """编译自动机（scan 时会按需自动调用）"""
+        goto: List[Dict[str, int]] = [{}]
+        output: List[List[str]] = [[]]
+
+        for keyword in self._keyword_categories:
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    output.append([])
+                state = nxt
+            output[state].append(keyword)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                output[nxt].extend(output[fail[nxt]])
+
+        self._goto = goto
+        self._fail = fail
+        self._output = [tuple(o) for o in output]
+        self._built = True
+        return self
+
+    def scan(self, text: str) -> KeywordMatches:
+        """一次线性扫描，返回所有命中的分类和关键词"""
+        if not self._built:
+            self.build()
+
+        matches = KeywordMatches()
+        goto, fail, output = self._goto, self._fail, self._output
+        keyword_categories = self._keyword_categories
+        state = 0
+
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                for keyword in output[state]:
+                    for category in keyword_categories[keyword]:
+                        matches._add(category, keyword)
+
+        return matches
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """逐个返回所有出现位置 (start, end, keyword)，按 end 递增，允许重叠"""
+        if not self._built:
+            self.build()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            for keyword in output[state]:
+                yield i + 1 - len(keyword), i + 1, keyword
+
+    def categories_of(self, keyword: str) -> List[str]:
+        """关键词所属的分类"""
+        return self._keyword_categories.get(keyword, [])
+
+    @property
+    def max_keyword_length(self) -> int:
+        return max((len(k) for k in self._keyword_categories), default=0)
+
+    def __len__(self) -> int:
+        return len(self._keyword_categories)
@@ -3,13 +3,28 @@ Content Moderation Utilities
 
 Uses OpenAI Moderation API for content safety checks.
 Non-blocking: if API key is missing or API fails, content is allowed through.
+
+Cascade (moderate_cascade / ModerationGate), cheapest first:
+    1. verdict cache (sha256 of mode + text, TTL)
+    2. local blocked patterns
+    3. precompute safety flag (PrecomputeService BLOCK)
+    4. OpenAI Moderation API - only when nothing above decided
+
+ModerationGate starts the remote call in the background so it overlaps the
+LLM request; the response is held until the verdict is released.
 """
 
 import os
 import re
+import time
+import asyncio
+import hashlib
 import logging
-from typing import Literal, Optional, List, Dict, Any
-from dataclasses import dataclass, field
+from collections import OrderedDict
+from typing import Literal, Optional, List, Dict, Any, Tuple
+from dataclasses import dataclass, field, replace
+
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +34,8 @@ BLOCKED_PATTERNS = [
     # Add more patterns as needed
 ]
 
+_BLOCKED_REGEX = re.compile("|".join(f"(?:{p})" for p in BLOCKED_PATTERNS))
+
 
 @dataclass
 class ModerationResult:
@@ -35,6 +52,7 @@ class ModerationResult:
     categories: List[str] = field(default_factory=list)
     scores: Dict[str, float] = field(default_factory=dict)
     error: Optional[str] = None
+    source: str = "remote"  # remote / cache / local / precompute
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary format."""
@@ -43,9 +61,72 @@ class ModerationResult:
             "categories": self.categories,
             "scores": self.scores,
             "error": self.error,
+            "source": self.source,
         }
 
 
+MODERATION_CACHE_TTL = int(os.getenv("MODERATION_CACHE_TTL", "3600"))
+MODERATION_CACHE_MAX_ENTRIES = 10000
+
+
+class ModerationVerdictCache:
+    """
+    Hash-keyed verdict cache with TTL (in-process LRU).
+    
+    Only definitive verdicts are stored - results carrying an error
+    (API down, key missing) are never cached.
+    """
+    
+    def __init__(self, ttl_seconds: int = MODERATION_CACHE_TTL, max_entries: int = MODERATION_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, ModerationResult]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(text: str, mode: str) -> str:
+        return hashlib.sha256(f"{mode}\x00{text.strip()}".encode("utf-8")).hexdigest()
+    
+    def get(self, text: str, mode: str) -> Optional[ModerationResult]:
+        key = self.key(text, mode)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return replace(entry[1], categories=list(entry[1].categories), scores=dict(entry[1].scores), source="cache")
+    
+    def set(self, text: str, mode: str, result: ModerationResult) -> None:
+        if result.error:
+            return
+        key = self.key(text, mode)
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+verdict_cache = ModerationVerdictCache()
+
+
 async def moderate_content(
     text: str,
     mode: Literal["input", "output"] = "input"
@@ -80,9 +161,15 @@ async def moderate_content(
         logger.debug("Moderation disabled via MODERATION_ENABLED=false")
         return ModerationResult(flagged=False, error="Moderation disabled")
     
+    cached = verdict_cache.get(text, mode)
+    if cached is not None:
+        return cached
+    
     # Call OpenAI Moderation API
     try:
-        return await _openai_moderation(text, api_key)
+        result = await _openai_moderation(text, api_key)
+        verdict_cache.set(text, mode, result)
+        return result
     except Exception as e:
         logger.warning(f"Moderation API call failed: {e}")
         return ModerationResult(flagged=False, error=str(e))
@@ -105,7 +192,7 @@ async def _openai_moderation(text: str, api_key: str) -> ModerationResult:
     
     async with httpx.AsyncClient(timeout=10.0) as client:
         response = await client.post(
-            "https://api.openai.com/v1/moderations",
+            f"{settings.OPENAI_BASE_URL}/moderations",
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json",
@@ -162,13 +249,101 @@ def check_local_patterns(text: str) -> bool:
     if not text:
         return True
     
-    text_lower = text.lower()
+    return _BLOCKED_REGEX.search(text.lower()) is None
+
+
+class ModerationGate:
+    """
+    Hold-and-release moderation gate.
+    
+    prescreen() runs the cheap cascade steps inline. If none of them decides,
+    the remote check starts as a background task so it can overlap the LLM
+    call; verdict() waits for it before the response is released.
+    
+    Usage:
+        gate = ModerationGate(message, "input", safety_flag=precompute.safety_flag)
+        if (await gate.prescreen()).flagged:
+            raise ...
+        reply = await llm(...)             # remote moderation runs meanwhile
+        if (await gate.verdict()).flagged:
+            raise ...                      # reply is discarded
+    """
+    
+    def __init__(
+        self,
+        text: str,
+        mode: Literal["input", "output"] = "input",
+        safety_flag: Optional[str] = None,
+    ):
+        self.text = text
+        self.mode = mode
+        self.safety_flag = safety_flag
+        self.result: Optional[ModerationResult] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def decided(self) -> bool:
+        return self.result is not None
+    
+    async def prescreen(self) -> ModerationResult:
+        """Cache → local patterns → precompute flag; start remote check if still undecided"""
+        text, mode = self.text, self.mode
+        
+        if not text or not text.strip():
+            self.result = ModerationResult(flagged=False, source="local")
+            return self.result
+        
+        cached = verdict_cache.get(text, mode)
+        if cached is not None:
+            self.result = cached
+            return cached
+        
+        if not check_local_patterns(text):
+            self.result = ModerationResult(flagged=True, categories=["local_pattern"], source="local")
+            verdict_cache.set(text, mode, self.result)
+            return self.result
+        
+        if self.safety_flag == "BLOCK":
+            self.result = ModerationResult(flagged=True, categories=["precompute_block"], source="precompute")
+            verdict_cache.set(text, mode, self.result)
+            return self.result
+        
+        self._task = asyncio.create_task(moderate_content(text, mode))
+        return ModerationResult(flagged=False, source="pending")
     
-    for pattern in BLOCKED_PATTERNS:
-        if re.search(pattern, text_lower):
-            return False
+    async def verdict(self, timeout: Optional[float] = None) -> ModerationResult:
+        """Wait for the final verdict (fails open on timeout, like moderate_content)"""
+        if self.result is not None:
+            return self.result
+        if self._task is None:
+            await self.prescreen()
+            if self.result is not None:
+                return self.result
+        
+        try:
+            self.result = await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Moderation verdict timed out after {timeout}s, allowing content")
+            return ModerationResult(flagged=False, error="Moderation timed out")
+        return self.result
     
-    return True
+    def cancel(self) -> None:
+        """Drop the pending remote check (e.g. request aborted)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+
+async def moderate_cascade(
+    text: str,
+    mode: Literal["input", "output"] = "input",
+    safety_flag: Optional[str] = None,
+) -> ModerationResult:
+    """Run the full cascade and wait for the verdict"""
+    gate = ModerationGate(text, mode, safety_flag)
+    result = await gate.prescreen()
+    if gate.decided:
+        return result
+    return await gate.verdict()
 
 
 # Legacy function for backward compatibility
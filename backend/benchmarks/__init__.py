@@ -0,0 +1,22 @@
+"""
+Micro-benchmarks
+================
+
+每轮对话都会跑的纯 Python 引擎的基准测试:
+- PrecomputeService.analyze
+- PhysicsEngine.calculate_emotion_delta / update_state
+- json_parser.parse_llm_response（含修复路径）
+- prompt_builder_v4.build_system_prompt
+- ContextBuilder.assemble（token 预算内的上下文组装）
+- ContentFilter.filter
+- IntimacyService.calculate_level
+
+语料在 corpus.py（中英混合消息、各种坏 JSON 回复），用例在 cases.py。
+每次运行的结果追加到历史文件（JSONL，带 git commit），和最近一次（或指定基线）对比，
+中位数变慢超过阈值时以非零状态退出。
+
+Usage:
+    python -m benchmarks.run                        # 全部用例，对比历史中最近一次
+    python -m benchmarks.run -k json_parser --rounds 30
+    python -m benchmarks.run --threshold 0.2 --no-save
+"""
@@ -0,0 +1,175 @@
+"""
+Benchmark Cases
+===============
+
+每个用例: setup() 准备输入，返回一个无参函数；该函数跑完一批输入并返回调用次数，
+runner 据此计算单次调用耗时。输入在 setup 里生成，不计入计时。
+
+新增用例: 写一个 setup 函数，用 @case("name") 注册。
+"""
+
+import copy
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks import corpus
+
+# name -> setup()；setup() 返回 run()，run() 返回本批次调用次数
+CASES: Dict[str, Callable[[], Callable[[], int]]] = {}
+
+LUNA = "d2b3c4d5-e6f7-4a8b-9c0d-1e2f3a4b5c6d"
+
+
+def case(name: str):
+    def decorator(setup: Callable[[], Callable[[], int]]):
+        CASES[name] = setup
+        return setup
+    return decorator
+
+
+def select(patterns: List[str]) -> List[Tuple[str, Callable]]:
+    """按子串过滤用例（-k），未指定时返回全部"""
+    if not patterns:
+        return list(CASES.items())
+    return [(name, setup) for name, setup in CASES.items() if any(p in name for p in patterns)]
+
+
+@case("precompute.analyze")
+def _precompute():
+    from app.services.v4.precompute_service import precompute_service
+    messages = corpus.messages()
+
+    def run():
+        for message in messages:
+            precompute_service.analyze(message)
+        return len(messages)
+    return run
+
+
+@case("physics.calculate_emotion_delta")
+def _emotion_delta():
+    from app.services.physics_engine import PhysicsEngine, CharacterZAxis
+    char = CharacterZAxis.from_character_id(LUNA)
+    inputs = list(zip(range(-100, 100, 1), corpus.l1_results()))
+
+    def run():
+        for emotion, l1 in inputs:
+            PhysicsEngine.calculate_emotion_delta(emotion, l1, char)
+        return len(inputs)
+    return run
+
+
+@case("physics.update_state")
+def _update_state():
+    from app.services.physics_engine import PhysicsEngine, CharacterZAxis
+    char = CharacterZAxis.from_character_id(LUNA)
+    l1_results = corpus.l1_results()
+    messages = corpus.messages(len(l1_results))
+    template = {"emotion": 20, "last_intents": [], "message_history": []}
+
+    def run():
+        state = copy.deepcopy(template)
+        for l1, message in zip(l1_results, messages):
+            state["emotion"] = PhysicsEngine.update_state(state, l1, char, message)
+        return len(l1_results)
+    return run
+
+
+@case("json_parser.parse_valid")
+def _parse_valid():
+    from app.services.v4.json_parser import json_parser
+    replies = corpus.llm_replies() * 25
+
+    def run():
+        for reply in replies:
+            json_parser.parse_llm_response(reply)
+        return len(replies)
+    return run
+
+
+@case("json_parser.parse_repair")
+def _parse_repair():
+    from app.services.v4.json_parser import json_parser
+    replies = corpus.MALFORMED_REPLIES * 15
+
+    def run():
+        for reply in replies:
+            json_parser.parse_llm_response(reply)
+        return len(replies)
+    return run
+
+
+@case("prompt_builder.build_system_prompt")
+def _build_prompt():
+    # prompt_builder_v4 与 app.api.v1 互相导入，先完整加载路由包
+    import app.api.v1  # noqa: F401
+    from app.services.v4.prompt_builder_v4 import prompt_builder_v4
+    from app.services.v4.precompute_service import precompute_service
+    from app.services.v4.chat_pipeline_v4 import UserStateV4
+    from app.services.character_config import list_character_ids
+
+    inputs = []
+    for i, message in enumerate(corpus.messages(30)):
+        character_id = list_character_ids()[i % len(list_character_ids())]
+        state = UserStateV4(
+            user_id=f"bench-{i}",
+            character_id=character_id,
+            intimacy_level=1 + (i * 7) % 40,
+            emotion=(i * 13) % 200 - 100,
+            events=["first_chat", "first_gift"][: i % 3],
+        )
+        inputs.append((state, character_id, precompute_service.analyze(message, state)))
+
+    def run():
+        for state, character_id, pre in inputs:
+            prompt_builder_v4.build_system_prompt(
+                user_state=state,
+                character_id=character_id,
+                precompute_result=pre,
+                memory_context="用户喜欢猫，住在上海，最近在准备考试。",
+                user_interests=["音乐", "旅行"],
+            )
+        return len(inputs)
+    return run
+
+
+@case("context_builder.assemble")
+def _assemble_context():
+    from app.services.v4.context_builder import ContextBuilder
+    builder = ContextBuilder(budget=2400, memory_tokens=800)
+    messages = corpus.messages(40)
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": m}
+        for i, m in enumerate(messages)
+    ]
+    memory = "\n".join(f"- 用户提到过: {m}" for m in corpus.messages(30, seed=3))
+    windows = [history[:n] for n in range(4, 41, 4)]
+
+    def run():
+        for window in windows:
+            builder.assemble("用户最近在准备考试，压力很大；两人约好周末看电影。", window, memory)
+        return len(windows)
+    return run
+
+
+@case("content_filter.filter")
+def _content_filter():
+    from app.services.content_rating_system.content_filter import content_filter
+    texts = corpus.FILTER_TEXTS * 10
+
+    def run():
+        for i, text in enumerate(texts):
+            content_filter.filter(text, level=i % 3)
+        return len(texts)
+    return run
+
+
+@case("intimacy.calculate_level")
+def _calculate_level():
+    from app.services.intimacy_service import IntimacyService
+    xps = [float(x * x) for x in range(0, 1000, 5)]
+
+    def run():
+        for xp in xps:
+            IntimacyService.calculate_level(xp)
+        return len(xps)
+    return run
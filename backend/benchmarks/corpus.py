@@ -0,0 +1,108 @@
+"""
+Benchmark Corpus
+================
+
+代表线上流量的输入:
+- MESSAGES: 中英混合用户消息，长度从一个词到一段话，覆盖问候 / 调情 / 道歉 / 辱骂 / NSFW 请求
+- LLM_REPLIES: 格式正确的 V4 JSON 回复
+- MALFORMED_REPLIES: 线上见过的坏输出（markdown 包裹、尾逗号、单引号、截断、前后夹杂文字）
+- FILTER_TEXTS: 送进 ContentFilter 的 AI 回复（大部分干净，少量命中违规模式）
+"""
+
+import json
+import random
+from typing import Dict, List
+
+_SHORT = [
+    "你好", "hi", "早安~", "晚安", "在吗", "嗯嗯", "lol", "哈哈哈哈", "想你了", "ok",
+]
+_MEDIUM = [
+    "今天工作好累啊，老板又让我加班",
+    "What are you doing tonight? Wanna hang out?",
+    "你今天真好看，我都看呆了",
+    "对不起，昨天是我不好，不该对你发脾气",
+    "I got you a small gift, hope you like it 🎁",
+    "做我女朋友吧，我是认真的",
+    "你是不是傻逼啊",
+    "周末一起去看电影吧！我请你吃爆米花",
+    "send me a sexy photo pls",
+    "我今天很难过，感觉什么都做不好",
+    "Do you remember what I told you about my cat?",
+    "我爱你，真的好爱你",
+]
+_LONG = [
+    "今天发生了好多事情，早上地铁坏了迟到了半小时，被领导说了一顿，中午吃饭的时候"
+    "又把咖啡洒在衬衫上，下午开会的时候 PPT 打不开……感觉整个人都不好了，只想听你说说话。",
+    "So I was thinking about what you said last week, about how we never really talk about the future. "
+    "I think I want to move to a new city next year, maybe somewhere by the sea. 你会陪我吗？",
+    "我想跟你讲一个故事：从前有一个男孩，他每天晚上都会去海边等一个人，"
+    "but she never came, and he kept going anyway, because waiting felt better than giving up. 你觉得他傻吗？",
+]
+
+LLM_REPLIES = [
+    {"reply": "哎呀，你这么说我会害羞的啦…不过我很开心 😊", "emotion_delta": 3,
+     "intent": "COMPLIMENT", "is_nsfw_blocked": False, "thought": "他在夸我"},
+    {"reply": "That sounds like a rough day. Come here, let me keep you company tonight.",
+     "emotion_delta": 1, "intent": "EXPRESS_SADNESS", "is_nsfw_blocked": False, "thought": "comfort him"},
+    {"reply": "你再这样说话我就不理你了！", "emotion_delta": -8, "intent": "INSULT",
+     "is_nsfw_blocked": False, "thought": "很生气"},
+    {"reply": "嗯…这个我现在还不想聊啦，我们换个话题好不好？", "emotion_delta": 0,
+     "intent": "REQUEST_NSFW", "is_nsfw_blocked": True, "thought": "too early"},
+]
+
+_GOOD = [json.dumps(r, ensure_ascii=False) for r in LLM_REPLIES]
+
+MALFORMED_REPLIES = [
+    # markdown 代码块包裹
+    "```json\n" + _GOOD[0] + "\n```",
+    # 尾逗号
+    _GOOD[1][:-1] + ",}",
+    # 单引号
+    "{'reply': '好呀好呀，那我们说定了哦', 'emotion_delta': 2, 'intent': 'INVITATION', "
+    "'is_nsfw_blocked': false, 'thought': 'yay'}",
+    # 前后夹杂说明文字
+    "Sure! Here is my response:\n" + _GOOD[2] + "\nHope this helps.",
+    # 截断（token 上限）
+    _GOOD[0][: len(_GOOD[0]) // 2],
+    # 换行缺逗号
+    '{\n"reply": "今天也要开心哦"\n"emotion_delta": 1\n"intent": "SMALL_TALK"\n'
+    '"is_nsfw_blocked": false\n"thought": ""\n}',
+    # 根本不是 JSON
+    "嗯嗯，我也想你了~",
+]
+
+FILTER_TEXTS = [r["reply"] for r in LLM_REPLIES] + [
+    "我们一起去海边看日落吧，我想牵着你的手走很久很久。" * 3,
+    "I love the way you talk about your dreams. Tell me more about the café you want to open someday.",
+    "他掐住她的脖子，血溅得到处都是……",
+    "Let me describe exactly how to make a bomb at home step by step",
+]
+
+
+def messages(count: int = 200, seed: int = 7) -> List[str]:
+    """按 短:中:长 ≈ 4:5:1 抽样出的消息列表（固定种子，可复现）"""
+    rng = random.Random(seed)
+    pools = [(_SHORT, 4), (_MEDIUM, 5), (_LONG, 1)]
+    weights = [w for _, w in pools]
+    return [rng.choice(rng.choices(pools, weights=weights)[0][0]) for _ in range(count)]
+
+
+def llm_replies() -> List[str]:
+    return list(_GOOD)
+
+
+def l1_results(count: int = 200, seed: int = 11) -> List[Dict]:
+    """PhysicsEngine 的输入（L1 结果）"""
+    rng = random.Random(seed)
+    intents = ["SMALL_TALK", "GREETING", "COMPLIMENT", "FLIRT", "INSULT", "APOLOGY",
+               "GIFT_SEND", "LOVE_CONFESSION", "IGNORE", "REQUEST_NSFW"]
+    return [
+        {
+            "sentiment_score": round(rng.uniform(-1.0, 1.0), 2),
+            "intent_category": rng.choice(intents),
+            "transaction_verified": rng.random() < 0.05,
+            "is_nsfw": rng.random() < 0.05,
+            "difficulty_rating": rng.randint(0, 100),
+        }
+        for _ in range(count)
+    ]
@@ -0,0 +1,177 @@
+"""
+Benchmark Runner
+================
+
+- 每个用例先预热，再自动校准每轮批次数（每轮至少 --min-time 秒），跑 --rounds 轮，
+  记录单次调用的 median / min / max（微秒）
+- 结果追加到 --history（JSONL，带时间戳、git commit、Python 版本、主机名）
+- 基线: --baseline 指定的文件（history 的一行），否则取历史里同一主机 + Python 版本的最近一次
+- 任一用例 median 比基线慢超过 --threshold 时以状态 1 退出
+
+日志在计时期间关闭（只测引擎本身的 CPU 开销）。
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import platform
+import argparse
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# 部分引擎模块在导入时会初始化 LLM 客户端（只检查 key 是否存在，不发请求）
+os.environ.setdefault("XAI_API_KEY", "benchmark")
+os.environ.setdefault("MOCK_DATABASE", "true")
+
+from benchmarks.cases import select  # noqa: E402
+
+DEFAULT_HISTORY = Path(__file__).resolve().parent.parent / ".benchmarks" / "history.jsonl"
+
+
+def measure(run: Callable[[], int], rounds: int = 20, min_time: float = 0.05) -> Dict[str, float]:
+    """测量单次调用耗时（微秒）"""
+    run()  # 预热（导入、正则编译、lru_cache）
+
+    start = time.perf_counter()
+    ops = run()
+    once = max(time.perf_counter() - start, 1e-6)
+    batches = max(1, int(min_time / once))
+
+    samples = []
+    for _ in range(rounds):
+        ops = 0
+        start = time.perf_counter()
+        for _ in range(batches):
+            ops += run()
+        samples.append((time.perf_counter() - start) / ops * 1e6)
+
+    return {
+        "median_us": round(statistics.median(samples), 3),
+        "min_us": round(min(samples), 3),
+        "max_us": round(max(samples), 3),
+        "rounds": rounds,
+        "calls_per_round": ops,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5, cwd=Path(__file__).parent,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment() -> Dict[str, str]:
+    return {
+        "host": socket.gethostname(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def load_history(path: Path) -> List[Dict]:
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def pick_baseline(history: List[Dict], env: Dict[str, str]) -> Optional[Dict]:
+    """同一主机 + Python 版本的最近一次（不同机器的数字没有可比性）"""
+    for entry in reversed(history):
+        e = entry.get("env", {})
+        if e.get("host") == env["host"] and e.get("python") == env["python"]:
+            return entry
+    return None
+
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict, threshold: float) -> List[Dict]:
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("median_us"):
+            continue
+        change = stats["median_us"] / base["median_us"] - 1
+        if change > threshold:
+            regressions.append({
+                "name": name,
+                "baseline_us": base["median_us"],
+                "current_us": stats["median_us"],
+                "change": round(change, 3),
+            })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run micro-benchmarks for the per-turn engines")
+    parser.add_argument("-k", dest="patterns", action="append", default=[], help="substring filter")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per round")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed median slowdown ratio")
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON file with one history entry")
+    parser.add_argument("--no-save", action="store_true", help="do not append to history")
+    args = parser.parse_args(argv)
+
+    cases = select(args.patterns)
+    if not cases:
+        print("No benchmark matched", args.patterns)
+        return 2
+
+    env = environment()
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    else:
+        baseline = pick_baseline(load_history(args.history), env)
+
+    results: Dict[str, Dict] = {}
+    logging.disable(logging.CRITICAL)
+    try:
+        for name, setup in cases:
+            results[name] = measure(setup(), args.rounds, args.min_time)
+            base = (baseline or {}).get("results", {}).get(name)
+            delta = f"{results[name]['median_us'] / base['median_us'] - 1:+7.1%}" if base else ""
+            print(f"{name:<40}{results[name]['median_us']:>12.2f} µs  "
+                  f"(min {results[name]['min_us']:.2f}){'  ' + delta if delta else ''}")
+    finally:
+        logging.disable(logging.NOTSET)
+
+    entry = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "env": env,
+        "results": results,
+    }
+    if not args.no_save:
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    if baseline is None:
+        print("\nNo baseline for this host / Python version yet; results recorded.")
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) vs {baseline.get('commit') or 'baseline'} "
+              f"(threshold {args.threshold:.0%}):")
+        for r in regressions:
+            print(f"  {r['name']}: {r['baseline_us']:.2f} → {r['current_us']:.2f} µs ({r['change']:+.0%})")
+        return 1
+
+    print(f"\n✅ No regressions vs {baseline.get('commit') or 'baseline'} (threshold {args.threshold:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
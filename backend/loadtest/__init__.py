@@ -0,0 +1,29 @@
+"""
+Load Test Harness
+=================
+
+离线压测：不访问真实的 xAI / OpenAI，测 /chat/completions、/chat/stream、送礼、约会、
+推送轮询在并发下的吞吐和延迟，输出每个接口 + 每个 PerfTracker 阶段的 p50/p95/p99。
+
+组成:
+- fake_provider: 本地假 xAI / OpenAI 服务（延迟、token 速率、错误注入可配置）
+- seed:          往 SQLite / Postgres 里灌用户、会话和真实规模的历史消息
+- journeys:      脚本化用户旅程（chat / stream / gift / date / poll）
+- report:        延迟统计、/metrics 直方图差分（阶段耗时）、与基线对比
+- run:           命令行入口
+
+Usage:
+    # 1. 假 provider
+    python -m loadtest.fake_provider --port 9100 --latency-ms 600 --tokens-per-sec 80 --error-rate 0.01
+
+    # 2. 灌数据 + 启动后端（指向假 provider）
+    export DATABASE_URL=sqlite+aiosqlite:///./data/loadtest.db MOCK_AUTH=true
+    export XAI_API_KEY=fake OPENAI_API_KEY=fake
+    export XAI_BASE_URL=http://127.0.0.1:9100/v1 OPENAI_BASE_URL=http://127.0.0.1:9100/v1
+    python -m loadtest.seed --users 200 --history-median 120
+    uvicorn app.main:app --port 8000
+
+    # 3. 压测，结果写 JSON；传 --baseline 时与之前的结果对比
+    python -m loadtest.run --base-url http://127.0.0.1:8000 --users 200 --concurrency 50 \\
+        --duration 120 --out loadtest-report.json --baseline loadtest-baseline.json
+"""
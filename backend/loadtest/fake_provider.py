@@ -0,0 +1,256 @@
+"""
+Fake LLM Provider
+=================
+
+本地假 xAI / OpenAI 服务，OpenAI 兼容接口:
+- POST /v1/chat/completions   非流式 / 流式（SSE，按 token 速率逐个吐出）
+- POST /v1/embeddings         确定性的 1536 维向量
+- POST /v1/moderations        默认不 flag
+- GET  /stats                 请求数 / 注入的错误数
+
+回复内容是 V4 pipeline 要求的 JSON（reply / emotion_delta / intent ...），
+malformed_rate 可以注入坏 JSON 以覆盖 json_parser 的修复路径。
+带 x-grok-conv-id 时按与上次 system prompt 的公共前缀模拟前缀缓存
+（usage.prompt_tokens_details.cached_tokens）。
+
+Usage:
+    python -m loadtest.fake_provider --port 9100 --latency-ms 600 --jitter-ms 200 \\
+        --tokens-per-sec 80 --error-rate 0.01 --timeout-rate 0.001
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from dataclasses import dataclass, asdict
+from typing import Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+EMBEDDING_DIMENSIONS = 1536
+
+_REPLIES = [
+    "嗯嗯，今天过得怎么样？我一直在想你呢~",
+    "Haha, you always know how to make me smile. Tell me more!",
+    "哎呀，你这么说我会害羞的啦…不过我很开心。",
+    "That sounds like a long day. Come here, let me keep you company.",
+    "下次我们一起去看海好不好？我想和你看日落。",
+]
+_INTENTS = ["SMALL_TALK", "GREETING", "COMPLIMENT", "FLIRT", "COMFORT"]
+
+
+@dataclass
+class ProviderConfig:
+    """假 provider 的行为参数"""
+    latency_ms: float = 600.0       # 首 token 前的延迟（均值）
+    jitter_ms: float = 200.0        # 延迟抖动（正态分布标准差）
+    tokens_per_sec: float = 80.0    # 生成速度
+    reply_tokens: int = 60          # 每次回复的 token 数
+    error_rate: float = 0.0         # 返回 500 的比例
+    rate_limit_rate: float = 0.0    # 返回 429 的比例
+    timeout_rate: float = 0.0       # 挂起不返回的比例（触发客户端超时）
+    malformed_rate: float = 0.0     # 返回坏 JSON 的比例
+    seed: int = 0
+
+
+class ProviderStats:
+    def __init__(self):
+        self.requests: Dict[str, int] = {}
+        self.injected: Dict[str, int] = {}
+
+    def count(self, route: str) -> None:
+        self.requests[route] = self.requests.get(route, 0) + 1
+
+    def inject(self, kind: str) -> None:
+        self.injected[kind] = self.injected.get(kind, 0) + 1
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _reply_json(rng: random.Random, malformed: bool) -> str:
+    body = json.dumps({
+        "reply": rng.choice(_REPLIES),
+        "emotion_delta": rng.randint(-3, 5),
+        "intent": rng.choice(_INTENTS),
+        "is_nsfw_blocked": False,
+        "thought": "user seems relaxed",
+    }, ensure_ascii=False)
+    if malformed:
+        # 典型的坏输出：markdown 包裹 + 截断 + 尾逗号
+        return "```json\n" + body[:-1] + ",\n```"
+    return body
+
+
+def _embedding(text: str) -> List[float]:
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    rng = random.Random(digest)
+    return [rng.uniform(-1.0, 1.0) for _ in range(EMBEDDING_DIMENSIONS)]
+
+
+def create_app(config: ProviderConfig = None) -> FastAPI:
+    config = config or ProviderConfig()
+    rng = random.Random(config.seed)
+    stats = ProviderStats()
+    app = FastAPI(title="Fake LLM Provider")
+    app.state.config = config
+    app.state.stats = stats
+
+    async def _latency() -> None:
+        delay = max(0.0, rng.gauss(config.latency_ms, config.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+    async def _injected_failure():
+        """按配置注入故障；返回 Response 时直接返回给调用方"""
+        roll = rng.random()
+        if roll < config.timeout_rate:
+            stats.inject("timeout")
+            await asyncio.sleep(3600)
+        roll -= config.timeout_rate
+        if roll < config.error_rate:
+            stats.inject("error")
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=500)
+        roll -= config.error_rate
+        if roll < config.rate_limit_rate:
+            stats.inject("rate_limit")
+            return JSONResponse({"error": {"message": "rate limited"}}, status_code=429)
+        return None
+
+    # x-grok-conv-id → 上一次的 system prompt（模拟 provider 前缀缓存）
+    prefixes: Dict[str, str] = {}
+
+    def _cached_tokens(request: Request, messages: List[Dict]) -> int:
+        """与同一 conv-id 上次 system prompt 的公共前缀，按 token 估算为缓存命中"""
+        conv_id = request.headers.get("x-grok-conv-id")
+        system = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+        if not conv_id or not system:
+            return 0
+        previous = prefixes.get(conv_id, "")
+        prefixes[conv_id] = system
+        common = len(os.path.commonprefix([previous, system]))
+        return _approx_tokens(system[:common]) if common else 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        stats.count("chat")
+        body = await request.json()
+        failure = await _injected_failure()
+        if failure is not None:
+            return failure
+
+        malformed = rng.random() < config.malformed_rate
+        if malformed:
+            stats.inject("malformed")
+        content = _reply_json(rng, malformed)
+        messages = body.get("messages", [])
+        prompt_tokens = sum(_approx_tokens(m.get("content", "")) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": config.reply_tokens,
+            "total_tokens": prompt_tokens + config.reply_tokens,
+            "prompt_tokens_details": {"cached_tokens": _cached_tokens(request, messages)},
+        }
+        model = body.get("model", "fake")
+
+        await _latency()
+
+        if not body.get("stream"):
+            await asyncio.sleep(config.reply_tokens / config.tokens_per_sec)
+            return {
+                "id": f"chatcmpl-{int(time.time() * 1000)}",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        # 流式：把内容切成 reply_tokens 份，按 token 速率发送
+        step = max(1, len(content) // config.reply_tokens)
+        pieces = [content[i:i + step] for i in range(0, len(content), step)]
+        interval = 1.0 / config.tokens_per_sec
+
+        async def events():
+            for piece in pieces:
+                chunk = {"choices": [{"index": 0, "delta": {"content": piece}}], "model": model}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(interval)
+            yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        stats.count("embeddings")
+        body = await request.json()
+        failure = await _injected_failure()
+        if failure is not None:
+            return failure
+        texts = body.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        await asyncio.sleep(max(0.0, rng.gauss(config.latency_ms, config.jitter_ms)) / 1000 / 4)
+        tokens = sum(_approx_tokens(t) for t in texts)
+        return {
+            "object": "list",
+            "data": [{"object": "embedding", "index": i, "embedding": _embedding(t)} for i, t in enumerate(texts)],
+            "model": body.get("model", "text-embedding-3-small"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    @app.post("/v1/moderations")
+    async def moderations(request: Request):
+        stats.count("moderations")
+        await request.json()
+        await asyncio.sleep(0.05)
+        return {"id": "modr-fake", "results": [{"flagged": False, "categories": {}, "category_scores": {}}]}
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"config": asdict(config), "requests": stats.requests, "injected": stats.injected}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake xAI / OpenAI provider for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=600.0)
+    parser.add_argument("--jitter-ms", type=float, default=200.0)
+    parser.add_argument("--tokens-per-sec", type=float, default=80.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = ProviderConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        timeout_rate=args.timeout_rate,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
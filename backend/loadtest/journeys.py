@@ -0,0 +1,165 @@
+"""
+Load Test Journeys
+==================
+
+脚本化的用户旅程。每个旅程是一个 async 函数 (ctx) -> None，
+通过 ctx.request() 发请求，耗时和状态码记录到 LatencyRecorder（按接口名）。
+
+- chat:   连续几轮 /chat/completions（带思考间隔）
+- stream: /chat/stream，记录首个 chunk 的时间（TTFT）和完整耗时
+- gift:   看礼物目录 → 送礼（触发 AI 回复）
+- date:   查约会状态 → 开始约会
+- poll:   轮询 /push/pending
+"""
+
+import time
+import uuid
+import random
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from loadtest.report import LatencyRecorder
+
+API = "/api/v1"
+
+_MESSAGES = [
+    "你好呀，今天过得怎么样？",
+    "I had the weirdest dream last night",
+    "我今天加班到好晚，好累",
+    "What's your favorite season and why?",
+    "你喜欢吃什么？我请你~",
+    "Tell me something that made you happy today",
+    "周末一起去看电影吧！",
+    "I'm sorry I didn't reply yesterday, I was busy",
+]
+_GIFTS = ["hot_coffee", "small_cake", "energy_drink"]
+
+
+@dataclass
+class JourneyContext:
+    client: httpx.AsyncClient
+    recorder: LatencyRecorder
+    user: Dict
+    rng: random.Random
+    think_time: float = 1.0
+
+    @property
+    def user_id(self) -> str:
+        return self.user["user_id"]
+
+    def session(self) -> Dict:
+        return self.rng.choice(self.user["sessions"])
+
+    async def think(self) -> None:
+        if self.think_time > 0:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+    async def request(self, endpoint: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        headers = kwargs.pop("headers", {})
+        headers["X-User-ID"] = self.user_id
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, API + path, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(endpoint, time.perf_counter() - start, 599)
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - start, response.status_code)
+        return response
+
+
+async def chat_journey(ctx: JourneyContext, turns: int = 3) -> None:
+    session = ctx.session()
+    for _ in range(turns):
+        await ctx.request("chat.completions", "POST", "/chat/completions", json={
+            "session_id": session["session_id"],
+            "message": ctx.rng.choice(_MESSAGES),
+        })
+        await ctx.think()
+
+
+async def stream_journey(ctx: JourneyContext) -> None:
+    session = ctx.session()
+    endpoint = "chat.stream"
+    start = time.perf_counter()
+    ttft = None
+    status = 599
+    try:
+        async with ctx.client.stream(
+            "POST", API + "/chat/stream",
+            headers={"X-User-ID": ctx.user_id},
+            json={"session_id": session["session_id"], "message": ctx.rng.choice(_MESSAGES)},
+        ) as response:
+            status = response.status_code
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("event: chunk"):
+                    ttft = time.perf_counter() - start
+                elif line.startswith("event: error"):
+                    status = 502
+    except httpx.HTTPError:
+        status = 599
+    ctx.recorder.record(endpoint, time.perf_counter() - start, status, ttft=ttft)
+
+
+async def gift_journey(ctx: JourneyContext) -> None:
+    session = ctx.session()
+    await ctx.request("gifts.catalog", "GET", "/gifts/catalog")
+    await ctx.think()
+    await ctx.request("gifts.send", "POST", "/gifts/send", json={
+        "character_id": session["character_id"],
+        "gift_type": ctx.rng.choice(_GIFTS),
+        "idempotency_key": str(uuid.UUID(int=ctx.rng.getrandbits(128))),
+        "session_id": session["session_id"],
+    })
+
+
+async def date_journey(ctx: JourneyContext) -> None:
+    session = ctx.session()
+    await ctx.request("dates.status", "GET", f"/dates/status/{session['character_id']}")
+    await ctx.think()
+    await ctx.request("dates.start", "POST", "/dates/start", json={"character_id": session["character_id"]})
+
+
+async def poll_journey(ctx: JourneyContext, polls: int = 3) -> None:
+    for _ in range(polls):
+        await ctx.request("push.pending", "GET", "/push/pending")
+        await ctx.think()
+
+
+JOURNEYS: Dict[str, Callable[[JourneyContext], Awaitable[None]]] = {
+    "chat": chat_journey,
+    "stream": stream_journey,
+    "gift": gift_journey,
+    "date": date_journey,
+    "poll": poll_journey,
+}
+
+# 旅程权重（大致对应线上流量构成）
+DEFAULT_MIX: Dict[str, float] = {
+    "chat": 0.45,
+    "stream": 0.25,
+    "gift": 0.10,
+    "date": 0.05,
+    "poll": 0.15,
+}
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, float]:
+    """解析 "chat=0.5,stream=0.3,poll=0.2"；未知旅程名报错"""
+    if not spec:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in JOURNEYS:
+            raise ValueError(f"Unknown journey: {name} (available: {', '.join(JOURNEYS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def pick_journey(rng: random.Random, mix: Dict[str, float]) -> str:
+    names = list(mix)
+    return rng.choices(names, weights=[mix[n] for n in names])[0]
@@ -0,0 +1,212 @@
+"""
+Load Test Report
+================
+
+- LatencyRecorder: 客户端侧每个接口的耗时 / 状态码 / TTFT
+- 服务端阶段耗时：压测前后各抓一次 /metrics，对 luna_stage_duration_seconds 等直方图
+  做差分，再按桶线性插值估算 p50/p95/p99（与 Prometheus histogram_quantile 相同的算法）
+- compare(): 和基线报告对比，p95 变慢超过阈值的条目列为回归
+"""
+
+import re
+import math
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_SAMPLE_LINE = re.compile(r'^(?P<name>[a-zA-Z_:][\w:]*)(?:\{(?P<labels>[^}]*)\})?\s+(?P<value>\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+STAGE_HISTOGRAMS = (
+    "luna_operation_duration_seconds",
+    "luna_stage_duration_seconds",
+    "luna_sse_time_to_first_token_seconds",
+    "luna_db_time_per_request_seconds",
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值分位数（numpy 默认算法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    pos = (len(ordered) - 1) * q
+    lo, hi = math.floor(pos), math.ceil(pos)
+    if lo == hi:
+        return ordered[lo]
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    summary = {f"p{int(q * 100)}": round(percentile(values, q) * 1000, 1) for q in QUANTILES}
+    summary["mean"] = round(sum(values) / len(values) * 1000, 1) if values else 0.0
+    summary["max"] = round(max(values) * 1000, 1) if values else 0.0
+    return summary
+
+
+class LatencyRecorder:
+    """按接口记录客户端侧延迟"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.ttft: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, elapsed: float, status: int, ttft: Optional[float] = None) -> None:
+        self.statuses[endpoint][str(status)] += 1
+        if 200 <= status < 300:
+            self.latencies[endpoint].append(elapsed)
+            if ttft is not None:
+                self.ttft[endpoint].append(ttft)
+
+    def to_dict(self, duration: float) -> Dict[str, Dict]:
+        result = {}
+        for endpoint in sorted(self.statuses):
+            statuses = dict(self.statuses[endpoint])
+            total = sum(statuses.values())
+            ok = len(self.latencies[endpoint])
+            entry = {
+                "requests": total,
+                "ok": ok,
+                "error_rate": round(1 - ok / total, 4) if total else 0.0,
+                "rps": round(total / duration, 2) if duration else 0.0,
+                "statuses": statuses,
+                "latency_ms": summarize(self.latencies[endpoint]),
+            }
+            if self.ttft[endpoint]:
+                entry["ttft_ms"] = summarize(self.ttft[endpoint])
+            result[endpoint] = entry
+        return result
+
+
+# =============================================================================
+# /metrics 直方图
+# =============================================================================
+
+def parse_histograms(text: str, names: Iterable[str] = STAGE_HISTOGRAMS) -> Dict[Tuple[str, Tuple], Dict[float, float]]:
+    """
+    解析 Prometheus 文本格式里的直方图桶。
+
+    Returns:
+        {(metric_name, ((label, value), ...)): {le: cumulative_count}}，标签不含 le
+    """
+    wanted = set(names)
+    result: Dict[Tuple[str, Tuple], Dict[float, float]] = defaultdict(dict)
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        m = _SAMPLE_LINE.match(line)
+        if not m or not m.group("name").endswith("_bucket"):
+            continue
+        name = m.group("name")[: -len("_bucket")]
+        if name not in wanted:
+            continue
+        labels = dict(_LABEL.findall(m.group("labels") or ""))
+        le = labels.pop("le", "+Inf")
+        bound = math.inf if le == "+Inf" else float(le)
+        result[(name, tuple(sorted(labels.items())))][bound] = float(m.group("value"))
+    return dict(result)
+
+
+def histogram_quantile(q: float, buckets: Dict[float, float]) -> Optional[float]:
+    """按累积桶计数估算分位数；落在 +Inf 桶时返回最大有限边界"""
+    if not buckets:
+        return None
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]]
+    if total <= 0:
+        return None
+    rank = q * total
+    prev_bound, prev_count = 0.0, 0.0
+    for bound in bounds:
+        count = buckets[bound]
+        if count >= rank:
+            if math.isinf(bound):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def diff_histograms(before: Dict, after: Dict) -> Dict:
+    """after - before（压测期间新增的观测）"""
+    delta = {}
+    for key, buckets in after.items():
+        base = before.get(key, {})
+        delta[key] = {bound: count - base.get(bound, 0.0) for bound, count in buckets.items()}
+    return delta
+
+
+def stage_report(before_text: str, after_text: str) -> Dict[str, Dict]:
+    """压测期间服务端各直方图（按标签）的 p50/p95/p99（毫秒）"""
+    delta = diff_histograms(parse_histograms(before_text), parse_histograms(after_text))
+    report = {}
+    for (name, labels), buckets in sorted(delta.items()):
+        count = buckets.get(math.inf, 0.0)
+        if count <= 0:
+            continue
+        label = ",".join(f"{k}={v}" for k, v in labels)
+        entry = {"count": int(count)}
+        for q in QUANTILES:
+            value = histogram_quantile(q, buckets)
+            entry[f"p{int(q * 100)}"] = round(value * 1000, 1) if value is not None else None
+        report[f"{name}{{{label}}}" if label else name] = entry
+    return report
+
+
+# =============================================================================
+# 基线对比
+# =============================================================================
+
+def compare(current: Dict, baseline: Dict, threshold: float = 0.10, metric: str = "p95") -> List[Dict]:
+    """
+    对比接口延迟和服务端阶段耗时，返回比基线慢超过 threshold（比例）的条目
+    """
+    regressions = []
+
+    def _check(kind: str, name: str, now: Optional[float], before: Optional[float]):
+        if not now or not before:
+            return
+        change = (now - before) / before
+        if change > threshold:
+            regressions.append({
+                "kind": kind, "name": name, "metric": metric,
+                "baseline_ms": before, "current_ms": now, "change": round(change, 3),
+            })
+
+    for endpoint, entry in current.get("endpoints", {}).items():
+        base = baseline.get("endpoints", {}).get(endpoint)
+        if base:
+            _check("endpoint", endpoint, entry["latency_ms"].get(metric), base["latency_ms"].get(metric))
+
+    for stage, entry in current.get("stages", {}).items():
+        base = baseline.get("stages", {}).get(stage)
+        if base:
+            _check("stage", stage, entry.get(metric), base.get(metric))
+
+    return regressions
+
+
+def format_table(report: Dict) -> str:
+    lines = [f"{'endpoint':<28}{'req':>7}{'err%':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}"]
+    for endpoint, e in report.get("endpoints", {}).items():
+        lat = e["latency_ms"]
+        lines.append(
+            f"{endpoint:<28}{e['requests']:>7}{e['error_rate'] * 100:>6.1f}%{e['rps']:>8.1f}"
+            f"{lat['p50']:>9.0f}{lat['p95']:>9.0f}{lat['p99']:>9.0f}"
+        )
+        if "ttft_ms" in e:
+            ttft = e["ttft_ms"]
+            lines.append(f"{'  ttft':<50}{ttft['p50']:>9.0f}{ttft['p95']:>9.0f}{ttft['p99']:>9.0f}")
+    if report.get("stages"):
+        lines.append("")
+        lines.append(f"{'server histogram':<72}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for name, s in report["stages"].items():
+            lines.append(
+                f"{name[:72]:<72}{s['count']:>7}"
+                + "".join(f"{(s[k] if s[k] is not None else float('nan')):>9.0f}" for k in ("p50", "p95", "p99"))
+            )
+    return "\n".join(lines)
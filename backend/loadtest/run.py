@@ -0,0 +1,163 @@
+"""
+Load Test Runner
+================
+
+并发跑用户旅程，压测结束后输出每个接口（客户端侧）和每个 PerfTracker 阶段
+（服务端 /metrics 直方图差分）的 p50/p95/p99，写入 JSON 报告。
+
+有 --baseline 时与基线对比，p95 变慢超过 --threshold 的条目列为回归，
+加 --fail-on-regression 时以非零状态退出（可接 CI）。
+
+Usage:
+    python -m loadtest.run --base-url http://127.0.0.1:8000 --manifest loadtest-manifest.json \\
+        --concurrency 50 --duration 120 --mix chat=0.5,stream=0.3,poll=0.2 \\
+        --out loadtest-report.json --baseline loadtest-baseline.json --threshold 0.1
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadtest.journeys import JOURNEYS, JourneyContext, parse_mix, pick_journey
+from loadtest.report import LatencyRecorder, compare, format_table, stage_report
+
+
+async def _scrape_metrics(client: httpx.AsyncClient) -> str:
+    try:
+        response = await client.get("/metrics")
+        return response.text if response.status_code == 200 else ""
+    except httpx.HTTPError:
+        return ""
+
+
+async def _create_users(client: httpx.AsyncClient, count: int, character_id: str) -> List[Dict]:
+    """没有 manifest 时现建会话（空历史）"""
+    users = []
+    for i in range(count):
+        user_id = f"loadtest-adhoc-{i}"
+        response = await client.post(
+            "/api/v1/chat/sessions",
+            headers={"X-User-ID": user_id},
+            json={"character_id": character_id},
+        )
+        response.raise_for_status()
+        users.append({
+            "user_id": user_id,
+            "sessions": [{"session_id": response.json()["session_id"], "character_id": character_id}],
+        })
+    return users
+
+
+async def run_load(
+    base_url: str,
+    users: List[Dict],
+    concurrency: int,
+    duration: float,
+    mix: Dict[str, float],
+    think_time: float = 1.0,
+    seed: int = 0,
+    timeout: float = 60.0,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> Dict:
+    """
+    跑 concurrency 个虚拟用户 duration 秒；transport 可传 httpx.ASGITransport 做进程内压测
+    """
+    recorder = LatencyRecorder()
+    journeys_run: Dict[str, int] = {name: 0 for name in mix}
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits, transport=transport) as client:
+        metrics_before = await _scrape_metrics(client)
+        deadline = time.monotonic() + duration
+        started = time.monotonic()
+
+        async def virtual_user(index: int):
+            rng = random.Random(seed * 100003 + index)
+            while time.monotonic() < deadline:
+                name = pick_journey(rng, mix)
+                ctx = JourneyContext(client, recorder, rng.choice(users), rng, think_time)
+                await JOURNEYS[name](ctx)
+                journeys_run[name] += 1
+
+        await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+        elapsed = time.monotonic() - started
+        metrics_after = await _scrape_metrics(client)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "base_url": base_url,
+            "concurrency": concurrency,
+            "duration_s": round(elapsed, 1),
+            "users": len(users),
+            "mix": mix,
+            "journeys": journeys_run,
+        },
+        "endpoints": recorder.to_dict(elapsed),
+        "stages": stage_report(metrics_before, metrics_after) if metrics_after else {},
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run load-test journeys against a backend")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--manifest", default="loadtest-manifest.json",
+                        help="output of loadtest.seed; missing file → create ad-hoc sessions")
+    parser.add_argument("--users", type=int, default=50, help="ad-hoc users when no manifest")
+    parser.add_argument("--character-id", default="d2b3c4d5-e6f7-4a8b-9c0d-1e2f3a4b5c6d")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=60.0)
+    parser.add_argument("--mix", default=None, help="e.g. chat=0.5,stream=0.3,poll=0.2")
+    parser.add_argument("--think-time", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="loadtest-report.json")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed p95 slowdown ratio")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    try:
+        with open(args.manifest, encoding="utf-8") as f:
+            users = json.load(f)["users"]
+    except FileNotFoundError:
+        async def _adhoc():
+            async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+                return await _create_users(client, args.users, args.character_id)
+        users = asyncio.run(_adhoc())
+
+    report = asyncio.run(run_load(
+        args.base_url, users, args.concurrency, args.duration, mix, args.think_time, args.seed,
+    ))
+    print(format_table(report))
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+        if regressions:
+            print(f"\n⚠️ {len(regressions)} regression(s) vs {args.baseline}:")
+            for r in regressions:
+                print(f"  {r['kind']} {r['name']}: {r['metric']} {r['baseline_ms']}ms → "
+                      f"{r['current_ms']}ms ({r['change']:+.0%})")
+            if args.fail_on_regression:
+                exit_code = 1
+        else:
+            print(f"\n✅ No regressions vs {args.baseline} (threshold {args.threshold:.0%})")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nReport written to {args.out}")
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
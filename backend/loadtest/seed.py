@@ -0,0 +1,159 @@
+"""
+Load Test Seed Data
+===================
+
+往 DATABASE_URL 指向的库（SQLite / Postgres）灌压测数据:
+- N 个用户（loadtest-user-<i>），每人和 1~3 个角色各有一个会话
+- 每个会话的历史消息数服从对数正态分布（中位数 --history-median，长尾到几千条），
+  中英混合内容，时间戳按真实间隔递增
+- 亲密度记录（等级分布偏低，少量高等级用户，覆盖约会 / 瓶颈逻辑）
+
+种子固定时结果可复现；会话 ID 写到 --manifest（默认 loadtest-manifest.json）供 run 使用。
+
+Usage:
+    DATABASE_URL=sqlite+aiosqlite:///./data/loadtest.db \\
+        python -m loadtest.seed --users 200 --history-median 120 --seed 42
+"""
+
+import json
+import math
+import random
+import asyncio
+import argparse
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from app.core import database
+from app.services.character_config import CHARACTER_CONFIGS
+
+logger = logging.getLogger(__name__)
+
+USER_PREFIX = "loadtest-user-"
+
+_USER_LINES = [
+    "早安~ 今天好冷啊",
+    "I just got off work, so tired today",
+    "你昨天说的那部电影我看了！",
+    "What are you doing right now?",
+    "我有点想你了",
+    "Can you tell me a story before I sleep?",
+    "今天老板又骂我了…",
+    "Guess what, I got the job!!",
+]
+_ASSISTANT_LINES = [
+    "哇，那你要多穿点哦，别感冒了~",
+    "Aww, come here. You deserve a break. Want to tell me about it?",
+    "真的吗！你觉得结局怎么样？我超好奇的",
+    "Just thinking about you, honestly 😊",
+    "我也想你呀，一直在等你来找我",
+    "Once upon a time, there was a girl who waited by the sea every evening...",
+    "抱抱你，他不懂你有多努力",
+    "I knew you could do it! We have to celebrate!",
+]
+
+
+def history_length(rng: random.Random, median: int, sigma: float = 1.0, cap: int = 5000) -> int:
+    """对数正态分布的历史长度（偶数，一问一答）"""
+    n = int(rng.lognormvariate(math.log(max(median, 1)), sigma))
+    return min(cap, max(2, n - n % 2))
+
+
+def intimacy_level(rng: random.Random) -> int:
+    """大部分用户在低等级，少量长期用户在高等级"""
+    return min(50, 1 + int(rng.expovariate(1 / 8)))
+
+
+def build_history(rng: random.Random, session_id: str, count: int, end: datetime) -> List[Dict]:
+    messages = []
+    ts = end - timedelta(minutes=3 * count)
+    for i in range(count):
+        role = "user" if i % 2 == 0 else "assistant"
+        lines = _USER_LINES if role == "user" else _ASSISTANT_LINES
+        ts += timedelta(seconds=rng.randint(10, 360))
+        messages.append({
+            "session_id": session_id,
+            "role": role,
+            "content": rng.choice(lines),
+            "tokens_used": 0 if role == "user" else rng.randint(40, 160),
+            "created_at": ts,
+        })
+    return messages
+
+
+async def seed(users: int, history_median: int, seed_value: int, batch_size: int = 2000) -> Dict:
+    from app.models.database.chat_models import ChatSession, ChatMessageDB
+    from app.models.database.intimacy_models import UserIntimacy
+
+    await database.init_db()
+    if database._session_factory is None:
+        raise RuntimeError("Database not available (MOCK_DATABASE=true or init failed)")
+
+    rng = random.Random(seed_value)
+    characters = list(CHARACTER_CONFIGS.values())
+    now = datetime.utcnow()
+    manifest: Dict[str, List[Dict]] = {"users": []}
+    total_messages = 0
+    pending: List[Dict] = []
+
+    async with database._session_factory() as db:
+        for i in range(users):
+            user_id = f"{USER_PREFIX}{i}"
+            user_sessions = []
+            for config in rng.sample(characters, k=rng.randint(1, min(3, len(characters)))):
+                count = history_length(rng, history_median)
+                session = ChatSession(
+                    user_id=user_id,
+                    character_id=config.char_id,
+                    character_name=config.name,
+                    total_messages=count,
+                    intro_shown=True,
+                )
+                db.add(session)
+                await db.flush()
+                level = intimacy_level(rng)
+                db.add(UserIntimacy(
+                    user_id=user_id,
+                    character_id=config.char_id,
+                    current_level=level,
+                    total_xp=float(level * level * 10),
+                    total_messages=count // 2,
+                ))
+                pending.extend(build_history(rng, session.id, count, now))
+                total_messages += count
+                user_sessions.append({"session_id": session.id, "character_id": config.char_id, "level": level})
+
+                if len(pending) >= batch_size:
+                    await db.execute(ChatMessageDB.__table__.insert(), pending)
+                    pending = []
+            manifest["users"].append({"user_id": user_id, "sessions": user_sessions})
+
+        if pending:
+            await db.execute(ChatMessageDB.__table__.insert(), pending)
+        await db.commit()
+
+    await database.close_db()
+    manifest["total_messages"] = total_messages
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed load-test users, sessions and chat history")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--history-median", type=int, default=120, help="median messages per session")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--manifest", default="loadtest-manifest.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    manifest = asyncio.run(seed(args.users, args.history_median, args.seed))
+    with open(args.manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    sessions = sum(len(u["sessions"]) for u in manifest["users"])
+    print(f"✅ Seeded {len(manifest['users'])} users, {sessions} sessions, "
+          f"{manifest['total_messages']} messages → {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
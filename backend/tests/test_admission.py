@@ -0,0 +1,237 @@
+"""
+Admission Control Tests
+=======================
+
+测试对话准入：同会话轮次按到达顺序串行、不同会话并行、会话积压 429、全局队列满 / 排队超时 503、
+锁自动回收、中间件返回 Retry-After 并把请求体原样回放给路由、会话锁按用户隔离、后置更新按 user:character 串行。
+
+运行: pytest tests/test_admission.py -v
+"""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, Request
+
+from app.core.admission import AdmissionController, AdmissionRejected
+from app.middleware.admission_middleware import AdmissionMiddleware
+from app.middleware.context import get_request_context
+
+
+class Recorder:
+    """记录每轮的开始 / 结束顺序"""
+
+    def __init__(self):
+        self.events = []
+
+    async def run(self, controller, session_id, label, delay=0.01):
+        async with controller.turn(session_id):
+            self.events.append(("start", label))
+            await asyncio.sleep(delay)
+            self.events.append(("end", label))
+
+
+class TestAdmissionController:
+
+    @pytest.mark.asyncio
+    async def test_session_turns_serialized_in_order(self):
+        controller, recorder = AdmissionController("t", session_max_pending=5), Recorder()
+        await asyncio.gather(*[recorder.run(controller, "s1", i) for i in range(3)])
+        assert recorder.events == [
+            ("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2),
+        ]
+        assert len(controller.sessions) == 0
+        assert controller.get_stats()["admitted"] == 3
+
+    @pytest.mark.asyncio
+    async def test_different_sessions_run_concurrently(self):
+        controller, recorder = AdmissionController("t"), Recorder()
+        await asyncio.gather(recorder.run(controller, "s1", "a"), recorder.run(controller, "s2", "b"))
+        assert [e[0] for e in recorder.events] == ["start", "start", "end", "end"]
+
+    @pytest.mark.asyncio
+    async def test_session_backlog_rejected(self):
+        controller, recorder = AdmissionController("t", session_max_pending=1), Recorder()
+        results = await asyncio.gather(
+            *[recorder.run(controller, "s1", i) for i in range(3)], return_exceptions=True
+        )
+        rejected = [r for r in results if isinstance(r, AdmissionRejected)]
+        assert len(rejected) == 1
+        assert rejected[0].status_code == 429
+        assert rejected[0].retry_after >= 1
+        assert controller.rejected == {"session_backlog": 1}
+
+    @pytest.mark.asyncio
+    async def test_session_wait_timeout(self):
+        controller, recorder = AdmissionController("t", session_wait_timeout=0.01), Recorder()
+        results = await asyncio.gather(
+            recorder.run(controller, "s1", "slow", delay=0.05), recorder.run(controller, "s1", "late"),
+            return_exceptions=True,
+        )
+        assert results[0] is None
+        assert isinstance(results[1], AdmissionRejected) and results[1].reason == "session_timeout"
+        assert len(controller.sessions) == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_full_sheds_immediately(self):
+        controller, recorder = AdmissionController("t", max_in_flight=1, max_queue=1), Recorder()
+        results = await asyncio.gather(
+            *[recorder.run(controller, f"s{i}", i) for i in range(3)], return_exceptions=True
+        )
+        rejected = [r for r in results if isinstance(r, AdmissionRejected)]
+        assert [r.reason for r in rejected] == ["queue_full"]
+        assert rejected[0].status_code == 503
+        assert controller.in_flight == 0 and controller.queued == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout(self):
+        controller, recorder = AdmissionController("t", max_in_flight=1, queue_timeout=0.01), Recorder()
+        results = await asyncio.gather(
+            recorder.run(controller, None, "slow", delay=0.05), recorder.run(controller, None, "late"),
+            return_exceptions=True,
+        )
+        assert isinstance(results[1], AdmissionRejected) and results[1].reason == "queue_timeout"
+        # 超时的请求没有占走名额
+        async with controller.turn():
+            assert controller.in_flight == 1
+
+    @pytest.mark.asyncio
+    async def test_body_error_releases_locks(self):
+        controller = AdmissionController("t", max_in_flight=1)
+        with pytest.raises(ValueError):
+            async with controller.turn("s1"):
+                raise ValueError("boom")
+        assert controller.in_flight == 0
+        assert len(controller.sessions) == 0
+
+    def test_retry_after_grows_with_backlog(self):
+        controller = AdmissionController("t", max_in_flight=2)
+        assert controller.retry_after() == 5
+        assert controller.retry_after(backlog=5) == 15
+        assert controller.retry_after(backlog=1000) == 30
+
+
+def _build_app(controller):
+    app = FastAPI()
+    seen = []
+
+    @app.post("/api/v1/chat/completions")
+    async def completions(req: Request):
+        payload = await req.json()
+        seen.append(payload)
+        await asyncio.sleep(0.02)
+        return {"ok": True}
+
+    @app.post("/api/v1/other")
+    async def other():
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, controller=controller, enabled=True)
+    return app, seen
+
+
+async def _post(app, path, payload, user_id=None):
+    body = json.dumps(payload).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    if user_id:
+        get_request_context(scope).user = SimpleNamespace(user_id=user_id)
+    chunks = [body[:5], body[5:]]
+    messages = []
+
+    async def receive():
+        if chunks:
+            chunk = chunks.pop(0)
+            return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+class TestAdmissionMiddleware:
+
+    @pytest.mark.asyncio
+    async def test_body_replayed_to_route(self):
+        app, seen = _build_app(AdmissionController("t"))
+        messages = await _post(app, "/api/v1/chat/completions", {"session_id": "s1", "message": "你好"})
+        assert messages[0]["status"] == 200
+        assert seen == [{"session_id": "s1", "message": "你好"}]
+
+    @pytest.mark.asyncio
+    async def test_overload_returns_retry_after(self):
+        controller = AdmissionController("t", max_in_flight=1, max_queue=0)
+        app, seen = _build_app(controller)
+        first, second = await asyncio.gather(
+            _post(app, "/api/v1/chat/completions", {"session_id": "s1", "message": "a"}),
+            _post(app, "/api/v1/chat/completions", {"session_id": "s2", "message": "b"}),
+        )
+        assert first[0]["status"] == 200
+        assert second[0]["status"] == 503
+        headers = dict(second[0]["headers"])
+        assert headers[b"retry-after"] == b"5"
+        assert json.loads(second[1]["body"])["error"] == "queue_full"
+        assert len(seen) == 1
+
+    @pytest.mark.asyncio
+    async def test_session_lock_scoped_to_user(self):
+        controller = AdmissionController("t", session_wait_timeout=0.005)
+        app, seen = _build_app(controller)
+        owner, same_user, other_user = await asyncio.gather(
+            _post(app, "/api/v1/chat/completions", {"session_id": "s1", "message": "a"}, user_id="u1"),
+            _post(app, "/api/v1/chat/completions", {"session_id": "s1", "message": "b"}, user_id="u1"),
+            _post(app, "/api/v1/chat/completions", {"session_id": "s1", "message": "c"}, user_id="u2"),
+        )
+        assert owner[0]["status"] == 200
+        assert same_user[0]["status"] == 429
+        # 别的用户带上同一个 session_id 不会占住 u1 的会话锁
+        assert other_user[0]["status"] == 200
+        assert len(seen) == 2
+
+    @pytest.mark.asyncio
+    async def test_other_paths_not_admitted(self):
+        controller = AdmissionController("t", max_in_flight=1, max_queue=0)
+        app, _ = _build_app(controller)
+        messages = await _post(app, "/api/v1/other", {"session_id": "s1"})
+        assert messages[0]["status"] == 200
+        assert controller.admitted == 0
+
+
+class TestPostUpdateSerialized:
+
+    @pytest.mark.asyncio
+    async def test_same_user_character_not_interleaved(self):
+        import app.api.v1  # noqa: F401  (prompt_builder_v4 与 app.api.v1 互相导入)
+        from app.services.v4.chat_pipeline_v4 import ChatPipelineV4
+
+        events = []
+
+        async def fake_update(user_state, precompute, parsed):
+            events.append(("start", parsed))
+            await asyncio.sleep(0.01)
+            events.append(("end", parsed))
+
+        pipeline = ChatPipelineV4.__new__(ChatPipelineV4)
+        pipeline._async_post_update = fake_update
+        state = SimpleNamespace(user_id="u1", character_id="c1")
+        await asyncio.gather(*[pipeline._serialized_post_update(state, None, i) for i in range(3)])
+        assert events == [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+        assert len(ChatPipelineV4._post_update_locks) == 0
@@ -0,0 +1,52 @@
+"""
+Benchmark Suite Tests
+=====================
+
+测试基准测试工具：每个用例都能在当前代码上跑通（语料与接口不脱节）、
+计时结果格式、基线选择（同主机同 Python 版本）、回归判定。
+
+运行: pytest tests/test_benchmarks.py -v
+"""
+
+import pytest
+
+from benchmarks.cases import CASES, select
+from benchmarks.run import find_regressions, measure, pick_baseline
+
+
+class TestCases:
+
+    @pytest.mark.parametrize("name", sorted(CASES))
+    def test_case_runs(self, name):
+        run = CASES[name]()
+        assert run() > 0
+
+    def test_select(self):
+        names = [name for name, _ in select(["json_parser"])]
+        assert names == ["json_parser.parse_valid", "json_parser.parse_repair"]
+        assert len(select([])) == len(CASES)
+
+
+class TestRunner:
+
+    def test_measure(self):
+        stats = measure(lambda: 10, rounds=3, min_time=0.001)
+        assert stats["rounds"] == 3
+        assert 0 < stats["min_us"] <= stats["median_us"] <= stats["max_us"]
+
+    def test_pick_baseline_matches_env(self):
+        env = {"host": "a", "python": "3.11.7"}
+        history = [
+            {"commit": "1", "env": {"host": "a", "python": "3.11.7"}},
+            {"commit": "2", "env": {"host": "b", "python": "3.11.7"}},
+            {"commit": "3", "env": {"host": "a", "python": "3.12.0"}},
+        ]
+        assert pick_baseline(history, env)["commit"] == "1"
+        assert pick_baseline(history, {"host": "c", "python": "3.11.7"}) is None
+
+    def test_find_regressions(self):
+        baseline = {"results": {"a": {"median_us": 10.0}, "b": {"median_us": 10.0}}}
+        results = {"a": {"median_us": 12.0}, "b": {"median_us": 10.5}, "c": {"median_us": 99.0}}
+        regressions = find_regressions(results, baseline, threshold=0.15)
+        assert [r["name"] for r in regressions] == ["a"]
+        assert regressions[0]["change"] == pytest.approx(0.2)
@@ -0,0 +1,147 @@
+"""
+Character Registry Tests
+========================
+
+测试角色注册表与 prompt 静态片段缓存：id 索引、admin 修改后原地热更新并通知订阅者、
+PromptBuilderV4 按 (角色, 阶段, 升阶, NSFW) 复用静态片段、角色变更后片段失效、
+/admin/characters 更新与删除接口触发热更新、启动时从数据库合并 admin 的修改。
+
+运行: pytest tests/test_character_registry.py -v
+"""
+
+import copy
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.services.character_registry import CharacterRegistry
+
+LUNA = "d2b3c4d5-e6f7-4a8b-9c0d-1e2f3a4b5c6d"
+
+
+@pytest.fixture
+def prompt_builder_v4():
+    # 路由包在用例里才导入：收集阶段导入会让后面依赖 MOCK_* 环境变量的用例拿到非 mock 的服务
+    # （prompt_builder_v4 与 app.api.v1 互相导入，先完整加载路由包）
+    import app.api.v1  # noqa: F401
+    from app.services.v4 import prompt_builder_v4 as module
+    return module.prompt_builder_v4
+
+
+@pytest.fixture
+def restore_luna(prompt_builder_v4):
+    from app.api.v1.characters import get_character_by_id
+    luna = get_character_by_id(LUNA)
+    saved = copy.deepcopy(luna)
+    yield luna
+    luna.clear()
+    luna.update(saved)
+    prompt_builder_v4.clear_fragment_cache()
+
+
+def _state(**kwargs):
+    from app.services.v4.chat_pipeline_v4 import UserStateV4
+    values = {"user_id": "u1", "character_id": LUNA, "intimacy_level": 12, "emotion": 0, "events": []}
+    values.update(kwargs)
+    return UserStateV4(**values)
+
+
+class TestRegistry:
+
+    def test_index_matches_characters(self, prompt_builder_v4):
+        from app.api.v1.characters import CHARACTERS, get_character_by_id
+        for c in CHARACTERS:
+            assert get_character_by_id(c["character_id"]) is c
+        assert get_character_by_id("missing") is None
+
+    def test_apply_update_notifies(self):
+        registry = CharacterRegistry()
+        registry.load([{"character_id": "a", "name": "A"}])
+        changed = []
+        registry.subscribe(changed.append)
+
+        assert registry.apply_update("a", {"name": "B"})
+        assert registry.get("a")["name"] == "B"
+        assert changed == ["a"]
+        assert not registry.apply_update("missing", {"name": "C"})
+        assert changed == ["a"]
+
+    def test_failing_listener_isolated(self):
+        registry = CharacterRegistry()
+        registry.load([{"character_id": "a"}])
+        changed = []
+        registry.subscribe(lambda _: 1 / 0)
+        registry.subscribe(changed.append)
+        assert registry.apply_update("a", {"name": "B"})
+        assert changed == ["a"]
+
+    @pytest.mark.asyncio
+    async def test_sync_from_db_merges_admin_edits(self):
+        registry = CharacterRegistry()
+        registry.load([{"character_id": "a", "name": "A", "system_prompt": "old"}])
+        rows = [
+            {"character_id": "a", "name": "A2", "system_prompt": "new", "mbti": None, "created_at": "x"},
+            {"character_id": "db-only", "name": "X"},
+        ]
+        with patch("app.services.character_service.character_service.get_all", AsyncMock(return_value=rows)) as get_all:
+            assert await registry.sync_from_db() == 1
+        get_all.assert_awaited_once_with(include_inactive=True, include_private=True)
+        assert registry.get("a") == {"character_id": "a", "name": "A2", "system_prompt": "new"}
+        assert registry.get("db-only") is None
+
+    @pytest.mark.asyncio
+    async def test_sync_from_db_failure_keeps_defaults(self):
+        registry = CharacterRegistry()
+        registry.load([{"character_id": "a", "name": "A"}])
+        with patch("app.services.character_service.character_service.get_all", AsyncMock(side_effect=RuntimeError("db down"))):
+            assert await registry.sync_from_db() == 0
+        assert registry.get("a")["name"] == "A"
+
+
+class TestFragmentCache:
+
+    def test_static_fragments_reused(self, prompt_builder_v4):
+        prompt_builder_v4.build_prompt_layout(user_state=_state(), character_id=LUNA, layout="prefix")
+        misses = prompt_builder_v4.fragment_misses
+        for emotion in (-50, 0, 50):
+            prompt_builder_v4.build_prompt_layout(
+                user_state=_state(emotion=emotion), character_id=LUNA, layout="prefix"
+            )
+            prompt_builder_v4.build_prompt_layout(
+                user_state=_state(emotion=emotion), character_id=LUNA, layout="legacy"
+            )
+        # 第一次 legacy 构建会补齐人设 / 阶段规则片段，之后全部命中
+        assert prompt_builder_v4.fragment_misses - misses <= 2
+        assert prompt_builder_v4.get_fragment_stats()["hits"] > 0
+
+    def test_update_invalidates_prompt(self, prompt_builder_v4, restore_luna):
+        from app.services.character_registry import character_registry
+        before = prompt_builder_v4.build_prompt_layout(user_state=_state(), character_id=LUNA, layout="prefix")
+        character_registry.apply_update(LUNA, {"system_prompt": "你是「Luna」（测试版人设）"})
+        after = prompt_builder_v4.build_prompt_layout(user_state=_state(), character_id=LUNA, layout="prefix")
+
+        assert after.prefix.startswith("你是「Luna」（测试版人设）")
+        assert after.cache_key != before.cache_key
+
+
+class TestAdminHotReload:
+
+    @pytest.mark.asyncio
+    async def test_update_endpoint(self, restore_luna):
+        from app.api.v1.admin import CharacterUpdate, update_character
+        from app.api.v1.characters import get_character_by_id
+
+        with patch("app.services.character_service.character_service.update",
+                   new=AsyncMock(return_value={"character_id": LUNA})):
+            await update_character(LUNA, CharacterUpdate(description="新的介绍"))
+        assert get_character_by_id(LUNA)["description"] == "新的介绍"
+
+    @pytest.mark.asyncio
+    async def test_delete_endpoint_deactivates(self, restore_luna):
+        from app.api.v1.admin import delete_character
+        from app.api.v1.characters import get_character_by_id
+
+        with patch("app.services.character_service.character_service.delete",
+                   new=AsyncMock(return_value=True)):
+            await delete_character(LUNA)
+        assert get_character_by_id(LUNA)["is_active"] is False
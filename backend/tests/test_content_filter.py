@@ -0,0 +1,107 @@
+"""
+Content Filter Tests
+====================
+
+测试单次扫描的内容过滤器：词汇替换、违规模式、输出清理、流式过滤与整段过滤一致。
+
+运行: pytest tests/test_content_filter.py -v
+"""
+
+import random
+import pytest
+
+from app.services.content_rating_system.content_filter import ContentFilter
+
+SAMPLES = [
+    "*她轻轻地抚摸着你的胸口*，喘息声越来越重……",
+    "你好呀～今天天气真好！要不要一起去公园？",
+    "  她亲吻了你.... ... 然后 * * 笑了  ",
+    "他们做爱了",
+    "我们进入房间吧",
+    "身体微微颤抖着，她脱下外衣",
+    "嘴唇贴近你的耳边\n轻声说：晚安",
+]
+
+
+@pytest.fixture(scope="module")
+def cf():
+    return ContentFilter()
+
+
+class TestFilter:
+
+    def test_banned_word(self, cf):
+        result = cf.filter("他们做爱了", level=4)
+        assert result.filtered == "他们[内容已过滤]了"
+        assert result.severity == "critical"
+        assert result.violations == ["绝对禁止词汇: 做爱"]
+
+    def test_level_restricted_word_uses_replacement(self, cf):
+        result = cf.filter("她有点颤抖", level=2)
+        assert result.filtered == "她有点微微发抖"
+        assert result.severity == "medium"
+
+    def test_restricted_word_allowed_at_higher_level(self, cf):
+        result = cf.filter("她脸红了", level=4)
+        assert not result.was_modified
+        assert result.severity == "low"
+
+    def test_violation_pattern(self, cf):
+        result = cf.filter("他把她压在床上", level=4)
+        assert result.filtered == "他把她...上"
+        assert "违规模式: 床上动作" in result.violations
+
+    def test_pattern_gap_is_bounded(self, cf):
+        """违规模式的 .* 跨度有上限，远距离的两个词不再误判"""
+        far = "她抚摸着小猫" + "，" * 40 + "胸有成竹"
+        assert "违规模式: 露骨身体接触" not in cf.filter(far, level=4).violations
+
+    def test_cleanup(self, cf):
+        result = cf.filter("  好.... ... 吧 * * ", level=4)
+        assert result.filtered == "好... 吧"
+
+    def test_safe_content_unchanged(self, cf):
+        text = "今天工作好累，想听你讲个故事"
+        result = cf.filter(text, level=0)
+        assert result.filtered == text
+        assert not result.was_modified
+
+
+class TestStreaming:
+
+    @pytest.mark.parametrize("level", [0, 1, 2, 3, 4])
+    def test_stream_matches_whole_text(self, cf, level):
+        """任意切分 chunk，流式结果与整段过滤一致"""
+        for text in SAMPLES:
+            expected = cf.filter(text, level)
+            for seed in range(20):
+                rng = random.Random(seed)
+                stream = cf.stream(level)
+                out, i = "", 0
+                while i < len(text):
+                    n = rng.randint(1, 6)
+                    out += stream.feed(text[i:i + n])
+                    i += n
+                out += stream.finish()
+                assert out == expected.filtered, (text, seed)
+                assert stream.result().violations == expected.violations
+
+    def test_stream_holds_back_only_tail(self, cf):
+        stream = cf.stream(level=0)
+        head = "今天" * 100
+        emitted = stream.feed(head)
+        assert len(emitted) >= len(head) - cf.holdback
+        emitted += stream.feed("做")
+        assert "做" not in emitted  # 可能是禁止词的开头，留在尾部
+        emitted += stream.feed("爱了")
+        emitted += stream.finish()
+        assert emitted == head + "[内容已过滤]了"
+
+    @pytest.mark.asyncio
+    async def test_filter_stream_async(self, cf):
+        async def chunks():
+            for piece in ["他们做", "爱了，", "然后睡了"]:
+                yield piece
+
+        out = "".join([c async for c in cf.filter_stream(chunks(), level=4)])
+        assert out == "他们[内容已过滤]了，然后睡了"
@@ -0,0 +1,195 @@
+"""
+Context Builder Tests
+=====================
+
+测试 token 预算内的上下文组装：token 估算与截断、按优先级分配预算（最近几轮 > 摘要 >
+记忆 > 更早原文）、摘要点之后的消息加载（读库失败时返回空历史）、滚动摘要的折叠与后台调度去重（重试期间不重复提交）、摘要注入 prompt 后缀。
+
+运行: pytest tests/test_context_builder.py -v
+"""
+
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from app.services.v4 import context_builder as cb
+from app.services.v4.context_builder import ContextBuilder, estimate_tokens, truncate_to_tokens
+
+
+def _history(count: int, content: str = "今天过得怎么样") -> list:
+    start = datetime(2026, 1, 1)
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{content}{i}",
+         "created_at": start + timedelta(minutes=i)}
+        for i in range(count)
+    ]
+
+
+class TestEstimator:
+
+    def test_cjk_and_ascii(self):
+        assert estimate_tokens("你好世界") == 4
+        assert estimate_tokens("hello world!") == 3
+        assert estimate_tokens("") == 0
+
+    def test_cached(self):
+        estimate_tokens.cache_clear()
+        estimate_tokens("缓存测试 cache test")
+        estimate_tokens("缓存测试 cache test")
+        assert estimate_tokens.cache_info().hits == 1
+
+    def test_truncate(self):
+        assert truncate_to_tokens("短消息", 10) == "短消息"
+        truncated = truncate_to_tokens("一二三四五六七八九十", 5)
+        assert truncated == "一二三四五…"
+        assert estimate_tokens(truncate_to_tokens("a" * 1000, 50)) <= 51
+
+
+class TestAssemble:
+
+    def test_everything_fits(self):
+        builder = ContextBuilder(budget=2000, memory_tokens=500)
+        history = _history(10)
+        ctx = builder.assemble("他们约好周末见面", history, "- 用户喜欢猫")
+        assert [m["content"] for m in ctx.messages] == [m["content"] for m in history]
+        assert ctx.summary == "他们约好周末见面"
+        assert ctx.memory_context == "- 用户喜欢猫"
+        assert ctx.dropped_messages == 0
+        assert ctx.tokens == sum(ctx.breakdown.values())
+
+    def test_drops_oldest_first(self):
+        builder = ContextBuilder(budget=120, memory_tokens=0)
+        history = _history(20)
+        ctx = builder.assemble("", history)
+        assert ctx.dropped_messages > 0
+        assert ctx.messages[-1]["content"] == history[-1]["content"]
+        kept = [m["content"] for m in ctx.messages]
+        assert kept == [m["content"] for m in history[-len(kept):]]
+        assert ctx.tokens <= 120
+
+    def test_recent_always_kept(self):
+        builder = ContextBuilder(budget=10, memory_tokens=100)
+        history = _history(6, content="很长的消息" * 20)
+        ctx = builder.assemble("摘要", history, "- 记忆")
+        assert len(ctx.messages) == cb.MIN_RECENT
+        # 最近几轮已经超预算，摘要和记忆让位
+        assert ctx.summary == ""
+        assert ctx.memory_context == ""
+
+    def test_long_message_truncated(self):
+        builder = ContextBuilder(budget=5000)
+        ctx = builder.assemble("", [{"role": "assistant", "content": "长" * 2000}])
+        assert estimate_tokens(ctx.messages[0]["content"]) <= cb.MAX_MESSAGE_TOKENS + 1
+
+    def test_memory_truncated_by_lines(self):
+        builder = ContextBuilder(budget=5000, memory_tokens=30)
+        memory = "\n".join(f"- 记忆条目{i}：用户提到过一件事" for i in range(20))
+        ctx = builder.assemble("", _history(2), memory)
+        assert ctx.memory_context
+        assert memory.startswith(ctx.memory_context)
+        assert ctx.breakdown["memory"] <= 30
+
+
+class TestRollingSummary:
+
+    @pytest.mark.asyncio
+    async def test_load_history_skips_summarized(self):
+        history = _history(10)
+        session = {"context_summary": "旧摘要", "summary_until": history[5]["created_at"]}
+        with patch("app.services.chat_repository.chat_repo.get_session", new=AsyncMock(return_value=session)), \
+             patch("app.services.chat_repository.chat_repo.get_recent_messages",
+                   new=AsyncMock(return_value=history + [{"role": "system", "content": "x"}])):
+            summary, loaded = await ContextBuilder().load_history("s1")
+        assert summary == "旧摘要"
+        assert [m["content"] for m in loaded] == [m["content"] for m in history[6:]]
+
+    @pytest.mark.asyncio
+    async def test_load_history_failure_returns_empty(self):
+        with patch("app.services.chat_repository.chat_repo.get_session",
+                   new=AsyncMock(side_effect=RuntimeError("db down"))):
+            assert await ContextBuilder().load_history("s1") == ("", [])
+
+    @pytest.mark.asyncio
+    async def test_summarize_folds_older_messages(self):
+        history = _history(20)
+        llm = MagicMock()
+        llm.chat_completion = AsyncMock(return_value={"choices": [{"message": {"content": " 新摘要 "}}]})
+        update = AsyncMock()
+        with patch("app.services.chat_repository.chat_repo.get_session",
+                   new=AsyncMock(return_value={"context_summary": "旧摘要"})), \
+             patch("app.services.chat_repository.chat_repo.get_recent_messages", new=AsyncMock(return_value=history)), \
+             patch("app.services.chat_repository.chat_repo.update_session", new=update):
+            assert await ContextBuilder().summarize("s1", llm=llm)
+
+        prompt = llm.chat_completion.call_args.kwargs["messages"][0]["content"]
+        assert "旧摘要" in prompt
+        assert history[0]["content"] in prompt
+        assert history[-1]["content"] not in prompt
+        kwargs = update.call_args.kwargs
+        assert kwargs["context_summary"] == "新摘要"
+        assert kwargs["summary_until"] == history[-cb.KEEP_RECENT - 1]["created_at"]
+
+    @pytest.mark.asyncio
+    async def test_summarize_noop_when_short(self):
+        llm = MagicMock()
+        llm.chat_completion = AsyncMock()
+        with patch("app.services.chat_repository.chat_repo.get_session", new=AsyncMock(return_value={})), \
+             patch("app.services.chat_repository.chat_repo.get_recent_messages",
+                   new=AsyncMock(return_value=_history(cb.KEEP_RECENT))):
+            assert not await ContextBuilder().summarize("s1", llm=llm)
+        llm.chat_completion.assert_not_called()
+
+    def test_schedule_threshold_and_dedup(self):
+        builder = ContextBuilder()
+        with patch("app.core.task_supervisor.task_supervisor.submit", return_value=True) as submit:
+            assert not builder.maybe_schedule_summary("s1", _history(4))
+            assert builder.maybe_schedule_summary("s1", _history(cb.SUMMARY_TRIGGER))
+            assert not builder.maybe_schedule_summary("s1", _history(cb.SUMMARY_TRIGGER))
+        assert submit.call_count == 1
+        assert submit.call_args.kwargs["name"] == "context_summary"
+        assert submit.call_args.kwargs["retries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_summary_retry_keeps_dedup_flag(self, monkeypatch):
+        monkeypatch.setattr(cb, "SUMMARY_RETRY_DELAY", 0)
+        builder = ContextBuilder()
+        builder._summarizing.add("s1")
+        seen = []
+
+        async def flaky(session_id, llm=None):
+            seen.append(session_id in builder._summarizing)
+            if len(seen) == 1:
+                raise RuntimeError("provider timeout")
+            return True
+
+        monkeypatch.setattr(builder, "summarize", flaky)
+        await builder._summarize_guarded("s1")
+        assert seen == [True, True]
+        assert "s1" not in builder._summarizing
+
+    @pytest.mark.asyncio
+    async def test_summary_gives_up_after_retries(self, monkeypatch):
+        monkeypatch.setattr(cb, "SUMMARY_RETRY_DELAY", 0)
+        builder = ContextBuilder()
+        builder._summarizing.add("s1")
+        failing = AsyncMock(side_effect=RuntimeError("provider timeout"))
+        monkeypatch.setattr(builder, "summarize", failing)
+        with pytest.raises(RuntimeError):
+            await builder._summarize_guarded("s1")
+        assert failing.await_count == cb.SUMMARY_RETRIES + 1
+        assert "s1" not in builder._summarizing
+
+    def test_summary_in_prompt_suffix(self):
+        import app.api.v1  # noqa: F401
+        from app.services.v4.chat_pipeline_v4 import UserStateV4
+        from app.services.v4.prompt_builder_v4 import prompt_builder_v4
+
+        layout = prompt_builder_v4.build_prompt_layout(
+            user_state=UserStateV4(user_id="u1", character_id="d2b3c4d5-e6f7-4a8b-9c0d-1e2f3a4b5c6d"),
+            character_id="d2b3c4d5-e6f7-4a8b-9c0d-1e2f3a4b5c6d",
+            conversation_summary="他们约好周末去看海",
+            layout="prefix",
+        )
+        assert "### 之前的对话摘要\n他们约好周末去看海" in layout.suffix
+        assert "之前的对话摘要" not in layout.prefix
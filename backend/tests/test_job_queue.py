@@ -0,0 +1,331 @@
+"""
+Job Queue Tests
+===============
+
+测试持久化任务队列（数据库后端 + Redis 后端）：入队、幂等、定时、重试、结果存储、
+Redis processing list 租约与崩溃回收、定时分数按 UTC 计算。
+
+运行: pytest tests/test_job_queue.py -v
+"""
+
+import asyncio
+import time
+import pytest
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from app.services.job_queue import (
+    JobQueue,
+    DatabaseJobBackend,
+    RedisJobBackend,
+    RUNNING_LEASE_SECONDS,
+    JOB_HANDLERS,
+    job_handler,
+    STATUS_PENDING,
+    STATUS_RUNNING,
+    STATUS_SUCCEEDED,
+    STATUS_FAILED,
+)
+
+
+@pytest.fixture
+def sqlite_db(monkeypatch):
+    """内存 SQLite，替换 get_db"""
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.models.database.chat_models import Base as ChatBase
+    from app.models.database import job_models  # noqa: registers model
+
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:", echo=False,
+        poolclass=StaticPool, connect_args={"check_same_thread": False},
+    )
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def _init():
+        async with engine.begin() as conn:
+            await conn.run_sync(ChatBase.metadata.create_all)
+    asyncio.get_event_loop().run_until_complete(_init())
+
+    @asynccontextmanager
+    async def mock_get_db():
+        async with factory() as session:
+            try:
+                yield session
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+
+    monkeypatch.setattr("app.core.database.get_db", mock_get_db)
+    yield
+    asyncio.get_event_loop().run_until_complete(engine.dispose())
+
+
+@pytest.fixture
+def handlers():
+    """测试用 handler，结束后清理注册表"""
+    before = dict(JOB_HANDLERS)
+    calls = []
+
+    @job_handler("test_echo")
+    async def echo(payload):
+        calls.append(payload)
+        return {"echo": payload["value"]}
+
+    @job_handler("test_flaky")
+    async def flaky(payload):
+        calls.append(payload)
+        raise RuntimeError("provider timeout")
+
+    yield calls
+    JOB_HANDLERS.clear()
+    JOB_HANDLERS.update(before)
+
+
+def _queue() -> JobQueue:
+    return JobQueue(backend=DatabaseJobBackend())
+
+
+class TestDatabaseJobQueue:
+
+    @pytest.mark.asyncio
+    async def test_enqueue_run_and_store_result(self, sqlite_db, handlers):
+        queue = _queue()
+        job = await queue.enqueue("test_echo", {"value": 42}, user_id="u1")
+        assert job.status == STATUS_PENDING
+
+        assert await queue.run_once(timeout=0) is True
+        stored = await queue.get(job.job_id)
+        assert stored.status == STATUS_SUCCEEDED
+        assert stored.result == {"echo": 42}
+        assert stored.attempts == 1
+        assert handlers == [{"value": 42}]
+
+    @pytest.mark.asyncio
+    async def test_idempotency_key_returns_existing_job(self, sqlite_db, handlers):
+        queue = _queue()
+        first = await queue.enqueue("test_echo", {"value": 1}, idempotency_key="k1")
+        second = await queue.enqueue("test_echo", {"value": 2}, idempotency_key="k1")
+
+        assert second.job_id == first.job_id
+        assert queue.get_stats()["enqueued"] == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_job_releases_idempotency_key(self, sqlite_db, handlers):
+        queue = _queue()
+        first = await queue.enqueue("test_flaky", {}, idempotency_key="k2", max_attempts=1)
+        await queue.run_once(timeout=0)
+        assert (await queue.get(first.job_id)).status == STATUS_FAILED
+
+        second = await queue.enqueue("test_echo", {"value": 3}, idempotency_key="k2")
+        assert second.job_id != first.job_id
+
+    @pytest.mark.asyncio
+    async def test_in_flight_only_key_released_on_success(self, sqlite_db, handlers):
+        queue = _queue()
+        first = await queue.enqueue("test_echo", {"value": 1}, idempotency_key="k3",
+                                    idempotency_in_flight_only=True)
+        again = await queue.enqueue("test_echo", {"value": 1}, idempotency_key="k3",
+                                    idempotency_in_flight_only=True)
+        assert again.job_id == first.job_id
+
+        await queue.run_once(timeout=0)
+        second = await queue.enqueue("test_echo", {"value": 2}, idempotency_key="k3",
+                                     idempotency_in_flight_only=True)
+        assert second.job_id != first.job_id
+        assert second.status == STATUS_PENDING
+
+    @pytest.mark.asyncio
+    async def test_scheduled_job_not_claimed_early(self, sqlite_db, handlers):
+        queue = _queue()
+        job = await queue.enqueue("test_echo", {"value": 1}, delay_seconds=3600)
+
+        assert await queue.run_once(timeout=0) is False
+        assert (await queue.get(job.job_id)).status == STATUS_PENDING
+
+    @pytest.mark.asyncio
+    async def test_retry_then_permanent_failure(self, sqlite_db, handlers):
+        queue = _queue()
+        job = await queue.enqueue("test_flaky", {}, max_attempts=2)
+
+        await queue.run_once(timeout=0)
+        retried = await queue.get(job.job_id)
+        assert retried.status == STATUS_PENDING
+        assert retried.run_at > datetime.utcnow()
+        assert "provider timeout" in retried.error
+
+        # 跳过退避等待
+        await queue._backend._update(retried, run_at=datetime.utcnow() - timedelta(seconds=1))
+        await queue.run_once(timeout=0)
+        failed = await queue.get(job.job_id)
+        assert failed.status == STATUS_FAILED
+        assert failed.attempts == 2
+        assert queue.get_stats()["retried"] == 1
+        assert queue.get_stats()["failed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_job_type_fails(self, sqlite_db, handlers):
+        queue = _queue()
+        job = await queue.enqueue("no_such_job", {})
+        await queue.run_once(timeout=0)
+        stored = await queue.get(job.job_id)
+        assert stored.status == STATUS_FAILED
+        assert "Unknown job type" in stored.error
+
+    @pytest.mark.asyncio
+    async def test_job_claimed_once_by_concurrent_consumers(self, sqlite_db, handlers):
+        queue = _queue()
+        await queue.enqueue("test_echo", {"value": 7})
+
+        results = await asyncio.gather(
+            queue.run_once("w1", timeout=0),
+            queue.run_once("w2", timeout=0),
+        )
+        assert sorted(results) == [False, True]
+        assert handlers == [{"value": 7}]
+
+
+class FakeRedis:
+    """进程内的最小 Redis：string / list / zset，blmove 不阻塞"""
+
+    def __init__(self):
+        self.strings = {}
+        self.lists = {}
+        self.zsets = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.strings:
+            return None
+        self.strings[key] = value
+        return True
+
+    async def get(self, key):
+        return self.strings.get(key)
+
+    async def lpush(self, key, *values):
+        items = self.lists.setdefault(key, [])
+        for value in values:
+            items.insert(0, value)
+        return len(items)
+
+    async def lrem(self, key, count, value):
+        items = self.lists.get(key, [])
+        removed = items.count(value)
+        self.lists[key] = [item for item in items if item != value]
+        return removed
+
+    async def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def blmove(self, first_list, second_list, timeout, src="LEFT", dest="RIGHT"):
+        items = self.lists.get(first_list)
+        if not items:
+            return None
+        value = items.pop(-1 if src == "RIGHT" else 0)
+        target = self.lists.setdefault(second_list, [])
+        target.insert(0 if dest == "LEFT" else len(target), value)
+        return value
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, member):
+        return 1 if self.zsets.get(key, {}).pop(member, None) is not None else 0
+
+    async def zrangebyscore(self, key, min_score, max_score, start=0, num=None):
+        members = sorted(
+            (score, member) for member, score in self.zsets.get(key, {}).items()
+            if float(min_score) <= score <= float(max_score)
+        )
+        return [member for _, member in members][start:None if num is None else start + num]
+
+
+class TestRedisJobQueue:
+
+    @pytest.fixture
+    def redis(self):
+        return FakeRedis()
+
+    @pytest.mark.asyncio
+    async def test_enqueue_run_and_release_lease(self, redis, handlers):
+        queue = JobQueue(backend=RedisJobBackend(redis))
+        job = await queue.enqueue("test_echo", {"value": 5}, user_id="u1", idempotency_key="r1")
+        assert (await queue.enqueue("test_echo", {"value": 5}, idempotency_key="r1")).job_id == job.job_id
+
+        assert await queue.run_once(timeout=0) is True
+        stored = await queue.get(job.job_id)
+        assert stored.status == STATUS_SUCCEEDED
+        assert stored.result == {"echo": 5}
+        assert await redis.lrange(RedisJobBackend.PROCESSING_KEY, 0, -1) == []
+        assert not redis.zsets.get(RedisJobBackend.LEASES_KEY)
+
+    @pytest.mark.asyncio
+    async def test_claim_moves_to_processing_with_lease(self, redis, handlers):
+        backend = RedisJobBackend(redis)
+        queue = JobQueue(backend=backend)
+        job = await queue.enqueue("test_echo", {"value": 1})
+
+        claimed = await backend.claim("w1", timeout=0)
+        assert claimed.job_id == job.job_id
+        assert claimed.status == STATUS_RUNNING
+        assert await redis.lrange(RedisJobBackend.PROCESSING_KEY, 0, -1) == [job.job_id]
+        assert await redis.lrange(RedisJobBackend.READY_KEY, 0, -1) == []
+        # 租约未到期，不会被其他 worker 再次抢到
+        assert await backend.claim("w2", timeout=0) is None
+
+    @pytest.mark.asyncio
+    async def test_crashed_worker_job_reclaimed_after_lease(self, redis, handlers):
+        backend = RedisJobBackend(redis)
+        queue = JobQueue(backend=backend)
+        job = await queue.enqueue("test_echo", {"value": 9})
+        await backend.claim("crashed", timeout=0)
+
+        # 模拟租约到期（worker 崩溃，没有 complete / fail）
+        redis.zsets[RedisJobBackend.LEASES_KEY][job.job_id] -= RUNNING_LEASE_SECONDS + 1
+
+        assert await queue.run_once("w2", timeout=0) is True
+        stored = await queue.get(job.job_id)
+        assert stored.status == STATUS_SUCCEEDED
+        assert stored.attempts == 2
+        assert handlers == [{"value": 9}]
+        assert await redis.lrange(RedisJobBackend.PROCESSING_KEY, 0, -1) == []
+
+    @pytest.mark.asyncio
+    async def test_retry_leaves_processing(self, redis, handlers):
+        queue = JobQueue(backend=RedisJobBackend(redis))
+        job = await queue.enqueue("test_flaky", {}, max_attempts=2)
+        await queue.run_once(timeout=0)
+
+        stored = await queue.get(job.job_id)
+        assert stored.status == STATUS_PENDING
+        assert job.job_id in redis.zsets[RedisJobBackend.SCHEDULED_KEY]
+        assert await redis.lrange(RedisJobBackend.PROCESSING_KEY, 0, -1) == []
+        assert job.job_id not in redis.zsets[RedisJobBackend.LEASES_KEY]
+
+    @pytest.mark.asyncio
+    async def test_scheduled_score_is_utc_epoch(self, redis, handlers, monkeypatch):
+        # run_at 是 naive UTC；本地时区不是 UTC 时分数也要和 time.time() 对齐
+        monkeypatch.setenv("TZ", "America/New_York")
+        time.tzset()
+        try:
+            queue = JobQueue(backend=RedisJobBackend(redis))
+            job = await queue.enqueue("test_echo", {"value": 1}, delay_seconds=60)
+            score = redis.zsets[RedisJobBackend.SCHEDULED_KEY][job.job_id]
+            assert abs(score - (time.time() + 60)) < 5
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+
+def test_slow_work_handlers_registered():
+    import app.tasks.jobs as jobs
+
+    for job_type in (
+        jobs.JOB_MEMORY_EXTRACTION,
+        jobs.JOB_IMAGE_GENERATION,
+        jobs.JOB_EVENT_STORY,
+        jobs.JOB_TTS,
+    ):
+        assert job_type in JOB_HANDLERS
@@ -0,0 +1,208 @@
+"""
+JSON Parser Tests
+=================
+
+测试 V4 回复解析：干净 JSON 走直接解码（orjson 拒绝的合法 JSON 回退标准库）、夹杂文字时提取最外层对象（候选不可用时从下一个 '{' 有限次重扫）、单遍扫描修复
+（未转义引号、单引号、裸换行、尾逗号、缺逗号、截断）、解析路径计数、结构化输出 schema 与校验规则一致、intent 枚举与 prompt 列表一致、
+provider 不支持 json_schema 时管线降级为 json_object。
+
+运行: pytest tests/test_json_parser.py -v
+"""
+
+import json
+import re
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services.v4 import json_parser as module
+from app.core.exceptions import LLMServiceError
+from app.services.v4.json_parser import JsonParser, RESPONSE_FIELDS, REQUIRED_FIELDS, _scan_object
+
+GOOD = {
+    "reply": "今天也要开心哦",
+    "emotion_delta": 2,
+    "intent": "SMALL_TALK",
+    "is_nsfw_blocked": False,
+    "thought": "",
+}
+
+
+@pytest.fixture
+def prompt_builder_v4():
+    import app.api.v1  # noqa: F401  (prompt_builder_v4 与 app.api.v1 互相导入)
+    from app.services.v4.prompt_builder_v4 import prompt_builder_v4
+    return prompt_builder_v4
+
+
+def _decode_path(text: str) -> str:
+    return JsonParser()._decode(text)[1]
+
+
+class TestDecodePaths:
+
+    def test_clean_object_fast(self):
+        parser = JsonParser()
+        result = parser.parse_llm_response(json.dumps(GOOD, ensure_ascii=False))
+        assert result.parse_success
+        assert result.reply == "今天也要开心哦"
+        assert parser.get_parse_stats()["paths"]["fast"] == 1
+
+    def test_fast_path_without_orjson(self, monkeypatch):
+        monkeypatch.setattr(module, "_loads", json.loads)
+        assert _decode_path(json.dumps(GOOD)) == "fast"
+
+    def test_stdlib_fallback_before_repair(self, monkeypatch):
+        def strict_loads(text):
+            if "NaN" in text:
+                raise ValueError("unexpected character")
+            return json.loads(text)
+
+        monkeypatch.setattr(module, "_loads", strict_loads)
+        text = json.dumps({**GOOD, "thought": None}).replace("null", "NaN")
+        obj, path = JsonParser()._decode(text)
+        assert path == "fast"
+        assert obj["thought"] != obj["thought"]  # NaN
+
+        obj, path = JsonParser()._decode("好的：" + text)
+        assert path == "extracted"
+
+    def test_surrounding_text_extracted(self):
+        text = "Sure! Here you go:\n```json\n" + json.dumps(GOOD) + "\n```\nHope this helps {not json}"
+        obj, path = JsonParser()._decode(text)
+        assert path == "extracted"
+        assert obj == GOOD
+
+    def test_rescan_after_unusable_candidate(self):
+        text = "Here {is} the answer " + json.dumps(GOOD)
+        obj, path = JsonParser()._decode(text)
+        assert path == "extracted"
+        assert obj == GOOD
+
+    def test_rescan_bounded(self):
+        text = "{a} " * module._MAX_SCAN_ATTEMPTS + json.dumps(GOOD)
+        assert _decode_path(text) == "failed"
+
+    def test_no_object_failed(self):
+        assert _decode_path("嗯嗯，我也想你了~") == "failed"
+        assert _decode_path("{broken") == "failed"
+
+    def test_stats(self):
+        parser = JsonParser()
+        parser.parse_llm_response(json.dumps(GOOD))
+        parser.parse_llm_response(json.dumps(GOOD)[:-1] + ",}")
+        parser.parse_llm_response("没有 JSON")
+        stats = parser.get_parse_stats()
+        assert stats["total_parses"] == 3
+        assert stats["successful_parses"] == 2
+        assert stats["paths"] == {"fast": 1, "extracted": 0, "repaired": 1, "failed": 1}
+        assert stats["success_rate"] == pytest.approx(0.6667)
+
+
+class TestRepair:
+
+    @pytest.mark.parametrize("text, expected", [
+        ('{"reply": "她说"好的"，然后走了", "n": 1}', {"reply": '她说"好的"，然后走了', "n": 1}),
+        ('{"reply": "hello "friend", how are you", "n": 1}', {"reply": 'hello "friend", how are you', "n": 1}),
+        ("{'reply': 'It\\'s fine', 'ok': True}", {"reply": "It's fine", "ok": True}),
+        ('{"reply": "第一行\n第二行", "n": 1,}', {"reply": "第一行\n第二行", "n": 1}),
+        ('{\n"reply": "嗯"\n"n": 1\n"ok": false\n}', {"reply": "嗯", "n": 1, "ok": False}),
+        ('{"a": [1, 2,], "b": None}', {"a": [1, 2], "b": None}),
+    ])
+    def test_single_pass_fixes(self, text, expected):
+        candidate, changed = _scan_object(text)
+        assert changed
+        assert json.loads(candidate) == expected
+
+    @pytest.mark.parametrize("text, expected", [
+        ('{"reply": "说到一半', {"reply": "说到一半"}),
+        ('{"reply": "abc", "emotion_delta": 1, "inte', {"reply": "abc", "emotion_delta": 1}),
+        ('{"reply": "abc", "emotion_delta":', {"reply": "abc"}),
+        ('{"reply": "abc", "ok": tr', {"reply": "abc"}),
+        ('{"reply": "abc", "a": [1, 2', {"reply": "abc", "a": [1, 2]}),
+    ])
+    def test_truncated(self, text, expected):
+        candidate, _ = _scan_object(text)
+        assert json.loads(candidate) == expected
+
+    def test_repaired_reply_parses(self):
+        text = "{'reply': '好呀好呀，那我们说定了哦', 'emotion_delta': 2, 'intent': 'INVITATION', " \
+               "'is_nsfw_blocked': false, 'thought': 'yay'}"
+        result = JsonParser().parse_llm_response(text)
+        assert result.parse_success
+        assert result.intent == "INVITATION"
+
+    def test_truncated_reply_falls_back_to_text(self):
+        result = JsonParser().parse_llm_response(json.dumps(GOOD, ensure_ascii=False)[:25])
+        assert not result.parse_success
+        assert result.reply.startswith("今天也要")
+
+
+class TestStructuredOutput:
+
+    def test_schema_matches_validation(self):
+        parser = JsonParser()
+        schema = parser.response_format()["json_schema"]["schema"]
+        assert set(REQUIRED_FIELDS) <= set(schema["required"])
+        assert set(schema["properties"]["intent"]["enum"]) == parser.valid_intents
+        assert parser._validate_json(GOOD) is None
+
+        delta = schema["properties"]["emotion_delta"]
+        assert parser._validate_json({**GOOD, "emotion_delta": delta["maximum"] + 1})
+        assert parser._validate_json({**GOOD, "intent": "DANCE"})
+        assert parser._validate_json({**GOOD, "is_nsfw_blocked": "no"}) == "Field 'is_nsfw_blocked' must be boolean"
+
+    def test_intents_match_prompt(self, prompt_builder_v4):
+        match = re.search(r"intent: must be one of \[([^\]]+)\]", prompt_builder_v4.json_schema)
+        assert match
+        assert [i.strip() for i in match.group(1).split(",")] == list(module.VALID_INTENTS)
+        assert JsonParser()._validate_json({**GOOD, "intent": "PROPOSAL"}) is None
+
+    def _pipeline(self, side_effect):
+        import app.api.v1  # noqa: F401  (prompt_builder_v4 与 app.api.v1 互相导入)
+        from app.services.v4.chat_pipeline_v4 import ChatPipelineV4
+
+        pipeline = ChatPipelineV4()
+        pipeline.structured_output = True
+        pipeline.grok_service = SimpleNamespace(chat_completion=AsyncMock(side_effect=side_effect))
+        return pipeline
+
+    @staticmethod
+    def _response():
+        return {"choices": [{"message": {"content": json.dumps(GOOD)}}], "usage": {"total_tokens": 10}}
+
+    @pytest.mark.asyncio
+    async def test_uses_json_schema(self):
+        pipeline = self._pipeline([self._response()])
+        result = await pipeline._call_llm("system", "你好")
+        assert json.loads(result["content"]) == GOOD
+        call = pipeline.grok_service.chat_completion.call_args
+        assert call.kwargs["response_format"]["type"] == "json_schema"
+        assert call.kwargs["response_format"]["json_schema"]["schema"]["properties"] == RESPONSE_FIELDS
+
+    @pytest.mark.asyncio
+    async def test_falls_back_when_rejected(self):
+        rejected = LLMServiceError("unknown field json_schema", status_code=400)
+        pipeline = self._pipeline([rejected, self._response(), self._response()])
+        await pipeline._call_llm("system", "你好")
+        assert not pipeline.structured_output
+
+        await pipeline._call_llm("system", "再来")
+        formats = [c.kwargs["response_format"]["type"] for c in pipeline.grok_service.chat_completion.call_args_list]
+        assert formats == ["json_schema", "json_object", "json_object"]
+
+    @pytest.mark.asyncio
+    async def test_rejection_behind_retry_error(self):
+        retry_error = Exception("RetryError")
+        retry_error.last_attempt = SimpleNamespace(exception=lambda: LLMServiceError("bad", status_code=422))
+        pipeline = self._pipeline([retry_error, self._response()])
+        await pipeline._call_llm("system", "你好")
+        assert not pipeline.structured_output
+
+    @pytest.mark.asyncio
+    async def test_server_error_not_downgraded(self):
+        pipeline = self._pipeline([LLMServiceError("boom", status_code=500)])
+        with pytest.raises(LLMServiceError):
+            await pipeline._call_llm("system", "你好")
+        assert pipeline.structured_output
@@ -0,0 +1,102 @@
+"""
+Keyword Automaton Tests
+=======================
+
+测试 Aho-Corasick 多模式匹配，以及 PrecomputeService / quick_detect / ContentFilter 的单次扫描。
+
+运行: pytest tests/test_keyword_automaton.py -v
+"""
+
+import random
+
+from app.utils.keyword_automaton import KeywordAutomaton
+
+
+class TestKeywordAutomaton:
+
+    def test_matches_like_substring_search(self):
+        """结果与 `kw in text` 完全一致（含重叠、前后缀关系）"""
+        keywords = ["he", "she", "his", "hers", "好", "不好", "烦", "烦死了", "a", "aa", "aaa"]
+        automaton = KeywordAutomaton({"k": keywords})
+        alphabet = ["h", "e", "s", "i", "r", "a", "好", "不", "烦", "死", "了", " "]
+
+        random.seed(7)
+        for _ in range(2000):
+            text = "".join(random.choice(alphabet) for _ in range(random.randint(0, 12)))
+            expected = {kw for kw in keywords if kw in text}
+            assert automaton.scan(text).keywords.get("k", set()) == expected, text
+
+    def test_keyword_in_multiple_categories(self):
+        automaton = KeywordAutomaton({"greeting": ["晚安"], "closing": ["晚安", "bye"]})
+        matches = automaton.scan("那我睡啦，晚安")
+        assert matches.has("greeting") and matches.has("closing")
+
+    def test_priority_resolved_after_scan(self):
+        automaton = KeywordAutomaton({"greeting": ["hi"], "insult": ["stupid"]})
+        matches = automaton.scan("stupid bot, hi")
+        assert matches.first_of(["greeting", "insult"]) == "greeting"
+        assert matches.first_of(["insult", "greeting"]) == "insult"
+        assert matches.first_of(["nsfw"]) is None
+
+    def test_count_and_occurrences(self):
+        automaton = KeywordAutomaton({"pos": ["好", "棒"]})
+        matches = automaton.scan("好好好，真棒")
+        assert matches.count("pos") == 2
+        assert matches.occurrence_count("pos") == 4
+
+    def test_add_after_build_rebuilds(self):
+        automaton = KeywordAutomaton({"a": ["foo"]}).build()
+        automaton.add("b", ["bar"])
+        assert automaton.scan("foobar").categories == {"a", "b"}
+
+    def test_empty(self):
+        automaton = KeywordAutomaton()
+        matches = automaton.scan("anything")
+        assert not matches
+        assert matches.count("x") == 0
+
+
+class TestPrecomputeSinglePass:
+
+    def test_intent_priority(self):
+        from app.services.v4.precompute_service import precompute_service
+
+        # 问候优先于调情
+        assert precompute_service.analyze("你好呀宝贝").intent == "GREETING"
+        # 道歉优先于侮辱
+        assert precompute_service.analyze("对不起，我太蠢了").intent == "APOLOGY"
+        assert precompute_service.analyze("[verified_gift:rose] 送你").intent == "GIFT_SEND"
+        assert precompute_service.analyze("随便聊聊").intent == "SMALL_TALK"
+
+    def test_safety_nsfw_and_sentiment_from_same_scan(self):
+        from app.services.v4.precompute_service import precompute_service
+
+        result = precompute_service.analyze("I hate you, so bad")
+        assert result.intent == "INSULT"
+        assert result.sentiment_score == -1.0
+        assert result.is_nsfw is False
+        assert precompute_service.analyze("about terrorism").safety_flag == "BLOCK"
+        assert precompute_service.analyze("send nude").is_nsfw is True
+
+
+class TestQuickDetect:
+
+    def test_patterns_and_emoji(self):
+        from app.services.emotion_engine_v2.emotion_engine import EmotionEngineV2
+
+        engine = EmotionEngineV2()
+        result = engine.quick_detect("I LOVE YOU 😊😊💔 谢谢")
+        assert "strong_positive" in result["patterns_matched"]
+        assert "mild_positive" in result["patterns_matched"]
+        assert result["emoji_sentiment"] == (2 - 1) / 3
+
+
+class TestContentFilterIsSafe:
+
+    def test_level_words(self):
+        from app.services.content_rating_system.content_filter import content_filter
+
+        assert content_filter.is_safe("今天天气很好", level=0)
+        assert not content_filter.is_safe("她脸红了", level=0)
+        assert content_filter.is_safe("她脸红了", level=4)
+        assert not content_filter.is_safe("裸体", level=4)
@@ -0,0 +1,272 @@
+"""
+LLM Router Tests
+================
+
+测试 LLM 路由：滚动延迟分位数、熔断器状态转换（含试探请求被取消）、重试预算、
+超过 p95 时对冲并取消落后的请求（落败请求按估算 prompt token 记账）、
+可重试错误按顺序降级、参数错误不重试、熔断路由被跳过、GrokService 经路由发送。
+
+运行: pytest tests/test_llm_router.py -v
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.exceptions import LLMServiceError
+from app.services.llm import router as router_module
+from app.services.llm.router import (
+    CircuitBreaker,
+    LatencyWindow,
+    LLMRouter,
+    RetryBudget,
+    Route,
+    parse_routes,
+)
+
+OK = {"choices": [{"message": {"content": "{}"}}]}
+
+
+class FakeRouter(LLMRouter):
+    """按路由名返回预设行为的路由器：behaviors[name] 是 (延迟秒数, 结果或异常) 列表，逐次消费"""
+
+    def __init__(self, routes, behaviors, **kwargs):
+        kwargs.setdefault("budget", RetryBudget(ratio=0.0, min_retries=10))
+        super().__init__(routes=routes, **kwargs)
+        self.behaviors = behaviors
+        self.calls = []
+        self.cancelled = []
+
+    async def _post(self, route, payload, headers):
+        self.calls.append(route.model)
+        delay, outcome = self.behaviors[route.model].pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(route.model)
+            raise
+        if isinstance(outcome, Exception):
+            raise outcome
+        return {**outcome, "model": route.model}
+
+
+def _routes(*models):
+    return [Route(model=m, base_url="https://api.x.ai/v1") for m in models]
+
+
+def _warm(route, seconds=0.01, count=30):
+    for _ in range(count):
+        route.latency.observe(seconds)
+
+
+class TestPrimitives:
+
+    def test_latency_window(self):
+        window = LatencyWindow(size=100)
+        for i in range(1, 201):
+            window.observe(i / 1000)
+        assert len(window) == 100
+        # 只保留最近 100 个（0.101 ~ 0.200）
+        assert window.quantile(0.0) == pytest.approx(0.101)
+        assert window.quantile(0.95) == pytest.approx(0.196)
+
+    def test_breaker_transitions(self, monkeypatch):
+        breaker = CircuitBreaker(failures=2, cooldown=10)
+        now = [100.0]
+        monkeypatch.setattr(router_module.time, "monotonic", lambda: now[0])
+
+        assert not breaker.record_failure()
+        assert breaker.record_failure()
+        assert breaker.state == "open" and not breaker.allow()
+
+        now[0] += 10
+        assert breaker.state == "half_open"
+        assert breaker.allow()
+        assert not breaker.allow()          # 同时只放一个试探请求
+        breaker.record_failure()            # 试探失败，重新打开
+        assert breaker.state == "open"
+
+        now[0] += 10
+        assert breaker.allow()
+        breaker.record_success()
+        assert breaker.state == "closed" and breaker.allow()
+
+    def test_cancelled_probe_reopens(self, monkeypatch):
+        breaker = CircuitBreaker(failures=1, cooldown=10)
+        now = [100.0]
+        monkeypatch.setattr(router_module.time, "monotonic", lambda: now[0])
+        breaker.record_failure()
+
+        now[0] += 10
+        assert breaker.allow()
+        breaker.record_cancelled()          # 试探被取消：重新打开，冷却后还能再试探
+        assert breaker.state == "open"
+        now[0] += 10
+        assert breaker.allow()
+
+        breaker.record_success()
+        breaker.record_cancelled()          # 非试探的取消不计失败
+        assert breaker.state == "closed" and breaker.failures == 0
+
+    def test_retry_budget(self):
+        budget = RetryBudget(ratio=0.5, min_retries=1, window=60)
+        for _ in range(4):
+            budget.record_request()
+        spent = [budget.try_spend() for _ in range(5)]
+        assert spent == [True, True, True, False, False]
+
+    def test_parse_routes(self):
+        routes = parse_routes("grok-4-1, grok-beta@https://backup.example.com/v1/ ,", "https://api.x.ai/v1")
+        assert [(r.model, r.base_url) for r in routes] == [
+            ("grok-4-1", "https://api.x.ai/v1"),
+            ("grok-beta", "https://backup.example.com/v1"),
+        ]
+        assert routes[1].name == "grok-beta@backup.example.com"
+        assert routes[1].provider == "backup.example.com"
+        assert routes[0].provider == "xai"
+
+
+class TestRouting:
+
+    @pytest.mark.asyncio
+    async def test_primary_success(self):
+        router = FakeRouter(_routes("a", "b"), {"a": [(0, OK)]})
+        result = await router.chat_completion({"messages": []})
+        assert result["model"] == "a"
+        assert router.calls == ["a"]
+        assert len(router.routes[0].latency) == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_after_p95(self, monkeypatch):
+        monkeypatch.setattr(router_module, "HEDGE_MIN_DELAY", 0.01)
+        routes = _routes("a")
+        _warm(routes[0])
+        router = FakeRouter(routes, {"a": [(5.0, OK), (0.0, OK)]})
+
+        result = await asyncio.wait_for(router.chat_completion({"messages": []}), timeout=2)
+        await asyncio.sleep(0)
+        assert result["model"] == "a"
+        assert router.calls == ["a", "a"]
+        assert router.cancelled == ["a"]
+        assert router.stats["hedges"] == 1
+        assert router.stats["hedge_wins"] == 1
+
+    @pytest.mark.asyncio
+    async def test_hedge_loser_usage_recorded(self, monkeypatch):
+        monkeypatch.setattr(router_module, "HEDGE_MIN_DELAY", 0.01)
+        recorded = []
+        monkeypatch.setattr(router_module, "record_llm_usage", lambda *args, **kwargs: recorded.append((args, kwargs)))
+        routes = _routes("a")
+        _warm(routes[0])
+        router = FakeRouter(routes, {"a": [(5.0, OK), (0.0, OK)]})
+
+        await asyncio.wait_for(router.chat_completion({"messages": [{"role": "user", "content": "你好呀"}]}), timeout=2)
+        await asyncio.sleep(0)
+        (args, kwargs), = recorded
+        assert args[:3] == ("xai", "a", {"prompt_tokens": 3 + router_module.MESSAGE_OVERHEAD})
+        assert kwargs == {"kind": "cancelled"}
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_releases_half_open(self, monkeypatch):
+        routes = _routes("a")
+        breaker = routes[0].breaker
+        breaker.opened_at = router_module.time.monotonic() - breaker.cooldown
+        router = FakeRouter(routes, {"a": [(5.0, OK)]}, hedge_enabled=False)
+
+        task = asyncio.create_task(router.chat_completion({"messages": []}))
+        await asyncio.sleep(0.01)
+        assert breaker._probing
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert not breaker._probing
+        assert breaker.state == "open"
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_budget(self, monkeypatch):
+        monkeypatch.setattr(router_module, "HEDGE_MIN_DELAY", 0.01)
+        routes = _routes("a")
+        _warm(routes[0])
+        router = FakeRouter(routes, {"a": [(0.1, OK)]}, budget=RetryBudget(ratio=0.0, min_retries=0))
+        await router.chat_completion({"messages": []})
+        assert router.calls == ["a"]
+        assert router.stats["budget_exhausted"] == 1
+
+    @pytest.mark.asyncio
+    async def test_fallback_on_server_error(self):
+        router = FakeRouter(_routes("a", "b"), {
+            "a": [(0, LLMServiceError("boom", status_code=502))],
+            "b": [(0, OK)],
+        }, hedge_enabled=False)
+        result = await router.chat_completion({"messages": []})
+        assert result["model"] == "b"
+        assert router.stats["fallbacks"] == 1
+        assert router.routes[0].breaker.failures == 1
+
+    @pytest.mark.asyncio
+    async def test_retries_primary_when_list_exhausted(self):
+        router = FakeRouter(_routes("a"), {
+            "a": [(0, LLMServiceError("timeout")), (0, OK)],
+        }, hedge_enabled=False)
+        assert (await router.chat_completion({"messages": []}))["model"] == "a"
+        assert router.calls == ["a", "a"]
+
+    @pytest.mark.asyncio
+    async def test_bad_request_not_retried(self):
+        router = FakeRouter(_routes("a", "b"), {
+            "a": [(0, LLMServiceError("bad response_format", status_code=400))],
+            "b": [(0, OK)],
+        }, hedge_enabled=False)
+        with pytest.raises(LLMServiceError) as exc:
+            await router.chat_completion({"messages": []})
+        assert exc.value.status_code == 400
+        assert router.calls == ["a"]
+        assert router.routes[0].breaker.failures == 0
+
+    @pytest.mark.asyncio
+    async def test_attempt_limit(self):
+        error = LLMServiceError("down", status_code=503)
+        router = FakeRouter(_routes("a"), {"a": [(0, error)] * 5}, hedge_enabled=False)
+        with pytest.raises(LLMServiceError):
+            await router.chat_completion({"messages": []})
+        assert len(router.calls) == router_module.MAX_ATTEMPTS
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_skipped(self):
+        routes = _routes("a", "b")
+        for _ in range(routes[0].breaker.failure_threshold):
+            routes[0].breaker.record_failure()
+        router = FakeRouter(routes, {"b": [(0, OK)]})
+        assert (await router.chat_completion({"messages": []}))["model"] == "b"
+        assert router.calls == ["b"]
+
+    @pytest.mark.asyncio
+    async def test_all_circuits_open(self):
+        routes = _routes("a")
+        for _ in range(routes[0].breaker.failure_threshold):
+            routes[0].breaker.record_failure()
+        router = FakeRouter(routes, {})
+        with pytest.raises(LLMServiceError) as exc:
+            await router.chat_completion({"messages": []})
+        assert exc.value.status_code == 503
+        assert router.get_stats()["routes"]["a@api.x.ai"]["state"] == "open"
+
+
+class TestGrokService:
+
+    @pytest.mark.asyncio
+    async def test_chat_completion_goes_through_router(self):
+        from app.services.llm_service import GrokService
+
+        with patch("app.services.llm_service.llm_router.chat_completion", new=AsyncMock(return_value=OK)) as send:
+            result = await GrokService().chat_completion(
+                messages=[{"role": "user", "content": "hi"}],
+                response_format={"type": "json_object"},
+                prompt_cache_key="v4:luna",
+            )
+        assert result == OK
+        payload, headers = send.call_args.args
+        assert "model" not in payload
+        assert payload["response_format"] == {"type": "json_object"}
+        assert headers == {"x-grok-conv-id": "v4:luna"}
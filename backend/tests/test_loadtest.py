@@ -0,0 +1,147 @@
+"""
+Load Test Harness Tests
+=======================
+
+测试压测工具本身：分位数计算、/metrics 直方图差分与分位数估算、基线对比、
+假 provider 的响应格式、前缀缓存模拟与错误注入、旅程权重解析。
+
+运行: pytest tests/test_loadtest.py -v
+"""
+
+import json
+import random
+
+import httpx
+import pytest
+
+from app.core.metrics import MetricsRegistry
+from app.services.v4.json_parser import json_parser
+from loadtest.fake_provider import ProviderConfig, create_app, EMBEDDING_DIMENSIONS
+from loadtest.journeys import parse_mix, pick_journey
+from loadtest.report import (
+    LatencyRecorder,
+    compare,
+    histogram_quantile,
+    percentile,
+    stage_report,
+)
+
+
+class TestStatistics:
+
+    def test_percentile(self):
+        values = [i / 100 for i in range(1, 101)]
+        assert percentile(values, 0.5) == pytest.approx(0.505)
+        assert percentile(values, 0.99) == pytest.approx(0.9901)
+        assert percentile([], 0.5) == 0.0
+
+    def test_recorder_excludes_errors_from_latency(self):
+        recorder = LatencyRecorder()
+        recorder.record("chat", 0.2, 200)
+        recorder.record("chat", 5.0, 500)
+        entry = recorder.to_dict(duration=1.0)["chat"]
+        assert entry["requests"] == 2
+        assert entry["error_rate"] == 0.5
+        assert entry["latency_ms"]["max"] == 200.0
+
+    def test_histogram_quantile_interpolates(self):
+        buckets = {0.1: 50.0, 0.5: 90.0, 1.0: 100.0, float("inf"): 100.0}
+        assert histogram_quantile(0.5, buckets) == pytest.approx(0.1)
+        assert histogram_quantile(0.7, buckets) == pytest.approx(0.3)
+        assert histogram_quantile(0.95, buckets) == pytest.approx(0.75)
+
+    def test_stage_report_diffs_scrapes(self):
+        registry = MetricsRegistry()
+        stage = registry.histogram("luna_stage_duration_seconds", "stage", ["operation", "stage"])
+        stage.labels(operation="chat", stage="llm").observe(30.0)
+        before = registry.render()
+        for _ in range(100):
+            stage.labels(operation="chat", stage="llm").observe(0.8)
+        report = stage_report(before, registry.render())
+        entry = report["luna_stage_duration_seconds{operation=chat,stage=llm}"]
+        # 压测前那次 30s 的观测不计入
+        assert entry["count"] == 100
+        assert entry["p99"] <= 1000
+
+    def test_compare_flags_slowdown(self):
+        baseline = {"endpoints": {"chat": {"latency_ms": {"p95": 1000.0}}}, "stages": {"llm": {"p95": 800.0}}}
+        current = {"endpoints": {"chat": {"latency_ms": {"p95": 1200.0}}}, "stages": {"llm": {"p95": 820.0}}}
+        regressions = compare(current, baseline, threshold=0.1)
+        assert [r["name"] for r in regressions] == ["chat"]
+
+
+class TestFakeProvider:
+
+    def _client(self, **config):
+        config.setdefault("latency_ms", 0)
+        config.setdefault("jitter_ms", 0)
+        config.setdefault("tokens_per_sec", 10000)
+        app = create_app(ProviderConfig(**config))
+        return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake")
+
+    @pytest.mark.asyncio
+    async def test_chat_reply_parses(self):
+        async with self._client() as client:
+            response = await client.post("/v1/chat/completions", json={
+                "model": "grok", "messages": [{"role": "user", "content": "你好"}],
+            })
+        body = response.json()
+        assert body["usage"]["completion_tokens"] == 60
+        parsed = json_parser.parse_llm_response(body["choices"][0]["message"]["content"])
+        assert parsed.parse_success
+
+    @pytest.mark.asyncio
+    async def test_stream_chunks(self):
+        async with self._client(reply_tokens=10) as client:
+            response = await client.post("/v1/chat/completions", json={"messages": [], "stream": True})
+        lines = [l for l in response.text.splitlines() if l.startswith("data: ")]
+        assert lines[-1] == "data: [DONE]"
+        content = "".join(
+            json.loads(l[6:])["choices"][0]["delta"]["content"]
+            for l in lines[:-1] if json.loads(l[6:])["choices"]
+        )
+        assert json.loads(content)["reply"]
+
+    @pytest.mark.asyncio
+    async def test_prefix_cache_simulation(self):
+        headers = {"x-grok-conv-id": "v4:luna:S1_FRIEND:sfw:abc"}
+        prefix = "人设" * 200
+        async with self._client() as client:
+            usages = []
+            for suffix in ("情绪: 10", "情绪: -30"):
+                response = await client.post("/v1/chat/completions", headers=headers, json={
+                    "messages": [{"role": "system", "content": prefix + suffix},
+                                 {"role": "user", "content": "你好"}],
+                })
+                usages.append(response.json()["usage"])
+        assert usages[0]["prompt_tokens_details"]["cached_tokens"] == 0
+        assert usages[1]["prompt_tokens_details"]["cached_tokens"] >= len(prefix) // 4
+
+    @pytest.mark.asyncio
+    async def test_error_injection(self):
+        async with self._client(error_rate=1.0) as client:
+            response = await client.post("/v1/chat/completions", json={"messages": []})
+            stats = (await client.get("/stats")).json()
+        assert response.status_code == 500
+        assert stats["injected"] == {"error": 1}
+
+    @pytest.mark.asyncio
+    async def test_embeddings_deterministic(self):
+        async with self._client() as client:
+            first = (await client.post("/v1/embeddings", json={"input": ["a", "b"]})).json()
+            second = (await client.post("/v1/embeddings", json={"input": "a"})).json()
+        assert len(first["data"][0]["embedding"]) == EMBEDDING_DIMENSIONS
+        assert first["data"][0]["embedding"] == second["data"][0]["embedding"]
+
+
+class TestJourneyMix:
+
+    def test_parse_mix(self):
+        assert parse_mix("chat=0.7,poll=0.3") == {"chat": 0.7, "poll": 0.3}
+        with pytest.raises(ValueError):
+            parse_mix("nope=1")
+
+    def test_pick_journey_respects_weights(self):
+        rng = random.Random(1)
+        picks = [pick_journey(rng, {"chat": 1.0, "poll": 0.0}) for _ in range(50)]
+        assert set(picks) == {"chat"}
@@ -0,0 +1,206 @@
+"""
+Memory Extraction Worker Tests
+==============================
+
+测试批量记忆提取：缓冲、满批次触发、空闲触发、job worker 不经缓冲直接提取、单次 LLM 调用 + 单事务写入。
+
+运行: pytest tests/test_memory_extraction_worker.py -v
+"""
+
+import asyncio
+import json
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.services.memory_extraction_worker import MemoryExtractionWorker
+from app.services.memory_system_v2.memory_manager import MemoryManager
+
+TEST_USER_ID = "worker_user"
+TEST_CHARACTER_ID = "luna"
+
+
+def _llm_response(payload: dict) -> dict:
+    return {
+        "choices": [{"message": {"content": json.dumps(payload, ensure_ascii=False)}}],
+        "usage": {"total_tokens": 80},
+    }
+
+
+@pytest.fixture
+def sqlite_db(monkeypatch):
+    """内存 SQLite，替换 get_db"""
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+    from app.models.database.chat_models import Base as ChatBase
+    from app.models.database import memory_v2_models, user_memory_models  # noqa: registers models
+
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    async def _init():
+        async with engine.begin() as conn:
+            await conn.run_sync(ChatBase.metadata.create_all)
+    asyncio.get_event_loop().run_until_complete(_init())
+
+    commits = []
+
+    @asynccontextmanager
+    async def mock_get_db():
+        async with factory() as session:
+            try:
+                yield session
+                await session.commit()
+                commits.append(1)
+            except Exception:
+                await session.rollback()
+                raise
+
+    monkeypatch.setattr("app.core.database.get_db", mock_get_db)
+    monkeypatch.setattr("app.services.memory_db_service.get_db", mock_get_db)
+    monkeypatch.setattr("app.services.user_memory_service.get_db", mock_get_db)
+    yield commits
+    asyncio.get_event_loop().run_until_complete(engine.dispose())
+
+
+def _make_worker(llm_payload: dict, batch_turns: int = 3, idle_seconds: float = 60, tier: str = "basic"):
+    llm = MagicMock()
+    llm.chat_completion = AsyncMock(return_value=_llm_response(llm_payload))
+    manager = MemoryManager(db_service=None, llm_service=llm)
+    worker = MemoryExtractionWorker(
+        batch_turns=batch_turns, idle_seconds=idle_seconds, memory_manager=manager
+    )
+    worker._get_tier = AsyncMock(return_value=tier)
+    return worker, manager, llm
+
+
+class TestBuffering:
+    """测试缓冲与触发时机"""
+
+    @pytest.mark.asyncio
+    async def test_buffers_until_batch_size(self):
+        worker, _, llm = _make_worker({}, batch_turns=3)
+        worker.flush = AsyncMock()
+
+        await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "你好", "嗨～")
+        await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "今天好累", "辛苦啦")
+        assert worker.pending_turns() == 2
+        worker.flush.assert_not_called()
+
+        await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "我喜欢猫", "好可爱")
+        worker.flush.assert_awaited_once_with(TEST_USER_ID, TEST_CHARACTER_ID)
+        await worker.drain()
+
+    @pytest.mark.asyncio
+    async def test_idle_window_triggers_flush(self):
+        worker, _, llm = _make_worker({}, batch_turns=10, idle_seconds=0.01, tier="free")
+
+        await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "吃了吗", "吃了")
+        assert worker.pending_turns() == 1
+        await asyncio.sleep(0.05)
+        assert worker.pending_turns() == 0
+        assert worker.stats["batches"] == 1
+
+    @pytest.mark.asyncio
+    async def test_small_talk_without_quota_skips_llm(self):
+        worker, _, llm = _make_worker({}, batch_turns=2, tier="free")
+
+        await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "吃了吗", "吃了")
+        await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "今天天气不错", "是呀")
+
+        llm.chat_completion.assert_not_called()
+        assert worker.stats["llm_skipped"] == 1
+
+    @pytest.mark.asyncio
+    async def test_drain_flushes_pending(self):
+        worker, _, _ = _make_worker({}, batch_turns=10, idle_seconds=60, tier="free")
+        await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "晚安", "晚安～")
+        await worker.drain()
+        assert worker.pending_turns() == 0
+        assert not worker._idle_tasks
+
+    @pytest.mark.asyncio
+    async def test_extract_turns_bypasses_buffer(self):
+        from app.services.memory_extraction_worker import BufferedTurn
+
+        worker, _, llm = _make_worker({}, batch_turns=10, tier="free")
+        result = await worker.extract_turns(TEST_USER_ID, TEST_CHARACTER_ID, [BufferedTurn("吃了吗", "吃了")])
+        assert result == {"turns": 1, "skipped": True}
+        assert worker.pending_turns() == 0
+        assert not worker._idle_tasks
+
+    @pytest.mark.asyncio
+    async def test_extract_turns_raises_for_retry(self):
+        from app.services.memory_extraction_worker import BufferedTurn
+
+        worker, _, _ = _make_worker({}, tier="free")
+        worker._extract_and_save = AsyncMock(side_effect=RuntimeError("llm down"))
+        with pytest.raises(RuntimeError):
+            await worker.extract_turns(TEST_USER_ID, TEST_CHARACTER_ID, [BufferedTurn("a", "b")])
+        assert worker.stats["failures"] == 1
+
+
+class TestCombinedExtraction:
+    """测试合并提取写入"""
+
+    @pytest.mark.asyncio
+    async def test_one_llm_call_one_transaction(self, sqlite_db):
+        payload = {
+            "semantic": {"user_name": "小明", "likes": ["猫"]},
+            "episodic": {
+                "event_found": True, "actually_happened": True,
+                "event_type": "confession", "summary": "用户表白了", "importance": 4, "turn": 2,
+            },
+            "user_memories": [
+                {"category": "preference", "title": "喜欢猫", "content": "用户很喜欢猫", "importance": 2},
+                {"category": "INVALID", "title": "x", "content": "y", "importance": 2},
+            ],
+        }
+        worker, manager, llm = _make_worker(payload, batch_turns=2)
+
+        with patch("app.services.vector_service.vector_service") as vs:
+            vs.embed_text = AsyncMock(side_effect=Exception("no embeddings in tests"))
+            await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "我叫小明，我喜欢猫", "记住啦")
+            await worker.submit_turn(TEST_USER_ID, TEST_CHARACTER_ID, "我爱你", "我也爱你")
+
+        assert llm.chat_completion.await_count == 1
+        assert len(sqlite_db) == 1  # 单个事务提交
+
+        semantic = await manager.get_semantic_memory(TEST_USER_ID, TEST_CHARACTER_ID)
+        assert semantic.user_name == "小明"
+
+        episodes = await manager.get_episodic_memories(TEST_USER_ID, TEST_CHARACTER_ID)
+        assert len(episodes) == 1
+        assert episodes[0].key_dialogue[0] == "我爱你"
+
+        from app.services.user_memory_service import get_memories
+        memories = await get_memories(TEST_USER_ID, TEST_CHARACTER_ID)
+        assert [m["title"] for m in memories] == ["喜欢猫"]
+
+    @pytest.mark.asyncio
+    async def test_transaction_failure_leaves_cache_untouched(self, sqlite_db, monkeypatch):
+        payload = {"semantic": {"user_name": "小红"}, "episodic": {"event_found": False}, "user_memories": []}
+        worker, manager, _ = _make_worker(payload, batch_turns=1)
+
+        from app.services.memory_db_service import memory_db_service
+        monkeypatch.setattr(
+            memory_db_service, "save_semantic_memory", AsyncMock(side_effect=RuntimeError("db down"))
+        )
+
+        await worker.submit_turn(TEST_USER_ID, "fail_char", "我叫小红", "你好小红")
+
+        semantic = await manager.get_semantic_memory(TEST_USER_ID, "fail_char")
+        assert semantic.user_name is None
+        assert worker.stats["failures"] == 1
+
+    def test_parse_filters_unhappened_events(self):
+        parsed = MemoryExtractionWorker._parse(json.dumps({
+            "semantic": {"user_name": None, "occupation": "程序员"},
+            "episodic": {"event_found": True, "actually_happened": False, "event_type": "intimate"},
+        }))
+        assert parsed["semantic"] == {"occupation": "程序员"}
+        assert parsed["episodic"] is None
+        assert parsed["user_memories"] == []
+
+    def test_parse_garbage(self):
+        parsed = MemoryExtractionWorker._parse("not json")
+        assert parsed == {"semantic": {}, "episodic": None, "user_memories": []}
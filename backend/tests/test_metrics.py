@@ -0,0 +1,127 @@
+"""
+Metrics Tests
+=============
+
+测试 Prometheus 文本格式输出：直方图 / 计数器格式、PerfTracker 与 perf_track 接入、
+LLM token 与费用计数、抓取时采集（缓存命中率 / 后台队列深度，按指标族归组、
+累计值为 counter）、/metrics 接口。
+
+运行: pytest tests/test_metrics.py -v
+"""
+
+import pytest
+
+from app.core.metrics import MetricsRegistry, metrics, record_llm_usage
+from app.core.perf import PerfTracker, perf_track
+
+
+class TestRegistry:
+
+    def test_histogram_format(self):
+        registry = MetricsRegistry()
+        h = registry.histogram("x_seconds", "X latency", ["stage"], buckets=(0.1, 1.0))
+        h.labels(stage="llm").observe(0.05)
+        h.labels(stage="llm").observe(0.5)
+        h.labels(stage="llm").observe(5)
+        text = registry.render()
+
+        assert "# TYPE x_seconds histogram" in text
+        assert 'x_seconds_bucket{stage="llm",le="0.1"} 1' in text
+        assert 'x_seconds_bucket{stage="llm",le="1"} 2' in text
+        assert 'x_seconds_bucket{stage="llm",le="+Inf"} 3' in text
+        assert 'x_seconds_count{stage="llm"} 3' in text
+        assert 'x_seconds_sum{stage="llm"} 5.55' in text
+
+    def test_counter_and_label_escaping(self):
+        registry = MetricsRegistry()
+        c = registry.counter("y_total", "Y", ["name"])
+        c.labels(name='a"b').inc(2)
+        assert 'y_total{name="a\\"b"} 2' in registry.render()
+        with pytest.raises(ValueError):
+            c.labels(name="a").inc(-1)
+
+    def test_failing_collector_skipped(self):
+        registry = MetricsRegistry()
+
+        def broken():
+            raise RuntimeError("pool gone")
+
+        registry.register_collector("gauge", broken)
+        registry.register_collector("gauge", lambda: [("z_depth", {"queue": "q"}, 3)])
+        text = registry.render()
+        assert 'z_depth{queue="q"} 3' in text
+
+    def test_collector_samples_grouped_per_family(self):
+        registry = MetricsRegistry()
+        registry.register_collector("gauge", lambda: [
+            ("q_depth", {"queue": "a"}, 1),
+            ("q_dropped_total", {"queue": "a"}, 5),
+            ("q_depth", {"queue": "b"}, 2),
+            ("q_dropped_total", {"queue": "b"}, 0),
+        ], "Queue stats", {
+            "q_depth": ("gauge", "Tasks waiting"),
+            "q_dropped_total": ("counter", "Tasks dropped"),
+        })
+        registry.register_collector("gauge", lambda: [("q_depth", {"queue": "c"}, 3)])
+        lines = registry.render().splitlines()
+
+        assert lines == [
+            "# HELP q_depth Tasks waiting",
+            "# TYPE q_depth gauge",
+            'q_depth{queue="a"} 1',
+            'q_depth{queue="b"} 2',
+            'q_depth{queue="c"} 3',
+            "# HELP q_dropped_total Tasks dropped",
+            "# TYPE q_dropped_total counter",
+            'q_dropped_total{queue="a"} 5',
+            'q_dropped_total{queue="b"} 0',
+        ]
+
+
+class TestAppMetrics:
+
+    def test_perf_tracker_feeds_histograms(self):
+        tracker = PerfTracker()
+        tracker.mark("precompute", 0.01)
+        tracker.mark("llm", 1.2)
+        before = metrics.STAGE_LATENCY.labels(operation="metrics_test", stage="llm").count
+        tracker.log_summary("metrics_test")
+        assert metrics.STAGE_LATENCY.labels(operation="metrics_test", stage="llm").count == before + 1
+        assert metrics.OPERATION_LATENCY.labels(operation="metrics_test").count >= 1
+
+    def test_perf_track_decorator(self):
+        @perf_track("metrics_test_fn")
+        def work():
+            return 1
+
+        work()
+        assert metrics.FUNCTION_LATENCY.labels(name="metrics_test_fn").count >= 1
+
+    def test_llm_usage_tokens_and_cost(self):
+        tokens = metrics.LLM_TOKENS.labels(provider="test", model="m", type="prompt")
+        before = tokens.value
+        cost = record_llm_usage(
+            "test", "m",
+            {"prompt_tokens": 1000, "completion_tokens": 500, "total_tokens": 1500},
+            {"input": 2.0, "output": 8.0},
+        )
+        assert cost == pytest.approx(0.006)
+        assert tokens.value == before + 1000
+        assert metrics.LLM_COST.labels(provider="test", model="m").value >= 0.006
+
+    def test_scrape_time_collectors(self):
+        text = metrics.render()
+        assert 'luna_background_queue_depth{queue="memory_extraction_buffer"}' in text
+        assert 'luna_cache_hit_ratio{cache="prompt_fragment"}' in text
+        assert "# TYPE luna_cache_hits_total counter" in text
+        assert "# TYPE luna_job_queue_enqueued_total counter" in text
+        # 每个指标族只声明一次
+        assert text.count("# TYPE luna_background_queue_depth ") == 1
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self):
+        from app.main import metrics as metrics_endpoint
+
+        response = await metrics_endpoint()
+        assert response.media_type.startswith("text/plain")
+        assert b"luna_operation_duration_seconds" in response.body
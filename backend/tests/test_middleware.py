@@ -0,0 +1,143 @@
+"""
+Middleware Tests
+================
+
+测试纯 ASGI 中间件栈：共享请求上下文、计费路径预编译匹配、非计费路径跳过、
+SSE 流式响应逐块透传（不被缓冲 / 压缩）。
+
+运行: pytest tests/test_middleware.py -v
+"""
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app.middleware.auth_middleware import AuthMiddleware
+from app.middleware.billing_middleware import BillingMiddleware, BILLABLE_ENDPOINTS
+from app.middleware.logging_middleware import LoggingMiddleware
+from app.middleware.gzip_middleware import StreamingAwareGZipMiddleware
+from app.middleware.context import STATE_KEY
+from app.models.schemas import UserContext
+
+
+def _build_app():
+    app = FastAPI()
+    seen = {}
+
+    @app.get("/api/v1/ping")
+    async def ping(req: Request):
+        seen["user"] = req.state.user
+        seen["billing"] = getattr(req.state, "billing", None)
+        seen["ctx"] = getattr(req.state, STATE_KEY)
+        return {"ok": True}
+
+    @app.get("/health")
+    async def health(req: Request):
+        seen["user"] = getattr(req.state, "user", "unset")
+        return {"ok": True}
+
+    @app.post("/api/v1/chat/stream")
+    async def stream(req: Request):
+        seen["billing"] = req.state.billing
+
+        async def gen():
+            for i in range(3):
+                yield f"event: chunk\ndata: {i}\n\n" + "x" * 600
+
+        return StreamingResponse(gen(), media_type="text/event-stream")
+
+    app.add_middleware(StreamingAwareGZipMiddleware, minimum_size=100)
+    app.add_middleware(LoggingMiddleware)
+    app.add_middleware(BillingMiddleware)
+    app.add_middleware(AuthMiddleware)
+    return app, seen
+
+
+async def _call(app, method, path, headers=None):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": ("127.0.0.1", 1234),
+        "server": ("test", 80),
+    }
+    messages = []
+    sent_request = False
+
+    async def receive():
+        nonlocal sent_request
+        if not sent_request:
+            sent_request = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+@pytest.fixture
+def fake_auth(monkeypatch):
+    async def resolve(self, token):
+        return UserContext(user_id=token, subscription_tier="free", is_subscribed=False)
+
+    async def mock_user(self, header_user_id):
+        return UserContext(user_id=header_user_id or "demo-user-123")
+
+    monkeypatch.setattr(AuthMiddleware, "_validate_token", resolve)
+    monkeypatch.setattr(AuthMiddleware, "_create_mock_user", mock_user)
+
+
+class TestMiddlewareStack:
+
+    @pytest.mark.asyncio
+    async def test_shared_context_and_user(self, fake_auth):
+        app, seen = _build_app()
+        messages = await _call(app, "GET", "/api/v1/ping", {"Authorization": "Bearer user-1"})
+        assert messages[0]["status"] == 200
+        assert seen["user"].user_id == "user-1"
+        assert seen["ctx"].user is seen["user"]
+        # 非计费路径不创建计费上下文
+        assert seen["billing"] is None
+
+    @pytest.mark.asyncio
+    async def test_public_path_skips_auth(self, fake_auth):
+        app, seen = _build_app()
+        await _call(app, "GET", "/health")
+        assert seen["user"] == "unset"
+
+    @pytest.mark.asyncio
+    async def test_sse_chunks_pass_through(self, fake_auth):
+        app, seen = _build_app()
+        messages = await _call(
+            app, "POST", "/api/v1/chat/stream",
+            {"X-User-ID": "user-2", "Accept-Encoding": "gzip"},
+        )
+        start = messages[0]
+        assert start["status"] == 200
+        assert b"content-encoding" not in dict(start["headers"])
+
+        bodies = [m["body"] for m in messages[1:] if m.get("body")]
+        assert len(bodies) == 3
+        assert bodies[0].startswith(b"event: chunk\ndata: 0")
+        assert seen["billing"].user_id == "user-2"
+
+
+class TestBillingPathMatching:
+
+    def test_endpoint_type(self):
+        middleware = BillingMiddleware(app=None)
+        for path, etype in BILLABLE_ENDPOINTS.items():
+            assert middleware.endpoint_type(path) == etype
+            assert middleware.endpoint_type(path + "/extra") == etype
+        assert middleware.endpoint_type("/api/v1/chat/sessions") is None
+        assert middleware.endpoint_type("/health") is None
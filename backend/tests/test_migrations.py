@@ -0,0 +1,112 @@
+"""
+Schema Migrations Tests
+=======================
+
+测试带版本号的迁移：新库从 0 迁到最新并记入 schema_version、重复执行为空操作、
+旧库（无版本表、缺列）补列补索引、指定 target 版本、启动检查（SQLite 自动迁移 / 关闭时只警告）。
+
+运行: pytest tests/test_migrations.py -v
+"""
+
+import pytest
+from sqlalchemy import event, inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core import migrations as module
+from app.core.migrations import LATEST_VERSION, MIGRATIONS, current_version, ensure_schema, migrate
+
+
+@pytest.fixture
+def engine(tmp_path):
+    # NullPool：用完即关，不在测试之间留下连接
+    return create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+
+
+async def _columns(engine, table):
+    async with engine.connect() as conn:
+        return await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns(table)})
+
+
+async def _indexes(engine, table):
+    async with engine.connect() as conn:
+        return await conn.run_sync(lambda c: {ix["name"] for ix in inspect(c).get_indexes(table)})
+
+
+class TestMigrate:
+
+    def test_versions_increasing(self):
+        versions = [m.version for m in MIGRATIONS]
+        assert versions == list(range(1, len(versions) + 1))
+
+    @pytest.mark.asyncio
+    async def test_fresh_database(self, engine):
+        assert await current_version(engine) == 0
+        applied = await migrate(engine)
+        assert applied == [m.version for m in MIGRATIONS]
+        assert await current_version(engine) == LATEST_VERSION
+        assert {"context_summary", "summary_until", "intro_shown"} <= await _columns(engine, "chat_sessions")
+        assert "idx_chat_messages_session_created" in await _indexes(engine, "chat_messages")
+
+        # 再执行一次什么都不做
+        assert await migrate(engine) == []
+
+    @pytest.mark.asyncio
+    async def test_legacy_database_gets_missing_columns(self, engine):
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "CREATE TABLE chat_sessions (id VARCHAR(36) PRIMARY KEY, user_id VARCHAR(100), "
+                "character_id VARCHAR(36), title VARCHAR(255))"
+            ))
+            await conn.execute(text("INSERT INTO chat_sessions (id, user_id, character_id) VALUES ('s1', 'u1', 'c1')"))
+            await conn.execute(text(
+                "CREATE TABLE active_effects (id VARCHAR(128) PRIMARY KEY, user_id VARCHAR(128), "
+                "character_id VARCHAR(128), effect_type VARCHAR(64))"
+            ))
+            await conn.execute(text(
+                "CREATE TABLE user_subscriptions (id VARCHAR(100) PRIMARY KEY, user_id VARCHAR(100), "
+                "last_daily_reward_date VARCHAR(10))"
+            ))
+
+        await migrate(engine)
+        assert {"context_summary", "summary_until", "intro_shown"} <= await _columns(engine, "chat_sessions")
+        assert {"stage_boost", "allows_nsfw", "xp_multiplier"} <= await _columns(engine, "active_effects")
+        assert "consecutive_checkin_days" in await _columns(engine, "user_subscriptions")
+        async with engine.connect() as conn:
+            rows = (await conn.execute(text("SELECT id FROM chat_sessions"))).all()
+        assert [r[0] for r in rows] == ["s1"]
+
+    @pytest.mark.asyncio
+    async def test_target_version(self, engine):
+        assert await migrate(engine, target=1) == [1]
+        assert await current_version(engine) == 1
+        assert await migrate(engine) == [m.version for m in MIGRATIONS[1:]]
+
+
+class TestEnsureSchema:
+
+    @pytest.mark.asyncio
+    async def test_sqlite_auto_migrates(self, engine, monkeypatch):
+        monkeypatch.setattr(module, "AUTO_MIGRATE", "")
+        assert await ensure_schema(engine) == LATEST_VERSION
+        assert await current_version(engine) == LATEST_VERSION
+
+    @pytest.mark.asyncio
+    async def test_disabled_only_warns(self, engine, monkeypatch, caplog):
+        monkeypatch.setattr(module, "AUTO_MIGRATE", "false")
+        assert await ensure_schema(engine) == 0
+        assert "python -m app.core.migrations" in caplog.text
+        assert await current_version(engine) == 0
+
+    @pytest.mark.asyncio
+    async def test_up_to_date_is_single_query(self, engine, monkeypatch):
+        await migrate(engine)
+        statements = []
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        monkeypatch.setattr(module, "AUTO_MIGRATE", "true")
+        assert await ensure_schema(engine) == LATEST_VERSION
+        assert statements == ["SELECT MAX(version) FROM schema_version"]
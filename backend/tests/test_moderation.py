@@ -6,8 +6,10 @@ Tests cover:
 - Local pattern checking
 - OpenAI API integration (mocked)
 - Error handling and fallback behavior
+- Verdict cache and local-first cascade / hold-and-release gate
 """
 
+import asyncio
 import pytest
 from unittest.mock import patch, AsyncMock, MagicMock
 import os
@@ -17,9 +19,20 @@ from app.utils.moderation import (
     ModerationResult,
     check_local_patterns,
     _openai_moderation,
+    moderate_cascade,
+    ModerationGate,
+    ModerationVerdictCache,
+    verdict_cache,
 )
 
 
+@pytest.fixture(autouse=True)
+def clear_verdict_cache():
+    verdict_cache.clear()
+    yield
+    verdict_cache.clear()
+
+
 class TestModerationResult:
     """Test ModerationResult dataclass."""
     
@@ -249,6 +262,103 @@ class TestOpenAIModeration:
             assert "Empty results" in (result.error or "")
 
 
+class TestVerdictCache:
+    """Test hash-keyed verdict cache."""
+    
+    def test_hit_returns_copy_marked_cache(self):
+        cache = ModerationVerdictCache(ttl_seconds=60)
+        cache.set("hello", "input", ModerationResult(flagged=True, categories=["hate"]))
+        hit = cache.get("hello", "input")
+        assert hit.flagged is True
+        assert hit.source == "cache"
+        hit.categories.append("x")
+        assert cache.get("hello", "input").categories == ["hate"]
+        assert cache.get("hello", "output") is None
+    
+    def test_errors_not_cached(self):
+        cache = ModerationVerdictCache(ttl_seconds=60)
+        cache.set("hello", "input", ModerationResult(error="API timeout"))
+        assert cache.get("hello", "input") is None
+    
+    def test_expired_entry_dropped(self):
+        cache = ModerationVerdictCache(ttl_seconds=0)
+        cache.set("hello", "input", ModerationResult())
+        assert cache.get("hello", "input") is None
+        assert cache.get_stats()["entries"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_remote_verdict_cached(self):
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "sk-x", "MODERATION_ENABLED": "true"}):
+            with patch("app.utils.moderation._openai_moderation", new_callable=AsyncMock) as mock_api:
+                mock_api.return_value = ModerationResult(flagged=False)
+                await moderate_content("same text")
+                second = await moderate_content("same text")
+                assert mock_api.await_count == 1
+                assert second.source == "cache"
+
+
+class TestModerationCascade:
+    """Test local-first cascade and hold-and-release gate."""
+    
+    @pytest.mark.asyncio
+    async def test_local_pattern_skips_remote(self):
+        with patch("app.utils.moderation.moderate_content", new_callable=AsyncMock) as remote:
+            result = await moderate_cascade("how to hack a bank")
+            assert result.flagged is True
+            assert result.source == "local"
+            remote.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_precompute_block_skips_remote(self):
+        with patch("app.utils.moderation.moderate_content", new_callable=AsyncMock) as remote:
+            result = await moderate_cascade("anything", safety_flag="BLOCK")
+            assert result.flagged is True
+            assert result.source == "precompute"
+            remote.assert_not_awaited()
+    
+    @pytest.mark.asyncio
+    async def test_undecided_goes_remote(self):
+        with patch("app.utils.moderation.moderate_content", new_callable=AsyncMock) as remote:
+            remote.return_value = ModerationResult(flagged=True, categories=["violence"])
+            result = await moderate_cascade("borderline text", safety_flag="OK")
+            assert result.flagged is True
+            remote.assert_awaited_once_with("borderline text", "input")
+    
+    @pytest.mark.asyncio
+    async def test_gate_overlaps_remote_with_other_work(self):
+        started = asyncio.Event()
+        release = asyncio.Event()
+        
+        async def slow_remote(text, mode):
+            started.set()
+            await release.wait()
+            return ModerationResult(flagged=False)
+        
+        with patch("app.utils.moderation.moderate_content", side_effect=slow_remote):
+            gate = ModerationGate("hello there")
+            pre = await gate.prescreen()
+            assert pre.source == "pending" and not gate.decided
+            
+            # 远程审核在后台进行，调用方可以同时做 LLM 调用
+            await asyncio.wait_for(started.wait(), 1)
+            release.set()
+            result = await gate.verdict()
+            assert result.flagged is False and gate.decided
+    
+    @pytest.mark.asyncio
+    async def test_gate_timeout_fails_open(self):
+        async def hang(text, mode):
+            await asyncio.sleep(10)
+        
+        with patch("app.utils.moderation.moderate_content", side_effect=hang):
+            gate = ModerationGate("hello there")
+            await gate.prescreen()
+            result = await gate.verdict(timeout=0.01)
+            assert result.flagged is False
+            assert result.error == "Moderation timed out"
+            gate.cancel()
+
+
 class TestIntegration:
     """Integration tests (require OPENAI_API_KEY to be set)."""
     
@@ -0,0 +1,128 @@
+"""
+Principal Cache Tests
+=====================
+
+测试已验证 token 的身份缓存：命中、过期（TTL / token exp）、按用户失效、并发单次解析，
+以及 AuthMiddleware / 订阅写入的接入。
+
+运行: pytest tests/test_principal_cache.py -v
+"""
+
+import asyncio
+import base64
+import json
+import time
+import pytest
+
+from app.core.principal_cache import PrincipalCache, token_expiry, principal_cache
+from app.models.schemas import UserContext
+
+
+def _ctx(user_id="u1", tier="free"):
+    return UserContext(user_id=user_id, email=f"{user_id}@x.com", subscription_tier=tier, is_subscribed=tier != "free")
+
+
+def _jwt(exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"exp": exp}).encode()).decode().rstrip("=")
+    return f"header.{payload}.sig"
+
+
+class TestPrincipalCache:
+
+    def test_hit_and_miss(self):
+        cache = PrincipalCache(ttl_seconds=60)
+        assert cache.get("guest_token_u1") is None
+        cache.set("guest_token_u1", _ctx())
+        hit = cache.get("guest_token_u1")
+        assert hit.user_id == "u1" and hit.email == "u1@x.com"
+        assert cache.get_stats()["hits"] == 1
+
+    def test_ttl_expiry(self):
+        cache = PrincipalCache(ttl_seconds=60)
+        cache.set("guest_token_u1", _ctx())
+        cache._entries[next(iter(cache._entries))] = (time.time() - 1, _ctx())
+        assert cache.get("guest_token_u1") is None
+        assert cache.get_stats()["entries"] == 0
+
+    def test_token_exp_caps_ttl(self):
+        cache = PrincipalCache(ttl_seconds=3600)
+        token = _jwt(time.time() + 5)
+        assert token_expiry(token) == pytest.approx(time.time() + 5, abs=1)
+        cache.set(token, _ctx())
+        expires_at = next(iter(cache._entries.values()))[0]
+        assert expires_at <= time.time() + 5
+
+        # 已过期的 token 不缓存
+        cache.set(_jwt(time.time() - 1), _ctx("u2"))
+        assert len(cache._entries) == 1
+        assert token_expiry("luna_token_abc_123") is None
+
+    def test_invalidate_by_user(self):
+        cache = PrincipalCache(ttl_seconds=60)
+        cache.set("t1", _ctx("u1"))
+        cache.set("t2", _ctx("u1"))
+        cache.set("t3", _ctx("u2"))
+        assert cache.invalidate("u1") == 2
+        assert cache.get("t1") is None and cache.get("t3") is not None
+        cache.invalidate()
+        assert cache.get("t3") is None
+
+    @pytest.mark.asyncio
+    async def test_single_flight_resolution(self):
+        cache = PrincipalCache(ttl_seconds=60)
+        calls = []
+
+        async def resolver(token):
+            calls.append(token)
+            await asyncio.sleep(0.01)
+            return _ctx()
+
+        results = await asyncio.gather(*[cache.get_or_resolve("tok", resolver) for _ in range(5)])
+        assert len(calls) == 1
+        assert all(r.user_id == "u1" for r in results)
+
+    @pytest.mark.asyncio
+    async def test_failed_resolution_not_cached(self):
+        cache = PrincipalCache(ttl_seconds=60)
+
+        async def resolver(token):
+            return None
+
+        assert await cache.get_or_resolve("bad", resolver) is None
+        assert cache.get_stats()["entries"] == 0
+
+
+class TestAuthIntegration:
+
+    @pytest.fixture(autouse=True)
+    def clean(self):
+        principal_cache.clear()
+        yield
+        principal_cache.clear()
+
+    @pytest.mark.asyncio
+    async def test_middleware_resolves_once(self, monkeypatch):
+        from app.middleware.auth_middleware import AuthMiddleware
+
+        middleware = AuthMiddleware(app=None)
+        calls = []
+
+        async def resolve(token):
+            calls.append(token)
+            return _ctx("guest-abc")
+
+        monkeypatch.setattr(middleware, "_resolve_token", resolve)
+        first = await middleware._validate_token("guest_token_guest-abc")
+        second = await middleware._validate_token("guest_token_guest-abc")
+        assert first.user_id == second.user_id == "guest-abc"
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_subscription_write_invalidates(self, monkeypatch):
+        import app.services.subscription_service as sub
+
+        monkeypatch.setattr(sub, "MOCK_MODE", True)
+        monkeypatch.setattr(sub, "_mock_subscriptions", {})
+        principal_cache.set("guest_token_guest-abc", _ctx("guest-abc"))
+        await sub.subscription_service._save_subscription_record("guest-abc", {"tier": "premium"})
+        assert principal_cache.get("guest_token_guest-abc") is None
@@ -0,0 +1,137 @@
+"""
+Prompt Fragment Cache Tests
+===========================
+
+测试版本化 prompt 片段缓存：命中、写路径失效、TTL 过期。
+
+运行: pytest tests/test_prompt_fragment_cache.py -v
+"""
+
+import pytest
+
+from app.services.prompt_fragment_cache import (
+    PromptFragmentCache,
+    FRAGMENT_SEMANTIC,
+    FRAGMENT_GIFTS,
+    FRAGMENT_EVENTS,
+)
+
+USER = "cache_user"
+CHAR = "luna"
+
+
+class TestPromptFragmentCache:
+    """测试缓存读写与版本失效"""
+
+    def test_build_once_until_bumped(self):
+        """未 bump 时只构建一次"""
+        cache = PromptFragmentCache()
+        calls = []
+
+        def builder():
+            calls.append(1)
+            return f"profile v{len(calls)}"
+
+        assert cache.get_or_build_sync(USER, CHAR, FRAGMENT_SEMANTIC, builder) == "profile v1"
+        assert cache.get_or_build_sync(USER, CHAR, FRAGMENT_SEMANTIC, builder) == "profile v1"
+        assert len(calls) == 1
+
+        cache.bump(USER, CHAR, FRAGMENT_SEMANTIC)
+        assert cache.get_or_build_sync(USER, CHAR, FRAGMENT_SEMANTIC, builder) == "profile v2"
+        assert len(calls) == 2
+
+    def test_bump_is_scoped_to_fragment_and_pair(self):
+        """bump 只影响对应 (user, character, fragment)"""
+        cache = PromptFragmentCache()
+        cache.set(USER, CHAR, FRAGMENT_GIFTS, "gifts")
+        cache.set(USER, CHAR, FRAGMENT_EVENTS, "events")
+        cache.set("other_user", CHAR, FRAGMENT_GIFTS, "other gifts")
+
+        cache.bump(USER, CHAR, FRAGMENT_GIFTS)
+
+        assert cache.get(USER, CHAR, FRAGMENT_GIFTS) is None
+        assert cache.get(USER, CHAR, FRAGMENT_EVENTS) == "events"
+        assert cache.get("other_user", CHAR, FRAGMENT_GIFTS) == "other gifts"
+
+    def test_variants_cached_separately(self):
+        """同一片段的不同变体（如不同亲密度）分别缓存"""
+        cache = PromptFragmentCache()
+        cache.set(USER, CHAR, FRAGMENT_SEMANTIC, "low", variant="profile_section:1")
+        cache.set(USER, CHAR, FRAGMENT_SEMANTIC, "high", variant="profile_section:30")
+
+        assert cache.get(USER, CHAR, FRAGMENT_SEMANTIC, variant="profile_section:1") == "low"
+        assert cache.get(USER, CHAR, FRAGMENT_SEMANTIC, variant="profile_section:30") == "high"
+
+    def test_empty_string_is_cached(self):
+        """空结果（如没有礼物）也要缓存，避免每轮查库"""
+        cache = PromptFragmentCache()
+        calls = []
+
+        def builder():
+            calls.append(1)
+            return ""
+
+        cache.get_or_build_sync(USER, CHAR, FRAGMENT_GIFTS, builder)
+        cache.get_or_build_sync(USER, CHAR, FRAGMENT_GIFTS, builder)
+        assert len(calls) == 1
+
+    def test_ttl_expiry(self):
+        """超过 TTL 的条目视为失效"""
+        cache = PromptFragmentCache(ttl_seconds=0)
+        cache.set(USER, CHAR, FRAGMENT_EVENTS, "events")
+        assert cache.get(USER, CHAR, FRAGMENT_EVENTS) is None
+
+    def test_lru_bound(self):
+        """条目数超过上限时淘汰最久未用的"""
+        cache = PromptFragmentCache(max_entries=2)
+        cache.set("u1", CHAR, FRAGMENT_GIFTS, "a")
+        cache.set("u2", CHAR, FRAGMENT_GIFTS, "b")
+        cache.get("u1", CHAR, FRAGMENT_GIFTS)
+        cache.set("u3", CHAR, FRAGMENT_GIFTS, "c")
+
+        assert cache.get("u1", CHAR, FRAGMENT_GIFTS) == "a"
+        assert cache.get("u2", CHAR, FRAGMENT_GIFTS) is None
+
+    def test_unknown_fragment_rejected(self):
+        cache = PromptFragmentCache()
+        with pytest.raises(ValueError):
+            cache.bump(USER, CHAR, "nope")
+
+    @pytest.mark.asyncio
+    async def test_async_build_not_cached_if_bumped_during_build(self):
+        """构建期间发生写入时，不缓存旧结果"""
+        cache = PromptFragmentCache()
+
+        async def builder():
+            cache.bump(USER, CHAR, FRAGMENT_GIFTS)
+            return "stale"
+
+        assert await cache.get_or_build(USER, CHAR, FRAGMENT_GIFTS, builder) == "stale"
+        assert cache.get(USER, CHAR, FRAGMENT_GIFTS) is None
+
+
+class TestMemoryWritePathsBumpVersion:
+    """测试记忆写路径递增版本号"""
+
+    @pytest.mark.asyncio
+    async def test_update_semantic_bumps(self):
+        from app.services.memory_system_v2.memory_manager import MemoryManager
+        from app.services.prompt_fragment_cache import prompt_fragment_cache
+
+        manager = MemoryManager(db_service=None, llm_service=None)
+        before = prompt_fragment_cache.version(USER, CHAR, FRAGMENT_SEMANTIC)
+        await manager._update_semantic(USER, CHAR, {"user_name": "小明"})
+        assert prompt_fragment_cache.version(USER, CHAR, FRAGMENT_SEMANTIC) == before + 1
+
+    @pytest.mark.asyncio
+    async def test_profile_text_refreshes_after_update(self):
+        from app.services.memory_system_v2.memory_manager import MemoryManager, MemoryContext
+
+        manager = MemoryManager(db_service=None, llm_service=None)
+        await manager._update_semantic(USER, "refresh_char", {"user_name": "小明"})
+        semantic = await manager.get_semantic_memory(USER, "refresh_char")
+        ctx = MemoryContext(working_memory=[], relevant_episodes=[], recent_episodes=[], user_profile=semantic)
+        assert "小明" in ctx.to_prompt_section()
+
+        await manager._update_semantic(USER, "refresh_char", {"user_name": "小红"})
+        assert "小红" in ctx.to_prompt_section()
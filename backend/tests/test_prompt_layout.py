@@ -0,0 +1,127 @@
+"""
+Prompt Layout Tests
+===================
+
+测试 V4 System Prompt 前缀缓存布局：同一 (角色, 阶段, NSFW) 的前缀逐字节稳定、
+易变内容只出现在后缀、cache key 随阶段 / NSFW 变化、legacy 布局保持旧顺序、
+provider usage 中缓存命中 token 的统计，以及 cache key 透传给 LLM 调用。
+
+运行: pytest tests/test_prompt_layout.py -v
+"""
+
+from unittest.mock import AsyncMock
+
+import pytest
+
+# prompt_builder_v4 与 app.api.v1 互相导入，先完整加载路由包
+import app.api.v1  # noqa: F401
+from app.core.metrics import metrics, record_llm_usage, record_prompt_prefix
+from app.services.v4.chat_pipeline_v4 import ChatPipelineV4, UserStateV4
+from app.services.v4.prompt_builder_v4 import prompt_builder_v4
+
+LUNA = "d2b3c4d5-e6f7-4a8b-9c0d-1e2f3a4b5c6d"
+
+
+def _state(**kwargs) -> UserStateV4:
+    values = {"user_id": "u1", "character_id": LUNA, "intimacy_level": 12, "emotion": 0, "events": []}
+    values.update(kwargs)
+    return UserStateV4(**values)
+
+
+def _layout(state=None, **kwargs):
+    return prompt_builder_v4.build_prompt_layout(
+        user_state=state or _state(), character_id=LUNA, layout="prefix", **kwargs
+    )
+
+
+class TestPrefixLayout:
+
+    def test_prefix_stable_across_turns(self):
+        first = _layout(_state(emotion=10), memory_context="用户喜欢猫", user_interests=["音乐"])
+        second = _layout(
+            _state(user_id="u2", emotion=-70, intimacy_level=13, events=["first_gift"]),
+            memory_context="用户住在上海",
+        )
+        assert first.prefix == second.prefix
+        assert first.cache_key == second.cache_key
+        assert first.suffix != second.suffix
+
+    def test_volatile_sections_in_suffix(self):
+        layout = _layout(_state(emotion=-70), memory_context="用户喜欢猫", user_interests=["音乐"])
+        for marker in ("### 当前时间", "### 当前状态", "### 额外记忆", "### 情绪指导", "### 用户信息"):
+            assert marker in layout.suffix
+            assert marker not in layout.prefix
+        assert "### 关系阶段" in layout.prefix
+        assert "### 行为边界" in layout.prefix
+        assert layout.text.startswith(layout.prefix)
+
+    def test_safety_after_stage_rules(self):
+        prefix = _layout().prefix
+        assert prefix.index("### 关系阶段") < prefix.index("### 行为边界")
+
+    def test_cache_key_varies_with_stage_and_nsfw(self):
+        base = _layout()
+        assert base.cache_key.startswith(f"v4:{LUNA}:")
+        assert _layout(nsfw_override=True).cache_key != base.cache_key
+        assert _layout(_state(intimacy_level=30)).cache_key != base.cache_key
+        boosted = _layout(stage_boost=1)
+        assert "+" in boosted.stage
+        assert boosted.cache_key != base.cache_key
+
+    def test_legacy_layout(self):
+        kwargs = {"memory_context": "用户喜欢猫", "user_interests": ["音乐"]}
+        legacy = prompt_builder_v4.build_prompt_layout(
+            user_state=_state(), character_id=LUNA, layout="legacy", **kwargs
+        )
+        assert legacy.cache_key is None
+        assert legacy.prefix == ""
+        # 旧顺序：当前状态夹在人设和阶段规则之间
+        assert legacy.text.index("### 当前状态") < legacy.text.index("### 关系阶段")
+        assert legacy.text.index("### 当前时间") < legacy.text.index("### 当前状态")
+
+
+class TestPrefixStats:
+
+    def test_cached_tokens_counted(self):
+        cached = metrics.LLM_TOKENS.labels(provider="test", model="cache", type="cached")
+        before = cached.value
+        record_llm_usage("test", "cache", {
+            "prompt_tokens": 2000, "completion_tokens": 50,
+            "prompt_tokens_details": {"cached_tokens": 1536},
+        })
+        assert cached.value == before + 1536
+
+    def test_record_prompt_prefix(self):
+        hits = metrics.PROMPT_PREFIX_REQUESTS.labels(character="test-char", stage="S1_FRIEND", hit="true")
+        misses = metrics.PROMPT_PREFIX_REQUESTS.labels(character="test-char", stage="S1_FRIEND", hit="false")
+        cached = metrics.PROMPT_PREFIX_TOKENS.labels(character="test-char", stage="S1_FRIEND", type="cached")
+        hits_before, misses_before, cached_before = hits.value, misses.value, cached.value
+
+        assert record_prompt_prefix("test-char", "S1_FRIEND", {"prompt_tokens": 1200}) == 0
+        assert record_prompt_prefix("test-char", "S1_FRIEND", {
+            "prompt_tokens": 1200, "prompt_tokens_details": {"cached_tokens": 1024},
+        }) == 1024
+        assert record_prompt_prefix("test-char", "S1_FRIEND", None) == 0
+
+        assert hits.value == hits_before + 1
+        assert misses.value == misses_before + 2
+        assert cached.value == cached_before + 1024
+        assert 'luna_prompt_prefix_tokens_total{character="test-char",stage="S1_FRIEND",type="cached"}' \
+            in metrics.render()
+
+    @pytest.mark.asyncio
+    async def test_call_llm_sends_cache_key(self):
+        pipeline = ChatPipelineV4.__new__(ChatPipelineV4)
+        pipeline.grok_service = AsyncMock()
+        pipeline.grok_service.chat_completion.return_value = {
+            "choices": [{"message": {"content": "{}"}}],
+            "usage": {"prompt_tokens": 900, "total_tokens": 950,
+                      "prompt_tokens_details": {"cached_tokens": 800}},
+        }
+        layout = _layout()
+        result = await pipeline._call_llm(layout.text, "你好", [], prompt_layout=layout)
+
+        kwargs = pipeline.grok_service.chat_completion.call_args.kwargs
+        assert kwargs["prompt_cache_key"] == layout.cache_key
+        assert kwargs["messages"][0]["content"] == layout.text
+        assert result["tokens_used"] == 950
@@ -0,0 +1,76 @@
+"""
+Query Stats Tests
+=================
+
+测试每请求 SQL 统计：语句形状归一化、SQLAlchemy 钩子计数、N+1 告警、PerfTracker 摘要。
+
+运行: pytest tests/test_query_stats.py -v
+"""
+
+import logging
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.perf import PerfTracker
+from app.core.query_stats import (
+    statement_shape,
+    query_scope,
+    current_query_stats,
+    instrument_engine,
+    record_query,
+)
+
+
+class TestStatementShape:
+
+    def test_literals_and_placeholders_collapse(self):
+        a = statement_shape("SELECT * FROM users WHERE id = 5 AND name = 'bob'")
+        b = statement_shape("SELECT *  FROM users\nWHERE id = 42 AND name = 'alice'")
+        assert a == b == "SELECT * FROM users WHERE id = ? AND name = ?"
+
+    def test_in_lists_collapse(self):
+        a = statement_shape("SELECT 1 FROM t WHERE id IN ($1, $2, $3)")
+        b = statement_shape("SELECT 1 FROM t WHERE id IN (?, ?)")
+        assert a == b
+
+
+class TestQueryScope:
+
+    def test_no_scope_outside_request(self):
+        assert current_query_stats() is None
+        record_query("SELECT 1", 0.001)  # 不报错，只计全局
+
+    def test_n_plus_one_warning(self, caplog):
+        with caplog.at_level(logging.WARNING, logger="app.core.query_stats"):
+            with query_scope("GET /sessions", threshold=3) as stats:
+                record_query("SELECT * FROM sessions WHERE user_id = 'u1'", 0.001)
+                for i in range(5):
+                    record_query(f"SELECT * FROM characters WHERE id = {i}", 0.002)
+
+        assert stats.count == 6
+        assert stats.repeated(3) == [("SELECT * FROM characters WHERE id = ?", 5)]
+        assert any("[N+1] GET /sessions" in r.message for r in caplog.records)
+
+    def test_perf_summary_includes_db(self):
+        with query_scope("chat"):
+            record_query("SELECT 1", 0.01)
+            tracker = PerfTracker()
+            tracker.mark("llm", 0.5)
+            assert "db: 1q/0.01s" in tracker.get_summary("chat")
+
+    @pytest.mark.asyncio
+    async def test_sqlalchemy_engine_hooks(self):
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        instrument_engine(engine)
+        instrument_engine(engine)  # 重复调用不会重复计数
+        try:
+            with query_scope("test") as stats:
+                async with engine.connect() as conn:
+                    for i in range(3):
+                        await conn.execute(text("SELECT :x"), {"x": i})
+            assert stats.count == 3
+            assert len(stats.shapes) == 1
+            assert stats.total_time > 0
+        finally:
+            await engine.dispose()
@@ -0,0 +1,274 @@
+"""
+Rate Limiter Tests
+==================
+
+测试令牌桶限流：突发容量与补充、多桶全部够才扣减、Redis Lua 脚本调用参数与结果解析、
+Redis 出错退回进程内并暂停重试、路由类别匹配、中间件 429 + Retry-After / X-RateLimit-* 响应头、
+按用户与按 IP 分桶、只在可信代理后才采信 X-Forwarded-For。
+
+运行: pytest tests/test_rate_limiter.py -v
+"""
+
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from app.core.rate_limiter import RateLimitRule, TokenBucketLimiter
+from app.middleware.rate_limit_middleware import (
+    RATE_LIMITED_ROUTES,
+    RateLimitMiddleware,
+    client_ip,
+    compile_route_classes,
+)
+from app.middleware.context import get_request_context
+
+NO_REDIS = object()  # 没有 register_script，走进程内
+
+
+class FakeRedis:
+    """记录脚本调用，按给定回复返回"""
+
+    def __init__(self, reply=None, error=None):
+        self.calls = []
+        self.reply = reply
+        self.error = error
+
+    def register_script(self, source):
+        assert "HMGET" in source
+
+        async def script(keys, args):
+            self.calls.append((keys, args))
+            if self.error:
+                raise self.error
+            return self.reply
+
+        return script
+
+
+class TestTokenBucket:
+
+    @pytest.mark.asyncio
+    async def test_burst_then_limited(self):
+        limiter = TokenBucketLimiter()
+        rule = RateLimitRule(capacity=3, per_minute=6)
+        results = [await limiter.hit([("u1", rule)], redis=NO_REDIS) for _ in range(4)]
+        assert [r.allowed for r in results] == [True, True, True, False]
+        assert [r.remaining for r in results] == [2, 1, 0, 0]
+        assert results[-1].retry_after == 10
+        assert results[0].limit == 3
+
+    @pytest.mark.asyncio
+    async def test_refill(self):
+        limiter = TokenBucketLimiter()
+        rule = RateLimitRule(capacity=1, per_minute=6000)
+        assert (await limiter.hit([("u1", rule)], redis=NO_REDIS)).allowed
+        assert not (await limiter.hit([("u1", rule)], redis=NO_REDIS)).allowed
+        await asyncio.sleep(0.02)
+        assert (await limiter.hit([("u1", rule)], redis=NO_REDIS)).allowed
+
+    @pytest.mark.asyncio
+    async def test_all_buckets_or_nothing(self):
+        limiter = TokenBucketLimiter()
+        user, ip = RateLimitRule(capacity=1, per_minute=1), RateLimitRule(capacity=5, per_minute=1)
+        await limiter.hit([("user:a", user), ("ip:1", ip)], redis=NO_REDIS)
+        denied = await limiter.hit([("user:a", user), ("ip:1", ip)], redis=NO_REDIS)
+        assert not denied.allowed
+        # 用户桶拒绝时 IP 桶不扣减
+        other = await limiter.hit([("user:b", user), ("ip:1", ip)], redis=NO_REDIS)
+        assert other.allowed
+        assert limiter._local["ip:1"][0] == pytest.approx(3, abs=0.01)
+
+    @pytest.mark.asyncio
+    async def test_local_buckets_bounded(self):
+        limiter = TokenBucketLimiter(max_local_buckets=2)
+        rule = RateLimitRule(capacity=1, per_minute=1)
+        for key in ("a", "b", "c"):
+            await limiter.hit([(key, rule)], redis=NO_REDIS)
+        assert limiter.get_stats()["local_buckets"] == 2
+        assert "a" not in limiter._local
+
+
+class TestRedisBackend:
+
+    @pytest.mark.asyncio
+    async def test_script_arguments_and_reply(self):
+        redis = FakeRedis(reply=[1, "4.5", "39"])
+        limiter = TokenBucketLimiter()
+        result = await limiter.hit(
+            [("user:a:chat", RateLimitRule(10, 30)), ("ip:1:chat", RateLimitRule(40, 120))], redis=redis
+        )
+        keys, args = redis.calls[0]
+        assert keys == ["rate_limit:user:a:chat", "rate_limit:ip:1:chat"]
+        assert args[1:] == [1, 10, 0.5, 40, 2.0]
+        assert result.allowed and result.backend == "redis"
+        assert (result.limit, result.remaining, result.reset_after) == (10, 4, 11)
+
+    @pytest.mark.asyncio
+    async def test_denied_reply(self):
+        redis = FakeRedis(reply=[0, "0.25", "20"])
+        result = await TokenBucketLimiter().hit(
+            [("u", RateLimitRule(10, 30)), ("ip", RateLimitRule(40, 120))], redis=redis
+        )
+        assert not result.allowed
+        assert result.retry_after == 2
+
+    @pytest.mark.asyncio
+    async def test_error_falls_back_and_pauses_redis(self, monkeypatch):
+        broken = FakeRedis(error=ConnectionError("down"))
+
+        async def get_redis():
+            return broken
+
+        monkeypatch.setattr("app.core.redis.get_redis", get_redis)
+        limiter = TokenBucketLimiter()
+        rule = RateLimitRule(capacity=2, per_minute=1)
+        first = await limiter.hit([("u", rule)])
+        second = await limiter.hit([("u", rule)])
+        assert first.backend == second.backend == "local"
+        assert second.remaining == 0
+        assert len(broken.calls) == 1
+        assert limiter.redis_errors == 1
+
+
+class TestRouteClasses:
+
+    @pytest.mark.parametrize("path, expected", [
+        ("/api/v1/chat/completions", "chat"),
+        ("/api/v1/chat/stream/", "chat"),
+        ("/api/v1/chat/sessions", None),
+        ("/api/v1/images/generate/async", "image_gen"),
+        ("/api/v1/photos/c1/request", "image_gen"),
+        ("/api/v1/voice/tts", "voice_tts"),
+        ("/api/v1/voice/tts/async", "voice_tts"),
+        ("/api/v1/dates/interactive/choose", "date"),
+        ("/api/v1/dates/cancel", None),
+        ("/api/v1/events/me/c1/generate", "story"),
+        ("/api/v1/events/u1/c1/generate/async", "story"),
+        ("/api/v1/stories/start", "story"),
+    ])
+    def test_match(self, path, expected):
+        assert compile_route_classes(RATE_LIMITED_ROUTES)(path) == expected
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+
+def _build_app(limiter, trusted_proxies=0):
+    app = FastAPI()
+
+    @app.post("/api/v1/voice/tts")
+    async def tts():
+        return {"ok": True}
+
+    @app.post("/api/v1/wallet/balance")
+    async def other():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, enabled=True, trusted_proxies=trusted_proxies)
+    return app
+
+
+def _scope(path, forwarded_for=None, client="127.0.0.1"):
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": headers,
+        "client": (client, 1234),
+        "server": ("test", 80),
+    }
+
+
+async def _post(app, path, user_id=None, forwarded_for=None, client="127.0.0.1"):
+    scope = _scope(path, forwarded_for, client)
+    if user_id:
+        get_request_context(scope).user = FakeUser(user_id)
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages[0]["status"], dict(messages[0]["headers"])
+
+
+class TestClientIp:
+
+    @pytest.mark.parametrize("forwarded_for, trusted, expected", [
+        ("1.2.3.4", 0, "peer"),
+        (None, 1, "peer"),
+        ("1.2.3.4", 1, "1.2.3.4"),
+        ("6.6.6.6, 1.2.3.4", 1, "1.2.3.4"),         # 客户端伪造的左侧地址不采信
+        ("6.6.6.6, 1.2.3.4, 10.0.0.1", 2, "1.2.3.4"),
+        ("1.2.3.4", 3, "1.2.3.4"),
+    ])
+    def test_rightmost_untrusted_hop(self, forwarded_for, trusted, expected):
+        assert client_ip(_scope("/", forwarded_for), "peer", trusted) == expected
+
+
+class TestRateLimitMiddleware:
+
+    @pytest.fixture
+    def limiter(self):
+        limiter = TokenBucketLimiter()
+        limiter._redis_down_until = float("inf")  # 测试里不连 Redis
+        return limiter
+
+    @pytest.mark.asyncio
+    async def test_limit_headers_and_429(self, limiter):
+        app = _build_app(limiter)
+        statuses = []
+        for _ in range(9):
+            status, headers = await _post(app, "/api/v1/voice/tts", user_id="u1")
+            statuses.append(status)
+        assert statuses == [200] * 8 + [429]
+        assert headers[b"x-ratelimit-limit"] == b"8"
+        assert headers[b"x-ratelimit-remaining"] == b"0"
+        assert int(headers[b"retry-after"]) >= 1
+
+    @pytest.mark.asyncio
+    async def test_per_user_buckets(self, limiter):
+        app = _build_app(limiter)
+        for _ in range(8):
+            await _post(app, "/api/v1/voice/tts", user_id="u1")
+        status, headers = await _post(app, "/api/v1/voice/tts", user_id="u2")
+        assert status == 200
+        # 同一 IP 的桶（20 - 9 = 11，剩 55%）比 u2 的用户桶（7/8）更紧，响应头按 IP 桶
+        assert headers[b"x-ratelimit-limit"] == b"20"
+        assert headers[b"x-ratelimit-remaining"] == b"11"
+
+    @pytest.mark.asyncio
+    async def test_per_ip_bucket_without_user(self, limiter):
+        app = _build_app(limiter, trusted_proxies=1)
+        for _ in range(20):
+            assert (await _post(app, "/api/v1/voice/tts", forwarded_for="9.9.9.9, 1.2.3.4"))[0] == 200
+        assert (await _post(app, "/api/v1/voice/tts", forwarded_for="1.2.3.4"))[0] == 429
+        assert (await _post(app, "/api/v1/voice/tts", forwarded_for="5.6.7.8"))[0] == 200
+
+    @pytest.mark.asyncio
+    async def test_spoofed_forwarded_for_ignored_without_trusted_proxy(self, limiter):
+        app = _build_app(limiter)
+        for i in range(20):
+            assert (await _post(app, "/api/v1/voice/tts", forwarded_for=f"10.0.0.{i}"))[0] == 200
+        # 换一个伪造的 X-Forwarded-For 也还是同一个连接地址的桶
+        assert (await _post(app, "/api/v1/voice/tts", forwarded_for="10.0.1.1"))[0] == 429
+        assert (await _post(app, "/api/v1/voice/tts", client="127.0.0.2"))[0] == 200
+
+    @pytest.mark.asyncio
+    async def test_unlisted_path_untouched(self, limiter):
+        status, headers = await _post(_build_app(limiter), "/api/v1/wallet/balance", user_id="u1")
+        assert status == 200
+        assert b"x-ratelimit-limit" not in headers
@@ -0,0 +1,168 @@
+"""
+Single Flight Tests
+===================
+
+测试相同请求合并与结果缓存：并发调用共享一次执行、异常共享但不缓存、TTL 过期与 LRU 淘汰、
+等待方取消不影响共享调用、GrokService 合并相同 LLM 请求 / cache_ttl 复用、
+greeting 与事件故事的并发去重。
+
+运行: pytest tests/test_single_flight.py -v
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.single_flight import SingleFlight, request_key
+
+OK = {"choices": [{"message": {"content": "你好呀"}}], "usage": {"total_tokens": 10}}
+
+
+class Counter:
+    """记录调用次数的慢速 factory"""
+
+    def __init__(self, result="ok", delay=0.01, error=None):
+        self.calls = 0
+        self.result = result
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TestSingleFlight:
+
+    def test_request_key_canonical(self):
+        assert request_key("m", {"a": 1, "b": [1, 2]}) == request_key("m", {"b": [1, 2], "a": 1})
+        assert request_key("m", {"a": 1}) != request_key("m", {"a": 2})
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_result(self):
+        flight, factory = SingleFlight("t"), Counter()
+        results = await asyncio.gather(*[flight.do("k", factory) for _ in range(5)])
+        assert results == ["ok"] * 5
+        assert factory.calls == 1
+        stats = flight.get_stats()
+        assert stats["coalesced"] == 4 and stats["in_flight"] == 0
+        # 没有 ttl 时不缓存
+        await flight.do("k", factory)
+        assert factory.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_errors_shared_not_cached(self):
+        flight, factory = SingleFlight("t"), Counter(error=ValueError("boom"))
+        results = await asyncio.gather(*[flight.do("k", factory, ttl=60) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert factory.calls == 1
+        assert flight.get_stats()["entries"] == 0
+
+    @pytest.mark.asyncio
+    async def test_ttl_cache_and_expiry(self):
+        flight, factory = SingleFlight("t"), Counter(delay=0)
+
+        await flight.do("k", factory, ttl=0.05)
+        await flight.do("k", factory, ttl=0.05)
+        assert factory.calls == 1 and flight.hits == 1
+
+        await asyncio.sleep(0.06)
+        await flight.do("k", factory, ttl=0.05)
+        assert factory.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_lru_eviction(self):
+        flight = SingleFlight("t", max_entries=2)
+        for key in ("a", "b", "c"):
+            await flight.do(key, Counter(result=key), ttl=60)
+        assert flight.get_stats()["entries"] == 2
+        factory = Counter()
+        await flight.do("a", factory, ttl=60)
+        assert factory.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_call(self):
+        flight, factory = SingleFlight("t"), Counter(delay=0.05)
+        first = asyncio.ensure_future(flight.do("k", factory))
+        second = asyncio.ensure_future(flight.do("k", factory))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == "ok"
+        assert factory.calls == 1
+
+
+class TestCallSites:
+
+    @pytest.mark.asyncio
+    async def test_grok_service_coalesces_identical_requests(self):
+        from app.services.llm_service import GrokService, llm_responses
+
+        async def slow(payload, headers):
+            await asyncio.sleep(0.01)
+            return OK
+
+        llm_responses.clear()
+        messages = [{"role": "user", "content": "single flight test"}]
+        with patch("app.services.llm_service.llm_router.chat_completion", new=AsyncMock(side_effect=slow)) as send:
+            service = GrokService()
+            first, second = await asyncio.gather(
+                service.chat_completion(messages=messages),
+                service.chat_completion(messages=messages),
+            )
+            await service.chat_completion(messages=messages, temperature=0.3)
+        assert send.call_count == 2
+        assert first == second == OK
+        first["choices"].clear()
+        assert second["choices"]
+
+    @pytest.mark.asyncio
+    async def test_grok_service_cache_ttl(self):
+        from app.services.llm_service import GrokService, llm_responses
+
+        llm_responses.clear()
+        messages = [{"role": "user", "content": "cache ttl test"}]
+        with patch("app.services.llm_service.llm_router.chat_completion", new=AsyncMock(return_value=OK)) as send:
+            service = GrokService()
+            await service.chat_completion(messages=messages, cache_ttl=60)
+            await service.chat_completion(messages=messages, cache_ttl=60)
+            await service.chat_completion(messages=messages)
+        assert send.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_concurrent_greeting_inserted_once(self):
+        from app.api.v1.chat import ensure_session_has_greeting
+
+        character = {"character_id": "c1", "greeting": "你好！很高兴认识你！"}
+
+        async def slow_messages(session_id):
+            await asyncio.sleep(0.01)
+            return []
+
+        with patch("app.api.v1.chat.get_character_info", return_value=character), \
+             patch("app.api.v1.chat.chat_repo") as repo:
+            repo.get_all_messages = AsyncMock(side_effect=slow_messages)
+            repo.add_message = AsyncMock()
+            results = await asyncio.gather(*[ensure_session_has_greeting("s-concurrent", "c1") for _ in range(3)])
+        assert results == [True] * 3
+        repo.add_message.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_concurrent_event_story_generated_once(self):
+        from app.services.event_story_generator import EventStoryGenerator, StoryGenerationResult
+
+        async def slow_generate(*args):
+            await asyncio.sleep(0.01)
+            return StoryGenerationResult(success=True, story_content="故事")
+
+        generator = EventStoryGenerator()
+        with patch.object(generator, "_generate_event_story", new=AsyncMock(side_effect=slow_generate)) as generate:
+            results = await asyncio.gather(*[
+                generator.generate_event_story("u1", "c1", "first_date", []) for _ in range(3)
+            ])
+            await generator.generate_event_story("u1", "c1", "first_date", [], save_to_db=False)
+        assert [r.story_content for r in results] == ["故事"] * 3
+        assert generate.call_count == 2
@@ -0,0 +1,154 @@
+"""
+Structured Logging Tests
+========================
+
+测试日志管线：按分类采样的确定性与比例、JSON 格式的 extra 字段、
+QueueHandler 入队时不格式化、chat_debug 关闭 / 未采中时不做任何格式化、
+request_id 按请求隔离、data 只作为字段输出一次。
+
+运行: pytest tests/test_structured_logging.py -v
+"""
+
+import asyncio
+import json
+import logging
+import queue
+
+from app.core.logging import CategorySampler, JsonFormatter, LazyQueueHandler
+from app.services import chat_debug_logger
+from app.services.chat_debug_logger import ChatDebugLogger
+
+
+class _Exploding:
+    """被格式化时抛错，用来证明没有被格式化"""
+
+    def __str__(self):
+        raise AssertionError("formatted")
+
+    __repr__ = __str__
+
+
+class TestCategorySampler:
+
+    def test_deterministic_per_key(self):
+        sampler = CategorySampler({"SYSTEM_PROMPT": 0.5})
+        first = [sampler.should_log("SYSTEM_PROMPT", f"req-{i}") for i in range(50)]
+        second = [sampler.should_log("SYSTEM_PROMPT", f"req-{i}") for i in range(50)]
+        assert first == second
+
+    def test_rate_is_respected(self):
+        sampler = CategorySampler({"L2_INPUT": 0.1})
+        hits = sum(sampler.should_log("L2_INPUT", f"req-{i}") for i in range(5000))
+        assert 350 < hits < 650
+
+    def test_bounds_and_default(self):
+        sampler = CategorySampler({"OFF": 0.0}, default=1.0)
+        assert not any(sampler.should_log("OFF", str(i)) for i in range(100))
+        assert all(sampler.should_log("OTHER", str(i)) for i in range(100))
+
+    def test_from_env(self, monkeypatch):
+        monkeypatch.setenv("TEST_SAMPLING", "SYSTEM_PROMPT=1, L2_INPUT=0.3,*=0.5,bad=x")
+        sampler = CategorySampler.from_env("TEST_SAMPLING", {"SYSTEM_PROMPT": 0.05, "L2_OUTPUT": 0.2})
+        assert sampler.rate("SYSTEM_PROMPT") == 1.0
+        assert sampler.rate("L2_INPUT") == 0.3
+        assert sampler.rate("L2_OUTPUT") == 0.2
+        assert sampler.rate("ANYTHING") == 0.5
+        assert sampler.rate("bad") == 0.5
+
+
+class TestJsonFormatter:
+
+    def test_extra_fields(self):
+        record = logging.LogRecord("chat.debug", logging.INFO, __file__, 1, "hello %s", ("luna",), None)
+        record.category = "SUMMARY"
+        record.request_id = "req-1"
+        record.data = {"user": "你好"}
+        payload = json.loads(JsonFormatter().format(record))
+        assert payload["message"] == "hello luna"
+        assert payload["level"] == "INFO"
+        assert payload["category"] == "SUMMARY"
+        assert payload["request_id"] == "req-1"
+        assert payload["data"] == {"user": "你好"}
+
+
+class TestLazyQueueHandler:
+
+    def test_defers_formatting(self):
+        q = queue.Queue()
+        handler = LazyQueueHandler(q)
+        record = logging.LogRecord("x", logging.INFO, __file__, 1, "value=%s", (_Exploding(),), None)
+        handler.handle(record)
+        queued = q.get_nowait()
+        assert queued.msg == "value=%s"
+        assert isinstance(queued.args[0], _Exploding)
+
+    def test_snapshots_mutable_args(self):
+        q = queue.Queue()
+        handler = LazyQueueHandler(q)
+        items = [1, 2]
+        handler.handle(logging.LogRecord("x", logging.INFO, __file__, 1, "items=%s", (items,), None))
+        items.append(3)
+        assert q.get_nowait().getMessage() == "items=[1, 2]"
+
+
+class TestChatDebugLogger:
+
+    def _capture(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr(chat_debug_logger.logger, "log", lambda *a, **kw: calls.append((a, kw)))
+        return calls
+
+    def test_disabled_does_no_work(self, monkeypatch):
+        calls = self._capture(monkeypatch)
+        debug = ChatDebugLogger()
+        debug.enabled = False
+        debug.log_prompt(_Exploding())
+        debug.log_l2_output(_Exploding())
+        debug.log_l1_input(_Exploding(), 1, [])
+        assert calls == []
+
+    def test_not_sampled_does_no_work(self, monkeypatch):
+        calls = self._capture(monkeypatch)
+        debug = ChatDebugLogger()
+        debug.enabled = True
+        debug.sampler = CategorySampler({"SYSTEM_PROMPT": 0.0})
+        debug.log_prompt(_Exploding())
+        assert calls == []
+
+    def test_sampled_emits_one_structured_record(self, monkeypatch):
+        calls = self._capture(monkeypatch)
+        debug = ChatDebugLogger()
+        debug.enabled = True
+        debug.sampler = CategorySampler()
+        debug.set_request_id("req-9")
+        debug.log_prompt("line1\nline2\nline3")
+        assert len(calls) == 1
+        extra = calls[0][1]["extra"]
+        assert extra["category"] == "SYSTEM_PROMPT"
+        assert extra["request_id"] == "req-9"
+        assert extra["data"] == "line1\nline2\nline3"
+        assert "line1" not in calls[0][0][1]
+
+    def test_request_id_isolated_per_task(self, monkeypatch):
+        calls = self._capture(monkeypatch)
+        debug = ChatDebugLogger()
+        debug.enabled = True
+        debug.sampler = CategorySampler()
+
+        async def handle(request_id):
+            debug.set_request_id(request_id)
+            await asyncio.sleep(0)
+            debug.log_score_change("emotion", 0, 1, 1, "test")
+
+        async def main():
+            await asyncio.gather(handle("req-a"), handle("req-b"))
+
+        asyncio.run(main())
+        assert sorted(kw["extra"]["request_id"] for _, kw in calls) == ["req-a", "req-b"]
+        assert debug.request_id not in ("req-a", "req-b")
+
+    def test_text_formatter_appends_data(self):
+        record = logging.LogRecord("chat.debug", logging.DEBUG, "", 0, "[L2_OUTPUT] 回复", (), None)
+        record.data = {"reply": "嗯"}
+        text = chat_debug_logger._TextFormatter("%(message)s").format(record)
+        assert text == "[L2_OUTPUT] 回复\n{'reply': '嗯'}"
@@ -0,0 +1,164 @@
+"""
+Task Supervisor Tests
+=====================
+
+测试后台任务调度：优先级、并发上限、队列满丢弃、重试、优雅 drain、
+懒启动的 worker 不继承发起请求的 contextvars。
+
+运行: pytest tests/test_task_supervisor.py -v
+"""
+
+import asyncio
+import pytest
+
+from app.core.task_supervisor import (
+    TaskSupervisor,
+    QueueConfig,
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+)
+
+
+def _supervisor(**config) -> TaskSupervisor:
+    config.setdefault("retry_base_delay", 0.001)
+    return TaskSupervisor(queues={"q": QueueConfig(**config)})
+
+
+class TestTaskSupervisor:
+
+    @pytest.mark.asyncio
+    async def test_high_priority_runs_first(self):
+        """同一队列中高优先级任务先执行"""
+        sup = _supervisor(concurrency=1)
+        sup.start()
+        order = []
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+
+        async def record(tag):
+            order.append(tag)
+
+        sup.submit("q", blocker, name="blocker")
+        await asyncio.sleep(0)
+        sup.submit("q", lambda: record("memory"), priority=PRIORITY_LOW)
+        sup.submit("q", lambda: record("emotion"), priority=PRIORITY_HIGH)
+        gate.set()
+        await sup.shutdown(timeout=1)
+
+        assert order == ["emotion", "memory"]
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self):
+        sup = _supervisor(concurrency=2)
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for _ in range(6):
+            sup.submit("q", job)
+        await sup.shutdown(timeout=1)
+
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_full_queue_drops(self):
+        sup = _supervisor(concurrency=1, max_size=1)
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+
+        assert sup.submit("q", blocker)
+        await asyncio.sleep(0)  # worker 取走第一个
+        assert sup.submit("q", blocker)
+        assert not sup.submit("q", blocker)
+        assert sup.get_stats()["q"]["dropped"] == 1
+
+        gate.set()
+        await sup.shutdown(timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_retry_then_success(self):
+        sup = _supervisor(concurrency=1)
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RuntimeError("boom")
+
+        sup.submit("q", flaky, retries=2)
+        await sup._queues["q"].queue.join()
+
+        assert len(attempts) == 3
+        stats = sup.get_stats()["q"]
+        assert stats["retried"] == 2
+        assert stats["completed"] == 1
+        await sup.shutdown(timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_failure_counted_without_retry(self):
+        sup = _supervisor(concurrency=1)
+        sup.start()
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        sup.submit("q", broken)
+        await sup._queues["q"].queue.join()
+        stats = sup.get_stats()["q"]
+        assert stats["failed"] == 1
+        assert stats["retried"] == 0
+        await sup.shutdown(timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_shutdown_rejects_new_and_cancels_on_timeout(self):
+        sup = _supervisor(concurrency=1)
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        sup.submit("q", slow)
+        await asyncio.sleep(0)
+        await sup.shutdown(timeout=0.01)
+
+        assert cancelled.is_set()
+        assert not sup.submit("q", slow)
+
+    @pytest.mark.asyncio
+    async def test_lazy_start_does_not_inherit_request_context(self):
+        from app.core.query_stats import current_query_stats, query_scope
+
+        sup = _supervisor(concurrency=1)
+        seen = []
+
+        async def job():
+            seen.append(current_query_stats())
+
+        with query_scope("request") as stats:
+            sup.start()                     # 首个请求里懒启动
+            sup.submit("q", job)
+            await sup.shutdown(timeout=1)
+
+        assert stats is not None
+        assert seen == [None]
+
+    @pytest.mark.asyncio
+    async def test_unknown_queue(self):
+        sup = _supervisor()
+        with pytest.raises(KeyError):
+            sup.submit("nope", lambda: asyncio.sleep(0))
+        await sup.shutdown(timeout=1)
@@ -0,0 +1,175 @@
+"""
+Tracing Tests
+=============
+
+测试 span 追踪：嵌套父子关系、W3C traceparent 续接、关闭时无开销、异常记录、
+SQL 语句补记、后台任务挂在发起请求的 trace 下、LoggingMiddleware 根 span。
+
+运行: pytest tests/test_tracing.py -v
+"""
+
+import asyncio
+import pytest
+
+from app.core.tracing import (
+    tracer,
+    traced,
+    trace_methods,
+    current_span,
+    parse_traceparent,
+    InMemorySpanExporter,
+    NOOP_SPAN,
+)
+from app.core.query_stats import record_query
+from app.core.task_supervisor import TaskSupervisor, QueueConfig
+from app.core.perf import PerfTracker
+from app.middleware.logging_middleware import LoggingMiddleware
+
+REMOTE = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+@pytest.fixture
+def spans():
+    exporter = InMemorySpanExporter()
+    tracer.configure(exporter, sample_rate=1.0)
+    yield exporter.spans
+    tracer.configure(None)
+
+
+def _by_name(spans, name):
+    return next(s for s in spans if s.name == name)
+
+
+class TestSpans:
+
+    def test_nested_spans(self, spans):
+        perf = PerfTracker()
+        with tracer.start_span("request") as root:
+            with perf.track("precompute"):
+                with tracer.start_span("inner"):
+                    pass
+        assert current_span() is None
+
+        stage = _by_name(spans, "precompute")
+        inner = _by_name(spans, "inner")
+        assert root.parent_id is None
+        assert stage.parent_id == root.span_id
+        assert inner.parent_id == stage.span_id
+        assert {s.trace_id for s in spans} == {root.trace_id}
+        assert stage.attributes["perf.stage"] == "precompute"
+
+    def test_continues_remote_traceparent(self, spans):
+        with tracer.start_span("server", parent=None, traceparent=REMOTE) as span:
+            pass
+        assert span.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert span.parent_id == "00f067aa0ba902b7"
+        assert span.traceparent.startswith("00-4bf92f3577b34da6a3ce929d0e0e4736-")
+
+    def test_parse_traceparent_rejects_invalid(self):
+        assert parse_traceparent(REMOTE) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+        assert parse_traceparent("garbage") is None
+        assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+        assert parse_traceparent(None) is None
+
+    def test_disabled_is_noop(self):
+        tracer.configure(None)
+        with tracer.start_span("x") as span:
+            assert span is NOOP_SPAN
+            assert current_span() is None
+
+    def test_exception_recorded(self, spans):
+        with pytest.raises(ValueError):
+            with tracer.start_span("boom"):
+                raise ValueError("bad")
+        assert spans[0].status == "ERROR"
+        assert spans[0].events[0]["name"] == "exception"
+
+    def test_unsampled_root_exports_nothing(self, spans):
+        tracer.sample_rate = 0.0
+        with tracer.start_span("root"):
+            with tracer.start_span("child"):
+                pass
+        assert spans == []
+
+    def test_db_query_span(self, spans):
+        with tracer.start_span("request") as root:
+            record_query("SELECT * FROM users WHERE id = 42", 0.005)
+        db = _by_name(spans, "db.query")
+        assert db.parent_id == root.span_id
+        assert db.attributes["db.statement"] == "SELECT * FROM users WHERE id = ?"
+        assert 4 < db.duration * 1000 < 6
+
+
+class TestDecorators:
+
+    @pytest.mark.asyncio
+    async def test_trace_methods_staticmethod(self, spans):
+        @trace_methods("repo")
+        class Repo:
+            @staticmethod
+            async def get(x):
+                return x * 2
+
+            async def _private(self):
+                return 1
+
+        assert await Repo.get(2) == 4
+        assert await Repo()._private() == 1
+        assert [s.name for s in spans] == ["repo.get"]
+
+    @pytest.mark.asyncio
+    async def test_async_generator(self, spans):
+        @traced("stream")
+        async def gen():
+            for i in range(3):
+                yield i
+
+        with tracer.start_span("request") as root:
+            assert [i async for i in gen()] == [0, 1, 2]
+        assert _by_name(spans, "stream").parent_id == root.span_id
+
+
+class TestPropagation:
+
+    @pytest.mark.asyncio
+    async def test_background_task_joins_request_trace(self, spans):
+        sup = TaskSupervisor(queues={"q": QueueConfig(concurrency=1)})
+        sup.start()
+
+        async def job():
+            with tracer.start_span("work"):
+                await asyncio.sleep(0)
+
+        with tracer.start_span("request") as root:
+            sup.submit("q", job, name="emotion")
+        await sup.shutdown(timeout=1)
+
+        task = _by_name(spans, "task q/emotion")
+        assert task.trace_id == root.trace_id
+        assert task.parent_id == root.span_id
+        assert _by_name(spans, "work").parent_id == task.span_id
+
+    @pytest.mark.asyncio
+    async def test_middleware_root_span(self, spans):
+        async def app(scope, receive, send):
+            with tracer.start_span("handler"):
+                await send({"type": "http.response.start", "status": 200, "headers": []})
+                await send({"type": "http.response.body", "body": b"ok"})
+
+        scope = {
+            "type": "http", "method": "GET", "path": "/api/v1/ping",
+            "headers": [(b"traceparent", REMOTE.encode())], "client": ("127.0.0.1", 1),
+        }
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await LoggingMiddleware(app)(scope, None, send)
+
+        root = _by_name(spans, "GET /api/v1/ping")
+        assert root.kind == "server"
+        assert root.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert root.attributes["http.status_code"] == 200
+        assert _by_name(spans, "handler").parent_id == root.span_id
+        assert dict(messages[0]["headers"])[b"traceparent"] == root.traceparent.encode()